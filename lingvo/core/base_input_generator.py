@@ -79,6 +79,34 @@ def _PerHostInfeedTPUOrdinalFunction(use_per_core_infeed, task_id,
   return tpu_ordinal
 
 
+def _NumBytes(x):
+  """Returns the number of bytes of the data in `x`, as an int64 tensor."""
+  if isinstance(x, tf.sparse.SparseTensor):
+    return _NumBytes(x.indices) + _NumBytes(x.values)
+  if x.dtype == tf.string:
+    return tf.cast(tf.reduce_sum(tf.strings.length(x)), tf.int64)
+  return tf.size(x, out_type=tf.int64) * x.dtype.size
+
+
+def _NumExamples(batch):
+  """Returns the number of examples in `batch`, as an int64 tensor.
+
+  Args:
+    batch: A NestedMap, or a (nested) list of NestedMaps for sharded inputs.
+      The number of examples in a NestedMap is the leading dimension of its
+      first non-scalar value.
+  """
+  if isinstance(batch, (list, tuple)):
+    num_examples = [_NumExamples(b) for b in batch]
+    return tf.add_n(num_examples) if num_examples else tf.constant(0, tf.int64)
+  for x in py_utils.Flatten(batch):
+    if isinstance(x, tf.sparse.SparseTensor):
+      return x.dense_shape[0]
+    if x.shape.rank != 0:
+      return tf.shape(x, out_type=tf.int64)[0]
+  return tf.constant(0, tf.int64)
+
+
 def _ReorderTensorToLogical(tensor_list):
   """Reorder tensor into logical assignment order.
 
@@ -278,6 +306,10 @@ class BaseInputGenerator(base_layer.BaseLayer):
     # Set to true in GetPreprocessedInputBatch() (and thus _InputBatch())
     self._in_get_processed_input_batch = False
 
+    # Set by EnableStageProfiling().
+    self._stage_profile = None
+    self._stage_predecessors = None
+
     # Merged TF scalar summaries for training related input data stats.
     self._merged_input_data_summary_op = None
 
@@ -392,6 +424,70 @@ class BaseInputGenerator(base_layer.BaseLayer):
     """
     return batch
 
+  def EnableStageProfiling(self):
+    """Profiles each stage of the input pipeline built after this call.
+
+    The end of each stage of GetPreprocessedInputBatch(), CreateTpuEnqueueOps(),
+    CreateTpuEmbeddingEnqueueOps(), CreateCpuPassthroughEnqueueOps() and
+    CreateSinkOps() is timestamped, and the size of its output is measured. See
+    `stage_profile`.
+    """
+    self._stage_profile = py_utils.NestedMap()
+    self._stage_predecessors = {}
+
+  @property
+  def stage_profile(self):
+    """The tensors profiling each stage of the input pipeline.
+
+    Returns:
+      None if EnableStageProfiling() was not called. Otherwise, a NestedMap from
+      stage name to a NestedMap with lists of 'timestamp', 'num_bytes' and
+      'num_examples' tensors, one for each time the stage was built (e.g. once
+      per infeed host). They must be fetched together with the infeed ops.
+    """
+    return self._stage_profile
+
+  @property
+  def stage_predecessors(self):
+    """A dict from stage name to the name of the stage preceding it."""
+    return self._stage_predecessors
+
+  def _ProfileStage(self, stage, predecessor, batch, ops=None):
+    """Records the end of `stage`, which produced `batch` and ran `ops`.
+
+    Args:
+      stage: The name of the stage.
+      predecessor: The name of the stage preceding `stage`, if any.
+      batch: The output of the stage.
+      ops: The ops run by the stage, if any.
+
+    Returns:
+      The control dependencies for ops that must run after the stage.
+    """
+    if self._stage_profile is None:
+      return []
+    tensors = py_utils.Flatten(batch)
+    deps = [
+        x.values if isinstance(x, tf.sparse.SparseTensor) else x
+        for x in tensors + list(ops or [])
+    ]
+    if predecessor in self._stage_profile:
+      # Never timestamp a stage before the (latest) stage feeding it.
+      deps.append(self._stage_profile[predecessor].timestamp[-1])
+    with tf.control_dependencies(deps):
+      timestamp = tf.timestamp()
+    num_bytes = [_NumBytes(x) for x in tensors]
+    if predecessor is not None:
+      self._stage_predecessors[stage] = predecessor
+    if stage not in self._stage_profile:
+      self._stage_profile[stage] = py_utils.NestedMap(
+          timestamp=[], num_bytes=[], num_examples=[])
+    self._stage_profile[stage].timestamp.append(timestamp)
+    self._stage_profile[stage].num_bytes.append(
+        tf.add_n(num_bytes) if num_bytes else tf.constant(0, tf.int64))
+    self._stage_profile[stage].num_examples.append(_NumExamples(batch))
+    return [timestamp]
+
   def GetPreprocessedInputBatch(self):
     """Returns preprocessed batch of inputs.
 
@@ -400,6 +496,7 @@ class BaseInputGenerator(base_layer.BaseLayer):
     Subclasses generally should not override this function directly. Instead,
     override _InputBatch and maybe _PreprocessInputBatch.
     """
+    start_deps = self._ProfileStage('start', None, [])
     self._in_get_processed_input_batch = True
     # TODO(b/139345706): Use self.datasource.GetNext() for all datasource.
     if ('datasource' in self.children and
@@ -423,9 +520,17 @@ class BaseInputGenerator(base_layer.BaseLayer):
             'self._InputBatch() or self._PreprocessInputBatch(). To reduce the '
             'potential of mistakes, this error is raised when either of those '
             'functions have been overridden.')
-      batch = self.datasource.GetNext()
+      with tf.control_dependencies(start_deps):
+        batch = self.datasource.GetNext()
+      self._ProfileStage('input_batch', 'start', batch)
+      # Preprocessing is part of the datasource.
+      self._ProfileStage('preprocess', 'input_batch', batch)
     else:
-      batch = self._PreprocessInputBatch(self._InputBatch())
+      with tf.control_dependencies(start_deps):
+        batch = self._InputBatch()
+      self._ProfileStage('input_batch', 'start', batch)
+      batch = self._PreprocessInputBatch(batch)
+      self._ProfileStage('preprocess', 'input_batch', batch)
     self._in_get_processed_input_batch = False
 
     if py_utils.GetUnitTestSession():
@@ -575,6 +680,10 @@ class BaseInputGenerator(base_layer.BaseLayer):
         self._per_host_batches.append(batch)
 
         if benchmark_only:
+          self._ProfileStage('sink', 'preprocess', batch)
+          if cpu_passthrough_keys:
+            self._ProfileStage('cpu_passthrough_sink', 'preprocess',
+                               cur_passthrough_batches)
           continue
 
         for b in batch:
@@ -656,10 +765,14 @@ class BaseInputGenerator(base_layer.BaseLayer):
           input_ops = q.split_inputs_and_generate_enqueue_ops(
               batch[0].Flatten(),
               device_assignment=py_utils.GetTpuDeviceAssignment(job_name))
+        self._ProfileStage('tpu_enqueue', 'preprocess', batch, input_ops)
         input_ops_list += input_ops
 
     if benchmark_only:
-      grouped_infeed_op = tf.group(*self._per_host_batches)
+      # CPU passthrough batches are consumed too, so that their cost is
+      # included in the benchmark.
+      grouped_infeed_op = tf.group(*self._per_host_batches,
+                                   *self._per_host_passthrough_batches)
     else:
       tf.logging.info('input_ops_list %s', input_ops_list)
       grouped_infeed_op = tf.group(*input_ops_list)
@@ -792,6 +905,8 @@ class BaseInputGenerator(base_layer.BaseLayer):
             enqueue_data = ordinal_indexed_enqueue_data
           enqueue_ops += tpu_embedding.generate_enqueue_ops(
               enqueue_data, mode_override=self._tpu_embedding_mode)
+    self._ProfileStage('tpu_embedding_enqueue', 'preprocess', input_batches,
+                       enqueue_ops)
 
     if p.tpu_infeed_parallelism > 1:
       raise ValueError(
@@ -936,6 +1051,8 @@ class BaseInputGenerator(base_layer.BaseLayer):
         host_queue = tf.queue.FIFOQueue(capacity=10000, dtypes=cpu_dtypes)
         self._host_queues[task_id] = host_queue
         enqueue_ops += [host_queue.enqueue(py_utils.Flatten(batch))]
+        self._ProfileStage('cpu_passthrough_enqueue', 'preprocess', batch,
+                           enqueue_ops[-1:])
 
     if p.tpu_infeed_parallelism > 1:
       raise ValueError(
@@ -944,6 +1061,16 @@ class BaseInputGenerator(base_layer.BaseLayer):
           'between regular input batch and the passthrough batch.')
     self._tpu_infeed_op.append(tf.group(*enqueue_ops))
 
+  def CreateSinkOps(self):
+    """Creates ops consuming the preprocessed input batch on the local host.
+
+    Replaces CreateTpuEnqueueOps() to benchmark the input pipeline on hosts
+    without TPUs.
+    """
+    batch = self.GetPreprocessedInputBatch()
+    self._ProfileStage('sink', 'preprocess', batch)
+    self._tpu_infeed_op = [tf.group(batch)]
+
   def DequeueCpuPassthrough(self, concat=True):
     """Create CPU dequeue ops.
 
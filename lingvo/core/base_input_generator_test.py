@@ -185,6 +185,62 @@ class BaseInputGeneratorTest(test_utils.TestCase):
 
         self.assertEqual(batch.inp.shape.as_list(), [16, 3])
 
+  def testStageProfilingWithSink(self):
+
+    class FooInputGenerator(base_input_generator.BaseInputGenerator):
+
+      def _InputBatch(self):
+        return py_utils.NestedMap(
+            inp=tf.ones([4, 3], dtype=tf.float32),
+            text=tf.constant(['a', 'bc', 'def', '']))
+
+      def _PreprocessInputBatch(self, batch):
+        batch.ids = tf.zeros([4, 2], dtype=tf.int64)
+        return batch
+
+    with self.session() as sess:
+      input_generator = FooInputGenerator.Params().Instantiate()
+      input_generator.EnableStageProfiling()
+      input_generator.CreateSinkOps()
+      self.assertEqual(
+          {
+              'input_batch': 'start',
+              'preprocess': 'input_batch',
+              'sink': 'preprocess'
+          }, input_generator.stage_predecessors)
+      _, profile = sess.run(
+          [input_generator.tpu_infeed_op, input_generator.stage_profile])
+
+    self.assertEqual(['input_batch', 'preprocess', 'sink', 'start'],
+                     sorted(profile.keys()))
+    self.assertEqual([4 * 3 * 4 + 6], profile.input_batch.num_bytes)
+    self.assertEqual([4 * 3 * 4 + 6 + 4 * 2 * 8], profile.sink.num_bytes)
+    self.assertEqual([4], profile.input_batch.num_examples)
+    self.assertEqual([0], profile.start.num_examples)
+    timestamps = [
+        profile[stage].timestamp[0]
+        for stage in ['start', 'input_batch', 'preprocess', 'sink']
+    ]
+    self.assertEqual(sorted(timestamps), timestamps)
+
+  @flagsaver.flagsaver(xla_device='tpu', enable_asserts=False)
+  def testStageProfilingPerHostInfeed(self):
+
+    class FooInputGenerator(base_input_generator.BaseInputGenerator):
+
+      def _InputBatch(self):
+        return py_utils.NestedMap(
+            inp=tf.constant(1.0, shape=[128, 3], dtype=tf.float32))
+
+    with cluster_factory.ForTestingWorker(tpus=128, num_tpu_hosts=16):
+      p = FooInputGenerator.Params()
+      p.use_per_host_infeed = True
+      input_generator = p.Instantiate()
+      input_generator.EnableStageProfiling()
+      input_generator.CreateTpuEnqueueOps(benchmark_only=True)
+      for stage in ['start', 'input_batch', 'preprocess', 'sink']:
+        self.assertLen(input_generator.stage_profile[stage].timestamp, 16)
+
   def testGetPreprocessedBatchWithDatasource(self):
 
     class TestDataset(datasource.TFDatasetSource):
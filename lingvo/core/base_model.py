@@ -49,7 +49,8 @@ class DecodeFinalizeArgs(
   Attributes:
    decode_out_path: Path to where decoder outputs can be written.
    decode_out: A list of key value pairs aggregated from return values of.
-     PostProcessDecodeOut().
+     PostProcessDecodeOut(), or a decoder_lib.DecodeOutputReader over them if
+     they were already written to decode_out_path.
   """
 
 
@@ -237,6 +238,11 @@ class BaseTask(base_layer.BaseLayer):
         'checkpoint_finite_check', False,
         'Whether to santiy check variables to be finite when saving '
         'checkpoints. Currently only support custom saver.')
+    tp.Define(
+        'incremental_checkpointing', False,
+        'Whether to only write the checkpoint shards whose variables changed '
+        'since the previous checkpoint, and link the others from it. '
+        'Currently only support custom saver.')
     tp.Define(
         'keep_per_example_loss', False,
         'If True, checks if per-example metrics contain a key named \'loss\', '
@@ -332,6 +338,19 @@ class BaseTask(base_layer.BaseLayer):
     ep.Define(
         'decode_all_checkpoints', False,
         'Compute decoder metrics for every checkpoint saved by the Trainer.')
+    ep.Define(
+        'decoder_postprocess_pipeline_depth', 0,
+        'If > 0, the graph mode decoder post-processes decoder outputs on a '
+        'background thread while it fetches the next ones, with at most this '
+        'many fetched outputs waiting to be post-processed. If 0, fetching '
+        'and post-processing alternate on one thread.')
+    ep.Define(
+        'decode_out_chunk_size', 0,
+        'If > 0, the graph mode decoder streams decoder outputs to chunked '
+        'record files of this many key value pairs each, see '
+        'decoder_lib.DecodeOutputWriter, instead of buffering all of them in '
+        'memory. DecodeFinalize() then gets a decoder_lib.DecodeOutputReader '
+        'as decode_out.')
     return p
 
   @classmethod
@@ -998,6 +1017,9 @@ class BaseTask(base_layer.BaseLayer):
     """
     decode_out_path = decode_finalize_args.decode_out_path
     decode_out = decode_finalize_args.decode_out
+    if isinstance(decode_out, decoder_lib.DecodeOutputReader):
+      # Already written by the decoder.
+      return
     if decode_out:
       decoder_lib.WriteKeyValuePairs(decode_out_path, decode_out)
 
@@ -1208,6 +1230,11 @@ class BaseModel(base_layer.BaseLayer):
         'checkpoint_finite_check', False,
         'Whether to santiy check variables to be finite when saving '
         'checkpoints. Currently only support custom saver.')
+    tp.Define(
+        'incremental_checkpointing', False,
+        'Whether to only write the checkpoint shards whose variables changed '
+        'since the previous checkpoint, and link the others from it. '
+        'Currently only support custom saver.')
     return p
 
   def __init__(self, params, executor_ema=ExecutorEma()):
@@ -1411,6 +1438,7 @@ class SingleTaskModel(SingleTaskBase):
     tp.summary_interval_steps = p.task.train.summary_interval_steps
     tp.async_checkpointing = p.task.train.async_checkpointing
     tp.checkpoint_finite_check = p.task.train.checkpoint_finite_check
+    tp.incremental_checkpointing = p.task.train.incremental_checkpointing
     tp.ema_decay = p.task.train.ema_decay
     tp.ema_decay_moving_vars = p.task.train.ema_decay_moving_vars
     tp.ema_schedule = p.task.train.ema_schedule
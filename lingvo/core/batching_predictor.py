@@ -0,0 +1,448 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Dynamic request batching on top of a Predictor.
+
+Concurrent Run() calls for the same subgraph, fetches and feed signature are
+queued and concatenated along the batch (first) dimension, up to max_batch_size
+examples or until the oldest queued request has waited max_wait_secs. Each
+batch is run with a single Predictor.Run() call and the fetched results are
+split back per request.
+
+Example::
+
+  pred = predictor.Predictor(inference_graph, checkpoint=checkpoint)
+  batching_pred = batching_predictor.BatchingPredictor(
+      pred, max_batch_size=32, max_wait_secs=0.002)
+  # From many threads:
+  [topk_hyps] = batching_pred.Run(["topk_hyps"], src_strings=["Hello World"])
+  ...
+  tf.logging.info(batching_pred.Stats())
+  batching_pred.Close()
+
+All feeds and fetches of the batched subgraphs must have a leading batch
+dimension.
+"""
+
+import bisect
+import collections
+import concurrent.futures
+import functools
+import threading
+import time
+
+import lingvo.compat as tf
+from lingvo.core import py_utils
+import numpy as np
+
+# Bucket upper limits of the latency histograms, in seconds.
+_LATENCY_BUCKET_LIMITS = [
+    1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, 0.1, 0.2, 0.5, 1., 2.,
+    5., 10.
+]
+
+
+class Histogram:
+  """A thread-safe histogram of values in fixed buckets.
+
+  Bucket i counts the values v such that
+  bucket_limits[i - 1] < v <= bucket_limits[i]. The last bucket counts the
+  values larger than bucket_limits[-1].
+  """
+
+  def __init__(self, bucket_limits):
+    self._bucket_limits = list(bucket_limits)
+    self._counts = [0] * (len(self._bucket_limits) + 1)
+    self._num = 0
+    self._sum = 0.
+    self._max = None
+    self._lock = threading.Lock()
+
+  def Add(self, value):
+    with self._lock:
+      self._counts[bisect.bisect_left(self._bucket_limits, value)] += 1
+      self._num += 1
+      self._sum += value
+      self._max = value if self._max is None else max(self._max, value)
+
+  def _Percentile(self, q):
+    """Returns the upper limit of the bucket containing the q-th percentile."""
+    rank = q / 100. * self._num
+    cumulative = 0
+    for i, count in enumerate(self._counts):
+      cumulative += count
+      if count and cumulative >= rank:
+        return self._bucket_limits[i] if i < len(self._bucket_limits) else (
+            self._max)
+    return self._max
+
+  def Summary(self):
+    """Returns a NestedMap summarizing the values added so far."""
+    with self._lock:
+      return py_utils.NestedMap(
+          num=self._num,
+          mean=self._sum / self._num if self._num else 0.,
+          max=self._max,
+          p50=self._Percentile(50),
+          p90=self._Percentile(90),
+          p99=self._Percentile(99),
+          bucket_limits=list(self._bucket_limits),
+          bucket_counts=list(self._counts))
+
+
+class _Request:
+  """A Run() request waiting to be batched."""
+
+  def __init__(self, feeds, batch_size):
+    self.feeds = feeds
+    self.batch_size = batch_size
+    self.enqueue_time = time.time()
+    self.future = concurrent.futures.Future()
+
+
+class _BatchQueue:
+  """Queues requests with the same batch key and runs them in batches."""
+
+  def __init__(self, run_batch_fn, max_batch_size, max_wait_secs,
+               queue_depth_histogram):
+    self._run_batch_fn = run_batch_fn
+    self._max_batch_size = max_batch_size
+    self._max_wait_secs = max_wait_secs
+    self._queue_depth_histogram = queue_depth_histogram
+    self._pending = collections.deque()
+    self._pending_batch_size = 0
+    self._closed = False
+    self._cond = threading.Condition()
+    self._thread = threading.Thread(target=self._Loop, daemon=True)
+    self._thread.start()
+
+  def Put(self, request):
+    """Queues request. Returns False if the queue is closed."""
+    with self._cond:
+      if self._closed:
+        return False
+      self._pending.append(request)
+      self._pending_batch_size += request.batch_size
+      self._cond.notify()
+      return True
+
+  def Close(self):
+    with self._cond:
+      self._closed = True
+      self._cond.notify()
+    self._thread.join()
+
+  def _NextBatch(self):
+    """Waits for and dequeues the next batch of requests, or returns None."""
+    with self._cond:
+      while not self._pending and not self._closed:
+        self._cond.wait()
+      if not self._pending:
+        return None
+      deadline = self._pending[0].enqueue_time + self._max_wait_secs
+      while (self._pending_batch_size < self._max_batch_size and
+             not self._closed):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          break
+        self._cond.wait(remaining)
+
+      self._queue_depth_histogram.Add(len(self._pending))
+      # Always takes the first request, even if it is larger than
+      # max_batch_size on its own.
+      batch = [self._pending.popleft()]
+      batch_size = batch[0].batch_size
+      while (self._pending and batch_size + self._pending[0].batch_size <=
+             self._max_batch_size):
+        batch.append(self._pending.popleft())
+        batch_size += batch[-1].batch_size
+      self._pending_batch_size -= batch_size
+      return batch
+
+  def _Loop(self):
+    while True:
+      batch = self._NextBatch()
+      if batch is None:
+        return
+      self._run_batch_fn(batch)
+
+
+class BatchingPredictor:
+  """Batches concurrent Run() requests into fewer Predictor.Run() calls.
+
+  Requests are batched together only if they have the same subgraph, fetch
+  keys, feed keys, and feed dtypes and shapes apart from the batch dimension.
+  String feeds of any length have the same dtype. Each such group of requests
+  has its own queue, served by its own thread. At most max_num_queues queues
+  are kept: the least recently used one is closed in the background when a new
+  one is needed, e.g. for feeds of variable length.
+  """
+
+  def __init__(self,
+               predictor,
+               max_batch_size=64,
+               max_wait_secs=0.005,
+               pad_to_max_batch_size=False,
+               max_num_queues=32):
+    """Constructor.
+
+    Args:
+      predictor: A predictor.Predictor to run the batches with.
+      max_batch_size: Maximum number of examples of a batch. Requests larger
+        than this are run on their own.
+      max_wait_secs: Maximum time a request waits for other requests to be
+        batched with.
+      pad_to_max_batch_size: If True, batches smaller than max_batch_size are
+        padded to max_batch_size by repeating their last example, e.g. for
+        graphs compiled for a fixed batch size. The padding is dropped from the
+        results.
+      max_num_queues: Maximum number of request queues, and so of batching
+        threads.
+    """
+    assert max_batch_size > 0
+    assert max_wait_secs >= 0
+    assert max_num_queues > 0
+    self._predictor = predictor
+    self._max_batch_size = max_batch_size
+    self._max_wait_secs = max_wait_secs
+    self._pad_to_max_batch_size = pad_to_max_batch_size
+    self._max_num_queues = max_num_queues
+    # In least recently used order.
+    self._queues = collections.OrderedDict()
+    self._queues_lock = threading.Lock()
+    # Threads closing evicted queues.
+    self._closing_threads = []
+    self._closed = False
+
+    # Number of queued requests when a batch is formed.
+    self.queue_depth_histogram = Histogram(
+        [0, 1, 2, 4, 8, 16, 32, 64, 128, 256])
+    # Number of examples (excluding padding) of each batch.
+    self.batch_size_histogram = Histogram(
+        [2**i for i in range(max(max_batch_size - 1, 1).bit_length() + 1)])
+    # Time from Run() to results, and time spent in Predictor.Run().
+    self.request_latency_histogram = Histogram(_LATENCY_BUCKET_LIMITS)
+    self.run_latency_histogram = Histogram(_LATENCY_BUCKET_LIMITS)
+
+  @property
+  def predictor(self):
+    return self._predictor
+
+  def Stats(self):
+    """Returns a NestedMap of summaries of the batching histograms."""
+    return py_utils.NestedMap(
+        queue_depth=self.queue_depth_histogram.Summary(),
+        batch_size=self.batch_size_histogram.Summary(),
+        request_latency=self.request_latency_histogram.Summary(),
+        run_latency=self.run_latency_histogram.Summary())
+
+  @property
+  def num_queues(self):
+    with self._queues_lock:
+      return len(self._queues)
+
+  def _Enqueue(self, subgraph_name, fetch_keys, request):
+    """Puts request in the queue of its batch key, creating it if needed."""
+    key = (subgraph_name, fetch_keys,
+           tuple((k, v.dtype, v.shape[1:])
+                 for k, v in sorted(request.feeds.items())))
+    while True:
+      with self._queues_lock:
+        if self._closed:
+          raise RuntimeError("BatchingPredictor is closed.")
+        queue = self._queues.get(key)
+        if queue is None:
+          if len(self._queues) >= self._max_num_queues:
+            _, evicted = self._queues.popitem(last=False)
+            # Runs the requests already in the evicted queue and stops its
+            # thread, without delaying this request.
+            self._CloseInBackground(evicted)
+          queue = _BatchQueue(
+              functools.partial(self._RunBatch, subgraph_name, fetch_keys),
+              self._max_batch_size, self._max_wait_secs,
+              self.queue_depth_histogram)
+          self._queues[key] = queue
+        else:
+          self._queues.move_to_end(key)
+      # Fails if the queue was evicted since it was looked up.
+      if queue.Put(request):
+        return
+
+  def _CloseInBackground(self, queue):
+    """Closes queue from a new thread, joined by Close().
+
+    Must be called with _queues_lock held.
+
+    Args:
+      queue: The _BatchQueue to close.
+    """
+    self._closing_threads = [t for t in self._closing_threads if t.is_alive()]
+    thread = threading.Thread(target=queue.Close, daemon=True)
+    thread.start()
+    self._closing_threads.append(thread)
+
+  def RunAsync(self, fetch_keys, subgraph_name=None, **kwargs):
+    """Queues a request and returns a concurrent.futures.Future of its results.
+
+    Args:
+      fetch_keys: A list of keys in the fetch dictionary to fetch, or a single
+        key.
+      subgraph_name: Optional string of the subgraph to use.
+      **kwargs: a dict of inputs to feed. All inputs must have the same size in
+        their first (batch) dimension.
+
+    Returns:
+      A Future whose result is as returned by Predictor.Run().
+
+    Raises:
+      KeyError: a feed or fetch is invalid.
+      ValueError: the feeds do not have the same batch size.
+    """
+    single_fetch = not isinstance(fetch_keys, (list, type(dict().keys())))
+    if single_fetch:
+      fetch_keys = [fetch_keys]
+    fetch_keys = tuple(fetch_keys)
+
+    # Validates requests here so that an invalid request does not fail the
+    # other requests it is batched with.
+    if subgraph_name:
+      valid_fetch_keys = self._predictor.subgraph_fetch_keys(subgraph_name)
+      valid_feed_keys = self._predictor.subgraph_feed_keys(subgraph_name)
+    else:
+      valid_fetch_keys = self._predictor.fetch_keys
+      valid_feed_keys = self._predictor.feed_keys
+    for k in fetch_keys:
+      if k not in valid_fetch_keys:
+        raise KeyError(
+            f"{k} is not in the list of available fetches. Available keys: "
+            f"{valid_fetch_keys}.")
+    for k in kwargs:
+      if k not in valid_feed_keys:
+        raise KeyError(
+            f"{k} is not in the list of available feeds. Available keys: "
+            f"{valid_feed_keys}.")
+    if not kwargs:
+      raise ValueError("BatchingPredictor requires at least one feed.")
+
+    feeds = {k: _AsFeedArray(v) for k, v in kwargs.items()}
+    batch_sizes = {v.shape[0] if v.ndim else None for v in feeds.values()}
+    if len(batch_sizes) != 1 or None in batch_sizes:
+      raise ValueError(
+          "All feeds must have the same batch (first) dimension, got shapes "
+          f"{ {k: v.shape for k, v in feeds.items()} }.")
+    request = _Request(feeds, batch_sizes.pop())
+
+    self._Enqueue(subgraph_name, fetch_keys, request)
+    if not single_fetch:
+      return request.future
+    future = concurrent.futures.Future()
+    request.future.add_done_callback(lambda f: _ChainFirstResult(f, future))
+    return future
+
+  def Run(self, fetch_keys, subgraph_name=None, **kwargs):
+    """Runs a request batched with concurrent requests.
+
+    Args:
+      fetch_keys: A list of keys in the fetch dictionary to fetch, or a single
+        key.
+      subgraph_name: Optional string of the subgraph to use.
+      **kwargs: a dict of inputs to feed. All inputs must have the same size in
+        their first (batch) dimension.
+
+    Returns:
+      A list of predictions corresponding to the order of fetch_keys, or a
+      single prediction if fetch_keys is a single key.
+    """
+    return self.RunAsync(fetch_keys, subgraph_name, **kwargs).result()
+
+  def _RunBatch(self, subgraph_name, fetch_keys, requests):
+    """Runs requests as a single batch and sets their results."""
+    sizes = [r.batch_size for r in requests]
+    total_size = sum(sizes)
+    self.batch_size_histogram.Add(total_size)
+    num_padding = 0
+    if self._pad_to_max_batch_size and total_size < self._max_batch_size:
+      num_padding = self._max_batch_size - total_size
+
+    start = time.time()
+    try:
+      feeds = {}
+      for k in requests[0].feeds:
+        values = [r.feeds[k] for r in requests]
+        if num_padding:
+          values.append(np.repeat(values[-1][-1:], num_padding, axis=0))
+        feeds[k] = values[0] if len(values) == 1 else np.concatenate(values)
+      results = self._predictor.Run(
+          list(fetch_keys), subgraph_name=subgraph_name, **feeds)
+      for key, result in zip(fetch_keys, results):
+        if np.ndim(result) < 1 or len(result) != total_size + num_padding:
+          raise ValueError(
+              f"Fetch {key} of shape {np.shape(result)} does not have a batch "
+              f"dimension of size {total_size + num_padding}.")
+    except Exception as e:  # pylint: disable=broad-except
+      tf.logging.error("Batch of %d requests failed: %s", len(requests), e)
+      for r in requests:
+        r.future.set_exception(e)
+      return
+    finally:
+      self.run_latency_histogram.Add(time.time() - start)
+
+    now = time.time()
+    offset = 0
+    for r, size in zip(requests, sizes):
+      r.future.set_result(
+          [result[offset:offset + size] for result in results])
+      offset += size
+      self.request_latency_histogram.Add(now - r.enqueue_time)
+
+  def Close(self):
+    """Runs the queued requests and stops the batching threads."""
+    with self._queues_lock:
+      self._closed = True
+      queues = list(self._queues.values())
+      closing_threads = list(self._closing_threads)
+    for queue in queues:
+      queue.Close()
+    for thread in closing_threads:
+      thread.join()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.Close()
+
+
+def _AsFeedArray(value):
+  """Returns value as a numpy array to batch with other feeds of its dtype.
+
+  Fixed-width string arrays are converted to object arrays: their dtype, e.g.
+  <U7, depends on the length of their longest string, which would otherwise
+  prevent requests with strings of different lengths from being batched.
+
+  Args:
+    value: A feed value.
+  """
+  value = np.asarray(value)
+  if value.dtype.kind in "US":
+    value = value.astype(object)
+  return value
+
+
+def _ChainFirstResult(src, dst):
+  """Sets the result of dst to the first result of src."""
+  if src.exception() is not None:
+    dst.set_exception(src.exception())
+  else:
+    dst.set_result(src.result()[0])
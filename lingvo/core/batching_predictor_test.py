@@ -0,0 +1,204 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for lingvo.core.batching_predictor."""
+
+import concurrent.futures
+import threading
+from unittest import mock
+
+import lingvo.compat as tf
+from lingvo.core import base_input_generator
+from lingvo.core import base_model
+from lingvo.core import batching_predictor
+from lingvo.core import inference_graph_exporter
+from lingvo.core import inference_graph_pb2
+from lingvo.core import predictor
+from lingvo.core import test_utils
+import numpy as np
+
+
+class DummyModel(base_model.BaseTask):
+
+  def Inference(self):
+    with tf.name_scope('inference'):
+      feed1 = tf.placeholder(name='feed1_node', dtype=tf.float32, shape=[None])
+      fetch1 = tf.identity(feed1 * 2., name='fetch1_node')
+      fetch2 = tf.identity(
+          tf.fill([tf.shape(feed1)[0]], tf.shape(feed1)[0]), name='fetch2_node')
+      feed3 = tf.placeholder(name='feed3_node', dtype=tf.float32, shape=[4])
+      fetch3 = tf.identity(feed3, name='fetch3_node')
+      inference_graph = inference_graph_pb2.InferenceGraph()
+      subgraph = inference_graph.subgraphs['default']
+      subgraph.feeds['feed1'] = feed1.name
+      subgraph.fetches['fetch1'] = fetch1.name
+      subgraph.fetches['batch_size'] = fetch2.name
+      subgraph = inference_graph.subgraphs['fixed_batch_size']
+      subgraph.feeds['feed1'] = feed3.name
+      subgraph.fetches['fetch1'] = fetch3.name
+      feed4 = tf.placeholder(name='feed4_node', dtype=tf.string, shape=[None])
+      fetch4 = tf.identity(tf.strings.length(feed4), name='fetch4_node')
+      fetch5 = tf.identity(
+          tf.fill([tf.shape(feed4)[0]], tf.shape(feed4)[0]), name='fetch5_node')
+      subgraph = inference_graph.subgraphs['strings']
+      subgraph.feeds['feed1'] = feed4.name
+      subgraph.fetches['length'] = fetch4.name
+      subgraph.fetches['batch_size'] = fetch5.name
+      return inference_graph
+
+
+class BatchingPredictorTest(test_utils.TestCase):
+
+  def _Predictor(self):
+    p = base_model.SingleTaskModel.Params(DummyModel.Params().Set(name='test'))
+    p.input = base_input_generator.BaseInputGenerator.Params().Set(name='test')
+    inference_graph = inference_graph_exporter.InferenceGraphExporter.Export(p)
+    return predictor.Predictor(inference_graph)
+
+  def testRun(self):
+    with batching_predictor.BatchingPredictor(self._Predictor()) as pred:
+      self.assertAllEqual([2., 4.], pred.Run('fetch1', feed1=[1., 2.]))
+      fetch1, batch_size = pred.Run(['fetch1', 'batch_size'], feed1=[3.])
+      self.assertAllEqual([6.], fetch1)
+      self.assertAllEqual([1], batch_size)
+
+  def testConcurrentRequestsAreBatched(self):
+    num_requests = 16
+    pred = batching_predictor.BatchingPredictor(
+        self._Predictor(), max_batch_size=8, max_wait_secs=10.)
+    with concurrent.futures.ThreadPoolExecutor(num_requests) as executor:
+      futures = [
+          executor.submit(pred.Run, ['fetch1', 'batch_size'], feed1=[float(i)])
+          for i in range(num_requests)
+      ]
+      results = [f.result() for f in futures]
+    pred.Close()
+
+    for i, (fetch1, batch_size) in enumerate(results):
+      self.assertAllEqual([2. * i], fetch1)
+      # max_wait_secs is large enough for full batches to form.
+      self.assertAllEqual([8], batch_size)
+    stats = pred.Stats()
+    self.assertEqual(2, stats.batch_size.num)
+    self.assertEqual(8, stats.batch_size.max)
+    self.assertEqual(num_requests, stats.request_latency.num)
+    self.assertEqual(2, stats.run_latency.num)
+
+  def testMaxWaitSecs(self):
+    with batching_predictor.BatchingPredictor(
+        self._Predictor(), max_batch_size=8, max_wait_secs=0.) as pred:
+      future1 = pred.RunAsync('batch_size', feed1=[1., 2.])
+      self.assertAllEqual([2, 2], future1.result())
+      future2 = pred.RunAsync('batch_size', feed1=[3.])
+      self.assertAllEqual([1], future2.result())
+
+  def testLargeRequestIsRunAlone(self):
+    with batching_predictor.BatchingPredictor(
+        self._Predictor(), max_batch_size=2) as pred:
+      self.assertAllEqual([3, 3, 3], pred.Run('batch_size', feed1=[1., 2., 3.]))
+
+  def testPadToMaxBatchSize(self):
+    with batching_predictor.BatchingPredictor(
+        self._Predictor(), max_batch_size=4,
+        pad_to_max_batch_size=True) as pred:
+      self.assertAllEqual([1., 2.],
+                          pred.Run(
+                              'fetch1',
+                              feed1=[1., 2.],
+                              subgraph_name='fixed_batch_size'))
+      stats = pred.Stats()
+      self.assertEqual(1, stats.batch_size.num)
+      self.assertEqual(2, stats.batch_size.max)
+
+  def testNumQueuesIsBounded(self):
+    num_threads = threading.active_count()
+    with batching_predictor.BatchingPredictor(
+        self._Predictor(), max_num_queues=2) as pred:
+      for _ in range(2):
+        # Each request has a different batch key, as would feeds of variable
+        # length.
+        for dtype in [np.float32, np.float64, np.int32]:
+          for fetch_keys in [['fetch1', 'batch_size'], ['batch_size', 'fetch1']]:
+            fetch1, batch_size = pred.Run(
+                fetch_keys, feed1=np.array([1, 2], dtype))
+            if fetch_keys[0] == 'batch_size':
+              fetch1, batch_size = batch_size, fetch1
+            self.assertAllEqual([2., 4.], fetch1)
+            self.assertAllEqual([2, 2], batch_size)
+            self.assertLessEqual(pred.num_queues, 2)
+    self.assertEqual(num_threads, threading.active_count())
+
+  def testStringsOfDifferentLengthsAreBatched(self):
+    with batching_predictor.BatchingPredictor(
+        self._Predictor(), max_batch_size=2, max_wait_secs=10.) as pred:
+      future1 = pred.RunAsync(['length', 'batch_size'],
+                              subgraph_name='strings',
+                              feed1=['Hello'])
+      future2 = pred.RunAsync(['length', 'batch_size'],
+                              subgraph_name='strings',
+                              feed1=np.array(['Hello World!']))
+      self.assertAllEqual([[5], [2]], future1.result())
+      self.assertAllEqual([[12], [2]], future2.result())
+      self.assertEqual(1, pred.num_queues)
+      self.assertEqual(1, pred.Stats().batch_size.num)
+
+  def testEvictionDoesNotWaitForEvictedQueue(self):
+    pred = self._Predictor()
+    run = pred.Run
+    unblock = threading.Event()
+
+    def _Run(fetch_keys, subgraph_name=None, **kwargs):
+      if kwargs['feed1'].dtype == np.float32:
+        unblock.wait()
+      return run(fetch_keys, subgraph_name=subgraph_name, **kwargs)
+
+    with mock.patch.object(pred, 'Run', side_effect=_Run):
+      with batching_predictor.BatchingPredictor(
+          pred, max_wait_secs=0., max_num_queues=1) as batching_pred:
+        # Its batch is running until unblock is set.
+        future = batching_pred.RunAsync(
+            'fetch1', feed1=np.array([1.], np.float32))
+        # Evicts the queue of the blocked request.
+        self.assertAllEqual([4.],
+                            batching_pred.Run(
+                                'fetch1', feed1=np.array([2.], np.float64)))
+        self.assertFalse(future.done())
+        unblock.set()
+        self.assertAllEqual([2.], future.result())
+
+  def testInvalidRequests(self):
+    with batching_predictor.BatchingPredictor(self._Predictor()) as pred:
+      with self.assertRaisesRegex(KeyError, 'nonexistent'):
+        pred.Run('nonexistent', feed1=[1.])
+      with self.assertRaisesRegex(KeyError, 'nonexistent'):
+        pred.Run('fetch1', nonexistent=[1.])
+      with self.assertRaisesRegex(ValueError, 'batch'):
+        pred.Run('fetch1', feed1=1.)
+
+  def testHistogram(self):
+    histogram = batching_predictor.Histogram([1, 2, 4])
+    for v in [0, 1, 2, 3, 3, 10]:
+      histogram.Add(v)
+    summary = histogram.Summary()
+    self.assertEqual(6, summary.num)
+    self.assertEqual(10, summary.max)
+    self.assertAllClose(19. / 6, summary.mean)
+    self.assertEqual([2, 1, 2, 1], summary.bucket_counts)
+    self.assertEqual(2, summary.p50)
+    self.assertEqual(10, summary.p99)
+    self.assertEqual(0, batching_predictor.Histogram([1]).Summary().num)
+
+
+if __name__ == '__main__':
+  test_utils.main()
@@ -97,7 +97,8 @@ class SaverWrapper:
           sanity_checks=sanity_checks,
           keep_latest_n=self._keep_latest_n,
           keep_every_n_hours=self._keep_every_n_hours,
-          async_save=async_save)
+          async_save=async_save,
+          incremental_save=train_params.incremental_checkpointing)
 
   def Save(self, sess, gsteps):
     """Save a checkpoint.
@@ -14,6 +14,7 @@
 # ==============================================================================
 """Helpers for the decoding phase of jobs."""
 
+import hashlib
 import pickle
 
 import lingvo.compat as tf
@@ -42,3 +43,176 @@ def SerializeOutputs(nmap: py_utils.NestedMap) -> bytes:
     record.fields[key].CopyFrom(tf.make_tensor_proto(value))
   serialized = record.SerializeToString()
   return serialized
+
+
+def CheckpointFingerprint(checkpoint_path):
+  """Returns a fingerprint of the contents of a checkpoint.
+
+  The index file of a checkpoint holds the checksum of every tensor, so it
+  identifies the checkpoint contents without reading the data files.
+
+  Args:
+    checkpoint_path: The checkpoint prefix, e.g. /path/to/ckpt-123.
+  """
+  index_path = checkpoint_path + '.index'
+  if tf.io.gfile.exists(index_path):
+    with tf.io.gfile.GFile(index_path, 'rb') as f:
+      return hashlib.sha256(f.read()).hexdigest()[:32]
+  return hashlib.sha256(checkpoint_path.encode('utf-8')).hexdigest()[:32]
+
+
+def DecodeFingerprint(params, checkpoint_path):
+  """Returns a fingerprint of decoding with `params` and `checkpoint_path`."""
+  key = '\n'.join([params.ToText(), CheckpointFingerprint(checkpoint_path)])
+  return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def _ChunkPath(filename, chunk_id):
+  return '%s.chunk-%06d' % (filename, chunk_id)
+
+
+def _ChunkPaths(filename):
+  """Returns the paths of the consecutive chunks of `filename`, in order."""
+  existing = set(tf.io.gfile.glob(filename + '.chunk-*'))
+  paths = []
+  while _ChunkPath(filename, len(paths)) in existing:
+    paths.append(_ChunkPath(filename, len(paths)))
+  return paths
+
+
+class DecodeOutputWriter:
+  """Writes decoder output key value pairs to chunked record files.
+
+  Instead of pickling all key value pairs at once, pairs are pickled one by one
+  and written every `chunk_size` pairs to a new TFRecord file
+  `<filename>.chunk-<N>`. Each chunk is first written to a temporary file and
+  then renamed, so chunks are either complete or absent, and at most
+  `chunk_size` pairs are buffered in memory.
+
+  Next to the chunks, `<filename>.chunk-fingerprint` holds the fingerprint of
+  the decode producing them, and `<filename>.chunk-complete` is written by
+  Close() once all pairs have been written. A later writer only resumes from
+  the chunks of an incomplete decode with the same fingerprint.
+
+  Use DecodeOutputReader to read the pairs back.
+  """
+
+  def __init__(self, filename, chunk_size=1000, resume=False, fingerprint=''):
+    """Constructor.
+
+    Args:
+      filename: Path prefix of the chunk files.
+      chunk_size: Number of key value pairs per chunk.
+      resume: If True and the existing chunks of `filename` are those of an
+        incomplete decode with the same `fingerprint`, keeps them and skips the
+        first num_resumed_records writes, assuming that the decoder outputs are
+        written again in the same order, e.g. after a restart. Otherwise,
+        deletes the existing chunks.
+      fingerprint: A fingerprint of the decode, e.g. from DecodeFingerprint().
+        Decodes with different fingerprints never resume from each other.
+    """
+    assert chunk_size > 0
+    self._filename = filename
+    self._chunk_size = chunk_size
+    self._buffer = []
+    if resume and not self._CanResume(fingerprint):
+      tf.logging.info('Not resuming the decoder outputs at %s: they are '
+                      'complete or of a different decode.', filename)
+      resume = False
+    if resume:
+      chunk_paths = _ChunkPaths(filename)
+      self._num_chunks = len(chunk_paths)
+      self._num_resumed_records = sum(
+          sum(1 for _ in tf.io.tf_record_iterator(path))
+          for path in chunk_paths)
+    else:
+      for path in tf.io.gfile.glob(filename + '.chunk-*'):
+        tf.io.gfile.remove(path)
+      with tf.io.gfile.GFile(self._FingerprintPath(), 'w') as f:
+        f.write(fingerprint)
+      self._num_chunks = 0
+      self._num_resumed_records = 0
+    self._num_skipped_records = 0
+    self._num_written_records = 0
+
+  def _FingerprintPath(self):
+    return self._filename + '.chunk-fingerprint'
+
+  def _CompletePath(self):
+    return self._filename + '.chunk-complete'
+
+  def _CanResume(self, fingerprint):
+    if (tf.io.gfile.exists(self._CompletePath()) or
+        not tf.io.gfile.exists(self._FingerprintPath())):
+      return False
+    with tf.io.gfile.GFile(self._FingerprintPath(), 'r') as f:
+      return f.read() == fingerprint
+
+  @property
+  def num_resumed_records(self):
+    return self._num_resumed_records
+
+  @property
+  def num_records(self):
+    """Number of key value pairs written or resumed so far."""
+    return self._num_resumed_records + self._num_written_records
+
+  def Write(self, key, value):
+    """Writes one key value pair."""
+    if self._num_skipped_records < self._num_resumed_records:
+      self._num_skipped_records += 1
+      return
+    self._buffer.append(
+        pickle.dumps((key, value), protocol=pickle.HIGHEST_PROTOCOL))
+    self._num_written_records += 1
+    if len(self._buffer) >= self._chunk_size:
+      self.Flush()
+
+  def Extend(self, key_value_pairs):
+    """Writes an iterable of key value pairs."""
+    for key, value in key_value_pairs:
+      self.Write(key, value)
+
+  def Flush(self):
+    """Writes the buffered key value pairs to a new chunk."""
+    if not self._buffer:
+      return
+    path = _ChunkPath(self._filename, self._num_chunks)
+    tmp_path = path + '.tmp'
+    with tf.io.TFRecordWriter(tmp_path) as writer:
+      for record in self._buffer:
+        writer.write(record)
+    tf.io.gfile.rename(tmp_path, path, overwrite=True)
+    self._num_chunks += 1
+    self._buffer = []
+
+  def Close(self):
+    """Flushes the buffered pairs and marks the decoder outputs complete."""
+    self.Flush()
+    with tf.io.gfile.GFile(self._CompletePath(), 'w') as f:
+      f.write('')
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, *args):
+    if exc_type is None:
+      self.Close()
+    else:
+      self.Flush()
+
+
+class DecodeOutputReader:
+  """Lazily iterates over the key value pairs written by DecodeOutputWriter."""
+
+  def __init__(self, filename):
+    self._filename = filename
+
+  @property
+  def filename(self):
+    return self._filename
+
+  def __iter__(self):
+    for path in _ChunkPaths(self._filename):
+      for record in tf.io.tf_record_iterator(path):
+        yield pickle.loads(record)
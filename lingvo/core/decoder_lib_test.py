@@ -0,0 +1,104 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for decoder_lib."""
+
+import os
+
+import lingvo.compat as tf
+from lingvo.core import decoder_lib
+from lingvo.core import hyperparams
+from lingvo.core import test_utils
+import numpy as np
+
+
+class DecodeOutputWriterTest(test_utils.TestCase):
+
+  def _Pairs(self, n):
+    return [('key%d' % i, {'ids': np.arange(i)}) for i in range(n)]
+
+  def _AssertPairsEqual(self, expected, actual):
+    self.assertEqual([k for k, _ in expected], [k for k, _ in actual])
+    for (_, expected_value), (_, value) in zip(expected, actual):
+      self.assertAllEqual(expected_value['ids'], value['ids'])
+
+  def testWriteAndRead(self):
+    filename = os.path.join(self.get_temp_dir(), 'decoder_out')
+    pairs = self._Pairs(7)
+    with decoder_lib.DecodeOutputWriter(filename, chunk_size=3) as writer:
+      writer.Extend(pairs[:2])
+      # Nothing is written before a chunk is full.
+      self.assertEmpty(list(decoder_lib.DecodeOutputReader(filename)))
+      writer.Extend(pairs[2:])
+      self.assertEqual(7, writer.num_records)
+      self._AssertPairsEqual(pairs[:6],
+                             list(decoder_lib.DecodeOutputReader(filename)))
+    self.assertLen(tf.io.gfile.glob(filename + '.chunk-0*'), 3)
+    self._AssertPairsEqual(pairs, list(decoder_lib.DecodeOutputReader(filename)))
+
+  def testResume(self):
+    filename = os.path.join(self.get_temp_dir(), 'decoder_out')
+    pairs = self._Pairs(10)
+    writer = decoder_lib.DecodeOutputWriter(
+        filename, chunk_size=4, fingerprint='a')
+    # Preempted after writing 5 pairs, only the first chunk is complete.
+    writer.Extend(pairs[:5])
+
+    # A different decode, e.g. with other params, starts from scratch.
+    writer = decoder_lib.DecodeOutputWriter(
+        filename, chunk_size=4, resume=True, fingerprint='b')
+    self.assertEqual(0, writer.num_resumed_records)
+    writer.Extend(pairs[:5])
+
+    writer = decoder_lib.DecodeOutputWriter(
+        filename, chunk_size=4, resume=True, fingerprint='b')
+    self.assertEqual(4, writer.num_resumed_records)
+    writer.Extend(pairs)
+    writer.Close()
+    self.assertEqual(10, writer.num_records)
+    self._AssertPairsEqual(pairs, list(decoder_lib.DecodeOutputReader(filename)))
+
+    # Complete outputs are decoded again rather than resumed.
+    with decoder_lib.DecodeOutputWriter(
+        filename, chunk_size=4, resume=True, fingerprint='b') as writer:
+      self.assertEqual(0, writer.num_resumed_records)
+      writer.Extend(pairs[:3])
+    self._AssertPairsEqual(pairs[:3],
+                           list(decoder_lib.DecodeOutputReader(filename)))
+
+    # Without resume, existing chunks are deleted.
+    with decoder_lib.DecodeOutputWriter(filename, chunk_size=4) as writer:
+      writer.Extend(pairs[:2])
+    self._AssertPairsEqual(pairs[:2],
+                           list(decoder_lib.DecodeOutputReader(filename)))
+
+  def testDecodeFingerprint(self):
+    ckpt = os.path.join(self.get_temp_dir(), 'ckpt-1')
+    with open(ckpt + '.index', 'wb') as f:
+      f.write(b'index1')
+    p = hyperparams.Params()
+    p.Define('beam_size', 4, '')
+    fingerprint = decoder_lib.DecodeFingerprint(p, ckpt)
+    self.assertEqual(fingerprint, decoder_lib.DecodeFingerprint(p, ckpt))
+    # A different checkpoint at the same path.
+    with open(ckpt + '.index', 'wb') as f:
+      f.write(b'index2')
+    self.assertNotEqual(fingerprint, decoder_lib.DecodeFingerprint(p, ckpt))
+    fingerprint = decoder_lib.DecodeFingerprint(p, ckpt)
+    p.beam_size = 8
+    self.assertNotEqual(fingerprint, decoder_lib.DecodeFingerprint(p, ckpt))
+
+
+if __name__ == '__main__':
+  test_utils.main()
@@ -15,6 +15,7 @@
 """Defines Params base class, used for defining class/function parameters."""
 
 import ast
+import contextlib
 import copy
 import dataclasses
 import enum
@@ -23,6 +24,7 @@ import inspect
 import pickle
 import re
 import sys
+import threading
 import types
 import typing
 from typing import (
@@ -119,6 +121,63 @@ def _IsNamedTuple(x):
   return isinstance(x, tuple) and hasattr(x, '_fields')
 
 
+# Values of these types are never modified in place, so copies of Params can
+# share them instead of deep copying them.
+_IMMUTABLE_TYPES = (type(None), bool, int, float, complex, str, bytes, type,
+                    types.FunctionType, types.BuiltinFunctionType, enum.Enum)
+
+
+def _IsImmutable(value):
+  """Returns whether `value` can be shared between copies of a Params."""
+  if isinstance(value, _IMMUTABLE_TYPES):
+    return True
+  # Not namedtuples, which deepcopy reconstructs.
+  if type(value) is tuple:  # pylint: disable=unidiomatic-typecheck
+    return all(_IsImmutable(v) for v in value)
+  return False
+
+
+# Whether Params.Copy() in this thread shares the parameters of the copied
+# Params until one of the two is modified. See CopyOnWrite().
+_copy_on_write = threading.local()
+
+
+def _IsCopyOnWrite() -> bool:
+  return getattr(_copy_on_write, 'enabled', False)
+
+
+@contextlib.contextmanager
+def CopyOnWrite(enabled: bool = True):
+  """Context manager making Params.Copy() copy-on-write in this thread.
+
+  In copy-on-write mode, a copy initially shares the parameters of the copied
+  Params. The first time either one is modified, or hands out a mutable value
+  such as a nested Params or a list, it makes its own copy of the parameters at
+  that level only. Nested Params are copied the same way, so subtrees that are
+  never touched, such as most layer templates during model construction, are
+  never copied.
+
+  Copies are independent, as with a deep copy. A Params that handed out or was
+  given a mutable value, to which a reference may have been kept, copies its own
+  level right away when copied; e.g. `p.sub = sub; q = p.Copy()` gives q a
+  copy-on-write copy of `sub`, so later changes to `sub` do not affect `q.sub`.
+
+  The mode only applies to the calling thread, and contexts can be nested.
+
+  Args:
+    enabled: Whether Params.Copy() is copy-on-write in this context.
+
+  Yields:
+    None.
+  """
+  previous = _IsCopyOnWrite()
+  _copy_on_write.enabled = enabled
+  try:
+    yield
+  finally:
+    _copy_on_write.enabled = previous
+
+
 class _SortedDict(dict):
   """A dict with a __repr__ that is always sorted by key."""
 
@@ -194,6 +253,27 @@ class _Param:
     return self._default_value
 
 
+class _CopyOnWriteState:
+  """Number of Params sharing the same dict of _Param under copy-on-write."""
+
+  def __init__(self):
+    self.num_owners = 1
+
+
+def _CopyParamDict(params):
+  """Copies a dict of name => _Param, deep copying only the mutable values."""
+  memo = {}
+  res = {}
+  for name, param in params.items():
+    # pylint: disable=protected-access
+    if _IsImmutable(param._value):
+      res[name] = _Param(name, param._value, param._description)
+    else:
+      res[name] = copy.deepcopy(param, memo)
+    # pylint: enable=protected-access
+  return res
+
+
 def CopyFieldsTo(from_p, to_p, skip=None, ignore_unknown_keys=False):
   """Copy fields from one Params to another, with optional skipped params.
 
@@ -272,40 +352,84 @@ class Params:
 
   def __init__(self) -> None:
     self.__dict__['_immutable'] = False
-    self._params = {}  # name => _Param
+    self.__dict__['_param_dict'] = {}  # name => _Param
+    # Shared with the other Params using the same _param_dict, when copied in
+    # copy-on-write mode. None if _param_dict is not shared.
+    self.__dict__['_cow'] = None
+    # Whether mutable values in _param_dict may be referenced from outside, in
+    # which case _param_dict can not be shared by a copy-on-write copy.
+    self.__dict__['_escaped'] = False
+
+  @property
+  def _params(self) -> Dict[str, _Param]:
+    """The dict of name => _Param, owned by this Params."""
+    params = self._OwnParams()
+    self.__dict__['_escaped'] = True
+    return params
+
+  def _OwnParams(self) -> Dict[str, _Param]:
+    """Returns _param_dict, after copying it if it is shared."""
+    cow = self.__dict__['_cow']
+    if cow is not None:
+      self.__dict__['_cow'] = None
+      cow.num_owners -= 1
+      if cow.num_owners:
+        self.__dict__['_param_dict'] = _CopyParamDict(
+            self.__dict__['_param_dict'])
+      # Mutable values of a shared dict are never handed out.
+      self.__dict__['_escaped'] = False
+    return self.__dict__['_param_dict']
 
   def __setattr__(self, name: str, value: Any) -> None:
     if self._immutable:
       raise TypeError('This Params instance is immutable.')
-    if name == '_params' or name == '_immutable':
+    if name == '_params':
+      self._OwnParams()
+      self.__dict__['_param_dict'] = value
+      self.__dict__['_escaped'] = True
+    elif name == '_immutable':
       self.__dict__[name] = value
     else:
       try:
-        self._params[name].Set(value)
+        self._OwnParams()[name].Set(value)
       except KeyError:
         raise AttributeError(self._KeyErrorString(name))
+      self._MarkEscapedIfMutable(value)
+
+  def _MarkEscapedIfMutable(self, value: Any) -> None:
+    """Marks self as escaped if it now holds a mutable value from outside."""
+    # The caller may keep a reference to `value` and modify it later, which
+    # must not affect copies made in the meantime.
+    if not _IsImmutable(value):
+      self.__dict__['_escaped'] = True
 
   def __getattr__(self, name: str) -> Any:
-    if name == '_params' or name == '_immutable':
-      return self.__dict__[name]
+    params = self.__dict__.get('_param_dict')
+    if params is None or name in ('_immutable', '_cow', '_escaped'):
+      # cPickle expects __getattr__ to raise AttributeError, not KeyError.
+      raise AttributeError(name)
     try:
-      return self._params[name].Get()
+      value = params[name].Get()
     except KeyError:
-      # cPickle expects __getattr__ to raise AttributeError, not KeyError.
       raise AttributeError(self._KeyErrorString(name))
+    if not _IsImmutable(value):
+      # The caller may modify the value: it must be our own copy.
+      value = self._OwnParams()[name].Get()
+      self.__dict__['_escaped'] = True
+    return value
 
   def __dir__(self) -> List[str]:
-    return sorted(self._params.keys())
+    return sorted(self._param_dict.keys())
 
   def __contains__(self, name: str) -> bool:
-    return name in self._params
+    return name in self._param_dict
 
   def __len__(self) -> int:
-    return len(self._params)
+    return len(self._param_dict)
 
   # Note: This gets called by _Param.__eq__() on nested Params objects.
   def __eq__(self, other: 'Params') -> bool:
-    return isinstance(other, Params) and self._params == other._params  # pylint: disable=protected-access
+    return isinstance(other, Params) and self._param_dict == other._param_dict  # pylint: disable=protected-access
 
   def __ne__(self, other: 'Params') -> bool:
     return not self == other
@@ -316,7 +440,8 @@ class Params:
   def _ToString(self, nested_depth: int) -> str:
     # Note: We use iteritems() below so as to sort by name.
     sorted_param_strs = [
-        v.ToString(nested_depth + 1) for (_, v) in sorted(self._params.items())
+        v.ToString(nested_depth + 1)
+        for (_, v) in sorted(self._param_dict.items())
     ]
     nested_indent = '  ' * nested_depth
     return '{\n%s\n%s}' % ('\n'.join(sorted_param_strs), nested_indent)
@@ -342,25 +467,34 @@ class Params:
         return float(matches) / trials
       return 0
 
-    if '_params' in self.__dict__:
-      return [key for key in self._params if _Overlaps(name, key) > 0.5]
+    if '_param_dict' in self.__dict__:
+      return [key for key in self._param_dict if _Overlaps(name, key) > 0.5]
     return []
 
   def _KeyErrorString(self, name: str) -> str:
     similar = self._SimilarKeys(name)
     if similar:
       return name + ' (did you mean: [%s])' % (','.join(sorted(similar)))
-    if '_params' in self.__dict__:
-      return name + ' (keys are %s)' % sorted(list(self._params.keys()))
+    if '_param_dict' in self.__dict__:
+      return name + ' (keys are %s)' % sorted(list(self._param_dict.keys()))
     return name
 
   def Copy(self: ParamsT) -> ParamsT:
-    """Creates a deep copy of self."""
+    """Creates a deep copy of self, copy-on-write under CopyOnWrite()."""
     return self._CopyTo(type(self)())
 
   def _CopyTo(self: ParamsT, res: ParamsT) -> ParamsT:
+    if _IsCopyOnWrite() and not self.__dict__['_escaped']:
+      cow = self.__dict__['_cow']
+      if cow is None:
+        cow = _CopyOnWriteState()
+        self.__dict__['_cow'] = cow
+      cow.num_owners += 1
+      res.__dict__['_param_dict'] = self.__dict__['_param_dict']
+      res.__dict__['_cow'] = cow
+    else:
+      res.__dict__['_param_dict'] = _CopyParamDict(self.__dict__['_param_dict'])
     # pylint: disable=protected-access
-    res._params = copy.deepcopy(self._params)
     res._immutable = self._immutable
     # pylint: enable=protected-access
     return res
@@ -392,9 +526,11 @@ class Params:
     if re.match('^[a-z_][a-z0-9_]*$', name) is None:
       raise ValueError(f'Attribute name string invalid: "{name}", '
                        'must match regex "^[a-z_][a-z0-9_]*$".')
-    if name in self._params:
+    params = self._OwnParams()
+    if name in params:
       raise AttributeError('Parameter %s is already defined' % name)
-    self._params[name] = _Param(name, default_value, description)
+    params[name] = _Param(name, default_value, description)
+    self._MarkEscapedIfMutable(default_value)
 
   def Freeze(self) -> None:
     """Marks this Params as immutable."""
@@ -415,7 +551,7 @@ class Params:
           part = is_list_or_dict.group(1)
           list_index = ast.literal_eval(is_list_or_dict.group(2))
         # pylint: disable=protected-access
-        curr = curr._params[part].Get()
+        curr = curr._OwnParams()[part].Get()
         if is_list_or_dict:
           curr = curr[list_index]
       except KeyError:
@@ -446,7 +582,8 @@ class Params:
       # Update the value associated with key.
       try:
         # pylint: disable=protected-access
-        param._params[key].Set(value)
+        param._OwnParams()[key].Set(value)
+        param._MarkEscapedIfMutable(value)
       except KeyError:
         raise AttributeError(self._KeyErrorString(name))
     return self
@@ -471,7 +608,10 @@ class Params:
     # Get the value associated with key.
     try:
       # pylint: disable=protected-access
-      return param._params[key].Get()
+      value = param._OwnParams()[key].Get()
+      if not _IsImmutable(value):
+        param.__dict__['_escaped'] = True
+      return value
     except KeyError:
       raise AttributeError(self._KeyErrorString(name))
 
@@ -513,7 +653,7 @@ class Params:
       # Delete the key.
       try:
         # pylint: disable=protected-access
-        del param._params[key]
+        del param._OwnParams()[key]
       except KeyError:
         raise AttributeError(self._KeyErrorString(name))
     return self
@@ -524,7 +664,7 @@ class Params:
       yield (name, param.Get())
 
   def GetKeys(self) -> List[str]:
-    return list(self._params.keys())
+    return list(self._param_dict.keys())
 
   def ToProto(self) -> hyperparams_pb2.Hyperparam:
     """Writes to a Hyperparams proto.
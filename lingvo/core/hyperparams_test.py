@@ -17,6 +17,7 @@
 import collections
 import dataclasses
 import enum
+import threading
 
 import lingvo.compat as tf
 from lingvo.core import hyperparams
@@ -122,6 +123,122 @@ class ParamsTest(test_utils.TestCase):
     self.assertIs(outer.inner.tensor, outer_copy.inner.tensor)
     self.assertIs(outer.inner.symbol, outer_copy.inner.symbol)
 
+  def _NestedParams(self):
+    inner = hyperparams.Params()
+    inner.Define('alpha', 2, '')
+    inner.Define('values', [1, 2], '')
+    middle = hyperparams.Params()
+    middle.Define('inner', inner, '')
+    middle.Define('gamma', 'g', '')
+    outer = hyperparams.Params()
+    outer.Define('beta', 1, '')
+    outer.Define('middle', middle, '')
+    outer.Define('tpls', [inner.Copy(), inner.Copy()], '')
+    return outer
+
+  def testCopyOnWriteCopiesAreIndependent(self):
+    outer = self._NestedParams()
+    expected = outer.ToText()
+    with hyperparams.CopyOnWrite():
+      copies = [outer.Copy() for _ in range(3)]
+      copies[0].beta = 5
+      copies[0].middle.inner.alpha = 3
+      copies[1].Set(**{'middle.gamma': 'h', 'tpls[1].alpha': 4})
+      copies[1].middle.inner.values.append(3)
+      copies[2].tpls.append(None)
+      copies[2].Delete('middle.inner')
+      copy_of_copy = copies[0].Copy()
+      copy_of_copy.middle.inner.alpha = 6
+
+    self.assertEqual(expected, outer.ToText())
+    self.assertEqual(5, copies[0].beta)
+    self.assertEqual(3, copies[0].middle.inner.alpha)
+    self.assertEqual(6, copy_of_copy.middle.inner.alpha)
+    self.assertEqual('h', copies[1].middle.gamma)
+    self.assertEqual(4, copies[1].tpls[1].alpha)
+    self.assertEqual(2, copies[1].tpls[0].alpha)
+    self.assertEqual([1, 2, 3], copies[1].middle.inner.values)
+    self.assertEqual(3, len(copies[2].tpls))
+    self.assertNotIn('inner', copies[2].middle)
+    self.assertEqual(2, copies[2].tpls[1].alpha)
+
+  def testCopyOnWriteReferenceTakenBeforeCopy(self):
+    outer = self._NestedParams()
+    with hyperparams.CopyOnWrite():
+      middle = outer.middle
+      inner = middle.inner
+      outer_copy = outer.Copy()
+      middle.gamma = 'h'
+      inner.alpha = 3
+      outer.Copy().middle.inner.alpha = 4
+    self.assertEqual('g', outer_copy.middle.gamma)
+    self.assertEqual(2, outer_copy.middle.inner.alpha)
+    self.assertEqual('h', outer.middle.gamma)
+    self.assertEqual(3, outer.middle.inner.alpha)
+
+  def testCopyOnWriteValueSetBeforeCopy(self):
+    with hyperparams.CopyOnWrite():
+      sub = hyperparams.Params()
+      sub.Define('x', 1, '')
+      values = [1, 2]
+      p = hyperparams.Params()
+      p.Define('sub', None, '')
+      p.Define('values', None, '')
+      p.Define('defined', sub, '')
+      p.sub = sub
+      p.Set(values=values)
+      q = p.Copy()
+      sub.x = 5
+      values.append(3)
+    self.assertEqual(1, q.sub.x)
+    self.assertEqual(1, q.defined.x)
+    self.assertEqual([1, 2], q.values)
+    self.assertEqual(5, p.sub.x)
+    self.assertEqual([1, 2, 3], p.values)
+
+  def testCopyOnWriteSharesUntouchedSubtrees(self):
+    outer = self._NestedParams()
+    with hyperparams.CopyOnWrite():
+      # outer was given mutable values, so it copies its own level, while its
+      # copy is only copied when modified.
+      outer_copy = outer.Copy()
+      copy_of_copy = outer_copy.Copy()
+      copy_of_copy.beta = 2
+    # pylint: disable=protected-access
+    self.assertIsNot(outer._param_dict, outer_copy._param_dict)
+    middle = outer_copy._param_dict['middle'].Get()
+    middle_copy = copy_of_copy._param_dict['middle'].Get()
+    self.assertIsNot(middle, middle_copy)
+    self.assertIs(middle._param_dict, middle_copy._param_dict)
+    # pylint: enable=protected-access
+    self.assertEqual(outer.middle, copy_of_copy.middle)
+    self.assertEqual(1, outer.beta)
+    self.assertEqual(1, outer_copy.beta)
+
+  def testCopyOnWriteIsThreadLocal(self):
+    outer = self._NestedParams()
+    outer_copy = outer.Copy()
+
+    def _CopyInThread(results):
+      results.append(outer_copy.Copy())
+
+    results = []
+    with hyperparams.CopyOnWrite():
+      with hyperparams.CopyOnWrite(False):
+        copies = [outer_copy.Copy()]
+      copies.append(outer_copy.Copy())
+      thread = threading.Thread(target=_CopyInThread, args=(results,))
+      thread.start()
+      thread.join()
+    copies.append(outer_copy.Copy())
+    # pylint: disable=protected-access
+    # Only the copy-on-write copy shares the parameters of outer_copy.
+    self.assertIsNot(outer_copy._param_dict, copies[0]._param_dict)
+    self.assertIs(outer_copy._param_dict, copies[1]._param_dict)
+    self.assertIsNot(outer_copy._param_dict, results[0]._param_dict)
+    self.assertIsNot(outer_copy._param_dict, copies[2]._param_dict)
+    # pylint: enable=protected-access
+
   def testCopyFieldsTo(self):
     source = hyperparams.Params()
     dest = hyperparams.Params()
@@ -15,6 +15,7 @@
 """The MLPerf reference implementation of BLEU."""
 
 import collections
+import functools
 import math
 import re
 import sys
@@ -22,6 +23,7 @@ import unicodedata
 
 import lingvo.compat as tf
 from lingvo.core import metrics
+from lingvo.core import scorers
 import numpy as np
 import six
 
@@ -87,12 +89,9 @@ def compute_bleu(reference_corpus,
   """
   reference_length = 0
   translation_length = 0
-  bp = 1.0
-  geo_mean = 0
 
   matches_by_order = [0] * max_order
   possible_matches_by_order = [0] * max_order
-  precisions = []
 
   for (references, translations) in zip(reference_corpus, translation_corpus):
     reference_length += len(references)
@@ -108,6 +107,30 @@ def compute_bleu(reference_corpus,
     for ngram in translation_ngram_counts:
       possible_matches_by_order[len(ngram) -
                                 1] += translation_ngram_counts[ngram]
+  return compute_bleu_from_stats(matches_by_order, possible_matches_by_order,
+                                 reference_length, translation_length, use_bp)
+
+
+def compute_bleu_from_stats(matches_by_order,
+                            possible_matches_by_order,
+                            reference_length,
+                            translation_length,
+                            use_bp=True):
+  """Computes BLEU score from accumulated n-gram statistics.
+
+  Args:
+    matches_by_order: list of clipped n-gram match counts, one per order.
+    possible_matches_by_order: list of translation n-gram counts, one per order.
+    reference_length: total number of reference tokens.
+    translation_length: total number of translation tokens.
+    use_bp: boolean, whether to apply brevity penalty.
+
+  Returns:
+    BLEU score.
+  """
+  max_order = len(matches_by_order)
+  bp = 1.0
+  geo_mean = 0
   precisions = [0] * max_order
   smooth = 1.0
   for i in range(0, max_order):
@@ -181,20 +204,31 @@ class UnicodeRegex:
 
 uregex = UnicodeRegex()
 
+# Max number of distinct strings whose tokens are cached by bleu_tokenize().
+_BLEU_TOKENIZE_CACHE_SIZE = 1 << 16
+
+
+@functools.lru_cache(maxsize=_BLEU_TOKENIZE_CACHE_SIZE)
+def _cached_bleu_tokenize(string):
+  string = uregex.nondigit_punct_re.sub(r"\1 \2 ", string)
+  string = uregex.punct_nondigit_re.sub(r" \1 \2", string)
+  string = uregex.symbol_re.sub(r" \1 ", string)
+  return tuple(string.split())
+
 
 def bleu_tokenize(string):
   """Tokenize a string following the official BLEU implementation.
 
+  The tokens of recently seen strings are cached, so repeated references or
+  hypotheses are only run through the regexes once.
+
   Args:
     string: the input string
 
   Returns:
     a list of tokens
   """
-  string = uregex.nondigit_punct_re.sub(r"\1 \2 ", string)
-  string = uregex.punct_nondigit_re.sub(r" \1 \2", string)
-  string = uregex.symbol_re.sub(r" \1 ", string)
-  return string.split()
+  return list(_cached_bleu_tokenize(string))
 
 
 def bleu_wrapper(ref_lines, hyp_lines, case_sensitive=False):
@@ -212,16 +246,53 @@ def bleu_wrapper(ref_lines, hyp_lines, case_sensitive=False):
 
 
 class MlPerfBleuMetric(metrics.BaseMetric):
-  """Use the MLPerf reference impelmentation."""
+  """Use the MLPerf reference impelmentation.
+
+  Lines are tokenized once on Update(), and their n-gram statistics are
+  accumulated in batches, so reading value does not rescore all lines seen so
+  far. The score is identical to bleu_wrapper() over all the lines.
+  """
 
-  def __init__(self, **kwargs):
-    self._ref_lines = []
-    self._hyp_lines = []
+  def __init__(self, max_order=4, **kwargs):
+    self._max_order = max_order
+    self._matches_by_order = np.zeros([max_order], dtype=np.int64)
+    self._possible_matches_by_order = np.zeros([max_order], dtype=np.int64)
+    self._reference_length = 0
+    self._translation_length = 0
+    # Tokenized lines whose statistics are not accumulated yet.
+    self._ref_tokens = []
+    self._hyp_tokens = []
 
   def Update(self, ref_str, hyp_str):
-    self._ref_lines.append(ref_str)
-    self._hyp_lines.append(hyp_str)
+    self._ref_tokens.append(bleu_tokenize(native_to_unicode(ref_str).lower()))
+    self._hyp_tokens.append(bleu_tokenize(native_to_unicode(hyp_str).lower()))
+
+  def _AccumulatePending(self):
+    if not self._ref_tokens:
+      return
+    matches, totals = scorers.ClippedNGramMatches(self._ref_tokens,
+                                                  self._hyp_tokens,
+                                                  self._max_order)
+    self._matches_by_order += matches
+    self._possible_matches_by_order += totals
+    self._reference_length += sum(len(x) for x in self._ref_tokens)
+    self._translation_length += sum(len(x) for x in self._hyp_tokens)
+    self._ref_tokens = []
+    self._hyp_tokens = []
+
+  def Merge(self, other):
+    """Accumulates the statistics of another MlPerfBleuMetric into this one."""
+    assert self._max_order == other._max_order  # pylint: disable=protected-access
+    other._AccumulatePending()  # pylint: disable=protected-access
+    self._matches_by_order += other._matches_by_order  # pylint: disable=protected-access
+    self._possible_matches_by_order += other._possible_matches_by_order  # pylint: disable=protected-access
+    self._reference_length += other._reference_length  # pylint: disable=protected-access
+    self._translation_length += other._translation_length  # pylint: disable=protected-access
 
   @property
   def value(self):
-    return bleu_wrapper(self._ref_lines, self._hyp_lines)
+    self._AccumulatePending()
+    return compute_bleu_from_stats(
+        [int(x) for x in self._matches_by_order],
+        [int(x) for x in self._possible_matches_by_order],
+        self._reference_length, self._translation_length)
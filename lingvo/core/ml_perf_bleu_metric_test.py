@@ -26,6 +26,30 @@ class MlPerfMetricsTest(test_utils.TestCase):
     m.Update(u"y f g d k l m", u"e f \u2028 d")
     self.assertAllClose(0.2638, m.value, atol=1e-03)
 
+  def testMlPerfBleuMetricMatchesBleuWrapper(self):
+    refs = [u"a b a z", u"y f g d k l m", u"The cat, sat.", u"1,000 dogs!"]
+    hyps = [u"a b a c", u"e f \u2028 d", u"the cat sat .", u"1,000 dog !"]
+    expected = ml_perf_bleu_metric.bleu_wrapper(refs, hyps)
+    m = ml_perf_bleu_metric.MlPerfBleuMetric()
+    for ref, hyp in zip(refs[:2], hyps[:2]):
+      m.Update(ref, hyp)
+    # Reading the value in between does not change the final score.
+    self.assertGreater(m.value, 0.0)
+    other = ml_perf_bleu_metric.MlPerfBleuMetric()
+    for ref, hyp in zip(refs[2:], hyps[2:]):
+      other.Update(ref, hyp)
+    m.Merge(other)
+    self.assertEqual(expected, m.value)
+
+  def testBleuTokenize(self):
+    self.assertEqual([u"Hello", u",", u"world", u"!"],
+                     ml_perf_bleu_metric.bleu_tokenize(u"Hello, world!"))
+    # Cached results are not shared between callers.
+    tokens = ml_perf_bleu_metric.bleu_tokenize(u"Hello, world!")
+    tokens.append(u"?")
+    self.assertEqual([u"Hello", u",", u"world", u"!"],
+                     ml_perf_bleu_metric.bleu_tokenize(u"Hello, world!"))
+
 
 if __name__ == "__main__":
   test_utils.main()
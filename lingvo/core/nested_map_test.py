@@ -16,10 +16,13 @@
 
 import collections
 import copy
+import time
 
+import lingvo.compat as tf
 from lingvo.core import nested_map
 from lingvo.core import py_utils
 from lingvo.core import test_utils
+import numpy as np
 
 
 def _AddOne(x):
@@ -417,6 +420,45 @@ foo[2][0]     32"""
     ]
     self.assertEqual(m.FlattenItems(), expected)
 
+  def testTreeDef(self):
+    for m in [
+        nested_map.NestedMap(),
+        self._get_basic_test_inputs(),
+        self._get_advanced_test_inputs(),
+    ]:
+      treedef = m.GetTreeDef()
+      self.assertEqual(len(m.Flatten()), treedef.num_leaves)
+      self.assertEqual(m.Flatten(), treedef.Flatten(m))
+      self.assertEqual(m.FlattenItems(), treedef.FlattenItems(m))
+      self.assertEqual([k for k, _ in m.FlattenItems()], treedef.keys)
+      values = list(range(treedef.num_leaves))
+      packed = treedef.Pack(values)
+      self.assertEqual(m.Pack(values), packed)
+      self.assertIsInstance(packed, nested_map.NestedMap)
+      self.assertEqual(treedef, packed.GetTreeDef())
+      self.assertEqual(hash(treedef), hash(packed.GetTreeDef()))
+
+    m = self._get_basic_test_inputs()
+    treedef = m.GetTreeDef()
+    # Nested dicts keep their type.
+    self.assertIsInstance(treedef.Pack(list(range(6))).bar,
+                          nested_map.NestedMap)
+    self.assertNotEqual(treedef, self._get_advanced_test_inputs().GetTreeDef())
+
+    with self.assertRaisesRegex(ValueError, 'does not match length'):
+      treedef.Pack([1, 2])
+    m.bar.y.append(1)
+    with self.assertRaisesRegex(ValueError, 'does not match the structure'):
+      treedef.Flatten(m)
+    m.bar.y.pop()
+    del m.bar.x
+    m.bar.w = 1
+    with self.assertRaisesRegex(ValueError, 'does not match the structure'):
+      treedef.Flatten(m)
+    m.bar = 1
+    with self.assertRaisesRegex(ValueError, 'does not match the structure'):
+      treedef.Flatten(m)
+
   def testIsCompatible(self):
     empty = nested_map.NestedMap()
     self.assertTrue(empty.IsCompatible(empty))
@@ -604,5 +646,50 @@ foo[2][0]     32"""
       del a.a2
 
 
+class NestedMapBenchmark(tf.test.Benchmark):
+  """Benchmarks Flatten and Pack of NestedMap against a TreeDef."""
+
+  def _Batch(self, num_layers=12):
+    """Returns a NestedMap resembling an input batch and decoder states."""
+    batch = nested_map.NestedMap(
+        src=nested_map.NestedMap(
+            ids=np.zeros([8, 128], np.int32),
+            paddings=np.zeros([8, 128], np.float32)),
+        tgt=nested_map.NestedMap(
+            ids=np.zeros([8, 64], np.int32),
+            labels=np.zeros([8, 64], np.int32),
+            paddings=np.zeros([8, 64], np.float32),
+            weights=np.zeros([8, 64], np.float32)),
+        sample_ids=np.zeros([8], np.int32))
+    batch.states = [
+        nested_map.NestedMap(
+            key=np.zeros([8, 64, 256], np.float32),
+            value=np.zeros([8, 64, 256], np.float32),
+            step=np.zeros([], np.int32)) for _ in range(num_layers)
+    ]
+    return batch
+
+  def _RunBenchmark(self, name, fn, num_iters=10000):
+    fn()
+    start = time.time()
+    for _ in range(num_iters):
+      fn()
+    self.report_benchmark(
+        name=name, iters=num_iters, wall_time=(time.time() - start) / num_iters)
+
+  def benchmarkFlatten(self):
+    batch = self._Batch()
+    treedef = batch.GetTreeDef()
+    self._RunBenchmark('NestedMap.Flatten', batch.Flatten)
+    self._RunBenchmark('TreeDef.Flatten', lambda: treedef.Flatten(batch))
+
+  def benchmarkPack(self):
+    batch = self._Batch()
+    treedef = batch.GetTreeDef()
+    values = batch.Flatten()
+    self._RunBenchmark('NestedMap.Pack', lambda: batch.Pack(values))
+    self._RunBenchmark('TreeDef.Pack', lambda: treedef.Pack(values))
+
+
 if __name__ == '__main__':
   test_utils.main()
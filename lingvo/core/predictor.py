@@ -23,14 +23,17 @@ Example::
   pred.Load("/tmp/logdir/train/ckpt-00000000")
   [topk_hyps] = pred.Run(["topk_hyps"], src_strings=["Hello World"])
 """
+import concurrent.futures
 import threading
 import time
 from lingvo import model_imports
 import lingvo.compat as tf
 from lingvo.core import inference_graph_pb2
 from lingvo.core import py_utils
+import numpy as np
 
 from google.protobuf import text_format
+from tensorflow.core.protobuf import config_pb2
 
 
 def LoadInferenceGraph(path, clear_device_placement=False):  # pylint: disable=invalid-name
@@ -55,6 +58,22 @@ def LoadInferenceGraph(path, clear_device_placement=False):  # pylint: disable=i
   return inference_graph
 
 
+class _RunPlan:
+  """The validated fetches and feeds of Run() calls with the same arguments."""
+
+  def __init__(self, num_fetch_keys, valid_fetch_idxs, fetch_names, feed_keys,
+               feed_names, feed_dtypes):
+    self.num_fetch_keys = num_fetch_keys
+    self.valid_fetch_idxs = valid_fetch_idxs
+    self.fetch_names = fetch_names
+    self.feed_keys = feed_keys
+    self.feed_names = feed_names
+    self.feed_dtypes = feed_dtypes
+    # The session callable of this plan, and the session it belongs to.
+    self.sess = None
+    self.callable = None
+
+
 class Predictor:
   """Loads a model and does inference.
 
@@ -69,7 +88,9 @@ class Predictor:
                tf_master="",
                session_config=None,
                clear_device_placement=False,
-               load_graph_def_from_inference_graph=True):
+               load_graph_def_from_inference_graph=True,
+               use_session_callables=True,
+               num_async_threads=4):
     """Constructor.
 
     Args:
@@ -85,6 +106,11 @@ class Predictor:
       load_graph_def_from_inference_graph: Whether to load a graph def.
         If False, assumes the names in the inference graph correspond to tensors
         in the current default graph.
+      use_session_callables: Whether Run() calls without session_run_options
+        use session callables, created once per subgraph, fetches and feeds,
+        rather than tf.Session.run(), which processes its arguments on every
+        call.
+      num_async_threads: Number of threads running RunAsync() calls.
     """
     assert device_type in ["cpu", "gpu", "tpu"]
     subgraph_name = subgraph_name or "default"
@@ -113,6 +139,13 @@ class Predictor:
     self._device_type = device_type
     self._tf_master = tf_master
     self._session_config = session_config
+    self._use_session_callables = use_session_callables
+    self._num_async_threads = num_async_threads
+    # Cache of _RunPlan, keyed by the arguments of Run() they are created for.
+    self._run_plans = {}
+    self._run_plans_lock = threading.Lock()
+    self._async_executor = None
+    self._async_executor_lock = threading.Lock()
 
     if load_graph_def_from_inference_graph:
       tf.logging.info(
@@ -343,6 +376,63 @@ class Predictor:
       single_fetch = True
       fetch_keys = [fetch_keys]
 
+    plan = self._get_run_plan(subgraph_name, fetch_keys, validate_fetches,
+                              tuple(sorted(kwargs)))
+
+    start = time.time()
+    if self._use_session_callables and not session_run_options:
+      feed_args = [
+          np.asarray(kwargs[k], dtype=dtype)
+          for k, dtype in zip(plan.feed_keys, plan.feed_dtypes)
+      ]
+      fetched_results = self._run_with_valid_session(
+          self._run_plan_callable, plan, feed_args, run_metadata)
+    else:
+      run_options = tf.RunOptions(report_tensor_allocations_upon_oom=False)
+      if session_run_options:
+        run_options = session_run_options
+      feeds = {
+          name: kwargs[k] for k, name in zip(plan.feed_keys, plan.feed_names)
+      }
+      fetched_results = self._run_with_valid_session(
+          tf.Session.run,
+          plan.fetch_names,
+          feed_dict=feeds,
+          options=run_options,
+          run_metadata=run_metadata)
+    duration = time.time() - start
+    results = [None] * plan.num_fetch_keys
+    for i, fetch in zip(plan.valid_fetch_idxs, fetched_results):
+      results[i] = fetch
+    if single_fetch:
+      results = results[0]
+    return (results, duration) if time_session_run else results
+
+  def RunAsync(self, fetch_keys, **kwargs):  # pylint: disable=invalid-name
+    """Runs predictor in a background thread.
+
+    Args:
+      fetch_keys: dict_keys object or a list of keys in the fetch dictionary to
+        fetch.
+      **kwargs: keyword arguments of Run(), including the inputs to feed.
+
+    Returns:
+      A concurrent.futures.Future of the return value of Run().
+    """
+    with self._async_executor_lock:
+      if self._async_executor is None:
+        self._async_executor = concurrent.futures.ThreadPoolExecutor(
+            self._num_async_threads, thread_name_prefix="predictor")
+    return self._async_executor.submit(self.Run, fetch_keys, **kwargs)
+
+  def _get_run_plan(self, subgraph_name, fetch_keys, validate_fetches,
+                    feed_keys):
+    """Returns the cached _RunPlan of a Run() call, creating it if needed."""
+    key = (subgraph_name, tuple(fetch_keys), validate_fetches, feed_keys)
+    plan = self._run_plans.get(key)
+    if plan is not None:
+      return plan
+
     valid_fetch_keys = self.subgraph_fetch_keys(subgraph_name)
     if validate_fetches:
       for k in fetch_keys:
@@ -351,37 +441,43 @@ class Predictor:
               f"{k} is not in the list of available fetches. Available keys: "
               f"{valid_fetch_keys}.")
     subgraph_fetches = self._get_subgraph_fetches(subgraph_name)
-    valid_fetch_idxs, valid_fetches = zip(*[(i, subgraph_fetches[k])
-                                            for i, k in enumerate(fetch_keys)
-                                            if k in valid_fetch_keys])
+    valid_fetch_idxs = [
+        i for i, k in enumerate(fetch_keys) if k in valid_fetch_keys
+    ]
+    fetch_names = [subgraph_fetches[fetch_keys[i]] for i in valid_fetch_idxs]
 
     valid_feed_keys = self.subgraph_feed_keys(subgraph_name)
-    for k in kwargs:
+    for k in feed_keys:
       if k not in valid_feed_keys:
         raise KeyError(
             f"{k} is not in the list of available feeds. Available keys: "
             f"{valid_feed_keys}.")
     subgraph_feeds = self._get_subgraph_feeds(subgraph_name)
-    feeds = {subgraph_feeds[k]: v for k, v in kwargs.items()}
-
-    run_options = tf.RunOptions(report_tensor_allocations_upon_oom=False)
-    if session_run_options:
-      run_options = session_run_options
-
-    start = time.time()
-    fetched_results = self._run_with_valid_session(
-        tf.Session.run,
-        valid_fetches,
-        feed_dict=feeds,
-        options=run_options,
-        run_metadata=run_metadata)
-    duration = time.time() - start
-    results = [None] * len(fetch_keys)
-    for i, fetch in zip(valid_fetch_idxs, fetched_results):
-      results[i] = fetch
-    if single_fetch:
-      results = results[0]
-    return (results, duration) if time_session_run else results
+    feed_names = [subgraph_feeds[k] for k in feed_keys]
+    feed_dtypes = [
+        self._graph.get_tensor_by_name(name).dtype.as_numpy_dtype
+        for name in feed_names
+    ]
+
+    plan = _RunPlan(
+        len(fetch_keys), valid_fetch_idxs, fetch_names, feed_keys, feed_names,
+        feed_dtypes)
+    with self._run_plans_lock:
+      return self._run_plans.setdefault(key, plan)
+
+  def _run_plan_callable(self, sess, plan, feed_args, run_metadata):
+    """Runs the session callable of plan, creating it for sess if needed."""
+    with self._run_plans_lock:
+      if plan.sess is not sess:
+        callable_options = config_pb2.CallableOptions(
+            feed=plan.feed_names,
+            fetch=plan.fetch_names,
+            run_options=tf.RunOptions(
+                report_tensor_allocations_upon_oom=False))
+        plan.callable = sess._make_callable_from_options(callable_options)  # pylint: disable=protected-access
+        plan.sess = sess
+      fn = plan.callable
+    return fn(*feed_args, run_metadata=run_metadata)
 
 
 def main(_):
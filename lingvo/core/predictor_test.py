@@ -14,6 +14,8 @@
 # ==============================================================================
 """Tests for lingvo.core.predictor."""
 
+import time
+
 import lingvo.compat as tf
 from lingvo.core import base_input_generator
 from lingvo.core import base_model
@@ -96,6 +98,65 @@ class PredictorTest(test_utils.TestCase):
     self.assertEqual(12345, fetch1)
     self.assertIsNone(nonexistent)
 
+  def testPredictorWithoutSessionCallables(self):
+    pred = predictor.Predictor(
+        self._testInferenceGraph(), use_session_callables=False)
+    fetch1 = pred.Run('fetch1', feed1=[12345])
+    self.assertEqual(12345, fetch1)
+
+  def testPredictorSessionRunOptions(self):
+    pred = predictor.Predictor(self._testInferenceGraph())
+    run_metadata = tf.RunMetadata()
+    fetch1 = pred.Run(
+        'fetch1',
+        feed1=[12345],
+        session_run_options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
+        run_metadata=run_metadata)
+    self.assertEqual(12345, fetch1)
+    self.assertTrue(run_metadata.step_stats.dev_stats)
+
+  def testPredictorAfterNewSession(self):
+    pred = predictor.Predictor(self._testInferenceGraph())
+    self.assertEqual(12345, pred.Run('fetch1', feed1=[12345]))
+    pred._maybe_create_new_session(pred._cur_sess_id)
+    self.assertEqual(23456, pred.Run('fetch1', feed1=[23456]))
+
+  def testPredictorRunAsync(self):
+    pred = predictor.Predictor(self._testInferenceGraph())
+    futures = [
+        pred.RunAsync(['fetch1'], feed1=[i], subgraph_name='default')
+        for i in range(10)
+    ]
+    self.assertEqual([[i] for i in range(10)],
+                     [f.result()[0].tolist() for f in futures])
+    with self.assertRaisesRegex(KeyError, 'nonexistent'):
+      pred.RunAsync('nonexistent', feed1=[1]).result()
+
+
+class PredictorBenchmark(tf.test.Benchmark):
+  """Benchmarks the latency of Predictor.Run() on a tiny graph."""
+
+  def _RunBenchmark(self, use_session_callables, num_iters=1000):
+    p = base_model.SingleTaskModel.Params(DummyModel.Params().Set(name='test'))
+    p.input = base_input_generator.BaseInputGenerator.Params().Set(name='test')
+    inference_graph = inference_graph_exporter.InferenceGraphExporter.Export(p)
+    pred = predictor.Predictor(
+        inference_graph,
+        device_type='cpu',
+        use_session_callables=use_session_callables)
+    pred.Run('fetch1', feed1=[1.])
+    start = time.time()
+    for _ in range(num_iters):
+      pred.Run('fetch1', feed1=[1.])
+    self.report_benchmark(
+        iters=num_iters, wall_time=(time.time() - start) / num_iters)
+
+  def benchmarkRunWithSessionRun(self):
+    self._RunBenchmark(use_session_callables=False)
+
+  def benchmarkRunWithSessionCallables(self):
+    self._RunBenchmark(use_session_callables=True)
+
 
 if __name__ == '__main__':
   test_utils.main()
@@ -30,6 +30,7 @@ from lingvo import base_trial
 import lingvo.compat as tf
 from lingvo.core import base_model
 from lingvo.core import cluster_factory
+from lingvo.core import decoder_lib
 from lingvo.core import hyperparams
 from lingvo.core import metrics as metrics_lib
 from lingvo.core import ml_perf_log as mlp_log
@@ -1249,6 +1250,22 @@ class DecodeProgram(BaseProgram):
     p.Define(
         'trigger_interval', 1, 'The program is only effectively triggered '
         'every this num of runs, after trigger_offset is met.')
+    p.Define(
+        'use_decode_cache', False,
+        'If set, the results of decoding a dataset with a checkpoint are '
+        'cached under the program dir, see program_utils.DecodeStatusCache, '
+        'and decoding a dataset with a checkpoint it was already decoded with '
+        'is skipped.')
+    p.Define('decode_cache_max_entries', 100,
+             'Maximum number of decode cache entries, 0 for no limit.')
+    p.Define('decode_cache_max_bytes', 0,
+             'Maximum total size of the decode cache, 0 for no limit.')
+    p.Define('decode_cache_max_age_secs', 0,
+             'Maximum age of decode cache entries, 0 for no limit.')
+    p.Define(
+        'decode_cache_decode_out', False,
+        'Whether to also cache the decode outputs. They are passed to '
+        'DecodeFinalize() again when decode results are loaded from the cache.')
     return p
 
   def __init__(self, params, **kwargs):
@@ -1256,12 +1273,33 @@ class DecodeProgram(BaseProgram):
     self._program_name = 'DecodeProgram'
     self._decode_out_dict_lst = []
     self._dataset_summaries = {}
+    self.status_cache = None
+    p = self.params
+    if p.use_decode_cache:
+      self.status_cache = program_utils.DecodeStatusCache(
+          self._program_dir,
+          params_fingerprint=program_utils.ParamsFingerprint(p),
+          max_entries=p.decode_cache_max_entries,
+          max_bytes=p.decode_cache_max_bytes,
+          max_age_secs=p.decode_cache_max_age_secs)
     # TODO(xingwu): fully deprecate decode_until_out_of_range
     if self.params.decode_until_out_of_range:
       self.params.steps_per_loop = -1
     self._trigger_scheduler = program_utils.TriggerScheduler(
         self.params.trigger_offset, self.params.trigger_interval)
 
+  def _CheckpointKeys(self, global_step):
+    """Returns the decode cache keys of the variables at global_step."""
+    checkpoint_fingerprint = None
+    checkpoint_path = program_utils.SavedCheckpointPath(self._checkpoint_dir,
+                                                        global_step)
+    if checkpoint_path:
+      checkpoint_fingerprint = decoder_lib.CheckpointFingerprint(checkpoint_path)
+    return program_utils.CheckpointKeys(global_step, checkpoint_fingerprint)
+
+  def _DecodeOutPath(self, global_step):
+    return os.path.join(self._program_dir, 'decoder_out_%09d' % global_step)
+
   def _DatasetSummaryWriter(self, unused_dataset_name):
     """Returns the FileWriter object to use for summaries."""
     return self._summary_writer
@@ -1557,11 +1595,14 @@ class DecodeProgram(BaseProgram):
     self._WriteSummaries(
         os.path.basename(self._program_dir), dataset_name, global_step,
         summaries)
-    decode_out_path = os.path.join(self._program_dir,
-                                   'decoder_out_%09d' % global_step)
     decode_finalize_args = base_model.DecodeFinalizeArgs(
-        decode_out_path=decode_out_path, decode_out=buffered_decode_out)
+        decode_out_path=self._DecodeOutPath(global_step),
+        decode_out=buffered_decode_out)
     self._task.DecodeFinalize(decode_finalize_args)
+    if self.status_cache:
+      self.status_cache.Update(
+          self._CheckpointKeys(global_step)[0], dataset_name, summaries,
+          buffered_decode_out if self.params.decode_cache_decode_out else None)
 
     # Result is not returned as a signal for "done", unlike for training.
     self._ReportVizierMetrics(global_step, dec_metrics)
@@ -1677,11 +1718,32 @@ class DecodeProgram(BaseProgram):
       self.FinalizeCallback(finalize_ret)
       return None
 
+  def _TryLoadCache(self, dataset_name, sess=None):
+    """Returns whether the decode results of dataset_name are cached."""
+    if not self.status_cache:
+      return False
+    global_step = self._GetGlobalStep(sess)
+    result = self.status_cache.LookupAny(
+        self._CheckpointKeys(global_step),
+        dataset_name,
+        load_decode_out=self.params.decode_cache_decode_out)
+    if not result:
+      return False
+    if result.decode_out is not None:
+      self._task.DecodeFinalize(
+          base_model.DecodeFinalizeArgs(
+              decode_out_path=self._DecodeOutPath(global_step),
+              decode_out=result.decode_out))
+    self._dataset_summaries[dataset_name] = result.summaries
+    return True
+
   def Run(self, sess=None, threadpool=None, strategy=None):
     del strategy  # Unused in graph mode programs.
     self._trigger_scheduler.Trigger()
     if not self._trigger_scheduler.ShouldRun():
       return
+    if self._TryLoadCache(self.params.dataset_name, sess):
+      return
     return self.RunForInput(
         self.params.dataset_name,
         self._task.input,
@@ -1699,6 +1761,7 @@ class MultiInputsDecodeProgram(DecodeProgram):
     p.Delete('dataset_name')
     p.Define('dataset_names', [], 'List of datasets to decode.')
     p.Define('input_params', [], 'List of input params map to the datasets')
+    p.use_decode_cache = True
     return p
 
   def __init__(self, params, **kwargs):
@@ -1722,8 +1785,6 @@ class MultiInputsDecodeProgram(DecodeProgram):
                            'w') as f:
       f.write(p.ToText())
 
-    self.status_cache = program_utils.DecodeStatusCache(self._program_dir)
-
   def _DatasetSummaryWriter(self, dataset_name):
     if not self._summary_writer_objs:
       self._summary_writer_objs = {}
@@ -1737,10 +1798,6 @@ class MultiInputsDecodeProgram(DecodeProgram):
         self._summary_writer_objs[ds_name] = file_writer
     return self._summary_writer_objs[dataset_name]
 
-  def FinalizeCallback(self, finalize_ret):
-    dataset_name, summaries = finalize_ret
-    self.status_cache.UpdateDataset(dataset_name, summaries)
-
   def InitInputs(self, sess=None):
     self.SetStatusMessage('Init inputs %s' % self._program_name)
     for inp_instance in self._inputs:
@@ -1777,18 +1834,9 @@ class MultiInputsDecodeProgram(DecodeProgram):
 
   def Run(self, sess=None, threadpool=None):
     futures = []
-    # TODO(xingwu): move global_step to attribute.
-    if py_utils.IsEagerMode():
-      global_step = self._model.global_step.numpy()
-    else:
-      global_step = sess.run(self._model.global_step)
-    ckpt_key = f'ckpt-{global_step}'
-    self.status_cache.UpdateCkpt(ckpt_key)
     for i in range(len(self.params.dataset_names)):
       dataset_name = self.params.dataset_names[i]
-      summaries = self.status_cache.TryLoadCache(ckpt_key, dataset_name)
-      if summaries:
-        self._dataset_summaries[dataset_name] = summaries
+      if self._TryLoadCache(dataset_name, sess):
         continue
       inp_instance = self._inputs[i]
       future = self.RunForInput(dataset_name, inp_instance, sess, threadpool)
@@ -2247,7 +2295,13 @@ class MLPerfTrainDecodeProgram(BaseProgram):
 
 
 class InputBenchmark(BaseProgram):
-  """Measures input generation steps/sec depending on the params below."""
+  """Measures input generation steps/sec depending on the params below.
+
+  With `profile_stages`, it also reports the time per step, examples/sec and
+  bytes/sec of each stage of the input pipeline, e.g. `input_batch` (reading
+  and _InputBatch()), `preprocess` (_PreprocessInputBatch()) and `sink`. The
+  time of a stage is measured from the end of the stage preceding it.
+  """
 
   @classmethod
   def Params(cls):
@@ -2255,6 +2309,16 @@ class InputBenchmark(BaseProgram):
     p.Define('warmup_loops', 1,
              'How many loops to warmup before measuring elapsed time.')
     p.Define('measurement_loops', 5, 'How many loops to measure across.')
+    p.Define(
+        'profile_stages', False,
+        'Whether to report measurements for each input pipeline stage. Adds '
+        'timestamps and extra fetches to every step, and replaces the infeed '
+        'loop, so input data stats are not written.')
+    p.Define(
+        'use_cpu_sink', False,
+        'If True, the input batch is built and consumed on the local host '
+        'instead of on the TPU infeed hosts, so that the benchmark can run on '
+        'hosts without TPUs.')
     return p
 
   def __init__(self, params, **kwargs):
@@ -2262,10 +2326,42 @@ class InputBenchmark(BaseProgram):
     self._program_name = 'InputBenchmark'
 
   def BuildTpuSubgraph(self):
+    p = self.params
     with py_utils.OpportunisticVariableReuseScope(True):
       self._model = self._InstantiateTaskModel(self._task_params)
     self._task = self._model.GetTask()
-    self._task.input.CreateTpuEnqueueOps(benchmark_only=True)
+    if p.profile_stages:
+      self._task.input.EnableStageProfiling()
+    if p.use_cpu_sink:
+      self._task.input.CreateSinkOps()
+    else:
+      self._task.input.CreateTpuEnqueueOps(benchmark_only=True)
+
+  def _ProfileLoop(self, sess, stage_stats):
+    """Runs an infeed loop, accumulating per-stage stats in `stage_stats`."""
+    inp = self._task.input
+    for _ in range(self._steps_per_loop):
+      _, profile = sess.run([inp.tpu_infeed_op, inp.stage_profile])
+      for stage, predecessor in inp.stage_predecessors.items():
+        stats = stage_stats[stage]
+        # A stage ends when it ended on all hosts.
+        stats.secs += (
+            max(profile[stage].timestamp) -
+            max(profile[predecessor].timestamp))
+        stats.num_bytes += sum(profile[stage].num_bytes)
+        stats.num_examples += sum(profile[stage].num_examples)
+
+  def _ReportStageStats(self, stage_stats, num_steps):
+    for stage, stats in stage_stats.items():
+      values = {'secs_per_step': stats.secs / num_steps}
+      if stats.secs > 0:
+        values['examples_per_sec'] = stats.num_examples / stats.secs
+        values['bytes_per_sec'] = stats.num_bytes / stats.secs
+      tf.logging.info(
+          'Input benchmark stage %s: %s', stage,
+          ' '.join(f'{k} {v:f}' for k, v in sorted(values.items())))
+      for k, v in values.items():
+        self._SummarizeValue(num_steps, f'input_benchmark/{stage}/{k}', v)
 
   def Run(self, sess=None):
     p = self.params
@@ -2275,12 +2371,20 @@ class InputBenchmark(BaseProgram):
     for _ in range(p.warmup_loops):
       self._InfeedLoop(sess)
 
+    stage_stats = collections.defaultdict(
+        lambda: py_utils.NestedMap(secs=0., num_bytes=0, num_examples=0))
     with py_utils.Timer() as t:
       for _ in range(p.measurement_loops):
-        self._InfeedLoop(sess)
+        if p.profile_stages:
+          self._ProfileLoop(sess, stage_stats)
+        else:
+          self._InfeedLoop(sess)
 
     steps_per_sec = p.measurement_loops * self._steps_per_loop / t.duration
     tf.logging.info('Input benchmark: steps/sec %f', steps_per_sec)
+    if p.profile_stages:
+      self._ReportStageStats(stage_stats,
+                             p.measurement_loops * self._steps_per_loop)
     return True
 
 
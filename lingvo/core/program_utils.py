@@ -14,7 +14,13 @@
 # ==============================================================================
 """Utils function for program.py."""
 
+import collections
+import hashlib
+import json
 import os
+import pickle
+import threading
+import time
 
 import lingvo.compat as tf
 
@@ -31,6 +37,8 @@ def CsvToSummary(csv):
   """Convert csv format to summary (Dict[str, tf.Summary])."""
   summaries = {}
   for l in csv.split('\n'):
+    if not l:
+      continue
     row = l.split(',')
     if len(row) != 2:
       tf.logging.warn(f'Failed to parse csv line: {l}, will ignore it.')
@@ -42,48 +50,210 @@ def CsvToSummary(csv):
   return summaries
 
 
+CachedDecodeResult = collections.namedtuple('CachedDecodeResult',
+                                            ['summaries', 'decode_out'])
+
+
 class DecodeStatusCache:
-  """Maintain status file to keep decoding datasets status.
-
-  Status file should have following format:
-  - 1st line is checkpoint key, e.g. ckpt-123
-  - the rest lines are dataset names that has been decoded.
-  Here's an example:
-  ckpt-123
-  Dev
-  Test
+  """Content-addressed cache of decode results.
+
+  Each entry holds the summaries, and optionally the decode outputs, of
+  decoding one dataset with one checkpoint, and is keyed by the checkpoint key
+  (e.g. from CheckpointKeys()), the dataset name and a fingerprint of the decode
+  params, so that results of any previously decoded checkpoint can be reused,
+  and results of different decode params are never mixed up.
+
+  Entries are stored under <program_dir>/cache as:
+  - <entry id>.json: the key of the entry, its summaries in csv format,
+    and its creation and last use times. Written last, so that an entry
+    exists iff its json file does.
+  - <entry id>.pickle: the decode outputs, if any.
+
+  Entries older than max_age_secs are evicted, then the least recently used
+  entries until there are at most max_entries entries of at most max_bytes
+  in total.
   """
 
-  def __init__(self, program_dir):
+  def __init__(self,
+               program_dir,
+               params_fingerprint='',
+               max_entries=100,
+               max_bytes=0,
+               max_age_secs=0):
+    """Constructor.
+
+    Args:
+      program_dir: The program directory, the cache is in its cache subdir.
+      params_fingerprint: A fingerprint of the decode params, e.g. from
+        ParamsFingerprint().
+      max_entries: Maximum number of entries, 0 for no limit.
+      max_bytes: Maximum total size of the entries, 0 for no limit.
+      max_age_secs: Maximum age of an entry, 0 for no limit.
+    """
     self.ckpt_key = ''
-    self.decoded_datasets = []
-    self.status_file = os.path.join(program_dir, 'decoded_datasets.txt')
-    # TODO(xingwu): Consider add a TTL.
     self.cache_dir = os.path.join(program_dir, 'cache')
+    self.params_fingerprint = params_fingerprint
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.max_age_secs = max_age_secs
+    self.num_hits = 0
+    self.num_misses = 0
+    self._lock = threading.Lock()
     tf.io.gfile.makedirs(self.cache_dir)
-    if tf.io.gfile.exists(self.status_file):
-      with tf.io.gfile.GFile(self.status_file, 'r') as f:
-        content = list(l.strip() for l in f.readlines())
-        if content:
-          self.ckpt_key = content[0]
-        if len(content) > 1:
-          self.decoded_datasets = content[1:]
+
+  def _EntryId(self, ckpt_key, dataset_name):
+    key = '\n'.join([ckpt_key, dataset_name, self.params_fingerprint])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+  def _MetaPath(self, entry_id):
+    return os.path.join(self.cache_dir, f'{entry_id}.json')
+
+  def _DecodeOutPath(self, entry_id):
+    return os.path.join(self.cache_dir, f'{entry_id}.pickle')
+
+  def _ReadMeta(self, entry_id):
+    path = self._MetaPath(entry_id)
+    if not tf.io.gfile.exists(path):
+      return None
+    with tf.io.gfile.GFile(path, 'r') as f:
+      return json.load(f)
+
+  def _WriteMeta(self, entry_id, meta):
+    path = self._MetaPath(entry_id)
+    with tf.io.gfile.GFile(path + '.tmp', 'w') as f:
+      json.dump(meta, f)
+    tf.io.gfile.rename(path + '.tmp', path, overwrite=True)
+
+  def _Remove(self, entry_id):
+    for path in [self._MetaPath(entry_id), self._DecodeOutPath(entry_id)]:
+      if tf.io.gfile.exists(path):
+        tf.io.gfile.remove(path)
+
+  def _IsExpired(self, meta, now):
+    return self.max_age_secs and now - meta['created'] > self.max_age_secs
+
+  def HitRate(self):
+    """Returns the fraction of Lookup() calls that hit the cache."""
+    num_lookups = self.num_hits + self.num_misses
+    return self.num_hits / num_lookups if num_lookups else 0.
+
+  def Lookup(self, ckpt_key, dataset_name, load_decode_out=False):
+    """Looks up the decode results of ckpt_key on dataset_name.
+
+    Args:
+      ckpt_key: str, checkpoint key, e.g. ckpt-123
+      dataset_name: str, the dataset name, e.g. Test
+      load_decode_out: Whether to also load the cached decode outputs.
+
+    Returns:
+      A CachedDecodeResult, whose decode_out is None unless load_decode_out
+      and decode outputs were cached, or None if there is no such entry.
+    """
+    return self.LookupAny([ckpt_key], dataset_name, load_decode_out)
+
+  def LookupAny(self, ckpt_keys, dataset_name, load_decode_out=False):
+    """Looks up the decode results of the first cached of ckpt_keys.
+
+    Counts as a single hit or miss, see HitRate().
+
+    Args:
+      ckpt_keys: List of str, checkpoint keys of the same variables, e.g. from
+        CheckpointKeys().
+      dataset_name: str, the dataset name, e.g. Test
+      load_decode_out: Whether to also load the cached decode outputs.
+
+    Returns:
+      A CachedDecodeResult as in Lookup(), or None if none of ckpt_keys has an
+      entry.
+    """
+    with self._lock:
+      now = time.time()
+      for ckpt_key in ckpt_keys:
+        entry_id = self._EntryId(ckpt_key, dataset_name)
+        meta = self._ReadMeta(entry_id)
+        if meta and self._IsExpired(meta, now):
+          self._Remove(entry_id)
+          meta = None
+        if meta:
+          break
+      if not meta:
+        self.num_misses += 1
+        tf.logging.info('Decode cache miss for %s on %s (hit rate %.2f).',
+                        ckpt_keys, dataset_name, self.HitRate())
+        return None
+      decode_out = None
+      if load_decode_out and meta['has_decode_out']:
+        with tf.io.gfile.GFile(self._DecodeOutPath(entry_id), 'rb') as f:
+          decode_out = pickle.load(f)
+      meta['last_used'] = now
+      self._WriteMeta(entry_id, meta)
+      self.num_hits += 1
+      tf.logging.info('Decode cache hit for %s on %s (hit rate %.2f).',
+                      ckpt_key, dataset_name, self.HitRate())
+      return CachedDecodeResult(CsvToSummary(meta['summaries']), decode_out)
+
+  def Update(self, ckpt_key, dataset_name, summaries, decode_out=None):
+    """Caches the decode results of ckpt_key on dataset_name.
+
+    Args:
+      ckpt_key: str, checkpoint key, e.g. ckpt-123
+      dataset_name: str, the dataset name, e.g. Test
+      summaries: Dict[str, tf.Summary] of scalar summaries.
+      decode_out: Optional picklable decode outputs, e.g. the key value pairs
+        passed to DecodeFinalize().
+    """
+    entry_id = self._EntryId(ckpt_key, dataset_name)
+    with self._lock:
+      num_bytes = 0
+      if decode_out is not None:
+        with tf.io.gfile.GFile(self._DecodeOutPath(entry_id), 'wb') as f:
+          f.write(pickle.dumps(decode_out, protocol=pickle.HIGHEST_PROTOCOL))
+        num_bytes = tf.io.gfile.stat(self._DecodeOutPath(entry_id)).length
+      csv = SummaryToCsv(summaries)
+      now = time.time()
+      self._WriteMeta(
+          entry_id, {
+              'ckpt_key': ckpt_key,
+              'dataset_name': dataset_name,
+              'params_fingerprint': self.params_fingerprint,
+              'summaries': csv,
+              'has_decode_out': decode_out is not None,
+              'num_bytes': num_bytes + len(csv),
+              'created': now,
+              'last_used': now,
+          })
+      self._Evict(now)
+
+  def _Evict(self, now):
+    """Evicts expired, then least recently used entries."""
+    entries = []
+    for path in tf.io.gfile.glob(os.path.join(self.cache_dir, '*.json')):
+      entry_id = os.path.basename(path)[:-len('.json')]
+      meta = self._ReadMeta(entry_id)
+      if meta is None:
+        continue
+      if self._IsExpired(meta, now):
+        tf.logging.info('Evicting expired decode cache entry %s.', entry_id)
+        self._Remove(entry_id)
+        continue
+      entries.append((meta['last_used'], meta['num_bytes'], entry_id))
+    entries.sort()
+    total_bytes = sum(num_bytes for _, num_bytes, _ in entries)
+    while entries and (
+        (self.max_entries and len(entries) > self.max_entries) or
+        (self.max_bytes and total_bytes > self.max_bytes)):
+      _, num_bytes, entry_id = entries.pop(0)
+      tf.logging.info('Evicting decode cache entry %s.', entry_id)
+      self._Remove(entry_id)
+      total_bytes -= num_bytes
 
   def UpdateCkpt(self, ckpt_key):
-    """Update checkpoint key in the status."""
-    if ckpt_key != self.ckpt_key:
-      self.ckpt_key = ckpt_key
-      self.decoded_datasets = []
-      with tf.io.gfile.GFile(self.status_file, 'w') as f:
-        f.write(self.ckpt_key)
-
-  def UpdateDataset(self, dataset_name, summaries):
-    """Update decoded dataset in the status."""
-    cache_file = os.path.join(self.cache_dir, f'{dataset_name}.csv')
-    with tf.io.gfile.GFile(cache_file, 'w') as f:
-      f.write(SummaryToCsv(summaries))
-    with tf.io.gfile.GFile(self.status_file, 'w+') as f:
-      f.write(f.read().strip() + '\n' + dataset_name)
+    """Sets the checkpoint key of later UpdateDataset() calls."""
+    self.ckpt_key = ckpt_key
+
+  def UpdateDataset(self, dataset_name, summaries, decode_out=None):
+    """Caches the decode results of the current checkpoint on dataset_name."""
+    self.Update(self.ckpt_key, dataset_name, summaries, decode_out)
 
   def TryLoadCache(self, ckpt_key, dataset_name):
     """Try load summary cache for ckpt_key, dataset_name.
@@ -95,17 +265,56 @@ class DecodeStatusCache:
     Returns:
       summaries if load successful, otherwise, return None
     """
-    if ckpt_key == self.ckpt_key and dataset_name in self.decoded_datasets:
-      cache_file = os.path.join(self.cache_dir, f'{dataset_name}.csv')
-      if not tf.io.gfile.exists(cache_file):
-        tf.logging.warn(f'cached summary {cache_file} is gone!')
-        return None
-      with tf.io.gfile.GFile(cache_file, 'r') as f:
-        summaries = CsvToSummary(f.read())
-      with tf.io.gfile.GFile(self.status_file, 'w+') as f:
-        f.write(f.read().strip() + '\n' + dataset_name)
-      return summaries
-    return None
+    result = self.Lookup(ckpt_key, dataset_name)
+    return result.summaries if result else None
+
+
+def SavedCheckpointPath(checkpoint_dir, global_step):
+  """Returns the prefix of the checkpoint saved for global_step, or None.
+
+  Args:
+    checkpoint_dir: The directory of the checkpoints, e.g. <logdir>/train.
+    global_step: The global step of the checkpoint.
+  """
+  for index_path in tf.io.gfile.glob(
+      os.path.join(checkpoint_dir, 'ckpt-*.index')):
+    checkpoint_path = index_path[:-len('.index')]
+    # Checkpoint paths end in the global step, zero padded or not.
+    step = checkpoint_path.rsplit('-', 1)[-1]
+    if step.isdigit() and int(step) == global_step:
+      return checkpoint_path
+  return None
+
+
+def CheckpointKeys(global_step, checkpoint_fingerprint=None):
+  """Returns the decode cache keys of the variables at global_step.
+
+  Keys are ordered by preference. The first key identifies the variables by
+  the contents of the checkpoint saved for global_step, if any, so that
+  different checkpoints at the same step, e.g. of another run in the same
+  logdir, do not share entries, and a run that restores the checkpoint, e.g.
+  after a preemption, reuses the entries of the run that saved it. The last key
+  identifies the variables by global_step only, for entries cached before the
+  checkpoint was written, e.g. while it was saved asynchronously.
+
+  Args:
+    global_step: The global step of the variables.
+    checkpoint_fingerprint: Optional fingerprint of the checkpoint saved for
+      global_step, e.g. from decoder_lib.CheckpointFingerprint.
+
+  Returns:
+    A list of str, to look up with DecodeStatusCache.LookupAny(). Update()
+    entries with the first key.
+  """
+  keys = [f'ckpt-{global_step}']
+  if checkpoint_fingerprint:
+    keys.insert(0, f'ckpt-{checkpoint_fingerprint}')
+  return keys
+
+
+def ParamsFingerprint(params):
+  """Returns a fingerprint of the text representation of params."""
+  return hashlib.sha256(params.ToText().encode('utf-8')).hexdigest()[:32]
 
 
 class TriggerScheduler:
@@ -0,0 +1,178 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for program_utils."""
+
+import os
+import time
+from unittest import mock
+
+import lingvo.compat as tf
+from lingvo.core import decoder_lib
+from lingvo.core import program_utils
+from lingvo.core import test_utils
+
+
+def _Summaries(value):
+  return {'acc': tf.Summary(value=[tf.Summary.Value(tag='acc',
+                                                    simple_value=value)])}
+
+
+class DecodeStatusCacheTest(test_utils.TestCase):
+
+  def testLookup(self):
+    cache = program_utils.DecodeStatusCache(self.get_temp_dir())
+    self.assertIsNone(cache.Lookup('ckpt-1', 'Test'))
+    cache.Update('ckpt-1', 'Test', _Summaries(0.5), decode_out=[('a', 1)])
+    cache.Update('ckpt-2', 'Test', _Summaries(0.75))
+
+    result = cache.Lookup('ckpt-1', 'Test', load_decode_out=True)
+    self.assertEqual(0.5, result.summaries['acc'].value[0].simple_value)
+    self.assertEqual([('a', 1)], result.decode_out)
+    result = cache.Lookup('ckpt-2', 'Test', load_decode_out=True)
+    self.assertEqual(0.75, result.summaries['acc'].value[0].simple_value)
+    self.assertIsNone(result.decode_out)
+    self.assertIsNone(cache.Lookup('ckpt-2', 'Dev'))
+    self.assertEqual(2, cache.num_hits)
+    self.assertEqual(2, cache.num_misses)
+    self.assertEqual(0.5, cache.HitRate())
+
+    # Entries persist across instances, but not across decode params.
+    cache = program_utils.DecodeStatusCache(self.get_temp_dir())
+    self.assertIsNotNone(cache.Lookup('ckpt-1', 'Test'))
+    cache = program_utils.DecodeStatusCache(
+        self.get_temp_dir(), params_fingerprint='other')
+    self.assertIsNone(cache.Lookup('ckpt-1', 'Test'))
+
+  def testBackwardCompatibleApi(self):
+    cache = program_utils.DecodeStatusCache(self.get_temp_dir())
+    cache.UpdateCkpt('ckpt-1')
+    cache.UpdateDataset('Test', _Summaries(0.5))
+    summaries = cache.TryLoadCache('ckpt-1', 'Test')
+    self.assertEqual(0.5, summaries['acc'].value[0].simple_value)
+    self.assertIsNone(cache.TryLoadCache('ckpt-2', 'Test'))
+
+  def testEvictsLeastRecentlyUsed(self):
+    cache = program_utils.DecodeStatusCache(self.get_temp_dir(), max_entries=2)
+    with mock.patch.object(time, 'time', side_effect=range(100)):
+      cache.Update('ckpt-1', 'Test', _Summaries(1.))
+      cache.Update('ckpt-2', 'Test', _Summaries(2.))
+      self.assertIsNotNone(cache.Lookup('ckpt-1', 'Test'))
+      cache.Update('ckpt-3', 'Test', _Summaries(3.))
+      self.assertIsNone(cache.Lookup('ckpt-2', 'Test'))
+      self.assertIsNotNone(cache.Lookup('ckpt-1', 'Test'))
+      self.assertIsNotNone(cache.Lookup('ckpt-3', 'Test'))
+    self.assertLen(tf.io.gfile.glob(cache.cache_dir + '/*.json'), 2)
+
+  def testEvictsBySize(self):
+    cache = program_utils.DecodeStatusCache(
+        self.get_temp_dir(), max_entries=0, max_bytes=2000)
+    cache.Update('ckpt-1', 'Test', _Summaries(1.), decode_out=[b'x' * 1500])
+    cache.Update('ckpt-2', 'Test', _Summaries(2.), decode_out=[b'x' * 1500])
+    self.assertIsNone(cache.Lookup('ckpt-1', 'Test'))
+    self.assertIsNotNone(cache.Lookup('ckpt-2', 'Test'))
+    self.assertLen(tf.io.gfile.glob(cache.cache_dir + '/*.pickle'), 1)
+
+  def testEvictsByAge(self):
+    cache = program_utils.DecodeStatusCache(
+        self.get_temp_dir(), max_age_secs=10)
+    with mock.patch.object(time, 'time', return_value=100.):
+      cache.Update('ckpt-1', 'Test', _Summaries(1.))
+    with mock.patch.object(time, 'time', return_value=105.):
+      self.assertIsNotNone(cache.Lookup('ckpt-1', 'Test'))
+    with mock.patch.object(time, 'time', return_value=111.):
+      self.assertIsNone(cache.Lookup('ckpt-1', 'Test'))
+
+
+class CheckpointKeysTest(test_utils.TestCase):
+
+  def _SaveCheckpoint(self, checkpoint_dir, value, global_step):
+    """Saves a checkpoint of a variable holding value, returns its path."""
+    with self.session(graph=tf.Graph()) as sess:
+      var = tf.get_variable('var', initializer=value)
+      sess.run(tf.global_variables_initializer())
+      return tf.train.Saver([var]).save(
+          sess, os.path.join(checkpoint_dir, 'ckpt'), global_step=global_step)
+
+  def _CheckpointKeys(self, checkpoint_dir, global_step):
+    checkpoint_path = program_utils.SavedCheckpointPath(checkpoint_dir,
+                                                        global_step)
+    if not checkpoint_path:
+      return program_utils.CheckpointKeys(global_step)
+    return program_utils.CheckpointKeys(
+        global_step, decoder_lib.CheckpointFingerprint(checkpoint_path))
+
+  def testSavedCheckpointPath(self):
+    checkpoint_dir = self.get_temp_dir()
+    path = self._SaveCheckpoint(checkpoint_dir, 1., 100)
+    self.assertEqual(path,
+                     program_utils.SavedCheckpointPath(checkpoint_dir, 100))
+    self.assertIsNone(program_utils.SavedCheckpointPath(checkpoint_dir, 10))
+    self.assertIsNone(program_utils.SavedCheckpointPath(checkpoint_dir, 1000))
+
+  def testCheckpointKeys(self):
+    self.assertEqual(['ckpt-100'], program_utils.CheckpointKeys(100))
+    self.assertEqual(['ckpt-abc', 'ckpt-100'],
+                     program_utils.CheckpointKeys(100, 'abc'))
+
+  def testRestartReusesCachedOutputs(self):
+    logdir = self.get_temp_dir()
+    checkpoint_dir = os.path.join(logdir, 'train')
+    program_dir = os.path.join(logdir, 'decode_test')
+
+    # The first run saves ckpt-100 and decodes it.
+    checkpoint_path = self._SaveCheckpoint(checkpoint_dir, 1., 100)
+    cache = program_utils.DecodeStatusCache(program_dir)
+    keys = self._CheckpointKeys(checkpoint_dir, 100)
+    self.assertIsNone(cache.LookupAny(keys, 'Test'))
+    cache.Update(keys[0], 'Test', _Summaries(0.5), decode_out=[('a', 1)])
+
+    # After a restart, the job restores ckpt-100 and reuses the decode results.
+    with self.session(graph=tf.Graph()) as sess:
+      var = tf.get_variable('var', initializer=0.)
+      tf.train.Saver([var]).restore(sess, checkpoint_path)
+      self.assertEqual(1., sess.run(var))
+    cache = program_utils.DecodeStatusCache(program_dir)
+    result = cache.LookupAny(
+        self._CheckpointKeys(checkpoint_dir, 100), 'Test',
+        load_decode_out=True)
+    self.assertEqual(0.5, result.summaries['acc'].value[0].simple_value)
+    self.assertEqual([('a', 1)], result.decode_out)
+    self.assertEqual(1, cache.num_hits)
+    self.assertEqual(0, cache.num_misses)
+
+    # Another run with a different checkpoint at the same step does not.
+    other_dir = os.path.join(logdir, 'other')
+    self._SaveCheckpoint(other_dir, 2., 100)
+    self.assertIsNone(
+        cache.LookupAny(self._CheckpointKeys(other_dir, 100), 'Test'))
+
+  def testRestartReusesOutputsCachedBeforeCheckpointWasSaved(self):
+    logdir = self.get_temp_dir()
+    checkpoint_dir = os.path.join(logdir, 'train')
+    program_dir = os.path.join(logdir, 'decode_test')
+
+    # The first run decodes step 100 before ckpt-100 is written.
+    cache = program_utils.DecodeStatusCache(program_dir)
+    cache.Update(
+        self._CheckpointKeys(checkpoint_dir, 100)[0], 'Test', _Summaries(0.5))
+    self._SaveCheckpoint(checkpoint_dir, 1., 100)
+
+    cache = program_utils.DecodeStatusCache(program_dir)
+    result = cache.LookupAny(self._CheckpointKeys(checkpoint_dir, 100), 'Test')
+    self.assertEqual(0.5, result.summaries['acc'].value[0].simple_value)
+
+
+if __name__ == '__main__':
+  test_utils.main()
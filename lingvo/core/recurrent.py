@@ -134,14 +134,15 @@ def _Update(nmap_acc, nmap_x, t):
         ret[key] = nmap_acc[key];
         ret[key][t, :] = nmap_x[key]
   """
-  acc_lst = nmap_acc.Flatten()
-  kx_lst = nmap_x.FlattenItems()
+  treedef = nmap_acc.GetTreeDef()
+  acc_lst = treedef.Flatten(nmap_acc)
+  kx_lst = treedef.FlattenItems(nmap_x)
   t = tf.cast([t], tf.int32)  # tf.cast casts on-device tensors.
   lst = []
   for acc, (key, x) in zip(acc_lst, kx_lst):
     with tf.name_scope('update_%s' % py_utils.SanitizeScopeKey(key)):
       lst += [scatter_update.Update(acc, t, tf.expand_dims(x, 0))]
-  return nmap_acc.Pack(lst)
+  return treedef.Pack(lst)
 
 
 def _SeqLenDim(nmap):
@@ -18,7 +18,11 @@ to carry out extra sanity checks on the checkpoint.
 """
 
 import collections
+import concurrent.futures
+import json
+import os
 import re
+import struct
 import threading
 import time
 from lingvo import compat as tf
@@ -95,6 +99,74 @@ def _VarKey(var):
   return var.name[:-2]  # strip :0
 
 
+# Odd multipliers of the 64-bit mixing function in `_Fingerprint` (splitmix64),
+# as signed int64.
+_FINGERPRINT_MULTIPLIERS = (-7046029254386353131, -4658895280553007687,
+                            -7723592293110705685)
+
+
+def _Fingerprint(var):
+  """Returns a fingerprint of the value of `var`.
+
+  tf.fingerprint only has a CPU kernel, so fingerprinting the value of a
+  GPU/TPU variable directly would copy all of it to the host on every save.
+  Instead, each element of such a variable is bitcast to an integer and mixed
+  with its position, and the mixed elements are summed on the device of `var`,
+  so that only two int64 values per variable reach the host. Variables already
+  on the host are fingerprinted with tf.fingerprint, which is much faster on
+  CPU.
+
+  Args:
+    var: A variable.
+
+  Returns:
+    A [2] int64 tensor for numeric variables on an accelerator, or a [1, 8]
+    uint8 tensor computed on the host otherwise.
+  """
+  value = var.read_value()
+  device_type = tf.DeviceSpec.from_string(var.device).device_type
+  if value.dtype == tf.string or device_type in (None, "CPU"):
+    if value.dtype == tf.string:
+      value = tf.fingerprint(tf.reshape(value, [-1]))
+    return tf.fingerprint(tf.reshape(value, [1, -1]))
+  if value.dtype == tf.bool:
+    words = tf.cast(value, tf.int64)
+  else:
+    word_dtype = {1: tf.int8, 2: tf.int16}.get(value.dtype.size, tf.int32)
+    words = tf.cast(tf.bitcast(value, word_dtype), tf.int64)
+  words = tf.reshape(words, [-1])
+  m1, m2, m3 = _FINGERPRINT_MULTIPLIERS
+  h = words + tf.range(tf.size(words, out_type=tf.int64), dtype=tf.int64) * m1
+  h = tf.bitwise.bitwise_xor(h, tf.bitwise.right_shift(h, 30)) * m2
+  h = tf.bitwise.bitwise_xor(h, tf.bitwise.right_shift(h, 27)) * m3
+  h = tf.bitwise.bitwise_xor(h, tf.bitwise.right_shift(h, 31))
+  # The second sum is over a different, non-linear function of each element,
+  # so that changes cancelling out in one sum are unlikely to cancel in both.
+  return tf.stack([tf.reduce_sum(h), tf.reduce_sum(h * h)])
+
+
+def _DataFilename(prefix, shard, num_shards):
+  """Returns the name of a data file of a V2 checkpoint."""
+  return "{}.data-{:05d}-of-{:05d}".format(prefix, shard, num_shards)
+
+
+def _LinkOrCopy(src, dst):
+  """Hard links `src` to `dst` on local file systems, copies it otherwise."""
+  if "://" in src:
+    tf.io.gfile.copy(src, dst, overwrite=True)
+  else:
+    os.link(src, dst)
+
+
+# A shard written by an incremental save.
+#   fingerprint: Fingerprints of the values of the variables in the shard.
+#   prefix: The checkpoint containing the data file of the shard.
+#   index: The content of the .index file of the shard before it was merged
+#     into the checkpoint.
+_SavedShard = collections.namedtuple("_SavedShard",
+                                     ["fingerprint", "prefix", "index"])
+
+
 class Saver:
   """Simpler version of tf.train.Saver with extra sanity checks.
 
@@ -118,6 +190,13 @@ class Saver:
   2) It's also possible that a pre-emption occurs after saving the
   checkpoint state file but before checkpointing, so checkpoints
   that would have otherwise been deleted will live forever.
+
+  With `incremental_save`, variables are fingerprinted before each save and
+  only the shards whose variables changed since the previous save are
+  written, by `num_save_threads` parallel writers. The data files of unchanged
+  shards are hard linked (or copied on remote file systems) from the previous
+  checkpoint, so every checkpoint is still a complete V2 checkpoint readable
+  by tf.train.Saver and garbage collecting one never affects another.
   """
 
   RE_PATTERN = re.compile(r"^.*/ckpt-(\d+).*$")
@@ -128,7 +207,10 @@ class Saver:
                sanity_checks=None,
                keep_latest_n=None,
                keep_every_n_hours=None,
-               async_save=False):
+               async_save=False,
+               incremental_save=False,
+               incremental_shard_bytes=256 << 20,
+               num_save_threads=8):
     self._logdir = logdir
     self._state_file = "{}/checkpoint".format(self._logdir)
     self._vars = variables
@@ -141,6 +223,11 @@ class Saver:
     self._copying_op = []
     self._async_save_thread = None
     self._async_exception = None
+    self._incremental_save = incremental_save
+    self._incremental_shard_bytes = incremental_shard_bytes
+    self._num_save_threads = num_save_threads
+    # Shard index -> _SavedShard of the latest incremental save.
+    self._saved_shards = {}
     assert not sanity_checks or all(
         isinstance(x[1], SanityCheck) for x in sanity_checks)
     self._sanity_checks = sanity_checks
@@ -203,49 +290,17 @@ class Saver:
     self._copied_vars = []
     self._copying_op = None
 
-    if not self._async_save:
+    if self._incremental_save:
+      self._BuildIncrementalSave()
+    elif not self._async_save:
       self._save_op = self._AddShardedSaveOps(self._vars, self._save_prefix,
                                               _VarKey)
       self._copied_vars_initializer = tf.no_op()
     else:
-      # Creating a copy of the vars. We need to add the graph ops here (during
-      # construction) to avoid adding duplicate functions during execution
-      # (b/226390414).
-      # Note: the copy will be created in self._var_graph regardless which graph
-      # is set as default, so we need to apply the device context in
-      # self._var_graph.
-      copying_ops = []
-      with self._var_graph.as_default():
-        for v in self._vars:
-          with self._var_graph.device(v.device):
-            # Initialize with a constant scalar to avoid consuming large amount
-            # of memory unnecessarily.
-            # According to TF, use tf.TensorShape(None) (unspecified shape) so
-            # that the variable can later be assigned with values of different
-            # shapes.
-            assert v.name.endswith(":0")
-            copied_v = tf.compat.v2.Variable(
-                tf.cast(0, v.dtype),
-                trainable=False,
-                name=f"async_ckpt/{v.name[:-2]}",
-                dtype=v.dtype,
-                shape=tf.TensorShape(None))
-            assert copied_v.graph is v.graph
-            if v.device:
-              assert copied_v.device == v.device
-            else:
-              # When v.device is empty, the device of the copied variable is
-              # decided by the placer.
-              # TODO(laigd): this should not happen for model variables during
-              # training, find a way to check that.
-              pass
-            self._copied_vars.append(copied_v)
-            copying_ops.append(copied_v.assign(v))
+      copying_ops = self._CopyVars()
       # Group the ops to avoid running them directly, which will generate
       # expensive send/recv operations.
       self._copying_op = tf.group(*copying_ops)
-      self._copied_vars_initializer = tf.group(
-          *[v.initializer for v in self._copied_vars])
 
       copied_var_map = {
           id(copied_var): var
@@ -255,6 +310,111 @@ class Saver:
           self._copied_vars, self._save_prefix,
           lambda copied_var: _VarKey(copied_var_map[id(copied_var)]))
 
+  def _CopyVars(self):
+    """Creates a copy of each of self._vars for async saving.
+
+    Returns:
+      The list of ops assigning each variable to its copy.
+    """
+    # Creating a copy of the vars. We need to add the graph ops here (during
+    # construction) to avoid adding duplicate functions during execution
+    # (b/226390414).
+    # Note: the copy will be created in self._var_graph regardless which graph
+    # is set as default, so we need to apply the device context in
+    # self._var_graph.
+    copying_ops = []
+    with self._var_graph.as_default():
+      for v in self._vars:
+        with self._var_graph.device(v.device):
+          # Initialize with a constant scalar to avoid consuming large amount
+          # of memory unnecessarily.
+          # According to TF, use tf.TensorShape(None) (unspecified shape) so
+          # that the variable can later be assigned with values of different
+          # shapes.
+          assert v.name.endswith(":0")
+          copied_v = tf.compat.v2.Variable(
+              tf.cast(0, v.dtype),
+              trainable=False,
+              name=f"async_ckpt/{v.name[:-2]}",
+              dtype=v.dtype,
+              shape=tf.TensorShape(None))
+          assert copied_v.graph is v.graph
+          if v.device:
+            assert copied_v.device == v.device
+          else:
+            # When v.device is empty, the device of the copied variable is
+            # decided by the placer.
+            # TODO(laigd): this should not happen for model variables during
+            # training, find a way to check that.
+            pass
+          self._copied_vars.append(copied_v)
+          copying_ops.append(copied_v.assign(v))
+    self._copied_vars_initializer = tf.group(
+        *[v.initializer for v in self._copied_vars])
+    return copying_ops
+
+  def _ShardVariables(self):
+    """Groups self._vars into shards for incremental saving.
+
+    As in _AddShardedSaveOps(), variables are grouped per device. Each group is
+    further split into shards of at most `incremental_shard_bytes`, so that
+    unchanged large variables are not rewritten when a small variable next to
+    them changes.
+
+    Returns:
+      A list of lists of indices into self._vars.
+    """
+    per_device = collections.defaultdict(lambda: [])
+    for i, var in enumerate(self._vars):
+      per_device[var.device].append(i)
+
+    shards = []
+    for var_ids in per_device.values():
+      shard = []
+      shard_bytes = 0
+      for i in var_ids:
+        var = self._vars[i]
+        var_bytes = (var.shape.num_elements() or 0) * var.dtype.size
+        if shard and shard_bytes + var_bytes > self._incremental_shard_bytes:
+          shards.append(shard)
+          shard = []
+          shard_bytes = 0
+        shard.append(i)
+        shard_bytes += var_bytes
+      if shard:
+        shards.append(shard)
+    return shards
+
+  def _BuildIncrementalSave(self):
+    """Builds per-shard fingerprint, copy and save ops for incremental saves."""
+    self._shards = self._ShardVariables()
+    copying_ops = self._CopyVars() if self._async_save else None
+    saved_vars = self._copied_vars if self._async_save else self._vars
+    self._shard_prefix_ph = tf.placeholder(tf.string, shape=[])
+    self._shard_prefixes_ph = tf.placeholder(tf.string, shape=[None])
+    self._shard_fingerprints = []
+    self._shard_copying_ops = []
+    self._shard_save_ops = []
+    with self._var_graph.as_default():
+      for shard in self._shards:
+        with self._var_graph.device(self._vars[shard[0]].device):
+          self._shard_fingerprints.append(
+              [(_Fingerprint(self._vars[i]), tf.shape(self._vars[i]))
+               for i in shard])
+          if copying_ops:
+            self._shard_copying_ops.append(
+                tf.group(*[copying_ops[i] for i in shard]))
+          self._shard_save_ops.append(
+              io_ops.save_v2(
+                  prefix=self._shard_prefix_ph,
+                  tensor_names=[_VarKey(self._vars[i]) for i in shard],
+                  tensors=[saved_vars[i].read_value() for i in shard],
+                  shape_and_slices=[""] * len(shard)))
+      self._save_op = gen_io_ops.merge_v2_checkpoints(
+          self._shard_prefixes_ph, self._save_prefix, delete_old_dirs=True)
+    if not self._async_save:
+      self._copied_vars_initializer = tf.no_op()
+
   def _BuildRestore(self):
     """Builds restore ops."""
     assign_ops = []
@@ -353,21 +513,35 @@ class Saver:
       self._async_exception = None
       raise e
 
-    sess.run(self._copying_op)
-    global_step, prefix = sess.run(
-        fetches=[self._save_global_step, self._save_prefix],
-        feed_dict={self._logdir_ph: self._logdir})
-    prefix = tf.compat.as_text(prefix)
+    if self._incremental_save:
+      global_step, prefix, fingerprints = self._FingerprintShards(sess)
+      reused_shards = self._ReusableShards(fingerprints)
+      # Only the variables of the shards to be written need to be copied.
+      sess.run([
+          op for i, op in enumerate(self._shard_copying_ops)
+          if i not in reused_shards
+      ])
+    else:
+      sess.run(self._copying_op)
+      global_step, prefix = sess.run(
+          fetches=[self._save_global_step, self._save_prefix],
+          feed_dict={self._logdir_ph: self._logdir})
+      prefix = tf.compat.as_text(prefix)
     tf.logging.info("Saving asynchronously to %s", prefix)
 
     def _Async(global_step, prefix):
       checkpoint_start_time = time.perf_counter()
       start_time = time.time()
       try:
-        # Use the provided prefix in case self._save_global_step is changed.
-        _ = sess.run(
-            fetches=self._save_op, feed_dict={self._save_prefix: prefix})
-        self._FinalizeSave(global_step, prefix)
+        if self._incremental_save:
+          saved_shards = self._SaveShards(sess, prefix, fingerprints,
+                                          reused_shards)
+          self._FinalizeSave(global_step, prefix, saved_shards)
+        else:
+          # Use the provided prefix in case self._save_global_step is changed.
+          _ = sess.run(
+              fetches=self._save_op, feed_dict={self._save_prefix: prefix})
+          self._FinalizeSave(global_step, prefix)
       except Exception as e:  # pylint: disable=broad-except
         self._async_exception = e
       end_time = time.time()
@@ -394,16 +568,109 @@ class Saver:
 
   def _SaveSync(self, sess):
     """Saves the graph."""
-    _, global_step, prefix = sess.run(
-        fetches=[self._save_op, self._save_global_step, self._save_prefix],
-        feed_dict={self._logdir_ph: self._logdir})
-    prefix = tf.compat.as_text(prefix)
-    global_step, prefix = self._FinalizeSave(global_step, prefix)
+    saved_shards = None
+    if self._incremental_save:
+      global_step, prefix, fingerprints = self._FingerprintShards(sess)
+      saved_shards = self._SaveShards(sess, prefix, fingerprints,
+                                      self._ReusableShards(fingerprints))
+    else:
+      _, global_step, prefix = sess.run(
+          fetches=[self._save_op, self._save_global_step, self._save_prefix],
+          feed_dict={self._logdir_ph: self._logdir})
+      prefix = tf.compat.as_text(prefix)
+    global_step, prefix = self._FinalizeSave(global_step, prefix, saved_shards)
     self._RecordTrainingTimeSavedMetric(time.time())
 
     return global_step, prefix
 
-  def _FinalizeSave(self, global_step, prefix):
+  def _FingerprintShards(self, sess):
+    """Fingerprints the variables of each incremental save shard.
+
+    Args:
+      sess: A session with tf.Graph under which this object is constructed.
+
+    Returns:
+      The global step, the checkpoint prefix and a list with a fingerprint of
+      each shard.
+    """
+    global_step, prefix, shard_fingerprints = sess.run(
+        fetches=[
+            self._save_global_step, self._save_prefix, self._shard_fingerprints
+        ],
+        feed_dict={self._logdir_ph: self._logdir})
+    fingerprints = [
+        tuple(fp.tobytes() + shape.tobytes() for fp, shape in shard)
+        for shard in shard_fingerprints
+    ]
+    return global_step, tf.compat.as_text(prefix), fingerprints
+
+  def _ReusableShards(self, fingerprints):
+    """Returns the ids of the shards unchanged since the previous save."""
+    num_shards = len(self._shards)
+    reusable = set()
+    for i, fingerprint in enumerate(fingerprints):
+      saved = self._saved_shards.get(i)
+      if (saved and saved.fingerprint == fingerprint and
+          tf.io.gfile.exists(_DataFilename(saved.prefix, i, num_shards))):
+        reusable.add(i)
+    return reusable
+
+  def _SaveShards(self, sess, prefix, fingerprints, reused_shards):
+    """Saves a checkpoint incrementally.
+
+    The shards not in `reused_shards` are written in parallel. The data files
+    of the others are linked from the previous checkpoint. The shards are then
+    merged into a V2 checkpoint at `prefix`.
+
+    Args:
+      sess: A session with tf.Graph under which this object is constructed.
+      prefix: The checkpoint prefix.
+      fingerprints: The fingerprint of each shard.
+      reused_shards: Ids of the shards unchanged since the previous save.
+
+    Returns:
+      A dict mapping shard ids to their `_SavedShard`.
+    """
+    num_shards = len(self._shards)
+    part_prefixes = [
+        "{}_temp/part-{:05d}-of-{:05d}".format(prefix, i, num_shards)
+        for i in range(num_shards)
+    ]
+
+    def _SaveShard(i):
+      """Writes or links shard i and returns the content of its index."""
+      index_filename = part_prefixes[i] + ".index"
+      if i in reused_shards:
+        saved = self._saved_shards[i]
+        tf.io.gfile.makedirs(os.path.dirname(part_prefixes[i]))
+        _LinkOrCopy(
+            _DataFilename(saved.prefix, i, num_shards),
+            _DataFilename(part_prefixes[i], 0, 1))
+        file_io.write_string_to_file(index_filename, saved.index)
+        return saved.index
+      sess.run(
+          fetches=self._shard_save_ops[i],
+          feed_dict={self._shard_prefix_ph: part_prefixes[i]})
+      return file_io.read_file_to_string(index_filename, binary_mode=True)
+
+    with concurrent.futures.ThreadPoolExecutor(
+        self._num_save_threads) as executor:
+      indices = list(executor.map(_SaveShard, range(num_shards)))
+    sess.run(
+        fetches=self._save_op,
+        feed_dict={
+            self._shard_prefixes_ph: part_prefixes,
+            self._save_prefix: prefix
+        })
+    tf.logging.info("Wrote %d and reused %d of %d shards for %s",
+                    num_shards - len(reused_shards), len(reused_shards),
+                    num_shards, prefix)
+    return {
+        i: _SavedShard(fingerprints[i], prefix, index)
+        for i, index in enumerate(indices)
+    }
+
+  def _FinalizeSave(self, global_step, prefix, saved_shards=None):
     """Runs sanity check and updates status."""
     if not tf.executing_eagerly():
       # Many users expect this as the tf.train.Saver does this by default.
@@ -415,6 +682,9 @@ class Saver:
 
     # Commit new state.
     self._UpdateState(prefix)
+    if saved_shards is not None:
+      # Only reuse shards of checkpoints that were committed.
+      self._saved_shards = saved_shards
 
     tf.logging.info("Saved %d %s", global_step, prefix)
     return global_step, prefix
@@ -555,6 +825,8 @@ class Saver:
 
     sess.run(
         fetches=[self._restore_op], feed_dict={self._restore_prefix_ph: prefix})
+    # The next incremental save writes all shards.
+    self._saved_shards = {}
     global_step = self.GetCheckpointId(prefix)
     tf.logging.info("Restored %d %s", global_step, prefix)
     if self._async_save:
@@ -571,6 +843,23 @@ class Saver:
       self._async_save_thread = None
 
 
+def _WriteCheckpoint(file_prefix, items):
+  """Writes (name, numpy array) pairs into a TF checkpoint."""
+  g = tf.Graph()
+  with g.as_default():
+    placeholders = [
+        tf.placeholder(tf.as_dtype(v.dtype), shape=v.shape) for _, v in items
+    ]
+    save = io_ops.save_v2(
+        prefix=file_prefix,
+        tensor_names=[k for k, _ in items],
+        tensors=placeholders,
+        shape_and_slices=[""] * len(items))
+
+  with tf.Session(graph=g) as sess:
+    sess.run(save, feed_dict={p: v for p, (_, v) in zip(placeholders, items)})
+
+
 def WriteNpArrays(file_prefix, nmap):
   """Writes a NestedMap of numpy arrays into a TF checkpoint.
 
@@ -578,28 +867,10 @@ def WriteNpArrays(file_prefix, nmap):
     file_prefix: A TF checkpoint filename prefix.
     nmap: A NestedMap of numpy arrays.
   """
-  g = tf.Graph()
-  with g.as_default():
-
-    def Wrap(val):
-      dtype = tf.as_dtype(val.dtype)
-      assert dtype != tf.string  # tf.string is not supported by py_func.
-      return tf.py_func(lambda: val, [], dtype)
-
-    names, values = [], []
-    for k, v in nmap.FlattenItems():
-      names.append(k)
-      assert isinstance(v, np.ndarray)
-      values.append(Wrap(v))
-
-    save = io_ops.save_v2(
-        prefix=file_prefix,
-        tensor_names=names,
-        tensors=values,
-        shape_and_slices=[""] * len(names))
-
-  with tf.Session(graph=g) as sess:
-    sess.run(save)
+  items = nmap.FlattenItems()
+  for _, v in items:
+    assert isinstance(v, np.ndarray)
+  _WriteCheckpoint(file_prefix, items)
 
 
 def ReadNpArrays(file_prefix, nmap):
@@ -612,18 +883,185 @@ def ReadNpArrays(file_prefix, nmap):
   Returns:
     A NestedMap with numpy arrays compatible w/ nmap.
   """
-  g = tf.Graph()
-  with g.as_default():
-    reads = []
-    for name, dtype in nmap.FlattenItems():
-      reads.append(
-          io_ops.restore_v2(
-              prefix=file_prefix,
-              tensor_names=[name],
-              shape_and_slices=[""],
-              dtypes=[dtype])[0])
+  reader = tf.train.NewCheckpointReader(file_prefix)
+  vals = []
+  for name, dtype in nmap.FlattenItems():
+    val = reader.get_tensor(name)
+    if tf.as_dtype(val.dtype) != tf.as_dtype(dtype):
+      raise ValueError(f"{name} in {file_prefix} has dtype {val.dtype} instead "
+                       f"of {dtype}.")
+    vals.append(val)
+  return nmap.Pack(vals)
 
-  with tf.Session(graph=g) as sess:
-    vals = sess.run(reads)
 
-  return nmap.Pack(vals)
+# The NpMap format stores numpy arrays so that they can be memory mapped:
+#   - _NP_MAP_MAGIC.
+#   - The length of the header, as a little-endian uint64.
+#   - The header, a JSON list with the key, dtype, shape and offset in the file
+#     of each array.
+#   - The raw buffer of each array, aligned to _NP_MAP_ALIGNMENT bytes.
+_NP_MAP_MAGIC = b"\x93LINGVO_NPMAP1"
+_NP_MAP_ALIGNMENT = 64
+
+
+def _NpMapAlign(offset):
+  return -(-offset // _NP_MAP_ALIGNMENT) * _NP_MAP_ALIGNMENT
+
+
+def _IsLocalPath(filename):
+  return "://" not in filename
+
+
+def _ReadNpMapBuffer(filename):
+  """Reads a whole file into a read-only, _NP_MAP_ALIGNMENT-aligned buffer."""
+  size = tf.io.gfile.stat(filename).length
+  raw = np.empty(size + _NP_MAP_ALIGNMENT, dtype=np.uint8)
+  start = -raw.ctypes.data % _NP_MAP_ALIGNMENT
+  buf = raw[start:start + size]
+  if _IsLocalPath(filename):
+    with open(filename, "rb") as f:
+      pos = 0
+      while pos < size:
+        n = f.readinto(memoryview(buf[pos:]))
+        if not n:
+          break
+        pos += n
+  else:
+    # GFile has no readinto(), so copy the file in chunks.
+    with tf.io.gfile.GFile(filename, "rb") as f:
+      pos = 0
+      while pos < size:
+        chunk = f.read(min(size - pos, 64 << 20))
+        if not chunk:
+          break
+        buf[pos:pos + len(chunk)] = np.frombuffer(chunk, dtype=np.uint8)
+        pos += len(chunk)
+  if pos != size:
+    raise ValueError(f"{filename} was truncated while being read.")
+  buf.flags.writeable = False
+  return buf
+
+
+def _WriteNpMapItems(filename, items):
+  """Writes (key, numpy array) pairs into a NpMap file."""
+  arrays = []
+  for key, v in items:
+    v = np.asarray(v, order="C")
+    if v.dtype.hasobject:
+      raise ValueError(f"{key} has dtype {v.dtype}, which can not be memory "
+                       "mapped.")
+    arrays.append((key, v))
+
+  # The header size depends on the offsets it contains, so grow the space
+  # reserved for the header until it fits.
+  data_start = _NpMapAlign(len(_NP_MAP_MAGIC) + 8)
+  while True:
+    entries = []
+    offset = data_start
+    for key, v in arrays:
+      entries.append({
+          "key": key,
+          "dtype": v.dtype.str,
+          "shape": list(v.shape),
+          "offset": offset
+      })
+      offset = _NpMapAlign(offset + v.nbytes)
+    header = json.dumps(entries).encode("utf-8")
+    header_end = len(_NP_MAP_MAGIC) + 8 + len(header)
+    if header_end <= data_start:
+      break
+    data_start = _NpMapAlign(header_end)
+
+  tmp_filename = filename + ".tmp"
+  # GFile only writes bytes, which would copy each array. Write local files
+  # directly from the array buffers instead.
+  with (open(tmp_filename, "wb") if _IsLocalPath(filename) else
+        tf.io.gfile.GFile(tmp_filename, "wb")) as f:
+    f.write(_NP_MAP_MAGIC + struct.pack("<Q", len(header)) + header)
+    pos = header_end
+    for (_, v), entry in zip(arrays, entries):
+      f.write(b"\0" * (entry["offset"] - pos))
+      f.write(
+          memoryview(v.reshape(-1).view(np.uint8))
+          if _IsLocalPath(filename) else v.tobytes())
+      pos = entry["offset"] + v.nbytes
+    # Pad the file to the end of its last buffer, in case that is empty.
+    f.write(b"\0" * (offset - pos))
+  tf.io.gfile.rename(tmp_filename, filename, overwrite=True)
+
+
+def _ReadNpMapItems(filename, mmap=True):
+  """Reads the (key, numpy array) pairs from a NpMap file."""
+  if mmap and _IsLocalPath(filename):
+    buf = np.memmap(filename, dtype=np.uint8, mode="r")
+  else:
+    # Read into an aligned buffer, like the pages of a memory mapped file.
+    buf = _ReadNpMapBuffer(filename)
+  magic_len = len(_NP_MAP_MAGIC)
+  if buf[:magic_len].tobytes() != _NP_MAP_MAGIC:
+    raise ValueError(f"{filename} is not a NpMap file.")
+  header_len, = struct.unpack("<Q", buf[magic_len:magic_len + 8].tobytes())
+  header = json.loads(
+      buf[magic_len + 8:magic_len + 8 + header_len].tobytes().decode("utf-8"))
+  return [(entry["key"],
+           np.ndarray(
+               tuple(entry["shape"]),
+               dtype=np.dtype(entry["dtype"]),
+               buffer=buf,
+               offset=entry["offset"])) for entry in header]
+
+
+def WriteNpMap(filename, nmap):
+  """Writes a NestedMap of numpy arrays into a NpMap file.
+
+  Unlike WriteNpArrays(), this does not build a TF graph. The arrays are
+  written to the file directly and can be read back without copies by
+  ReadNpMap().
+
+  Args:
+    filename: The NpMap filename.
+    nmap: A NestedMap of numpy arrays. Object arrays are not supported.
+  """
+  _WriteNpMapItems(filename, nmap.FlattenItems())
+
+
+def ReadNpMap(filename, mmap=True):
+  """Reads a NestedMap of numpy arrays from a NpMap file.
+
+  Args:
+    filename: The NpMap filename.
+    mmap: If True and `filename` is local, the arrays are read-only views of the
+      memory mapped file, so only the parts of the file that are accessed are
+      read. Otherwise, the file is read into memory.
+
+  Returns:
+    A NestedMap of read-only numpy arrays.
+  """
+  nmap = py_utils.NestedMap()
+  for key, v in _ReadNpMapItems(filename, mmap):
+    nmap.Set(key, v)
+  return nmap
+
+
+def CheckpointToNpMap(file_prefix, filename):
+  """Converts a TF checkpoint to a NpMap file.
+
+  Args:
+    file_prefix: A TF checkpoint filename prefix.
+    filename: The NpMap filename. Its keys are the tensor names in the
+      checkpoint, so it can only be read with ReadNpMap() if these are valid
+      NestedMap keys.
+  """
+  reader = tf.train.NewCheckpointReader(file_prefix)
+  names = sorted(reader.get_variable_to_shape_map())
+  _WriteNpMapItems(filename, [(name, reader.get_tensor(name)) for name in names])
+
+
+def NpMapToCheckpoint(filename, file_prefix):
+  """Converts a NpMap file to a TF checkpoint.
+
+  Args:
+    filename: The NpMap filename.
+    file_prefix: A TF checkpoint filename prefix.
+  """
+  _WriteCheckpoint(file_prefix, _ReadNpMapItems(filename))
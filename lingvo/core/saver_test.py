@@ -317,6 +317,96 @@ class SaverTest(test_utils.TestCase, parameterized.TestCase):
       sess.run(tf.global_variables_initializer())
       _ = sav.Save(sess)
 
+  @parameterized.parameters(True, False)
+  def testIncrementalSave(self, save_async):
+    logdir = tempfile.mkdtemp()
+    g = tf.Graph()
+    with g.as_default():
+      gsv = py_utils.GetOrCreateGlobalStepVar()
+      inc = gsv.assign_add(1)
+      table = tf.get_variable(
+          'table', initializer=tf.random.normal([100, 16], seed=1))
+      update_table = table.assign_add(tf.ones_like(table))
+      sav = saver.Saver(
+          logdir, [gsv, table], [([table], saver.IsFinite())],
+          keep_latest_n=2,
+          async_save=save_async,
+          incremental_save=True,
+          incremental_shard_bytes=1024)
+
+    def _Inode(ckpt_id, shard):
+      return os.stat(
+          saver._DataFilename('%s/ckpt-%08d' % (logdir, ckpt_id), shard,
+                              2)).st_ino
+
+    with self.session(graph=g) as sess:
+      sess.run(tf.global_variables_initializer())
+      expected_table = sess.run(table)
+      sav.Save(sess)
+      sess.run(inc)
+      sav.Save(sess)
+      sav.Sync()
+      # Only the shard with the global step was written.
+      self.assertNotEqual(_Inode(0, 0), _Inode(1, 0))
+      self.assertEqual(_Inode(0, 1), _Inode(1, 1))
+
+      sess.run([inc, update_table])
+      sav.Save(sess)
+      sav.Sync()
+      self.assertNotEqual(_Inode(1, 1), _Inode(2, 1))
+      # The oldest checkpoint is garbage collected; the others are intact.
+      self.assertEqual([1, 2], self._checkpointIds(logdir))
+      reader = tf.train.NewCheckpointReader('%s/ckpt-%08d' % (logdir, 1))
+      self.assertAllEqual(expected_table, reader.get_tensor('table'))
+      self.assertEqual(1, reader.get_tensor('global_step'))
+
+      sess.run(tf.global_variables_initializer())
+      self.assertEqual((1, '%s/ckpt-%08d' % (logdir, 1)),
+                       sav.Restore(sess, checkpoint_id=1))
+      self.assertAllEqual(expected_table, sess.run(table))
+      # All shards are written after a restore.
+      inode = _Inode(2, 1)
+      sess.run(inc)
+      sav.Save(sess)
+      sav.Sync()
+      self.assertNotEqual(inode, _Inode(2, 1))
+      reader = tf.train.NewCheckpointReader('%s/ckpt-%08d' % (logdir, 2))
+      self.assertAllEqual(expected_table, reader.get_tensor('table'))
+
+  def testFingerprintOnAccelerator(self):
+    g = tf.Graph()
+    with g.as_default(), tf.device('/device:GPU:0'):
+      dtypes = [tf.float32, tf.bfloat16, tf.float64, tf.bool, tf.int8]
+      variables = [
+          tf.get_variable('var%d' % i, [4, 3], dtype, tf.zeros_initializer())
+          for i, dtype in enumerate(dtypes)
+      ]
+      fingerprints = [saver._Fingerprint(v) for v in variables]
+      updates = [
+          v.assign(tf.tensor_scatter_nd_update(v, [[0, 1], [2, 0]],
+                                               tf.cast([1, 0], v.dtype)))
+          for v in variables
+      ]
+      # Moves the updated element to another position.
+      moves = [
+          v.assign(tf.tensor_scatter_nd_update(v, [[0, 1], [2, 0]],
+                                               tf.cast([0, 1], v.dtype)))
+          for v in variables
+      ]
+
+    config = tf.config_pb2.ConfigProto(allow_soft_placement=True)
+    with self.session(graph=g, config=config) as sess:
+      sess.run(tf.global_variables_initializer())
+      initial = sess.run(fingerprints)
+      self.assertAllEqual([(2,)] * len(dtypes), [fp.shape for fp in initial])
+      sess.run(updates)
+      updated = sess.run(fingerprints)
+      sess.run(moves)
+      moved = sess.run(fingerprints)
+    for fp, updated_fp, moved_fp in zip(initial, updated, moved):
+      self.assertNotEqual(fp.tobytes(), updated_fp.tobytes())
+      self.assertNotEqual(moved_fp.tobytes(), updated_fp.tobytes())
+
   def testWriteReadNpArrays(self):
     prefix = os.path.join(tempfile.mkdtemp(), 'nptest')
     nmap = py_utils.NestedMap()
@@ -335,6 +425,57 @@ class SaverTest(test_utils.TestCase, parameterized.TestCase):
     self.assertAllEqual(nmap.test, read_nmap.test)
     self.assertAllEqual(nmap.foo.bar, read_nmap.foo.bar)
 
+  @parameterized.parameters(True, False)
+  def testWriteReadNpMap(self, mmap):
+    filename = os.path.join(tempfile.mkdtemp(), 'nptest.npmap')
+    nmap = py_utils.NestedMap()
+    nmap.train = np.random.normal(size=(3, 3))
+    nmap.test = np.random.normal(size=(1, 3)).astype(np.float16)
+    nmap.foo = py_utils.NestedMap()
+    nmap.foo.bar = np.arange(10).astype(np.int32).reshape([2, 5])
+    nmap.foo.baz = [np.array(True), np.zeros([0, 3], np.int64)]
+    nmap.names = np.array([b'a', b'bc'])
+    saver.WriteNpMap(filename, nmap)
+    self.assertEqual([filename], tf.io.gfile.glob(filename + '*'))
+    read_nmap = saver.ReadNpMap(filename, mmap=mmap)
+    self.assertTrue(nmap.IsCompatible(read_nmap))
+    for (key, expected), (_, actual) in zip(nmap.FlattenItems(),
+                                            read_nmap.FlattenItems()):
+      self.assertEqual(expected.dtype, actual.dtype, key)
+      self.assertAllEqual(expected, actual)
+      self.assertEqual(0, actual.ctypes.data % saver._NP_MAP_ALIGNMENT)
+      self.assertFalse(actual.flags.writeable)
+
+    saver.WriteNpMap(filename, py_utils.NestedMap())
+    self.assertEqual(py_utils.NestedMap(), saver.ReadNpMap(filename))
+
+    with self.assertRaisesRegex(ValueError, 'can not be memory mapped'):
+      saver.WriteNpMap(filename, py_utils.NestedMap(x=np.array([None])))
+    with self.assertRaisesRegex(ValueError, 'not a NpMap file'):
+      saver.ReadNpMap(__file__)
+
+  def testNpMapCheckpointConversion(self):
+    tmpdir = tempfile.mkdtemp()
+    nmap = py_utils.NestedMap(
+        w=np.random.normal(size=(4, 2)).astype(np.float32),
+        b=np.arange(2).astype(np.int64))
+    saver.WriteNpArrays(os.path.join(tmpdir, 'ckpt'), nmap)
+    saver.CheckpointToNpMap(
+        os.path.join(tmpdir, 'ckpt'), os.path.join(tmpdir, 'ckpt.npmap'))
+    read_nmap = saver.ReadNpMap(os.path.join(tmpdir, 'ckpt.npmap'))
+    self.assertAllEqual(nmap.w, read_nmap.w)
+    self.assertAllEqual(nmap.b, read_nmap.b)
+
+    saver.NpMapToCheckpoint(
+        os.path.join(tmpdir, 'ckpt.npmap'), os.path.join(tmpdir, 'ckpt2'))
+    read_nmap = saver.ReadNpArrays(
+        os.path.join(tmpdir, 'ckpt2'), nmap.Transform(lambda x: x.dtype))
+    self.assertAllEqual(nmap.w, read_nmap.w)
+    self.assertAllEqual(nmap.b, read_nmap.b)
+    with self.assertRaisesRegex(ValueError, 'dtype'):
+      saver.ReadNpArrays(
+          os.path.join(tmpdir, 'ckpt2'), nmap.Transform(lambda _: np.int32))
+
 
 if __name__ == '__main__':
   test_utils.main()
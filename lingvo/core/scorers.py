@@ -16,6 +16,7 @@
 
 import collections
 import math
+import numpy as np
 import six
 
 
@@ -32,6 +33,73 @@ def NGrams(lst, order):
   return (lst[i:i + order] for i in range(len(lst) - order + 1))
 
 
+def ClippedNGramMatches(ref_tokens_list, hyp_tokens_list, max_ngram):
+  """Counts clipped n-gram matches for a batch of tokenized sentence pairs.
+
+  Tokens are mapped to integer ids once, and n-grams of order k are assigned
+  dense integer ids from the ids of their (k-1)-gram prefix and last token. The
+  per-sentence n-gram counts of refs and hyps are then matched with NumPy.
+
+  Args:
+    ref_tokens_list: list of N token sequences, the references.
+    hyp_tokens_list: list of N token sequences, the hypotheses.
+    max_ngram: maximum n-gram order.
+
+  Returns:
+    A tuple (matches, totals) of int64 arrays of shape [max_ngram]. matches[k]
+    is the number of hyp (k+1)-grams also found in the paired ref, clipped to
+    their ref count, and totals[k] the number of hyp (k+1)-grams.
+  """
+  assert len(ref_tokens_list) == len(hyp_tokens_list)
+  num_sents = len(ref_tokens_list)
+  matches = np.zeros([max_ngram], dtype=np.int64)
+  totals = np.zeros([max_ngram], dtype=np.int64)
+
+  # Refs and hyps are concatenated into one token stream, so that they share
+  # token and n-gram ids.
+  vocab = {}
+  all_tokens = list(ref_tokens_list) + list(hyp_tokens_list)
+  token_ids = np.array(
+      [vocab.setdefault(t, len(vocab)) for tokens in all_tokens for t in tokens],
+      dtype=np.int64)
+  sent_lens = np.array([len(tokens) for tokens in all_tokens], dtype=np.int64)
+  num_tokens = len(token_ids)
+  if not num_tokens:
+    return matches, totals
+  # Per token: index of its (ref, hyp) pair, whether it is in a hyp, length of
+  # its sentence and position within it.
+  sent_idx = np.repeat(np.arange(2 * num_sents) % max(num_sents, 1), sent_lens)
+  is_hyp = np.repeat(np.arange(2 * num_sents) >= num_sents, sent_lens)
+  token_sent_lens = np.repeat(sent_lens, sent_lens)
+  token_pos = np.arange(num_tokens) - np.repeat(
+      np.cumsum(sent_lens) - sent_lens, sent_lens)
+
+  # ngram_ids[i] is the id of the n-gram starting at token i. Entries of n-grams
+  # crossing sentence boundaries are meaningless and masked out below.
+  ngram_ids = token_ids
+  for order in range(1, max_ngram + 1):
+    n = num_tokens - order + 1
+    if n <= 0:
+      break
+    if order > 1:
+      # ids are < num_tokens, so the combined key fits in int64.
+      keys = ngram_ids[:n] * (num_tokens + 1) + token_ids[order - 1:]
+      _, ngram_ids = np.unique(keys, return_inverse=True)
+      ngram_ids = ngram_ids.reshape([-1])
+    valid = token_pos[:n] + order <= token_sent_lens[:n]
+    keys = sent_idx[:n] * (num_tokens + 1) + ngram_ids[:n]
+    ref_keys = keys[valid & ~is_hyp[:n]]
+    hyp_keys = keys[valid & is_hyp[:n]]
+    totals[order - 1] = len(hyp_keys)
+    ref_unique, ref_counts = np.unique(ref_keys, return_counts=True)
+    hyp_unique, hyp_counts = np.unique(hyp_keys, return_counts=True)
+    _, ref_index, hyp_index = np.intersect1d(
+        ref_unique, hyp_unique, assume_unique=True, return_indices=True)
+    matches[order - 1] = np.sum(
+        np.minimum(ref_counts[ref_index], hyp_counts[hyp_index]))
+  return matches, totals
+
+
 class Unsegmenter:
   """Un-segments (merges) segmented strings.
 
@@ -69,7 +137,9 @@ class BleuScorer:
   order 1 to max_ngram across all sentences.
 
   Successive calls to AddSentence() accumulate statistics which are converted to
-  an overall score on calls to ComputeOverallScore().
+  an overall score on calls to ComputeOverallScore(). AddSentences() does the
+  same for a whole batch of sentence pairs at once, and Merge() accumulates the
+  statistics of another scorer, e.g. one filled by a parallel worker.
 
   Example usage:
   >>> scorer = BleuScorer(max_ngram=4)
@@ -111,6 +181,36 @@ class BleuScorer:
       self._hyp_ngram_matches[order_idx] += sum(hyp_matches.values())
       self._hyp_ngram_counts[order_idx] += hyp_count
 
+  def AddSentences(self, ref_strs, hyp_strs):
+    """Accumulates ngram statistics for lists of ref and hyp strings.
+
+    Equivalent to calling AddSentence() on every pair, but counts the n-grams
+    of the whole batch with vectorized ops.
+
+    Args:
+      ref_strs: list of reference strings.
+      hyp_strs: list of hypothesis strings, of the same length as ref_strs.
+    """
+    assert len(ref_strs) == len(hyp_strs)
+    ref_tokens_list = [_Tokenize(self._unsegmenter(x)) for x in ref_strs]
+    hyp_tokens_list = [_Tokenize(self._unsegmenter(x)) for x in hyp_strs]
+    self._num_ref_tokens += sum(len(x) for x in ref_tokens_list)
+    self._num_hyp_tokens += sum(len(x) for x in hyp_tokens_list)
+    matches, totals = ClippedNGramMatches(ref_tokens_list, hyp_tokens_list,
+                                          self._max_ngram)
+    for order_idx in range(self._max_ngram):
+      self._hyp_ngram_matches[order_idx] += int(matches[order_idx])
+      self._hyp_ngram_counts[order_idx] += int(totals[order_idx])
+
+  def Merge(self, other):
+    """Accumulates the statistics of another BleuScorer into this one."""
+    assert self._max_ngram == other._max_ngram  # pylint: disable=protected-access
+    for order_idx in range(self._max_ngram):
+      self._hyp_ngram_matches[order_idx] += other._hyp_ngram_matches[order_idx]  # pylint: disable=protected-access
+      self._hyp_ngram_counts[order_idx] += other._hyp_ngram_counts[order_idx]  # pylint: disable=protected-access
+    self._num_ref_tokens += other._num_ref_tokens  # pylint: disable=protected-access
+    self._num_hyp_tokens += other._num_hyp_tokens  # pylint: disable=protected-access
+
   def ComputeOverallScore(self):
     """Computes overall BLEU score from the statistics accumulated so far."""
     score = 0.0
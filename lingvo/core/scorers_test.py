@@ -91,6 +91,46 @@ class BleuScorerTest(test_utils.TestCase):
         scorer.AddSentence(ref, hyp)
     self.assertAlmostEqual(0.313776, scorer.ComputeOverallScore(), places=5)
 
+  def testClippedNGramMatches(self):
+    matches, totals = scorers.ClippedNGramMatches(
+        [['a', 'b', 'c', 'd'], ['x', 'y']], [['a', 'a', 'b', 'c', 'd'], ['y']],
+        max_ngram=4)
+    self.assertAllEqual([5, 3, 2, 1], matches)
+    self.assertAllEqual([6, 4, 3, 2], totals)
+
+  def testBleuScorerAddSentencesMatchesAddSentence(self):
+    filename = test_helper.test_src_dir_path('core/ops/testdata/wmt/sm18.txt')
+    refs, hyps = [], []
+    with open(filename, 'rb') as fp:
+      for line in fp:
+        hyp, ref = line[:-1].split(b'\t')
+        refs.append(ref)
+        hyps.append(hyp)
+    expected = scorers.BleuScorer()
+    for ref, hyp in zip(refs, hyps):
+      expected.AddSentence(ref, hyp)
+
+    scorer = scorers.BleuScorer()
+    scorer.AddSentences(refs, hyps)
+    self.assertEqual(expected.ComputeOverallScore(),
+                     scorer.ComputeOverallScore())
+
+    # Partial scorers, e.g. from parallel workers, can be merged.
+    half = len(refs) // 2
+    scorer = scorers.BleuScorer()
+    scorer.AddSentences(refs[:half], hyps[:half])
+    other = scorers.BleuScorer()
+    other.AddSentences(refs[half:], hyps[half:])
+    scorer.Merge(other)
+    self.assertEqual(expected.ComputeOverallScore(),
+                     scorer.ComputeOverallScore())
+
+  def testBleuScorerAddSentencesEmpty(self):
+    scorer = scorers.BleuScorer(max_ngram=4)
+    scorer.AddSentences([], [])
+    scorer.AddSentences(['', 'a b'], ['', 'a b'])
+    self.assertAlmostEqual(1.0, scorer.ComputeOverallScore())
+
 
 if __name__ == '__main__':
   test_utils.main()
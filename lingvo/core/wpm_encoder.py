@@ -22,7 +22,15 @@ search," 2012 IEEE International Conference on Acoustics,
 Speech and Signal Processing, 2012
 
 https://static.googleusercontent.com/media/research.google.com/en//pubs/archive/37842.pdf
+
+WpmEncoder builds the segmentation into the TF graph. HostWpmEncoder produces
+the same segmentation in Python, for offline preprocessing of text corpora.
 """
+import functools
+import heapq
+import random
+import re
+
 import lingvo.compat as tf
 from lingvo.core import ops
 from lingvo.core import py_utils
@@ -37,6 +45,23 @@ SENTENCE_END_STRING = '</s>'
 
 BOW_STR = '▁'
 
+# Whitespace as understood by tf.strings.split() and tf.strings.strip().
+_ASCII_WHITESPACE = ' \t\n\r\f\v'
+_ASCII_WHITESPACE_RE = re.compile('[%s]+' % _ASCII_WHITESPACE)
+
+
+def _LoadPieces(wpm_filepath):
+  """Returns the list of wordpieces in the vocabulary file."""
+  lines = py_utils.ReadFileLines(wpm_filepath)
+
+  pieces = []
+  for line in lines:
+    if isinstance(line, bytes):
+      line = six.ensure_text(line, 'utf-8')
+    piece = line.strip().split('\t')[0]
+    pieces.append(piece)
+  return pieces
+
 
 class WpmEncoder:
   """WPM encoder."""
@@ -49,14 +74,7 @@ class WpmEncoder:
       merge_prob: the probability of merging tokens while encoding.
     """
     # Load vocabulary file.
-    lines = py_utils.ReadFileLines(wpm_filepath)
-
-    self._pieces = []
-    for line in lines:
-      if isinstance(line, bytes):
-        line = six.ensure_text(line, 'utf-8')
-      piece = line.strip().split('\t')[0]
-      self._pieces.append(piece)
+    self._pieces = _LoadPieces(wpm_filepath)
     self._merge_prob = merge_prob
 
   def _TokenToString(self, token):
@@ -194,3 +212,131 @@ class WpmEncoder:
   @property
   def unk_id(self):
     return self._pieces.index(NO_TOKEN_STRING)
+
+
+class HostWpmEncoder:
+  """WPM encoder running in Python, outside of the TF graph.
+
+  Produces the same ids as WpmEncoder.Encode(), but encodes sentences without
+  building or running a graph, which is much faster for offline preprocessing.
+
+  Merges are looked up in a table, built once from the vocabulary, mapping a
+  pair of adjacent token ids to the id of their concatenation. Each word is
+  then encoded with a heap of merge candidates ordered by (merged id, position),
+  which replicates the argmin over candidates of WpmEncoder. Encoded words are
+  cached, since words are heavily repeated in natural text.
+  """
+
+  def __init__(self, wpm_filepath, merge_prob=1., cache_size=1 << 16):
+    """Create a host WPM encoder.
+
+    Args:
+      wpm_filepath: a path to the file containing the vocabulary.
+      merge_prob: the probability of merging tokens while encoding.
+      cache_size: maximum number of encoded words kept in the LRU word cache.
+        The cache is only used when merge_prob is 1.
+    """
+    self._pieces = _LoadPieces(wpm_filepath)
+    self._merge_prob = merge_prob
+    self._piece_to_id = {}
+    for i, piece in enumerate(self._pieces):
+      self._piece_to_id.setdefault(piece, i)
+    self._unk_id = self.unk_id
+    # Maps (left id, right id) to the id of the concatenated piece.
+    self._merges = {}
+    for piece, i in self._piece_to_id.items():
+      for k in range(1, len(piece)):
+        left = self._piece_to_id.get(piece[:k])
+        right = self._piece_to_id.get(piece[k:])
+        if left is not None and right is not None:
+          self._merges[(left, right)] = i
+    self._encode_word_fn = self._EncodeWord
+    if merge_prob >= 1.:
+      self._encode_word_fn = functools.lru_cache(maxsize=cache_size)(
+          self._EncodeWord)
+
+  def _EncodeWord(self, word):
+    """Returns the tuple of token ids of a word, including the BOW prefix."""
+    tokens = [self._piece_to_id.get(c, self._unk_id) for c in BOW_STR + word]
+    num_tokens = len(tokens)
+    # Doubly linked list over the positions of the remaining tokens.
+    nxt = list(range(1, num_tokens + 1))
+    prv = list(range(-1, num_tokens - 1))
+    heap = []
+
+    def _Push(i, j):
+      merged = self._merges.get((tokens[i], tokens[j]))
+      if merged is not None:
+        heapq.heappush(heap, (merged, i, j, tokens[i], tokens[j]))
+
+    for i in range(num_tokens - 1):
+      _Push(i, i + 1)
+    while heap:
+      merged, i, j, left, right = heap[0]
+      # Drop candidates whose tokens were merged away since they were pushed.
+      if nxt[i] != j or tokens[i] != left or tokens[j] != right:
+        heapq.heappop(heap)
+        continue
+      if self._merge_prob < 1. and random.random() >= self._merge_prob:
+        break
+      heapq.heappop(heap)
+      tokens[i] = merged
+      tokens[j] = None
+      nxt[i] = nxt[j]
+      if nxt[i] < num_tokens:
+        prv[nxt[i]] = i
+        _Push(i, nxt[i])
+      if prv[i] >= 0:
+        _Push(prv[i], i)
+
+    return tuple(t for t in tokens if t is not None)
+
+  def Encode(self, text):
+    """Converts string `text` to integer ids and the encoded string.
+
+    Encoding includes prefixing the beginning-of-word token to each word.
+
+    Args:
+      text: a unicode or UTF-8 encoded string.
+
+    Returns:
+      (ids, tokens) where ids is the list of encoded integer ids and tokens is
+      the list of the corresponding wordpieces.
+    """
+    text = six.ensure_text(text, 'utf-8')
+    ids = []
+    for word in _ASCII_WHITESPACE_RE.split(text):
+      if word:
+        ids.extend(self._encode_word_fn(word))
+    return ids, [self._pieces[i] for i in ids]
+
+  def EncodeBatch(self, texts):
+    """Returns the list of Encode() results of a batch of strings."""
+    return [self.Encode(text) for text in texts]
+
+  def Decode(self, ids):
+    txt = ''.join(self._pieces[i] for i in ids)
+    txt = txt.replace(BOW_STR, ' ')
+    # Note that this strips spaces from the end of the input as well.
+    # We assume no inputs rely on the existence of trailing whitespace.
+    return txt.strip(_ASCII_WHITESPACE)
+
+  @property
+  def sentence_start_id(self):
+    return self._pieces.index(SENTENCE_START_STRING)
+
+  @property
+  def sentence_start_string(self):
+    return SENTENCE_START_STRING
+
+  @property
+  def sentence_end_id(self):
+    return self._pieces.index(SENTENCE_END_STRING)
+
+  @property
+  def sentence_end_string(self):
+    return SENTENCE_END_STRING
+
+  @property
+  def unk_id(self):
+    return self._pieces.index(NO_TOKEN_STRING)
@@ -20,42 +20,43 @@ from lingvo.core import test_utils
 from lingvo.core import wpm_encoder
 
 
-class WpmEncoderTest(test_utils.TestCase):
+def _CreateVocab():
+  outpath = os.path.join(tf.test.get_temp_dir(), 'wpm.voc')
+  with tf.io.gfile.GFile(outpath, 'w') as f:
+    contents = [
+        '<unk>',
+        '<s>',
+        '</s>',
+        't',
+        'i',
+        'o',
+        'f',
+        'r',
+        'D',
+        'it',
+        'or',
+        'for',
+        'itt',
+        'to',
+        'i-',
+        'tt',
+        'f.',
+        'o-',
+        'o.',
+        'fo',
+        'ø',  # \xC3\xB8
+        'ö',  # \xC3\xB6
+        '\\',
+        '▁',
+    ]
+    f.write('\n'.join(contents))
+  return outpath
+
 
-  def _CreateVocab(self):
-    outpath = os.path.join(tf.test.get_temp_dir(), 'wpm.voc')
-    with tf.io.gfile.GFile(outpath, 'w') as f:
-      contents = [
-          '<unk>',
-          '<s>',
-          '</s>',
-          't',
-          'i',
-          'o',
-          'f',
-          'r',
-          'D',
-          'it',
-          'or',
-          'for',
-          'itt',
-          'to',
-          'i-',
-          'tt',
-          'f.',
-          'o-',
-          'o.',
-          'fo',
-          'ø',  # \xC3\xB8
-          'ö',  # \xC3\xB6
-          '\\',
-          '▁',
-      ]
-      f.write('\n'.join(contents))
-    return outpath
+class WpmEncoderTest(test_utils.TestCase):
 
   def setUp(self):
-    voc = self._CreateVocab()
+    voc = _CreateVocab()
     self._enc = wpm_encoder.WpmEncoder(voc)
 
   def testDitto(self):
@@ -70,7 +71,7 @@ class WpmEncoderTest(test_utils.TestCase):
       self.assertEqual(b'Ditto Ditto', self._enc.Decode(ids).eval())
 
   def testMergeProb(self):
-    voc = self._CreateVocab()
+    voc = _CreateVocab()
     enc = wpm_encoder.WpmEncoder(voc, merge_prob=0.)
     with tf.Session():
       ids, strs = enc.Encode('Ditto')
@@ -99,5 +100,48 @@ class WpmEncoderTest(test_utils.TestCase):
       self.assertEqual(u'føö'.encode('utf-8'), self._enc.Decode(ids).eval())
 
 
+class HostWpmEncoderTest(test_utils.TestCase):
+
+  def setUp(self):
+    voc = _CreateVocab()
+    self._enc = wpm_encoder.WpmEncoder(voc)
+    self._host_enc = wpm_encoder.HostWpmEncoder(voc)
+
+  def testMatchesWpmEncoder(self):
+    texts = ['Ditto', 'Ditto Ditto', '  for it\tto  ', 'fo-or. i-t', 'føö \\',
+             'ittt tto itto', '']
+    with tf.Session():
+      for text in texts:
+        ids, strs = self._enc.Encode(text)
+        host_ids, host_strs = self._host_enc.Encode(text)
+        self.assertEqual(list(ids.eval()), host_ids)
+        self.assertEqual([s.decode('utf-8') for s in strs.eval()], host_strs)
+        self.assertEqual(
+            self._enc.Decode(ids).eval().decode('utf-8'),
+            self._host_enc.Decode(host_ids))
+
+  def testHostDitto(self):
+    ids, strs = self._host_enc.Encode('Ditto Ditto')
+    self.assertEqual(['▁', 'D', 'itt', 'o', '▁', 'D', 'itt', 'o'], strs)
+    self.assertEqual('Ditto Ditto', self._host_enc.Decode(ids))
+    # Encoding from the word cache gives the same result.
+    self.assertEqual((ids, strs), self._host_enc.Encode(b'Ditto  Ditto'))
+
+  def testHostEncodeBatch(self):
+    texts = ['Ditto', '', 'føö']
+    self.assertEqual([self._host_enc.Encode(t) for t in texts],
+                     self._host_enc.EncodeBatch(texts))
+
+  def testHostMergeProb(self):
+    enc = wpm_encoder.HostWpmEncoder(_CreateVocab(), merge_prob=0.)
+    ids, strs = enc.Encode('Ditto')
+    self.assertEqual(['▁', 'D', 'i', 't', 't', 'o'], strs)
+    self.assertEqual('Ditto', enc.Decode(ids))
+
+  def testHostEmpty(self):
+    self.assertEqual(([], []), self._host_enc.Encode(''))
+    self.assertEqual('', self._host_enc.Decode([]))
+
+
 if __name__ == '__main__':
   test_utils.main()
@@ -25,6 +25,7 @@ from lingvo import pdb_wrapper
 from lingvo.core import base_model
 from lingvo.core import checkpointer as checkpointer_lib
 from lingvo.core import cluster_factory
+from lingvo.core import hyperparams
 from lingvo.core import ml_perf_log as mlp_log
 from lingvo.core import multitask_model
 from lingvo.core import program as lingvo_program
@@ -83,7 +84,8 @@ def GetExecutorParams(model_name, cluster_params, model_registry):
   """
 
   ps_params_dict = {}
-  with cluster_factory.Cluster(cluster_params):
+  # The params of every task and dataset are copied from the same templates.
+  with cluster_factory.Cluster(cluster_params), hyperparams.CopyOnWrite():
     ps_cfg = model_registry.GetProgramSchedule(model_name)
     train_cfg = model_registry.GetParams(model_name, 'Train')
     train_cfg.cluster = cluster_params
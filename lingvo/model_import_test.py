@@ -14,9 +14,34 @@
 # ==============================================================================
 """Test model imports."""
 
+import os
+from unittest import mock
+
 from lingvo import model_imports
 import lingvo.compat as tf
 
+
+class ModelIndexTest(tf.test.TestCase):
+
+  def testImportParamsWithIndex(self):
+    path = os.path.join(self.get_temp_dir(), 'model_index.txt')
+    model_imports.WriteModelIndex(path, {'foo.bar.Baz': 'json.decoder'})
+    with mock.patch.dict(os.environ, {'LINGVO_MODEL_INDEX': path}):
+      self.assertEqual({'foo.bar.Baz': 'json.decoder'},
+                       model_imports.ModelIndex())
+      with mock.patch.object(
+          model_imports, '_Import', wraps=model_imports._Import) as import_fn:
+        self.assertTrue(model_imports.ImportParams('foo.bar.Baz'))
+        import_fn.assert_called_once_with('json.decoder')
+        # Already imported models are not imported again.
+        self.assertTrue(model_imports.ImportParams('foo.bar.Baz'))
+        import_fn.assert_called_once()
+
+  def testNoIndex(self):
+    with mock.patch.dict(os.environ, {'LINGVO_MODEL_INDEX': ''}):
+      self.assertEqual({}, model_imports.ModelIndex())
+
+
 if __name__ == '__main__':
   model_imports.ImportAllParams()
   tf.test.main()
@@ -17,7 +17,9 @@
 Using this module any ModelParams can be accessed via GetParams.
 """
 
+import functools
 import importlib
+import os
 import re
 import sys
 
@@ -35,6 +37,59 @@ def _Import(name):
   return False
 
 
+# Name of the model index file, next to this file. See ImportParams().
+MODEL_INDEX_FILENAME = 'model_index.txt'
+# If set, overrides the path of the model index file. If set to an empty
+# string, the model index is not used.
+_MODEL_INDEX_ENV_VAR = 'LINGVO_MODEL_INDEX'
+
+# Names of the models whose params were already imported by ImportParams().
+_IMPORTED_MODELS = set()
+
+
+def _ModelIndexPath():
+  return os.environ.get(
+      _MODEL_INDEX_ENV_VAR,
+      os.path.join(os.path.dirname(__file__), MODEL_INDEX_FILENAME))
+
+
+@functools.lru_cache(maxsize=None)
+def _LoadModelIndex(path):
+  """Returns a dict mapping model names to the modules registering them."""
+  index = {}
+  if not path or not os.path.exists(path):
+    return index
+  with open(path, 'r') as f:
+    for line in f:
+      line = line.strip()
+      if line and not line.startswith('#'):
+        model_name, module = line.split()
+        index[model_name] = module
+  return index
+
+
+def ModelIndex():
+  """Returns the model index, mapping model names to their modules.
+
+  The model index is generated at build time by
+  lingvo/tools/generate_model_index.py. It is empty if there is no index file.
+  """
+  return _LoadModelIndex(_ModelIndexPath())
+
+
+def WriteModelIndex(path, model_modules):
+  """Writes a model index file.
+
+  Args:
+    path: Path of the model index file.
+    model_modules: A dict mapping model names to the modules registering them.
+  """
+  with open(path, 'w') as f:
+    f.write('# Generated by lingvo/tools/generate_model_index.py.\n')
+    for model_name, module in sorted(model_modules.items()):
+      f.write(f'{model_name} {module}\n')
+
+
 def _InsertParams(module):
   """Try inserting 'params' everywhere in the module."""
   left = []
@@ -86,6 +141,14 @@ def ImportParams(model_name,
   if model_name.startswith('test.'):
     # Test models don't need external imports.
     return True
+  if model_name in _IMPORTED_MODELS:
+    return True
+  # Import only the module registering the model if it is in the index.
+  indexed_module = ModelIndex().get(model_name)
+  if indexed_module and _Import(indexed_module):
+    _IMPORTED_MODELS.add(model_name)
+    return True
+
   model_module = model_name.rpartition('.')[0]
   # Try importing the module directly, in case it's a local import.
   success = _Import(model_module)
@@ -104,4 +167,6 @@ def ImportParams(model_name,
     raise LookupError(
         f'Could not find any valid import paths for module {model_module}. '
         f'Make sure the relevant params files are linked into the binary.')
+  if success:
+    _IMPORTED_MODELS.add(model_name)
   return success
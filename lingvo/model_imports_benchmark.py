@@ -0,0 +1,115 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+r"""Benchmarks the startup of the trainer entry point for one model.
+
+Each run starts a new Python process which imports lingvo.trainer, imports the
+params of --model as the trainer does, and looks up the model in the registry.
+The wall time and peak RSS of the process are reported for:
+  - importing all task params (model_imports.ImportAllParams()),
+  - ImportParams() probing candidate modules, without the model index,
+  - ImportParams() with the model index (see model_imports.ModelIndex()).
+
+Usage:
+  bazel run -c opt //lingvo:model_imports_benchmark -- --benchmarks=. \
+      --model=lm.one_billion_wds.WordLevelOneBwdsSimpleSampledSoftmax
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from lingvo import model_imports
+import lingvo.compat as tf
+
+tf.flags.DEFINE_string('model', 'image.mnist.LeNet5',
+                       'Name of the model to benchmark the startup of.')
+tf.flags.DEFINE_string(
+    'model_index', None, 'Path of the model index file. Defaults to the one '
+    'next to model_imports.py.')
+tf.flags.DEFINE_integer('num_iters', 3, 'Number of runs per mode.')
+
+FLAGS = tf.flags.FLAGS
+
+# Run in a new process, so that nothing is imported yet.
+_STARTUP_SCRIPT = """
+import json
+import resource
+import sys
+import time
+
+start = time.time()
+from lingvo import model_imports
+from lingvo import model_registry
+from lingvo import trainer
+import_secs = time.time() - start
+model_name, import_all = sys.argv[1], sys.argv[2] == 'True'
+if import_all:
+  model_imports.ImportAllParams()
+else:
+  model_imports.ImportParams(model_name)
+model_registry.GetClass(model_name)
+print(json.dumps({
+    'import_secs': import_secs,
+    'total_secs': time.time() - start,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+"""
+
+
+def _RunStartup(model_name, import_all, model_index_path):
+  """Returns the stats printed by _STARTUP_SCRIPT in a new process."""
+  env = dict(os.environ)
+  env[model_imports._MODEL_INDEX_ENV_VAR] = model_index_path  # pylint: disable=protected-access
+  output = subprocess.run(
+      [sys.executable, '-c', _STARTUP_SCRIPT, model_name,
+       str(import_all)],
+      env=env,
+      check=True,
+      stdout=subprocess.PIPE).stdout
+  return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+class ModelImportsBenchmark(tf.test.Benchmark):
+  """Benchmarks the startup time and memory of the trainer for one model."""
+
+  def _RunBenchmark(self, import_all, model_index_path):
+    runs = [
+        _RunStartup(FLAGS.model, import_all, model_index_path)
+        for _ in range(FLAGS.num_iters)
+    ]
+    extras = {
+        key: min(run[key] for run in runs)
+        for key in ['import_secs', 'total_secs', 'max_rss_kb']
+    }
+    self.report_benchmark(
+        iters=FLAGS.num_iters, wall_time=extras['total_secs'], extras=extras)
+    return extras
+
+  def benchmarkImportAllParams(self):
+    self._RunBenchmark(import_all=True, model_index_path='')
+
+  def benchmarkImportParamsWithoutIndex(self):
+    self._RunBenchmark(import_all=False, model_index_path='')
+
+  def benchmarkImportParamsWithIndex(self):
+    model_index_path = FLAGS.model_index or os.path.join(
+        os.path.dirname(model_imports.__file__),
+        model_imports.MODEL_INDEX_FILENAME)
+    self._RunBenchmark(import_all=False, model_index_path=model_index_path)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,102 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+r"""Benchmarks building and instantiating the params of registered models.
+
+Measures, for each registered model matching --model_regex, the time spent in
+building its Train params and in instantiating the model from them, with and
+without copy-on-write Params.Copy() (see hyperparams.CopyOnWrite()).
+
+Usage:
+  bazel run -c opt //lingvo:model_params_benchmark -- --benchmarks=. \
+      --model_regex='^lm\.'
+"""
+
+import re
+import time
+
+from lingvo import model_imports  # pylint: disable=unused-import
+from lingvo import model_registry
+import lingvo.compat as tf
+from lingvo.core import cluster_factory
+from lingvo.core import hyperparams
+
+tf.flags.DEFINE_string('model_regex', '.*',
+                       'Benchmark registered models matching this regex.')
+tf.flags.DEFINE_integer('num_iters', 3, 'Number of runs per model and mode.')
+
+FLAGS = tf.flags.FLAGS
+
+
+def _BuildAndInstantiate(name):
+  """Returns the seconds spent building and instantiating model `name`."""
+  with tf.Graph().as_default():
+    start = time.time()
+    # Not model_registry.GetParams(), whose cache would hide the cost of
+    # building the params after the first run.
+    model_params = model_registry.GetClass(name)()
+    p = model_params.Model()
+    p.input = model_params.GetDatasetParams('Train')
+    p.cluster.mode = 'sync'
+    p.cluster.job = 'decoder'
+    p.cluster.decoder.replicas = 1
+    params_time = time.time() - start
+    with p.cluster.Instantiate():
+      start = time.time()
+      p.Instantiate()
+      instantiate_time = time.time() - start
+  return params_time, instantiate_time
+
+
+class ModelParamsBenchmark(tf.test.Benchmark):
+  """Benchmarks Params() and Instantiate() of registered models."""
+
+  def _RunBenchmark(self, copy_on_write):
+    names = sorted(
+        name for name in model_registry.GetAllRegisteredClasses()
+        if re.search(FLAGS.model_regex, name))
+    total_params_time = 0.
+    total_instantiate_time = 0.
+    extras = {}
+    with cluster_factory.SetRequireSequentialInputOrder(False):
+      with hyperparams.CopyOnWrite(copy_on_write):
+        for name in names:
+          try:
+            times = [_BuildAndInstantiate(name) for _ in range(FLAGS.num_iters)]
+          except Exception as e:  # pylint: disable=broad-except
+            tf.logging.warning('Skipping %s: %s', name, e)
+            continue
+          params_time = min(t[0] for t in times)
+          instantiate_time = min(t[1] for t in times)
+          extras['%s_params_secs' % name] = params_time
+          extras['%s_instantiate_secs' % name] = instantiate_time
+          total_params_time += params_time
+          total_instantiate_time += instantiate_time
+    extras['total_params_secs'] = total_params_time
+    extras['total_instantiate_secs'] = total_instantiate_time
+    self.report_benchmark(
+        iters=FLAGS.num_iters,
+        wall_time=total_params_time + total_instantiate_time,
+        extras=extras)
+    return extras
+
+  def benchmarkDeepCopy(self):
+    self._RunBenchmark(copy_on_write=False)
+
+  def benchmarkCopyOnWrite(self):
+    self._RunBenchmark(copy_on_write=True)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -23,6 +23,7 @@ import inspect
 from lingvo import model_imports
 import lingvo.compat as tf
 from lingvo.core import base_model_params
+from lingvo.core import hyperparams
 from lingvo.core import program
 
 tf.flags.DEFINE_string(
@@ -76,6 +77,8 @@ class _ModelRegistryHelper:
   _MODEL_PARAMS = {}
   # Global set of modules from which ModelParam subclasses have been registered.
   _REGISTERED_MODULES = set()
+  # Global dictionary mapping subclass name to the module registering it.
+  _MODEL_MODULES = {}
 
   @classmethod
   def _ClassPathPrefix(cls):
@@ -133,6 +136,7 @@ class _ModelRegistryHelper:
 
     # Decorate param methods to add source info metadata.
     cls._MODEL_PARAMS[key] = wrapper_cls
+    cls._MODEL_MODULES[key] = module
     return key
 
   @classmethod
@@ -222,6 +226,11 @@ class _ModelRegistryHelper:
       tf.logging.warning('No classes registered.')
     return all_params
 
+  @staticmethod
+  def GetAllRegisteredModules():
+    """Returns global map from model names to the modules registering them."""
+    return dict(_ModelRegistryHelper._MODEL_MODULES)
+
   @classmethod
   def GetClass(cls, class_key):
     """Returns a ModelParams subclass with the given `class_key`.
@@ -275,25 +284,28 @@ class _ModelRegistryHelper:
         ~.base_model_params._BaseModelParams instance.
 
     """
-    cfg = model_params_obj.Model()
-    if dataset_name:
-      cfg.input = model_params_obj.GetDatasetParams(dataset_name)
-      # Overwrite dataset specific Task parameters.
-      try:
-        dataset_task_params = model_params_obj.GetDatasetParams('Task_' +
-                                                                dataset_name)
-        # Overwrite task params with dataset specific ones.
-        if isinstance(model_params_obj,
-                      base_model_params.SingleTaskModelParams):
-          cfg.cls.CopyTaskParams(dataset_task_params, cfg)
-        elif isinstance(model_params_obj,
-                        base_model_params.MultiTaskModelParams):
-          cfg.task_params = dataset_task_params
-      except base_model_params.DatasetError:
-        tf.logging.info('No dataset specific task parameters for %s',
-                        dataset_name)
-
-    cls.MaybeUpdateParamsFromFlags(cfg)
+    # Model params copy layer templates many times over, most of which are
+    # never modified.
+    with hyperparams.CopyOnWrite():
+      cfg = model_params_obj.Model()
+      if dataset_name:
+        cfg.input = model_params_obj.GetDatasetParams(dataset_name)
+        # Overwrite dataset specific Task parameters.
+        try:
+          dataset_task_params = model_params_obj.GetDatasetParams(
+              'Task_' + dataset_name)
+          # Overwrite task params with dataset specific ones.
+          if isinstance(model_params_obj,
+                        base_model_params.SingleTaskModelParams):
+            cfg.cls.CopyTaskParams(dataset_task_params, cfg)
+          elif isinstance(model_params_obj,
+                          base_model_params.MultiTaskModelParams):
+            cfg.task_params = dataset_task_params
+        except base_model_params.DatasetError:
+          tf.logging.info('No dataset specific task parameters for %s',
+                          dataset_name)
+
+      cls.MaybeUpdateParamsFromFlags(cfg)
     return cfg
 
   @classmethod
@@ -375,6 +387,11 @@ def GetAllRegisteredClasses():
   return _ModelRegistryHelper.GetAllRegisteredClasses()
 
 
+def GetAllRegisteredModules():
+  model_imports.ImportAllParams()
+  return _ModelRegistryHelper.GetAllRegisteredModules()
+
+
 def GetClass(class_key):
   model_imports.ImportParams(class_key)
   return _ModelRegistryHelper.GetClass(class_key)
@@ -101,6 +101,11 @@ class ModelRegistryTest(test_utils.TestCase, parameterized.TestCase):
       # Not yet registered.
       model_registry.GetClass('something.does.not.exist')
 
+  def testGetAllRegisteredModules(self):
+    model_modules = (
+        model_registry._ModelRegistryHelper.GetAllRegisteredModules())
+    self.assertEqual(__name__, model_modules['test.DummyModel'])
+
   def testGetParams(self):
     cfg = model_registry.GetParams('test.DummyModel', 'Test')
     self.assertIsNotNone(cfg)
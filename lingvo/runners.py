@@ -16,6 +16,7 @@
 
 import contextlib
 import os
+import queue
 import re
 import threading
 import time
@@ -26,6 +27,7 @@ import lingvo.compat as tf
 from lingvo.core import base_model
 from lingvo.core import checkpointer
 from lingvo.core import cluster_factory
+from lingvo.core import decoder_lib
 from lingvo.core import metrics
 from lingvo.core import py_utils
 from lingvo.core import summary_utils
@@ -1207,6 +1209,180 @@ class Decoder(base_runner.BaseRunner):
         del proto.value[i]
     return proto.SerializeToString()
 
+  def _FetchDecodeOutput(self, sess, global_step, is_first_loop):
+    """Runs the decode graph and returns the fetched decoder output."""
+    tf.logging.info('Fetching dec_output.')
+    fetch_start = time.time()
+    run_options = tf.RunOptions(report_tensor_allocations_upon_oom=False)
+
+    # NOTE: We intentionally do not generate scalar summaries by
+    # default, because decoder is run  multiple times for each
+    # checkpoint. Multiple summaries at the same step is often confusing.
+    # Instead, models should generate aggregate summaries using
+    # PostProcessDecodeOut. Other types of summaries (images, audio etc.)
+    # will be generated for the first eval batch.
+    if self._summary_op is not None and is_first_loop:
+      dec_out, summaries = sess.run([self._dec_output, self._summary_op],
+                                    options=run_options)
+      summaries = self._RemoveScalarSummaries(summaries)
+
+      # Add non-scalar summaries only for the first batch of data.
+      self._summary_writer.add_summary(summaries, global_step)
+      self._summary_writer.flush()
+    else:
+      dec_out = sess.run(self._dec_output, options=run_options)
+
+    self._RunTF2SummaryOps(sess)
+    tf.logging.info('Done fetching (%f seconds)' % (time.time() - fetch_start))
+    return dec_out
+
+  def _PostProcessDecodeOutput(self, dec_out, dec_metrics, global_step,
+                               is_first_loop, write_decode_out_fn,
+                               samples_per_summary):
+    """Post-processes one fetched decoder output into dec_metrics."""
+    post_process_start = time.time()
+    decode_out = self._task.PostProcessDecodeOut(dec_out, dec_metrics)
+    if decode_out:
+      if isinstance(decode_out, dict):
+        decode_out = decode_out.items()
+
+      if is_first_loop:
+        # Add summaries only for the first batch of data.
+        for key, value in decode_out:
+          if isinstance(value, tf.Summary):
+            tf.logging.info(f'Adding summary {key} with tags '
+                            f'{[x.tag for x in value.value]}.')
+            self._summary_writer.add_summary(value, global_step)
+        self._summary_writer.flush()
+
+      write_decode_out_fn(
+          kv for kv in decode_out if not isinstance(kv[1], tf.Summary))
+    tf.logging.info(
+        'Total examples done: %d/%d '
+        '(%f seconds decode postprocess)',
+        dec_metrics['num_samples_in_batch'].total_value, samples_per_summary,
+        time.time() - post_process_start)
+
+  def _PipelinedDecodeLoop(self, sess, global_step, dec_metrics,
+                           write_decode_out_fn, samples_per_summary,
+                           pipeline_depth):
+    """Overlaps fetching decoder outputs with post-processing them.
+
+    Decoder outputs are fetched on this thread and post-processed in fetch
+    order on a background thread, which is the only one to update dec_metrics
+    and write decode outputs. At most pipeline_depth fetched outputs wait to be
+    post-processed.
+
+    Like the sequential loop, no batch is fetched once samples_per_summary
+    examples have been post-processed, so that non-resettable inputs are not
+    consumed past it. A batch is only fetched before the outputs in flight are
+    post-processed if they cannot complete samples_per_summary examples, i.e.
+    assuming no batch has more examples than the largest one post-processed so
+    far. Any outputs still fetched past samples_per_summary examples are
+    dropped, so that the metrics and decode outputs are the same as when
+    fetching and post-processing alternate.
+
+    Args:
+      sess: The session to fetch decoder outputs with.
+      global_step: The global step of the decoded checkpoint.
+      dec_metrics: Decoder metrics, updated by PostProcessDecodeOut().
+      write_decode_out_fn: Function called with the key value pairs of decode
+        outputs.
+      samples_per_summary: Number of examples to decode, or 0 to decode until
+        the input is exhausted.
+      pipeline_depth: Maximum number of fetched outputs waiting to be
+        post-processed.
+    """
+    num_examples_metric = dec_metrics['num_samples_in_batch']
+    dec_out_queue = queue.Queue()
+    cond = threading.Condition()
+    # Shared with the post-processing thread, guarded by cond.
+    state = py_utils.NestedMap(
+        done=False,
+        errors=[],
+        # Number of fetched outputs not post-processed yet.
+        num_in_flight=0,
+        num_examples=0,
+        max_batch_examples=0)
+
+    def _PostProcessLoop():
+      is_first_loop = True
+      while True:
+        dec_out = dec_out_queue.get()
+        if dec_out is None:
+          return
+        with cond:
+          if state.done:
+            continue
+        num_examples = num_examples_metric.total_value
+        try:
+          self._PostProcessDecodeOutput(dec_out, dec_metrics, global_step,
+                                        is_first_loop, write_decode_out_fn,
+                                        samples_per_summary)
+        except Exception as e:  # pylint: disable=broad-except
+          with cond:
+            state.errors.append(e)
+            state.done = True
+            cond.notify_all()
+          continue
+        is_first_loop = False
+        with cond:
+          state.num_in_flight -= 1
+          state.num_examples = num_examples_metric.total_value
+          state.max_batch_examples = max(state.max_batch_examples,
+                                         state.num_examples - num_examples)
+          if samples_per_summary and state.num_examples >= samples_per_summary:
+            state.done = True
+          cond.notify_all()
+
+    def _CanFetch():
+      if state.num_in_flight > pipeline_depth:
+        return False
+      if not samples_per_summary:
+        return True
+      if state.num_in_flight and not state.max_batch_examples:
+        # No batch size is known before the first batch is post-processed.
+        return False
+      return (state.num_examples + state.num_in_flight *
+              state.max_batch_examples < samples_per_summary)
+
+    post_process_thread = threading.Thread(
+        target=_PostProcessLoop, name='decoder_postprocess', daemon=True)
+    post_process_thread.start()
+    is_first_loop = True
+    try:
+      while True:
+        with cond:
+          # Waits until the outputs in flight are known not to complete
+          # samples_per_summary examples.
+          while not state.done and state.num_in_flight and not _CanFetch():
+            cond.wait()
+          if state.done or not _CanFetch():
+            break
+          state.num_in_flight += 1
+        try:
+          dec_out = self._FetchDecodeOutput(sess, global_step, is_first_loop)
+        except tf.errors.OutOfRangeError:
+          if not self._task.input.params.resettable:
+            raise
+          break
+        is_first_loop = False
+        dec_out_queue.put(dec_out)
+    except Exception:  # pylint: disable=broad-except
+      # Drops the pending outputs.
+      with cond:
+        state.done = True
+      raise
+    finally:
+      dec_out_queue.put(None)
+      post_process_thread.join()
+    if state.errors:
+      error = state.errors[0]
+      # Handled like in the sequential loop.
+      if not (isinstance(error, tf.errors.OutOfRangeError) and
+              self._task.input.params.resettable):
+        raise error
+
   def DecodeCheckpoint(self, sess, checkpoint_path):
     """Decodes `samples_per_summary` examples using `checkpoint_path`."""
     p = self._task.params
@@ -1231,64 +1407,48 @@ class Decoder(base_runner.BaseRunner):
     if not dec_metrics:
       tf.logging.info('Empty decoder metrics')
       return
-    buffered_decode_out = []
-    num_examples_metric = dec_metrics['num_samples_in_batch']
-    start_time = time.time()
-    while samples_per_summary == 0 or (num_examples_metric.total_value <
-                                       samples_per_summary):
-      try:
-        is_first_loop = num_examples_metric.total_value == 0
-        tf.logging.info('Fetching dec_output.')
-        fetch_start = time.time()
-        run_options = tf.RunOptions(report_tensor_allocations_upon_oom=False)
-
-        # NOTE: We intentionally do not generate scalar summaries by
-        # default, because decoder is run  multiple times for each
-        # checkpoint. Multiple summaries at the same step is often confusing.
-        # Instead, models should generate aggregate summaries using
-        # PostProcessDecodeOut. Other types of summaries (images, audio etc.)
-        # will be generated for the first eval batch.
-        if self._summary_op is not None and is_first_loop:
-          dec_out, summaries = sess.run([self._dec_output, self._summary_op],
-                                        options=run_options)
-          summaries = self._RemoveScalarSummaries(summaries)
+    # global_step and the checkpoint id from the checkpoint file might be
+    # different. For consistency of checkpoint filename and decoder_out
+    # file, use the checkpoint id as derived from the checkpoint filename.
+    checkpoint_id = _GetCheckpointIdForDecodeOut(ckpt_id_from_file, global_step)
+    decode_out_path = self.GetDecodeOutPath(self._decoder_dir, checkpoint_id)
 
-          # Add non-scalar summaries only for the first batch of data.
-          self._summary_writer.add_summary(summaries, global_step)
-          self._summary_writer.flush()
-        else:
-          dec_out = sess.run(self._dec_output, options=run_options)
+    decode_out_writer = None
+    if p.eval.decode_out_chunk_size > 0:
+      # Outputs are only written in the same order again after a restart if
+      # the input is read from the start.
+      decode_out_writer = decoder_lib.DecodeOutputWriter(
+          decode_out_path,
+          chunk_size=p.eval.decode_out_chunk_size,
+          resume=self._task.input.params.resettable,
+          fingerprint=decoder_lib.DecodeFingerprint(p, checkpoint_path))
+      write_decode_out_fn = decode_out_writer.Extend
+    else:
+      buffered_decode_out = []
+      write_decode_out_fn = buffered_decode_out.extend
 
-        self._RunTF2SummaryOps(sess)
-        post_process_start = time.time()
-        tf.logging.info('Done fetching (%f seconds)' %
-                        (post_process_start - fetch_start))
-        decode_out = self._task.PostProcessDecodeOut(dec_out, dec_metrics)
-        if decode_out:
-          if isinstance(decode_out, dict):
-            decode_out = decode_out.items()
-
-          if is_first_loop:
-            # Add summaries only for the first batch of data.
-            for key, value in decode_out:
-              if isinstance(value, tf.Summary):
-                tf.logging.info(f'Adding summary {key} with tags '
-                                f'{[x.tag for x in value.value]}.')
-                self._summary_writer.add_summary(value, global_step)
-            self._summary_writer.flush()
-
-          buffered_decode_out.extend(
-              kv for kv in decode_out if not isinstance(kv[1], tf.Summary))
-        tf.logging.info(
-            'Total examples done: %d/%d '
-            '(%f seconds decode postprocess)', num_examples_metric.total_value,
-            samples_per_summary,
-            time.time() - post_process_start)
-      except tf.errors.OutOfRangeError:
-        if not self._task.input.params.resettable:
-          raise
-        break
+    num_examples_metric = dec_metrics['num_samples_in_batch']
+    start_time = time.time()
+    if p.eval.decoder_postprocess_pipeline_depth > 0:
+      self._PipelinedDecodeLoop(sess, global_step, dec_metrics,
+                                write_decode_out_fn, samples_per_summary,
+                                p.eval.decoder_postprocess_pipeline_depth)
+    else:
+      while samples_per_summary == 0 or (num_examples_metric.total_value <
+                                         samples_per_summary):
+        try:
+          is_first_loop = num_examples_metric.total_value == 0
+          dec_out = self._FetchDecodeOutput(sess, global_step, is_first_loop)
+          self._PostProcessDecodeOutput(dec_out, dec_metrics, global_step,
+                                        is_first_loop, write_decode_out_fn,
+                                        samples_per_summary)
+        except tf.errors.OutOfRangeError:
+          if not self._task.input.params.resettable:
+            raise
+          break
     tf.logging.info('Done decoding ckpt: %s', checkpoint_path)
+    if decode_out_writer:
+      decode_out_writer.Close()
 
     summaries = {k: v.Summary(k) for k, v in dec_metrics.items()}
     elapsed_secs = time.time() - start_time
@@ -1309,14 +1469,13 @@ class Decoder(base_runner.BaseRunner):
         decode_checkpoint=int(global_step),
         dec_metrics=dec_metrics,
         example_rate=example_rate)
-    # global_step and the checkpoint id from the checkpoint file might be
-    # different. For consistency of checkpoint filename and decoder_out
-    # file, use the checkpoint id as derived from the checkpoint filename.
-    checkpoint_id = _GetCheckpointIdForDecodeOut(ckpt_id_from_file, global_step)
-    decode_out_path = self.GetDecodeOutPath(self._decoder_dir, checkpoint_id)
 
+    if decode_out_writer:
+      decode_out = decoder_lib.DecodeOutputReader(decode_out_path)
+    else:
+      decode_out = buffered_decode_out
     decode_finalize_args = base_model.DecodeFinalizeArgs(
-        decode_out_path=decode_out_path, decode_out=buffered_decode_out)
+        decode_out_path=decode_out_path, decode_out=decode_out)
     self._task.DecodeFinalize(decode_finalize_args)
 
     if self._should_report_metrics:
@@ -0,0 +1,153 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for runners."""
+
+import threading
+import time
+
+from absl.testing import parameterized
+from lingvo import compat as tf
+from lingvo import runners
+from lingvo.core import metrics
+from lingvo.core import py_utils
+from lingvo.core import test_utils
+
+
+class _FakeDecoder:
+  """Fetches and post-processes fake batches for Decoder._PipelinedDecodeLoop.
+
+  Batch i is the pair (i, batch_size). Post-processing is slower than fetching,
+  so that fetches run ahead of post-processing whenever the loop allows.
+  """
+
+  def __init__(self,
+               batch_size,
+               num_batches=None,
+               resettable=False,
+               post_process_error=None,
+               post_process_error_batch=None):
+    self._batch_size = batch_size
+    self._num_batches = num_batches
+    self._post_process_error = post_process_error
+    self._post_process_error_batch = post_process_error_batch
+    self._task = py_utils.NestedMap(
+        input=py_utils.NestedMap(
+            params=py_utils.NestedMap(resettable=resettable)))
+    self.num_fetched = 0
+    self.post_processed = []
+
+  def _FetchDecodeOutput(self, sess, global_step, is_first_loop):
+    del sess, global_step, is_first_loop
+    if self._num_batches is not None and self.num_fetched >= self._num_batches:
+      raise tf.errors.OutOfRangeError(None, None, 'End of input.')
+    self.num_fetched += 1
+    return (self.num_fetched - 1, self._batch_size)
+
+  def _PostProcessDecodeOutput(self, dec_out, dec_metrics, global_step,
+                               is_first_loop, write_decode_out_fn,
+                               samples_per_summary):
+    del global_step, is_first_loop, samples_per_summary
+    time.sleep(0.005)
+    batch, batch_size = dec_out
+    if batch == self._post_process_error_batch:
+      raise self._post_process_error
+    self.post_processed.append(batch)
+    dec_metrics['num_samples_in_batch'].Update(batch_size)
+    write_decode_out_fn([(str(batch), batch_size)])
+
+  def RunPipelinedDecodeLoop(self, samples_per_summary, pipeline_depth):
+    """Returns the decode outputs written by _PipelinedDecodeLoop."""
+    dec_metrics = {'num_samples_in_batch': metrics.AverageMetric()}
+    decode_out = []
+    runners.Decoder._PipelinedDecodeLoop(self, None, 0, dec_metrics,
+                                         decode_out.extend, samples_per_summary,
+                                         pipeline_depth)
+    return decode_out
+
+
+def _PostProcessThreads():
+  return [t for t in threading.enumerate() if t.name == 'decoder_postprocess']
+
+
+class PipelinedDecodeLoopTest(test_utils.TestCase, parameterized.TestCase):
+
+  @parameterized.parameters(
+      (4, 1, 1),
+      (4, 10, 1),
+      (4, 10, 3),
+      (4, 12, 3),
+      (1, 7, 2),
+      (3, 100, 8),
+  )
+  def testStopsFetchingAtSampleBudget(self, batch_size, samples_per_summary,
+                                      pipeline_depth):
+    decoder = _FakeDecoder(batch_size)
+    decode_out = decoder.RunPipelinedDecodeLoop(samples_per_summary,
+                                                pipeline_depth)
+    # As many batches as the sequential loop fetches.
+    num_batches = -(-samples_per_summary // batch_size)
+    self.assertEqual(num_batches, decoder.num_fetched)
+    self.assertEqual(list(range(num_batches)), decoder.post_processed)
+    self.assertEqual([(str(i), batch_size) for i in range(num_batches)],
+                     decode_out)
+    self.assertEmpty(_PostProcessThreads())
+
+  @parameterized.parameters(1, 3)
+  def testDecodesUntilOutOfRange(self, pipeline_depth):
+    decoder = _FakeDecoder(2, num_batches=5, resettable=True)
+    decode_out = decoder.RunPipelinedDecodeLoop(0, pipeline_depth)
+    self.assertEqual(5, decoder.num_fetched)
+    self.assertEqual([(str(i), 2) for i in range(5)], decode_out)
+
+  def testOutOfRangeRaisesIfNotResettable(self):
+    decoder = _FakeDecoder(2, num_batches=2)
+    with self.assertRaises(tf.errors.OutOfRangeError):
+      decoder.RunPipelinedDecodeLoop(10, 2)
+    self.assertEmpty(_PostProcessThreads())
+
+  @parameterized.parameters(
+      (0, 1),
+      (0, 4),
+      (2, 1),
+      (2, 4),
+  )
+  def testPostProcessingErrorDrainsQueue(self, error_batch, pipeline_depth):
+    decoder = _FakeDecoder(
+        2,
+        resettable=True,
+        post_process_error=ValueError('Post-processing failed.'),
+        post_process_error_batch=error_batch)
+    with self.assertRaisesRegex(ValueError, 'Post-processing failed'):
+      decoder.RunPipelinedDecodeLoop(0, pipeline_depth)
+    # Fetching stops with at most pipeline_depth + 1 outputs in flight, and the
+    # outputs fetched after the failed one are dropped.
+    self.assertBetween(decoder.num_fetched, error_batch + 1,
+                       error_batch + pipeline_depth + 1)
+    self.assertEqual(list(range(error_batch)), decoder.post_processed)
+    self.assertEmpty(_PostProcessThreads())
+
+  def testPostProcessingOutOfRangeStopsResettableInput(self):
+    decoder = _FakeDecoder(
+        2,
+        resettable=True,
+        post_process_error=tf.errors.OutOfRangeError(None, None, 'Done.'),
+        post_process_error_batch=3)
+    decode_out = decoder.RunPipelinedDecodeLoop(0, 2)
+    self.assertEqual([(str(i), 2) for i in range(3)], decode_out)
+    self.assertEmpty(_PostProcessThreads())
+
+
+if __name__ == '__main__':
+  test_utils.main()
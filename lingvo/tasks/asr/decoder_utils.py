@@ -16,6 +16,7 @@
 import lingvo.compat as tf
 from lingvo.core import py_utils
 from lingvo.core import symbolic
+import numpy as np
 import six
 from lingvo.tasks.asr import levenshtein_distance
 
@@ -125,6 +126,57 @@ def EditDistanceInIds(ref_ids, hyp_ids):
   return EditDistance(ref_str, hyp_str)
 
 
+def _PadTokenIds(seqs):
+  """Packs a list of int sequences into a [N, max_len] array plus lengths."""
+  lens = np.array([len(x) for x in seqs], dtype=np.int64)
+  ids = np.zeros([len(seqs), int(np.max(lens, initial=0))], dtype=np.int64)
+  for i, seq in enumerate(seqs):
+    ids[i, :lens[i]] = seq
+  return ids, lens
+
+
+def BatchEditDistanceInIds(ref_ids, hyp_ids):
+  """Computes Levenshtein edit distances between batches of id sequences.
+
+  Args:
+    ref_ids: A list of N int sequences, the references.
+    hyp_ids: A list of N int sequences, the hypotheses.
+
+  Returns:
+    (ins, subs, del, total), each an int64 array of shape [N]. Element i
+    matches EditDistanceInIds(ref_ids[i], hyp_ids[i]).
+  """
+  assert len(ref_ids) == len(hyp_ids)
+  refs, ref_lens = _PadTokenIds(ref_ids)
+  hyps, hyp_lens = _PadTokenIds(hyp_ids)
+  results = levenshtein_distance.BatchLevenshteinDistance(
+      refs, ref_lens, hyps, hyp_lens)
+  return results.insertions, results.subs, results.deletions, results.total
+
+
+def BatchEditDistance(ref_strs, hyp_strs):
+  """Computes Levenshtein edit distances between batches of sentences.
+
+  Words are mapped to ids with a vocabulary built on the fly for the batch, then
+  all pairs are scored in one BatchEditDistanceInIds() call.
+
+  Args:
+    ref_strs: A list of N ref sentences.
+    hyp_strs: A list of N hyp sentences.
+
+  Returns:
+    (ins, subs, del, total), each an int64 array of shape [N]. Element i
+    matches EditDistance(ref_strs[i], hyp_strs[i]).
+  """
+  vocab = {}
+
+  def _ToIds(string):
+    return [vocab.setdefault(w, len(vocab)) for w in Tokenize(string)]
+
+  return BatchEditDistanceInIds([_ToIds(x) for x in ref_strs],
+                                [_ToIds(x) for x in hyp_strs])
+
+
 def FilterEpsilon(string):
   """Filters out <epsilon> tokens from the given string."""
   return ' '.join(Tokenize(string.replace('<epsilon>', ' ')))
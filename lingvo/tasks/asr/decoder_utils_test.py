@@ -218,6 +218,24 @@ class DecoderUtilsEditDistanceTest(test_utils.TestCase):
     hyp = "a b c d e   f g h"
     self.assertEqual((0, 0, 0, 0), decoder_utils.EditDistance(ref, hyp))
 
+  def testBatchEditDistance(self):
+    refs = ["a b c d", "a b c d", "", "a  b", "a b c d"]
+    hyps = ["a b c d", "a c d e", "a b c", "A b", ""]
+    ins, subs, dels, errs = decoder_utils.BatchEditDistance(refs, hyps)
+    for i, (ref, hyp) in enumerate(zip(refs, hyps)):
+      self.assertEqual(
+          decoder_utils.EditDistance(ref, hyp),
+          (ins[i], subs[i], dels[i], errs[i]))
+
+  def testBatchEditDistanceInIds(self):
+    refs = [[0, 1, 2, 3, 9], [], [4, 5]]
+    hyps = [[0, 2, 3, 5, 6], [1], [4, 5]]
+    ins, subs, dels, errs = decoder_utils.BatchEditDistanceInIds(refs, hyps)
+    self.assertAllEqual([1, 1, 0], ins)
+    self.assertAllEqual([1, 0, 0], subs)
+    self.assertAllEqual([1, 0, 0], dels)
+    self.assertAllEqual([3, 1, 0], errs)
+
 
 if __name__ == "__main__":
   test_utils.main()
@@ -15,6 +15,11 @@
 import copy
 from typing import List
 
+import numpy as np
+
+# Row indices of the error counts stacked by BatchLevenshteinDistance().
+_INS, _DEL, _SUB, _TOT = range(4)
+
 
 class ErrorStats:
   """Class to keep track of error counts."""
@@ -65,3 +70,102 @@ def LevenshteinDistance(lst_ref: List[str], lst_hyp: List[str]) -> ErrorStats:
       e[i] = copy.copy(cur_e[i])
 
   return e[-1]
+
+
+def BatchLevenshteinDistance(ref_ids: np.ndarray, ref_lens: np.ndarray,
+                             hyp_ids: np.ndarray,
+                             hyp_lens: np.ndarray) -> ErrorStats:
+  """Computes Levenshtein edit distances for a batch of sequence pairs.
+
+  The DP table of every pair is filled one anti-diagonal at a time. All cells
+  on an anti-diagonal only depend on the two previous anti-diagonals, so each
+  step is a handful of vectorized NumPy ops over [batch, max_hyp_len + 1]
+  arrays. Ties are broken exactly as in LevenshteinDistance(), hence the
+  insertion/deletion/substitution breakdown is identical.
+
+  Args:
+    ref_ids: An int array of shape [batch, max_ref_len] holding reference token
+      ids. Entries beyond ref_lens are ignored.
+    ref_lens: An int array of shape [batch], the reference lengths.
+    hyp_ids: An int array of shape [batch, max_hyp_len] holding hypothesis
+      token ids. Entries beyond hyp_lens are ignored.
+    hyp_lens: An int array of shape [batch], the hypothesis lengths.
+
+  Returns:
+    An ErrorStats whose insertions, deletions, subs and total fields are int64
+    arrays of shape [batch].
+  """
+  ref_ids = np.asarray(ref_ids)
+  hyp_ids = np.asarray(hyp_ids)
+  ref_lens = np.asarray(ref_lens, dtype=np.int64)
+  hyp_lens = np.asarray(hyp_lens, dtype=np.int64)
+  batch = ref_lens.shape[0]
+  # [4, batch] with rows (insertions, deletions, subs, total).
+  result = np.zeros([4, batch], dtype=np.int64)
+  if batch == 0:
+    return ErrorStats(*result)
+  assert ref_ids.ndim == 2 and ref_ids.shape[0] == batch, ref_ids.shape
+  assert hyp_ids.ndim == 2 and hyp_ids.shape[0] == batch, hyp_ids.shape
+  assert hyp_lens.shape == (batch,), hyp_lens.shape
+  assert np.all(ref_lens <= ref_ids.shape[1])
+  assert np.all(hyp_lens <= hyp_ids.shape[1])
+  max_ref = int(np.max(ref_lens))
+  max_hyp = int(np.max(hyp_lens))
+  # Keeps one extra column so that gathering a ref token never goes out of
+  # bounds, even for empty references; those cells are masked out anyway.
+  ref_ids = np.pad(ref_ids[:, :max_ref], [[0, 0], [0, 1]])
+  hyp_ids = hyp_ids[:, :max_hyp]
+
+  # State of anti-diagonal d is stored as [4, batch, max_hyp + 1], indexed by
+  # the hyp position h; the matching ref position is d - h.
+  hyp_pos = np.arange(max_hyp + 1)
+  prev2 = np.zeros([4, batch, max_hyp + 1], dtype=np.int64)
+  prev1 = np.zeros([4, batch, max_hyp + 1], dtype=np.int64)
+  # Anti-diagonal 0 is the single cell (0, 0) with no errors.
+  done = (ref_lens + hyp_lens) == 0
+  for d in range(1, max_ref + max_hyp + 1):
+    cur = np.zeros_like(prev1)
+    # Interior cells (h >= 1, r >= 1); computed for all h in [1, max_hyp] and
+    # masked below.
+    ref_pos = d - hyp_pos[1:]
+    ref_tokens = ref_ids[:, np.clip(ref_pos - 1, 0, max_ref)]
+    mismatch = (hyp_ids != ref_tokens).astype(np.int64)
+    ins_err = prev1[_TOT, :, :-1] + 1
+    del_err = prev1[_TOT, :, 1:] + 1
+    sub_err = prev2[_TOT, :, :-1] + mismatch
+    use_sub = (sub_err < ins_err) & (sub_err < del_err)
+    use_del = ~use_sub & (del_err < ins_err)
+    from_sub = prev2[:, :, :-1].copy()
+    from_sub[_SUB] += mismatch
+    from_sub[_TOT] = sub_err
+    from_del = prev1[:, :, 1:].copy()
+    from_del[_DEL] += 1
+    from_del[_TOT] = del_err
+    from_ins = prev1[:, :, :-1].copy()
+    from_ins[_INS] += 1
+    from_ins[_TOT] = ins_err
+    cur[:, :, 1:] = np.where(use_sub, from_sub,
+                             np.where(use_del, from_del, from_ins))
+    # Mask out cells that fall outside of the table.
+    valid = (ref_pos >= 1) & (ref_pos <= max_ref)
+    cur[:, :, 1:] *= valid
+    # Boundary cells: (0, d) consists of deletions only, (d, 0) of insertions.
+    if d <= max_ref:
+      cur[:, :, 0] = 0
+      cur[_DEL, :, 0] = d
+      cur[_TOT, :, 0] = d
+    if d <= max_hyp:
+      cur[:, :, d] = 0
+      cur[_INS, :, d] = d
+      cur[_TOT, :, d] = d
+    # Collect the pairs whose final cell (hyp_len, ref_len) is on this diagonal.
+    finished = (ref_lens + hyp_lens) == d
+    if np.any(finished):
+      idx = np.nonzero(finished)[0]
+      result[:, idx] = cur[:, idx, hyp_lens[idx]]
+      done |= finished
+    prev2, prev1 = prev1, cur
+    if np.all(done):
+      break
+
+  return ErrorStats(*result)
@@ -0,0 +1,123 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for levenshtein_distance."""
+
+import time
+
+import lingvo.compat as tf
+from lingvo.core import test_utils
+from lingvo.tasks.asr import levenshtein_distance
+import numpy as np
+
+
+def _Pad(seqs):
+  lens = np.array([len(x) for x in seqs], dtype=np.int64)
+  ids = np.zeros([len(seqs), int(np.max(lens, initial=0))], dtype=np.int64)
+  for i, seq in enumerate(seqs):
+    ids[i, :lens[i]] = seq
+  return ids, lens
+
+
+def _RandomSeqs(rng, batch, max_len, vocab_size):
+  return [
+      list(rng.randint(vocab_size, size=rng.randint(max_len + 1)))
+      for _ in range(batch)
+  ]
+
+
+class LevenshteinDistanceTest(test_utils.TestCase):
+
+  def testLevenshteinDistance(self):
+    e = levenshtein_distance.LevenshteinDistance(['a', 'b', 'c'],
+                                                 ['a', 'x', 'c', 'd'])
+    self.assertEqual((1, 0, 1, 2), (e.insertions, e.deletions, e.subs, e.total))
+
+  def testBatchLevenshteinDistance(self):
+    refs, ref_lens = _Pad([[0, 1, 2], [0, 1, 2], [], [3, 4], [5, 6, 7, 8]])
+    hyps, hyp_lens = _Pad([[0, 9, 2, 3], [], [1, 2], [3, 4], [6, 7]])
+    e = levenshtein_distance.BatchLevenshteinDistance(refs, ref_lens, hyps,
+                                                      hyp_lens)
+    self.assertAllEqual([1, 0, 2, 0, 0], e.insertions)
+    self.assertAllEqual([0, 3, 0, 0, 2], e.deletions)
+    self.assertAllEqual([1, 0, 0, 0, 0], e.subs)
+    self.assertAllEqual([2, 3, 2, 0, 2], e.total)
+
+  def testBatchLevenshteinDistanceEmptyBatch(self):
+    e = levenshtein_distance.BatchLevenshteinDistance(
+        np.zeros([0, 0]), [], np.zeros([0, 0]), [])
+    self.assertAllEqual([], e.total)
+
+  def testBatchLevenshteinDistanceMatchesPerPair(self):
+    rng = np.random.RandomState(12345)
+    ref_seqs = _RandomSeqs(rng, 200, 20, 6)
+    hyp_seqs = _RandomSeqs(rng, 200, 20, 6)
+    refs, ref_lens = _Pad(ref_seqs)
+    hyps, hyp_lens = _Pad(hyp_seqs)
+    e = levenshtein_distance.BatchLevenshteinDistance(refs, ref_lens, hyps,
+                                                      hyp_lens)
+    for i, (ref, hyp) in enumerate(zip(ref_seqs, hyp_seqs)):
+      expected = levenshtein_distance.LevenshteinDistance(
+          [str(x) for x in ref], [str(x) for x in hyp])
+      self.assertEqual(
+          (expected.insertions, expected.deletions, expected.subs,
+           expected.total),
+          (e.insertions[i], e.deletions[i], e.subs[i], e.total[i]))
+
+
+class LevenshteinDistanceBenchmark(tf.test.Benchmark):
+  """Compares BatchLevenshteinDistance against per-pair LevenshteinDistance.
+
+  Run with:
+    bazel run -c opt lingvo/tasks/asr:levenshtein_distance_test -- \
+      --benchmarks=all
+  """
+
+  def _RunBenchmark(self, batch, max_len):
+    rng = np.random.RandomState(12345)
+    ref_seqs = _RandomSeqs(rng, batch, max_len, 1000)
+    hyp_seqs = _RandomSeqs(rng, batch, max_len, 1000)
+    ref_strs = [[str(x) for x in seq] for seq in ref_seqs]
+    hyp_strs = [[str(x) for x in seq] for seq in hyp_seqs]
+    refs, ref_lens = _Pad(ref_seqs)
+    hyps, hyp_lens = _Pad(hyp_seqs)
+
+    start = time.time()
+    for ref, hyp in zip(ref_strs, hyp_strs):
+      levenshtein_distance.LevenshteinDistance(ref, hyp)
+    per_pair_secs = time.time() - start
+
+    start = time.time()
+    levenshtein_distance.BatchLevenshteinDistance(refs, ref_lens, hyps,
+                                                  hyp_lens)
+    batch_secs = time.time() - start
+
+    self.report_benchmark(
+        name='levenshtein_b%d_l%d' % (batch, max_len),
+        iters=1,
+        wall_time=batch_secs,
+        extras={
+            'per_pair_secs': per_pair_secs,
+            'batch_secs': batch_secs,
+            'speedup': per_pair_secs / max(batch_secs, 1e-9),
+        })
+
+  def benchmarkShortUtterances(self):
+    self._RunBenchmark(batch=1024, max_len=20)
+
+  def benchmarkLongUtterances(self):
+    self._RunBenchmark(batch=256, max_len=200)
+
+
+if __name__ == '__main__':
+  test_utils.main()
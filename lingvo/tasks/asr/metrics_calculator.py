@@ -94,6 +94,24 @@ def CalculateMetrics(
   total_ref_tokens = 0
   total_accurate_sentences = 0
 
+  # Edit distances of all utterances are computed in batch up front; the loop
+  # below only logs and aggregates them.
+  all_ref_ids = []
+  all_top_hyp_ids = []
+  for i in range(len(transcripts)):
+    num_hyps_per_beam = len(topk_decoded[i])
+    hyp_index = i * num_hyps_per_beam
+    all_ref_ids.append(GetRefIds(target_labels[i], target_paddings[i]))
+    all_top_hyp_ids.append(topk_ids[hyp_index][:topk_lens[hyp_index]])
+  _, _, _, all_token_errs = decoder_utils.BatchEditDistanceInIds(
+      all_ref_ids, all_top_hyp_ids)
+  all_ins, all_subs, all_dels, all_errs = decoder_utils.BatchEditDistance(
+      filtered_transcripts, filtered_top_hyps)
+  # Case insensitive edit distances.
+  all_ci_ins, all_ci_subs, all_ci_dels, all_ci_errs = (
+      decoder_utils.BatchEditDistance([x.lower() for x in filtered_transcripts],
+                                      [x.lower() for x in filtered_top_hyps]))
+
   for i in range(len(transcripts)):
     ref_str = transcripts[i]
     if not use_tpu:
@@ -102,16 +120,13 @@ def CalculateMetrics(
       tf.logging.info('  ref_str: %s',
                       ref_str.decode('utf-8') if log_utf8 else ref_str)
     hyps = topk_decoded[i]
-    num_hyps_per_beam = len(hyps)
-    ref_ids = GetRefIds(target_labels[i], target_paddings[i])
-    hyp_index = i * num_hyps_per_beam
-    top_hyp_ids = topk_ids[hyp_index][:topk_lens[hyp_index]]
+    ref_ids = all_ref_ids[i]
+    top_hyp_ids = all_top_hyp_ids[i]
     if add_summary:
       tf.logging.info('  ref_ids: %s', ref_ids)
       tf.logging.info('  top_hyp_ids: %s', top_hyp_ids)
     total_ref_tokens += len(ref_ids)
-    _, _, _, token_errs = decoder_utils.EditDistanceInIds(ref_ids, top_hyp_ids)
-    total_token_errs += token_errs
+    total_token_errs += int(all_token_errs[i])
 
     filtered_ref = filtered_transcripts[i]
     oracle_errs = norm_wer_errors[i][0]
@@ -123,9 +138,8 @@ def CalculateMetrics(
       # Only aggregate scores of the top hypothesis.
       if n != 0:
         continue
-      filtered_hyp = filtered_top_hyps[i]
-      ins, subs, dels, errs = decoder_utils.EditDistance(
-          filtered_ref, filtered_hyp)
+      ins, subs, dels, errs = (int(all_ins[i]), int(all_subs[i]),
+                               int(all_dels[i]), int(all_errs[i]))
 
       total_ins += ins
       total_subs += subs
@@ -133,8 +147,10 @@ def CalculateMetrics(
       total_errs += errs
 
       # Calculating case_insensitive WERs
-      ci_ins, ci_subs, ci_dels, ci_errs = decoder_utils.EditDistance(
-          filtered_ref.lower(), filtered_hyp.lower())
+      ci_ins, ci_subs, ci_dels, ci_errs = (int(all_ci_ins[i]),
+                                           int(all_ci_subs[i]),
+                                           int(all_ci_dels[i]),
+                                           int(all_ci_errs[i]))
 
       ci_total_ins += ci_ins
       ci_total_subs += ci_subs
@@ -0,0 +1,150 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Word-level edit distance and alignment shared by the simple_wer tools.
+
+Tensorflow and Lingvo are not required to use this library, only NumPy, so
+that the stand-alone simple_wer scripts can import it from the same directory.
+
+The edit distance matrix is an int32 array filled one reference word (row) at
+a time. Within a row, the dependency on the cell to the left is resolved with
+a running minimum, so each row costs a few vectorized NumPy ops instead of a
+Python loop over the hypothesis words.
+
+For long-form transcripts, a band can be given to only fill cells close to the
+diagonal. Cells outside of the band are set to a large value, so the banded
+distance is an upper bound of the true one, and exact as long as the optimal
+alignment stays inside the band.
+"""
+
+import numpy as np
+
+# Value of the cells outside of the band. Small enough that adding to it does
+# not overflow int32.
+_OUT_OF_BAND = np.iinfo(np.int32).max // 2
+
+
+def _WordsToIds(hyp_words, ref_words):
+  """Maps the words of both sentences to int ids using a shared vocabulary."""
+  vocab = {}
+  hyp_ids = np.array([vocab.setdefault(w, len(vocab)) for w in hyp_words],
+                     dtype=np.int32)
+  ref_ids = np.array([vocab.setdefault(w, len(vocab)) for w in ref_words],
+                     dtype=np.int32)
+  return hyp_ids, ref_ids
+
+
+def ComputeEditDistanceMatrix(hyp_words, ref_words, band_width=None):
+  """Compute edit distance between two list of strings.
+
+  Args:
+    hyp_words: the list of words in the hypothesis sentence
+    ref_words: the list of words in the reference sentence
+    band_width: optional int. If set, only cells whose hypothesis position is
+      within band_width of the diagonal (widened by the length difference of
+      the two sentences) are computed.
+
+  Returns:
+    Edit distance matrix as an int32 array of shape
+    [len(ref_words) + 1, len(hyp_words) + 1], where the first index is the
+    reference and the second index is the hypothesis.
+  """
+  hyp_ids, ref_ids = _WordsToIds(hyp_words, ref_words)
+  num_ref, num_hyp = len(ref_ids), len(hyp_ids)
+  dists = np.empty([num_ref + 1, num_hyp + 1], dtype=np.int32)
+  hyp_pos = np.arange(num_hyp + 1, dtype=np.int32)
+  dists[0] = hyp_pos
+
+  if band_width is not None:
+    assert band_width >= 0, band_width
+    # Allowed range of (hyp position - ref position).
+    lo = min(0, num_hyp - num_ref) - band_width
+    hi = max(0, num_hyp - num_ref) + band_width
+    dists[0, hyp_pos > hi] = _OUT_OF_BAND
+
+  for i in range(1, num_ref + 1):
+    prev = dists[i - 1]
+    row = dists[i]
+    if band_width is None:
+      start, end = 0, num_hyp + 1
+    else:
+      start, end = max(0, i + lo), min(num_hyp + 1, i + hi + 1)
+      row[:start] = _OUT_OF_BAND
+      row[end:] = _OUT_OF_BAND
+      if start >= end:
+        continue
+    # Best cost of reaching each cell from the previous row: substitution (or
+    # match) from the upper-left cell, or deletion from the cell above.
+    from_prev = np.empty([end - start], dtype=np.int32)
+    first = max(start, 1)
+    if start == 0:
+      # Column 0 can only be reached by deleting the first i ref words.
+      from_prev[0] = i
+    mismatch = hyp_ids[first - 1:end - 1] != ref_ids[i - 1]
+    from_prev[first - start:] = np.minimum(prev[first - 1:end - 1] + mismatch,
+                                           prev[first:end] + 1)
+    # Insertions: cell j can also be reached from any cell k < j of the same
+    # row at cost (j - k), i.e. row[j] = min_k(from_prev[k] - k) + j.
+    offsets = hyp_pos[start:end]
+    row[start:end] = np.minimum.accumulate(from_prev - offsets) + offsets
+
+  return dists
+
+
+def Backtrace(hyp_words, ref_words, distmat):
+  """Back traces the edit distance matrix to find the aligned error types.
+
+  Args:
+    hyp_words: the list of words in the hypothesis sentence
+    ref_words: the list of words in the reference sentence
+    distmat: the edit distance matrix from ComputeEditDistanceMatrix().
+
+  Yields:
+    Tuples (err_type, pos_hyp, pos_ref), from the end of both sentences back to
+    their beginning. err_type is one of 'none', 'sub', 'del', 'ins', and
+    pos_hyp, pos_ref are the 1-based positions of the aligned hypothesis and
+    reference words before the step is taken.
+
+  Raises:
+    ValueError: when the program fails to parse edit distance matrix.
+  """
+  pos_hyp, pos_ref = len(hyp_words), len(ref_words)
+  while pos_hyp > 0 or pos_ref > 0:
+    # Distinguish error type by back tracking
+    if pos_ref == 0:
+      err_type = 'ins'
+    elif pos_hyp == 0:
+      err_type = 'del'
+    else:
+      dist = distmat[pos_ref, pos_hyp]
+      if hyp_words[pos_hyp - 1] == ref_words[pos_ref - 1]:
+        err_type = 'none'  # correct error
+      elif dist == distmat[pos_ref - 1, pos_hyp - 1] + 1:
+        err_type = 'sub'  # substitute error
+      elif dist == distmat[pos_ref - 1, pos_hyp] + 1:
+        err_type = 'del'  # deletion error
+      elif dist == distmat[pos_ref, pos_hyp - 1] + 1:
+        err_type = 'ins'  # insersion error
+      else:
+        raise ValueError('fail to parse edit distance matrix.')
+
+    yield err_type, pos_hyp, pos_ref
+
+    # Adjust position of ref and hyp.
+    if err_type == 'del':
+      pos_ref = pos_ref - 1
+    elif err_type == 'ins':
+      pos_hyp = pos_hyp - 1
+    else:  # err_type in ('none', 'sub')
+      pos_hyp, pos_ref = pos_hyp - 1, pos_ref - 1
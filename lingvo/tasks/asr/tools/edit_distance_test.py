@@ -0,0 +1,97 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for edit_distance."""
+
+from lingvo.core import test_utils
+from lingvo.tasks.asr.tools import edit_distance
+import numpy as np
+
+
+def _ReferenceEditDistanceMatrix(hyp_words, ref_words):
+  """Straightforward O(n*m) Python implementation."""
+  dists = [[0] * (len(hyp_words) + 1) for _ in range(len(ref_words) + 1)]
+  for i in range(len(ref_words) + 1):
+    for j in range(len(hyp_words) + 1):
+      if i == 0 or j == 0:
+        dists[i][j] = i + j
+      elif ref_words[i - 1] == hyp_words[j - 1]:
+        dists[i][j] = dists[i - 1][j - 1]
+      else:
+        dists[i][j] = 1 + min(dists[i - 1][j - 1], dists[i][j - 1],
+                              dists[i - 1][j])
+  return dists
+
+
+class EditDistanceTest(test_utils.TestCase):
+
+  def testComputeEditDistanceMatrix(self):
+    distmat = edit_distance.ComputeEditDistanceMatrix(['a', 'x', 'c', 'd'],
+                                                      ['a', 'b', 'c'])
+    self.assertEqual(distmat.dtype, np.int32)
+    self.assertAllEqual(distmat,
+                        [[0, 1, 2, 3, 4], [1, 0, 1, 2, 3], [2, 1, 1, 2, 3],
+                         [3, 2, 2, 1, 2]])
+
+  def testComputeEditDistanceMatrixEmpty(self):
+    self.assertAllEqual([[0]], edit_distance.ComputeEditDistanceMatrix([], []))
+    self.assertAllEqual([[0, 1, 2]],
+                        edit_distance.ComputeEditDistanceMatrix(['a', 'b'],
+                                                                []))
+    self.assertAllEqual([[0], [1]],
+                        edit_distance.ComputeEditDistanceMatrix([], ['a']))
+
+  def testComputeEditDistanceMatrixRandom(self):
+    rng = np.random.RandomState(12345)
+    for _ in range(200):
+      hyp_words = list(rng.choice(list('abcd'), size=rng.randint(12)))
+      ref_words = list(rng.choice(list('abcd'), size=rng.randint(12)))
+      expected = _ReferenceEditDistanceMatrix(hyp_words, ref_words)
+      self.assertAllEqual(
+          expected,
+          edit_distance.ComputeEditDistanceMatrix(hyp_words, ref_words))
+      # A band wider than both sentences is exact.
+      self.assertAllEqual(
+          expected,
+          edit_distance.ComputeEditDistanceMatrix(
+              hyp_words, ref_words, band_width=12))
+      # A narrow band is an upper bound, and can still be back traced.
+      banded = edit_distance.ComputeEditDistanceMatrix(
+          hyp_words, ref_words, band_width=1)
+      self.assertGreaterEqual(banded[-1, -1], expected[-1][-1])
+      num_errs = sum(err_type != 'none' for err_type, _, _ in
+                     edit_distance.Backtrace(hyp_words, ref_words, banded))
+      self.assertEqual(banded[-1, -1], num_errs)
+
+  def testBandedExactForSmallShifts(self):
+    ref_words = 'the quick brown fox jumps over the lazy dog'.split()
+    hyp_words = 'a quick brown fox jumped over over the lazy dog'.split()
+    self.assertEqual(
+        3,
+        edit_distance.ComputeEditDistanceMatrix(
+            hyp_words, ref_words, band_width=1)[-1, -1])
+
+  def testBacktrace(self):
+    hyp_words = ['a', 'x', 'c', 'd']
+    ref_words = ['a', 'b', 'c']
+    distmat = edit_distance.ComputeEditDistanceMatrix(hyp_words, ref_words)
+    self.assertEqual([('ins', 4, 3), ('none', 3, 3), ('sub', 2, 2),
+                      ('none', 1, 1)],
+                     list(
+                         edit_distance.Backtrace(hyp_words, ref_words,
+                                                 distmat)))
+
+
+if __name__ == '__main__':
+  test_utils.main()
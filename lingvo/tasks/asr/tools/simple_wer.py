@@ -16,7 +16,8 @@
 
 THIS SCRIPT IS NO LONGER SUPPORTED. PLEASE USE simple_wer_v2.py INSTEAD.
 
-Tensorflow and Lingvo are not required to run this script.
+Tensorflow and Lingvo are not required to run this script. It only needs NumPy
+and edit_distance.py from the same directory.
 
 Example of Usage::
 
@@ -39,45 +40,33 @@ Note to evaluate the ASR, we consider the following pre-processing:
   - remove extra empty spaces
 """
 
+import multiprocessing
 import re
 import sys
 
+# pylint: disable=g-import-not-at-top
+try:
+  from lingvo.tasks.asr.tools import edit_distance
+except ImportError:
+  # Run as a stand-alone script, without the lingvo package.
+  import edit_distance
+# pylint: enable=g-import-not-at-top
 
-def ComputeEditDistanceMatrix(hs, rs):
+
+def ComputeEditDistanceMatrix(hs, rs, band_width=None):
   """Compute edit distance between two list of strings.
 
   Args:
     hs: the list of words in the hypothesis sentence
     rs: the list of words in the reference sentence
+    band_width: optional int. If set, only cells within band_width of the
+      diagonal are computed, see edit_distance.ComputeEditDistanceMatrix().
 
   Returns:
-    Edit distance matrix (in the format of list of lists), where the first
-    index is the reference and the second index is the hypothesis.
+    Edit distance matrix (as an int32 numpy array), where the first index is
+    the reference and the second index is the hypothesis.
   """
-  dr, dh = len(rs) + 1, len(hs) + 1
-  dists = [[]] * dr
-
-  # Initialization.
-  for i in range(dr):
-    dists[i] = [0] * dh
-    for j in range(dh):
-      if i == 0:
-        dists[0][j] = j
-      elif j == 0:
-        dists[i][0] = i
-
-  # Do dynamic programming.
-  for i in range(1, dr):
-    for j in range(1, dh):
-      if rs[i - 1] == hs[j - 1]:
-        dists[i][j] = dists[i - 1][j - 1]
-      else:
-        tmp0 = dists[i - 1][j - 1] + 1
-        tmp1 = dists[i][j - 1] + 1
-        tmp2 = dists[i - 1][j] + 1
-        dists[i][j] = min(tmp0, tmp1, tmp2)
-
-  return dists
+  return edit_distance.ComputeEditDistanceMatrix(hs, rs, band_width)
 
 
 def PreprocessTxtBeforeWER(txt):
@@ -168,13 +157,15 @@ def GenerateSummaryFromErrs(nref, errs):
   return str_sum, str_details
 
 
-def ComputeWER(hyp, ref, diagnosis=False):
+def ComputeWER(hyp, ref, diagnosis=False, band_width=None):
   """Computes WER for ASR by ignoring diff of punctuation, space, captions.
 
   Args:
     hyp: Hypothesis string.
     ref: Reference string.
     diagnosis (optional): whether to generate diagnosis str (in html format)
+    band_width (optional): if set, only compute the edit distance within this
+      distance of the diagonal.
 
   Returns:
     A tuple of 3 elements:
@@ -190,32 +181,12 @@ def ComputeWER(hyp, ref, diagnosis=False):
   # Compute edit distance.
   hs = hyp.split()
   rs = ref.split()
-  distmat = ComputeEditDistanceMatrix(hs, rs)
+  distmat = ComputeEditDistanceMatrix(hs, rs, band_width)
 
   # Back trace, to distinguish different errors: insert, deletion, substitution.
-  ih, ir = len(hs), len(rs)
   errs = {'sub': 0, 'ins': 0, 'del': 0}
   aligned_html = ''
-  while ih > 0 or ir > 0:
-    err_type = ''
-
-    # Distinguish error type by back tracking
-    if ir == 0:
-      err_type = 'ins'
-    elif ih == 0:
-      err_type = 'del'
-    else:
-      if hs[ih - 1] == rs[ir - 1]:  # correct
-        err_type = 'none'
-      elif distmat[ir][ih] == distmat[ir - 1][ih - 1] + 1:  # substitute
-        err_type = 'sub'
-      elif distmat[ir][ih] == distmat[ir - 1][ih] + 1:  # deletion
-        err_type = 'del'
-      elif distmat[ir][ih] == distmat[ir][ih - 1] + 1:  # insert
-        err_type = 'ins'
-      else:
-        raise ValueError('fail to parse edit distance matrix')
-
+  for err_type, ih, ir in edit_distance.Backtrace(hs, rs, distmat):
     # Generate aligned_html
     if diagnosis:
       if ih == 0 or not hs:
@@ -228,21 +199,9 @@ def ComputeWER(hyp, ref, diagnosis=False):
         tmpr = rs[ir - 1]
       aligned_html = _GenerateAlignedHtml(tmph, tmpr, err_type) + aligned_html
 
-    # If no error, go to previous ref and hyp.
-    if err_type == 'none':
-      ih, ir = ih - 1, ir - 1
-      continue
-
     # Update error.
-    errs[err_type] += 1
-
-    # Adjust position of ref and hyp.
-    if err_type == 'del':
-      ir = ir - 1
-    elif err_type == 'ins':
-      ih = ih - 1
-    else:  # err_type == 'sub'
-      ih, ir = ih - 1, ir - 1
+    if err_type != 'none':
+      errs[err_type] += 1
 
   assert distmat[-1][-1] == sum(errs.values())
 
@@ -252,7 +211,32 @@ def ComputeWER(hyp, ref, diagnosis=False):
   return errs, nref, aligned_html
 
 
-def AverageWERs(hyps, refs, verbose=True, diagnosis=False):
+def _AverageWERsShard(args):
+  """Computes the summed errors over one shard of (hyp, ref) pairs."""
+  hyps, refs, diagnosis, band_width = args
+  totalw = 0
+  total_errs = {'sub': 0, 'ins': 0, 'del': 0}
+  aligned_html_list = []
+
+  for hyp, ref in zip(hyps, refs):
+    errs_i, nref_i, diag_str = ComputeWER(hyp, ref, diagnosis, band_width)
+    if diagnosis:
+      aligned_html_list += [diag_str]
+
+    totalw += nref_i
+    total_errs['sub'] += errs_i['sub']
+    total_errs['ins'] += errs_i['ins']
+    total_errs['del'] += errs_i['del']
+
+  return total_errs, totalw, aligned_html_list
+
+
+def AverageWERs(hyps,
+                refs,
+                verbose=True,
+                diagnosis=False,
+                num_workers=1,
+                band_width=None):
   """Computes average WER from a list of references/hypotheses.
 
   Args:
@@ -260,6 +244,10 @@ def AverageWERs(hyps, refs, verbose=True, diagnosis=False):
     refs: list of reference strings.
     verbose: optional (default True)
     diagnosis (optional): whether to generate list of diagnosis html
+    num_workers (optional): if > 1, split the pairs into contiguous shards
+      scored in a multiprocessing pool of that many processes.
+    band_width (optional): if set, only compute the edit distances within this
+      distance of the diagonal.
 
   Returns:
     A tuple of 3 elements:
@@ -269,19 +257,24 @@ def AverageWERs(hyps, refs, verbose=True, diagnosis=False):
     - list of aligned html string for diagnosis (empty if diagnosis = False)
 
   """
+  num_shards = max(1, min(num_workers, len(hyps)))
+  bounds = [len(hyps) * i // num_shards for i in range(num_shards + 1)]
+  shards = [(hyps[bounds[i]:bounds[i + 1]], refs[bounds[i]:bounds[i + 1]],
+             diagnosis, band_width) for i in range(num_shards)]
+  if num_shards == 1:
+    shard_results = [_AverageWERsShard(shards[0])]
+  else:
+    with multiprocessing.Pool(num_shards) as pool:
+      shard_results = pool.map(_AverageWERsShard, shards)
+
   totalw = 0
   total_errs = {'sub': 0, 'ins': 0, 'del': 0}
   aligned_html_list = []
-
-  for hyp, ref in zip(hyps, refs):
-    errs_i, nref_i, diag_str = ComputeWER(hyp, ref, diagnosis)
-    if diagnosis:
-      aligned_html_list += [diag_str]
-
-    totalw += nref_i
-    total_errs['sub'] += errs_i['sub']
-    total_errs['ins'] += errs_i['ins']
-    total_errs['del'] += errs_i['del']
+  for errs_i, totalw_i, aligned_htmls_i in shard_results:
+    totalw += totalw_i
+    for k in total_errs:
+      total_errs[k] += errs_i[k]
+    aligned_html_list += aligned_htmls_i
 
   if verbose:
     str_summary, str_details = GenerateSummaryFromErrs(totalw, total_errs)
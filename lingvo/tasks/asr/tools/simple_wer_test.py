@@ -27,6 +27,16 @@ class SimpleWerTest(test_utils.TestCase):
     self.assertEqual(sum(errs.values()), 0)
     self.assertEqual(nw, 10)
 
+  def testAverageWERs(self):
+    hyps = ['hello world', 'a b c d', 'today is a day', 'x']
+    refs = ['hello world', 'a c d e', 'today is a good day', '']
+    expected = simple_wer.AverageWERs(hyps, refs, verbose=False, diagnosis=True)
+    self.assertEqual(({'sub': 0, 'ins': 2, 'del': 2}, 12), expected[:2])
+    self.assertEqual(
+        expected,
+        simple_wer.AverageWERs(
+            hyps, refs, verbose=False, diagnosis=True, num_workers=2))
+
 
 if __name__ == '__main__':
   test_utils.main()
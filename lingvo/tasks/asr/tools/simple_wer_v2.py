@@ -14,7 +14,8 @@
 # ==============================================================================
 """The new version script to evalute the word error rate (WER) for ASR tasks.
 
-Tensorflow and Lingvo are not required to run this script.
+Tensorflow and Lingvo are not required to run this script. It only needs NumPy
+and edit_distance.py from the same directory.
 
 Example of Usage:
 
@@ -42,9 +43,18 @@ SimpleWER with the following member functions:
 
 """
 
+import multiprocessing
 import re
 import sys
 
+# pylint: disable=g-import-not-at-top
+try:
+  from lingvo.tasks.asr.tools import edit_distance
+except ImportError:
+  # Run as a stand-alone script, without the lingvo package.
+  import edit_distance
+# pylint: enable=g-import-not-at-top
+
 
 def TxtPreprocess(txt):
   """Preprocess text before WER caculation."""
@@ -126,42 +136,21 @@ def HighlightAlignedHtml(hyp, ref, err_type):
   return highlighted_html
 
 
-def ComputeEditDistanceMatrix(hyp_words, ref_words):
+def ComputeEditDistanceMatrix(hyp_words, ref_words, band_width=None):
   """Compute edit distance between two list of strings.
 
   Args:
     hyp_words: the list of words in the hypothesis sentence
     ref_words: the list of words in the reference sentence
+    band_width: optional int. If set, only cells within band_width of the
+      diagonal are computed, see edit_distance.ComputeEditDistanceMatrix().
 
   Returns:
-    Edit distance matrix (in the format of list of lists), where the first
-    index is the reference and the second index is the hypothesis.
+    Edit distance matrix (as an int32 numpy array), where the first index is
+    the reference and the second index is the hypothesis.
   """
-  reference_length_plus = len(ref_words) + 1
-  hypothesis_length_plus = len(hyp_words) + 1
-  edit_dist_mat = [[]] * reference_length_plus
-
-  # Initialization.
-  for i in range(reference_length_plus):
-    edit_dist_mat[i] = [0] * hypothesis_length_plus
-    for j in range(hypothesis_length_plus):
-      if i == 0:
-        edit_dist_mat[0][j] = j
-      elif j == 0:
-        edit_dist_mat[i][0] = i
-
-  # Do dynamic programming.
-  for i in range(1, reference_length_plus):
-    for j in range(1, hypothesis_length_plus):
-      if ref_words[i - 1] == hyp_words[j - 1]:
-        edit_dist_mat[i][j] = edit_dist_mat[i - 1][j - 1]
-      else:
-        tmp0 = edit_dist_mat[i - 1][j - 1] + 1
-        tmp1 = edit_dist_mat[i][j - 1] + 1
-        tmp2 = edit_dist_mat[i - 1][j] + 1
-        edit_dist_mat[i][j] = min(tmp0, tmp1, tmp2)
-
-  return edit_dist_mat
+  return edit_distance.ComputeEditDistanceMatrix(hyp_words, ref_words,
+                                                 band_width)
 
 
 def RemoveTags(txt):
@@ -232,7 +221,8 @@ class SimpleWER:
   def __init__(self,
                key_phrases=None,
                html_handler=HighlightAlignedHtmlHandler(HighlightAlignedHtml),
-               preprocess_handler=RemoveCommentTxtPreprocess):
+               preprocess_handler=RemoveCommentTxtPreprocess,
+               band_width=None):
     """Initialize SimpleWER object.
 
     Args:
@@ -241,9 +231,14 @@ class SimpleWER:
       html_handler: A HtmlHandler with a `Render` method that generates a string
         with html tags.
       preprocess_handler: function to preprocess text before computing WER.
+      band_width: optional int. If set, the edit distance of each (hyp, ref)
+        pair is only computed within this distance of the diagonal, which
+        speeds up long-form transcripts at the risk of over-counting errors
+        when the alignment leaves the band.
     """
     self._preprocess_handler = preprocess_handler
     self._html_handler = html_handler
+    self._band_width = band_width
     self.key_phrases = key_phrases
     self.aligned_htmls = []
     self.wer_info = {'sub': 0, 'ins': 0, 'del': 0, 'nw': 0}
@@ -287,33 +282,15 @@ class SimpleWER:
     hypothesis = RemoveTags(hypothesis)
     hyp_words = hypothesis.split()
     ref_words = reference.split()
-    distmat = ComputeEditDistanceMatrix(hyp_words, ref_words)
+    distmat = ComputeEditDistanceMatrix(hyp_words, ref_words,
+                                        self._band_width)
 
     # Back trace, to distinguish different errors: ins, del, sub.
-    pos_hyp, pos_ref = len(hyp_words), len(ref_words)
     wer_info = {'sub': 0, 'ins': 0, 'del': 0, 'nw': len(ref_words)}
     aligned_html = ''
     matched_ref = ''
-    while pos_hyp > 0 or pos_ref > 0:
-      err_type = ''
-
-      # Distinguish error type by back tracking
-      if pos_ref == 0:
-        err_type = 'ins'
-      elif pos_hyp == 0:
-        err_type = 'del'
-      else:
-        if hyp_words[pos_hyp - 1] == ref_words[pos_ref - 1]:
-          err_type = 'none'  # correct error
-        elif distmat[pos_ref][pos_hyp] == distmat[pos_ref - 1][pos_hyp - 1] + 1:
-          err_type = 'sub'  # substitute error
-        elif distmat[pos_ref][pos_hyp] == distmat[pos_ref - 1][pos_hyp] + 1:
-          err_type = 'del'  # deletion error
-        elif distmat[pos_ref][pos_hyp] == distmat[pos_ref][pos_hyp - 1] + 1:
-          err_type = 'ins'  # insersion error
-        else:
-          raise ValueError('fail to parse edit distance matrix.')
-
+    for err_type, pos_hyp, pos_ref in edit_distance.Backtrace(
+        hyp_words, ref_words, distmat):
       # Generate aligned_html
       if self._html_handler:
         kwargs = dict(
@@ -331,23 +308,14 @@ class SimpleWER:
           kwargs['ref_word'] = ref_words[pos_ref - 1]
         aligned_html = self._html_handler.Render(**kwargs) + aligned_html
 
-      # If no error, go to previous ref and hyp.
+      # If no error, only collect the matched word.
       if err_type == 'none':
         matched_ref = hyp_words[pos_hyp - 1] + ' ' + matched_ref
-        pos_hyp, pos_ref = pos_hyp - 1, pos_ref - 1
         continue
 
       # Update error.
       wer_info[err_type] += 1
 
-      # Adjust position of ref and hyp.
-      if err_type == 'del':
-        pos_ref = pos_ref - 1
-      elif err_type == 'ins':
-        pos_hyp = pos_hyp - 1
-      else:  # err_type == 'sub'
-        pos_hyp, pos_ref = pos_hyp - 1, pos_ref - 1
-
     # Verify the computation of edit distance finishes
     assert distmat[-1][-1] == wer_info['ins'] + \
         wer_info['del'] + wer_info['sub']
@@ -367,6 +335,22 @@ class SimpleWER:
         self.hyp_keyphrase_counts[w] += hypothesis.count(w)
         self.matched_keyphrase_counts[w] += matched_ref.count(w)
 
+  def Merge(self, other):
+    """Accumulates the errors and key phrase counts of another SimpleWER.
+
+    Args:
+      other: a SimpleWER with the same key phrases, whose hyp-ref pairs are
+        considered to be added after the ones of this object.
+    """
+    for k in self.wer_info:
+      self.wer_info[k] += other.wer_info[k]
+    self.aligned_htmls += other.aligned_htmls
+    if self.key_phrases:
+      for w in self.key_phrases:
+        self.ref_keyphrase_counts[w] += other.ref_keyphrase_counts[w]
+        self.hyp_keyphrase_counts[w] += other.hyp_keyphrase_counts[w]
+        self.matched_keyphrase_counts[w] += other.matched_keyphrase_counts[w]
+
   def GetWER(self):
     """Compute Word Error Rate (WER).
 
@@ -446,6 +430,49 @@ class SimpleWER:
     return str_sum, str_details, str_keyphrases_info
 
 
+def _AddHypRefShard(args):
+  """Computes a SimpleWER over one shard of (hyp, ref) pairs."""
+  hyps, refs, wer_kwargs = args
+  wer_obj = SimpleWER(**wer_kwargs)
+  for hyp, ref in zip(hyps, refs):
+    wer_obj.AddHypRef(hyp, ref)
+  return wer_obj
+
+
+def AverageWERs(hyps, refs, num_workers=1, **wer_kwargs):
+  """Computes a SimpleWER over lists of hypotheses and references.
+
+  With num_workers > 1, the pairs are split into contiguous shards that are
+  scored in a multiprocessing pool, and the per-shard results are merged in
+  order. wer_info, key phrase counts and aligned_htmls are thus identical to
+  calling AddHypRef() on every pair sequentially.
+
+  Args:
+    hyps: list of hypothesis strings.
+    refs: list of reference strings.
+    num_workers: number of processes to use.
+    **wer_kwargs: arguments passed to the SimpleWER constructor. They must be
+      picklable when num_workers > 1.
+
+  Returns:
+    A SimpleWER with all the pairs added.
+  """
+  assert len(hyps) == len(refs)
+  num_shards = max(1, min(num_workers, len(hyps)))
+  if num_shards == 1:
+    return _AddHypRefShard((hyps, refs, wer_kwargs))
+
+  bounds = [len(hyps) * i // num_shards for i in range(num_shards + 1)]
+  shards = [(hyps[bounds[i]:bounds[i + 1]], refs[bounds[i]:bounds[i + 1]],
+             wer_kwargs) for i in range(num_shards)]
+  with multiprocessing.Pool(num_shards) as pool:
+    shard_wer_objs = pool.map(_AddHypRefShard, shards)
+  wer_obj = shard_wer_objs[0]
+  for shard_wer_obj in shard_wer_objs[1:]:
+    wer_obj.Merge(shard_wer_obj)
+  return wer_obj
+
+
 def main(argv):
   hypothesis = open(argv[1], 'r').read()
   reference = open(argv[2], 'r').read()
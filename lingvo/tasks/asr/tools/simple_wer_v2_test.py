@@ -124,5 +124,34 @@ class SimpleWerTest(test_utils.TestCase):
     f1 = stats[1]
     self.assertAlmostEqual(f1, 0.66666666666666667, delta=0.01)
 
+  def testAverageWERs(self):
+    key_phrases = ['Google', 'Mars']
+    hyps = [
+        'Hey Google! I have question about Mars, can I google it? ',
+        'Hey Google, could you tell me a story about March? ',
+        'hello world', 'hello people of the world today a bad day how'
+    ]
+    refs = [
+        'Hey  Google. I have a question about Mars, can I google it? ',
+        'Hey Google, could you tell me a story about Mars? ', 'hello world',
+        'hello world today is a good day how are you'
+    ]
+    expected = simple_wer.SimpleWER(key_phrases=key_phrases)
+    for hyp, ref in zip(hyps, refs):
+      expected.AddHypRef(hyp, ref)
+
+    for num_workers in (1, 3):
+      wer_obj = simple_wer.AverageWERs(
+          hyps, refs, num_workers=num_workers, key_phrases=key_phrases)
+      self.assertEqual(expected.wer_info, wer_obj.wer_info)
+      self.assertEqual(expected.aligned_htmls, wer_obj.aligned_htmls)
+      self.assertEqual(expected.ref_keyphrase_counts,
+                       wer_obj.ref_keyphrase_counts)
+      self.assertEqual(expected.hyp_keyphrase_counts,
+                       wer_obj.hyp_keyphrase_counts)
+      self.assertEqual(expected.matched_keyphrase_counts,
+                       wer_obj.matched_keyphrase_counts)
+
+
 if __name__ == '__main__':
   test_utils.main()
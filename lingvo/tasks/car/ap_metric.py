@@ -14,7 +14,10 @@
 # ==============================================================================
 """Average precision metric interface."""
 
+import collections
+from concurrent import futures
 import functools
+
 from lingvo import compat as tf
 from lingvo.core import hyperparams
 from lingvo.core import py_utils
@@ -63,14 +66,7 @@ class Boxes3D:
         image.
       speed: A [1 x 2] numpy array with speed of object in world frame.
     """
-    if self._size >= self._capacity:
-      # resize
-      if self._capacity:
-        # Increase the capacity exponentially.
-        self._capacity += self._capacity // 4
-      else:
-        self._capacity = 100
-      self._buf = self._buf.Transform(self._Resize)
+    self._Reserve(1)
     self._buf.imgids[self._size] = img_id
     self._buf.scores[self._size] = score
     self._buf.boxes[self._size] = box
@@ -82,6 +78,63 @@ class Boxes3D:
     self._buf.speeds[self._size] = speed
     self._size += 1
 
+  def AddBatch(self, img_ids, scores, boxes, difficulties, distances,
+               num_points, rotations, heights_in_pixels, speeds):
+    """Adds N bboxes at once.
+
+    Each argument is either an array with a leading dimension of N, or a
+    scalar (resp. a [2] speed) shared by all boxes.
+
+    Args:
+      img_ids: [N] unique image identifiers.
+      scores: [N] confidence scores.
+      boxes: [N x 7] numpy array.
+      difficulties: [N] difficulties of the boxes.
+      distances: [N] binned distances of the boxes.
+      num_points: [N] number of laser points in the boxes.
+      rotations: [N] binned rotations of the boxes.
+      heights_in_pixels: [N] heights of the 2D bboxes of the objects in the
+        camera image.
+      speeds: [N x 2] numpy array with speeds of objects in world frame.
+    """
+    boxes = np.asarray(boxes)
+    n = boxes.shape[0]
+    assert boxes.shape == (n, 7), boxes.shape
+    if not n:
+      return
+    self._Reserve(n)
+    begin, end = self._size, self._size + n
+    self._buf.imgids[begin:end] = img_ids
+    self._buf.scores[begin:end] = scores
+    self._buf.boxes[begin:end] = boxes
+    self._buf.difficulties[begin:end] = difficulties
+    self._buf.distances[begin:end] = distances
+    self._buf.num_points[begin:end] = num_points
+    self._buf.rotations[begin:end] = rotations
+    self._buf.heights_in_pixels[begin:end] = heights_in_pixels
+    self._buf.speeds[begin:end] = speeds
+    self._size = end
+
+  def Select(self, mask):
+    """Returns a new Boxes3D with the boxes where mask is True."""
+    selected = Boxes3D()
+    selected._size = int(np.sum(mask))  # pylint: disable=protected-access
+    selected._capacity = selected._size  # pylint: disable=protected-access
+    selected._buf = self._buf.Transform(lambda x: x[:self._size][mask])  # pylint: disable=protected-access
+    return selected
+
+  def _Reserve(self, n):
+    """Makes sure there is room for n more boxes."""
+    if self._size + n <= self._capacity:
+      return
+    while self._size + n > self._capacity:
+      if self._capacity:
+        # Increase the capacity exponentially.
+        self._capacity += max(1, self._capacity // 4)
+      else:
+        self._capacity = 100
+    self._buf = self._buf.Transform(self._Resize)
+
   def _Resize(self, arr):
     n = self._capacity
     ret = np.empty([n] + list(arr.shape)[1:], dtype=arr.dtype)
@@ -156,6 +209,11 @@ class APMetrics(BaseMetric):
         'be performed (only supported by waymo metric).  '
         'One of ["2d", "3d"]: 3d means to do 3D AP calculation, and 2d '
         'means to do a top down Birds-Eye-View AP calculation.')
+    p.Define(
+        'num_eval_workers', 1,
+        'Number of threads used to compute the final metrics. If > 1, the '
+        'metrics of all breakdown bins (each covering all classes) are '
+        'computed concurrently before being handed to the breakdown metrics.')
     return p
 
   def __init__(self, params):
@@ -206,6 +264,33 @@ class APMetrics(BaseMetric):
     # Invalidate the evaluation.
     self._is_eval_complete = False
 
+  def _AddGroundtruthBatch(self, str_id, labels, bboxes, difficulties,
+                           distances, num_points, rotations, speeds):
+    """Record all the ground truth boxes of an image, grouped by class."""
+    n = labels.shape[0]
+    if not n:
+      return
+    imgid = self._GetImageId(str_id)
+    labels = np.asarray(labels)
+    assert np.all(labels > 0) and np.all(labels < self.metadata.NumClasses()), (
+        '{} vs. {}'.format(labels, self.metadata.NumClasses()))
+    distances = np.asarray(distances)
+    num_points = np.asarray(num_points)
+    rotations = np.asarray(rotations)
+
+    for classid in np.unique(labels):
+      classid = int(classid)
+      mask = labels == classid
+      boxes = self._groundtruth.get(classid)
+      if boxes is None:
+        boxes = Boxes3D()
+        self._groundtruth[classid] = boxes
+      boxes.AddBatch(imgid, 1., bboxes[mask], difficulties[mask],
+                     distances[mask], num_points[mask], rotations[mask], -1,
+                     speeds[mask])
+    # Invalidate the evaluation.
+    self._is_eval_complete = False
+
   def _LoadBoundingBoxes(self,
                          box_type,
                          class_id,
@@ -241,53 +326,21 @@ class APMetrics(BaseMetric):
     if class_id not in boxes_by_class:
       return None
     boxes = boxes_by_class[class_id]
-
-    if boxes is not None and distance is not None:
-      # Filter bounding boxes based a binned (integer) distance.
-      filtered_boxes = None
-      for i, s, b, d, dist, n, r, h, v in zip(boxes.imgids, boxes.scores,
-                                              boxes.boxes, boxes.difficulties,
-                                              boxes.distances, boxes.num_points,
-                                              boxes.rotations,
-                                              boxes.heights_in_pixels,
-                                              boxes.speeds):
-        if dist == distance:
-          if filtered_boxes is None:
-            filtered_boxes = Boxes3D()
-          filtered_boxes.Add(i, s, b, d, dist, n, r, h, v)
-      boxes = filtered_boxes
-
-    if boxes is not None and num_points is not None:
-      # Filter bounding boxes based a binned (integer) number of points.
-      filtered_boxes = None
-      for i, s, b, d, dist, n, r, h, v in zip(boxes.imgids, boxes.scores,
-                                              boxes.boxes, boxes.difficulties,
-                                              boxes.distances, boxes.num_points,
-                                              boxes.rotations,
-                                              boxes.heights_in_pixels,
-                                              boxes.speeds):
-        if n == num_points:
-          if filtered_boxes is None:
-            filtered_boxes = Boxes3D()
-          filtered_boxes.Add(i, s, b, d, dist, n, r, h, v)
-      boxes = filtered_boxes
-
-    if boxes is not None and rotation is not None:
-      # Filter bounding boxes based a binned (integer) rotation.
-      filtered_boxes = None
-      for i, s, b, d, dist, n, r, h, v in zip(boxes.imgids, boxes.scores,
-                                              boxes.boxes, boxes.difficulties,
-                                              boxes.distances, boxes.num_points,
-                                              boxes.rotations,
-                                              boxes.heights_in_pixels,
-                                              boxes.speeds):
-        if r == rotation:
-          if filtered_boxes is None:
-            filtered_boxes = Boxes3D()
-          filtered_boxes.Add(i, s, b, d, dist, n, r, h, v)
-      boxes = filtered_boxes
-
-    return boxes
+    if distance is None and num_points is None and rotation is None:
+      return boxes
+
+    # Filter bounding boxes based on binned (integer) distance, number of
+    # points and rotation.
+    mask = np.ones([boxes.imgids.shape[0]], dtype=bool)
+    if distance is not None:
+      mask &= boxes.distances == distance
+    if num_points is not None:
+      mask &= boxes.num_points == num_points
+    if rotation is not None:
+      mask &= boxes.rotations == rotation
+    if not np.any(mask):
+      return None
+    return boxes.Select(mask)
 
   def _GetData(self,
                classid,
@@ -402,9 +455,9 @@ class APMetrics(BaseMetric):
     # dummy values in the latter case.  We should figure
     # out how to avoid requiring these dummy values by making
     # the Boxes3D object take a dynamic set of attributes.
-    num_points = [0] * n
-    rotations = [0] * n
-    distances = [0] * n
+    num_points = np.zeros([n])
+    rotations = np.zeros([n])
+    distances = np.zeros([n])
     if 'num_points' in self._breakdown_metrics:
       num_points = self._breakdown_metrics['num_points'].Discretize(
           result.groundtruth_num_points)
@@ -415,12 +468,10 @@ class APMetrics(BaseMetric):
       distances = self._breakdown_metrics['distance'].Discretize(
           result.groundtruth_bboxes)
 
-    for label, bbox, difficulty, distance, num_points, rotations, speed in zip(
-        result.groundtruth_labels, result.groundtruth_bboxes,
-        result.groundtruth_difficulties, distances, num_points, rotations,
-        result.groundtruth_speed):
-      self._AddGroundtruth((str_id, label, 1., bbox, difficulty, distance,
-                            num_points, rotations, speed))
+    self._AddGroundtruthBatch(str_id, result.groundtruth_labels,
+                              result.groundtruth_bboxes,
+                              result.groundtruth_difficulties, distances,
+                              num_points, rotations, result.groundtruth_speed)
 
     c = result.detection_scores.shape[0]
     assert c == self.metadata.NumClasses(), '%s vs. %s' % (
@@ -433,9 +484,7 @@ class APMetrics(BaseMetric):
       assert class_id > 0 and class_id < self.metadata.NumClasses(), (
           '{} vs. {}'.format(class_id, self.metadata.NumClasses()))
 
-      # Get or create the box list for the class.  This is done for speed -- we
-      # do it once per class to avoid dictionary lookups to fetch the field for
-      # every box.
+      # Get or create the box list for the class.
       boxes_for_class = self._prediction.get(class_id)
       if boxes_for_class is None:
         boxes_for_class = Boxes3D()
@@ -450,8 +499,8 @@ class APMetrics(BaseMetric):
       non_zero_scores = scores[scores > 0]
       non_zero_heights_in_pixels = heights_in_pixels[scores > 0]
 
-      rotations = [0] * len(non_zero_bboxes)
-      distances = [0] * len(non_zero_bboxes)
+      rotations = 0
+      distances = 0
       if 'distance' in self._breakdown_metrics:
         # Compute all distances for non-zero-bboxes in one shot.
         distances = self._breakdown_metrics['distance'].Discretize(
@@ -460,23 +509,17 @@ class APMetrics(BaseMetric):
         rotations = self._breakdown_metrics['rotation'].Discretize(
             non_zero_bboxes)
 
-      # Add each box to the list.
-      #
-      # NOTE: The length of this loop can be large (e.g., for an early
-      # checkpoint), so any code inside of this for loop should be
-      # double-checked for efficiency.
-      dummy_speed = np.zeros((1, 2), dtype=np.float32)
-      for box_id in range(non_zero_bboxes.shape[0]):
-        boxes_for_class.Add(
-            img_id=str_imgid,
-            score=non_zero_scores[box_id],
-            box=non_zero_bboxes[box_id],
-            difficulty=0,
-            distance=distances[box_id],
-            num_points=0,
-            rotation=rotations[box_id],
-            height_in_pixels=non_zero_heights_in_pixels[box_id],
-            speed=dummy_speed)
+      # Add all the boxes of the class in one copy.
+      boxes_for_class.AddBatch(
+          img_ids=str_imgid,
+          scores=non_zero_scores,
+          boxes=non_zero_bboxes,
+          difficulties=0,
+          distances=distances,
+          num_points=0,
+          rotations=rotations,
+          heights_in_pixels=non_zero_heights_in_pixels,
+          speeds=0.)
 
   def _EvaluateIfNecessary(self):
     """Evaluate all precision recall metrics."""
@@ -484,10 +527,58 @@ class APMetrics(BaseMetric):
       return
     compute_metrics_fn = functools.partial(
         self._ComputeFinalMetrics, classids=self.metadata.EvalClassIndices())
-    for metric_class in self._breakdown_metrics.values():
-      metric_class.ComputeMetrics(compute_metrics_fn)
+    precomputed_metrics_fns = {}
+    if self.params.num_eval_workers > 1:
+      precomputed_metrics_fns = self._PrecomputeFinalMetrics(compute_metrics_fn)
+    for name, metric_class in self._breakdown_metrics.items():
+      metric_class.ComputeMetrics(
+          precomputed_metrics_fns.get(name, compute_metrics_fn))
     self._is_eval_complete = True
 
+  def _PrecomputeFinalMetrics(self, compute_metrics_fn):
+    """Computes the metrics of all breakdown bins in a thread pool.
+
+    Each call of compute_metrics_fn builds and runs its own graph, so the calls
+    are independent and the C++ AP ops run concurrently.
+
+    Args:
+      compute_metrics_fn: Function computing the metrics of all classes given
+        keyword arguments selecting a breakdown bin.
+
+    Returns:
+      A dict from breakdown name to a function with the same signature as
+      compute_metrics_fn, which returns the precomputed results of the bins of
+      the breakdown and otherwise calls compute_metrics_fn.
+    """
+
+    def _Key(kwargs):
+      return tuple(sorted(kwargs.items()))
+
+    # (breakdown name, keyword arguments) of every breakdown bin.
+    bins = [(name, kwargs)
+            for name, metric_class in self._breakdown_metrics.items()
+            for kwargs in metric_class.ComputeMetricsArgs() or []]
+    tf.logging.info('Computing %d metric breakdowns with %d workers.',
+                    len(bins), self.params.num_eval_workers)
+    results = collections.defaultdict(dict)
+    with futures.ThreadPoolExecutor(self.params.num_eval_workers) as executor:
+      pending = [
+          executor.submit(compute_metrics_fn, **kwargs) for _, kwargs in bins
+      ]
+      for (name, kwargs), future in zip(bins, pending):
+        results[name][_Key(kwargs)] = future.result()
+
+    def _CachedComputeMetrics(breakdown_results, **kwargs):
+      key = _Key(kwargs)
+      if key in breakdown_results:
+        return breakdown_results[key]
+      return compute_metrics_fn(**kwargs)
+
+    return {
+        name: functools.partial(_CachedComputeMetrics, breakdown_results)
+        for name, breakdown_results in results.items()
+    }
+
   @property
   def value(self):
     if self.params.metric_weights is None:
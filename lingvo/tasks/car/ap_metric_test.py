@@ -0,0 +1,243 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for ap_metric."""
+
+import threading
+import time
+
+from lingvo import compat as tf
+from lingvo.core import py_utils
+from lingvo.core import test_utils
+from lingvo.tasks.car import ap_metric
+from lingvo.tasks.car import kitti_ap_metric
+from lingvo.tasks.car import kitti_metadata
+import numpy as np
+
+_FIELDS = ('imgids', 'scores', 'boxes', 'difficulties', 'distances',
+           'num_points', 'rotations', 'heights_in_pixels', 'speeds')
+
+
+def _RandomFrame(num_classes, num_gt, num_detections):
+  return py_utils.NestedMap(
+      groundtruth_labels=np.random.randint(1, num_classes, size=[num_gt]),
+      groundtruth_bboxes=np.random.uniform(-50., 50., size=[num_gt, 7]),
+      groundtruth_difficulties=np.random.randint(0, 4, size=[num_gt]),
+      groundtruth_num_points=np.random.randint(1, 1000, size=[num_gt]),
+      detection_scores=np.random.uniform(
+          size=[num_classes, num_detections]) *
+      (np.random.uniform(size=[num_classes, num_detections]) > 0.2),
+      detection_boxes=np.random.uniform(
+          -50., 50., size=[num_classes, num_detections, 7]),
+      detection_heights_in_pixels=np.random.uniform(
+          0., 100., size=[num_classes, num_detections]))
+
+
+def _MatchingFrame(num_classes, num_gt, num_detections):
+  """Returns a frame with one noisy detection of each ground truth box."""
+  assert num_detections >= num_gt
+  frame = _RandomFrame(num_classes, num_gt, num_detections)
+  centers = np.random.uniform(-40., 40., size=[num_gt, 3])
+  dims = np.random.uniform(1., 4., size=[num_gt, 3])
+  headings = np.random.uniform(-np.pi, np.pi, size=[num_gt, 1])
+  frame.groundtruth_bboxes = np.concatenate([centers, dims, headings], axis=-1)
+  frame.detection_heights_in_pixels = np.random.uniform(
+      30., 100., size=[num_classes, num_detections])
+  for i, label in enumerate(frame.groundtruth_labels):
+    frame.detection_boxes[label, i] = (
+        frame.groundtruth_bboxes[i] + np.random.normal(0., 0.05, size=[7]))
+    frame.detection_scores[label, i] = np.random.uniform(0.5, 1.)
+  return frame
+
+
+class _FakeKITTIAPMetrics(kitti_ap_metric.KITTIAPMetrics):
+  """Returns deterministic metrics instead of running the AP ops."""
+
+  def __init__(self, params):
+    super().__init__(params)
+    self.calls = []
+    self._calls_lock = threading.Lock()
+
+  def _ComputeFinalMetrics(self, classids=None, **kwargs):
+    with self._calls_lock:
+      self.calls.append(kwargs)
+    seed = hash(tuple(sorted(kwargs.items()))) % (1 << 31)
+    rng = np.random.RandomState(seed)
+    num_pr_points = self.metadata.NumberOfPrecisionRecallPoints() + 1
+    scalars = [{'ap': rng.uniform()} for _ in classids]
+    curves = [{'pr': rng.uniform(size=[num_pr_points, 2])} for _ in classids]
+    return {'scalars': scalars, 'curves': curves}
+
+
+class Boxes3DTest(test_utils.TestCase):
+
+  def testAddBatchMatchesAdd(self):
+    n = 257
+    imgids = np.random.randint(0, 10, size=[n])
+    scores = np.random.uniform(size=[n])
+    boxes = np.random.uniform(size=[n, 7])
+    difficulties = np.random.randint(0, 4, size=[n])
+    distances = np.random.randint(0, 10, size=[n])
+    num_points = np.random.randint(0, 10, size=[n])
+    rotations = np.random.randint(0, 10, size=[n])
+    heights = np.random.uniform(size=[n])
+    speeds = np.random.uniform(size=[n, 2])
+
+    expected = ap_metric.Boxes3D()
+    for i in range(n):
+      expected.Add(imgids[i], scores[i], boxes[i], difficulties[i],
+                   distances[i], num_points[i], rotations[i], heights[i],
+                   speeds[i])
+
+    actual = ap_metric.Boxes3D()
+    actual.AddBatch(imgids[:3], scores[:3], boxes[:3], difficulties[:3],
+                    distances[:3], num_points[:3], rotations[:3], heights[:3],
+                    speeds[:3])
+    actual.AddBatch(imgids[3:], scores[3:], boxes[3:], difficulties[3:],
+                    distances[3:], num_points[3:], rotations[3:], heights[3:],
+                    speeds[3:])
+    for field in _FIELDS:
+      self.assertAllEqual(getattr(expected, field), getattr(actual, field))
+
+  def testAddBatchBroadcastsScalars(self):
+    boxes = ap_metric.Boxes3D()
+    boxes.AddBatch(7, [0.5, 0.6], np.ones([2, 7]), 0, 1, 2, 3, -1, 0.)
+    boxes.AddBatch(8, [], np.zeros([0, 7]), 0, 1, 2, 3, -1, 0.)
+    self.assertAllEqual([7, 7], boxes.imgids)
+    self.assertAllEqual([0.5, 0.6], boxes.scores)
+    self.assertAllEqual([-1, -1], boxes.heights_in_pixels)
+    self.assertAllEqual(np.zeros([2, 2]), boxes.speeds)
+
+  def testSelect(self):
+    boxes = ap_metric.Boxes3D()
+    boxes.AddBatch([0, 1, 2], [0.1, 0.2, 0.3], np.arange(21).reshape([3, 7]),
+                   0, [1, 2, 1], 0, 0, -1, 0.)
+    selected = boxes.Select(boxes.distances == 1)
+    self.assertAllEqual([0, 2], selected.imgids)
+    self.assertAllEqual([[0, 1, 2, 3, 4, 5, 6], [14, 15, 16, 17, 18, 19, 20]],
+                        selected.boxes)
+    # Adding to a selection does not modify the original boxes.
+    selected.Add(3, 0.4, np.zeros([7]), 0, 1, 0, 0, -1, np.zeros([2]))
+    self.assertAllEqual([0, 2, 3], selected.imgids)
+    self.assertAllEqual([0, 1, 2], boxes.imgids)
+
+
+class APMetricsTest(test_utils.TestCase):
+
+  def testUpdateGroupsBoxesByClass(self):
+    metadata = kitti_metadata.KITTIMetadata()
+    metrics = kitti_ap_metric.KITTIAPMetrics.Params(metadata).Set(
+        breakdown_metrics=['distance', 'num_points', 'rotation']).Instantiate()
+    num_classes = metadata.NumClasses()
+    frames = [_RandomFrame(num_classes, 20, 30) for _ in range(3)]
+    for i, frame in enumerate(frames):
+      metrics.Update('frame%d' % i, frame)
+
+    for classid in range(1, num_classes):
+      gt = metrics._LoadBoundingBoxes('groundtruth', classid)  # pylint: disable=protected-access
+      expected_boxes = np.concatenate([
+          f.groundtruth_bboxes[f.groundtruth_labels == classid] for f in frames
+      ])
+      expected_imgids = np.concatenate([
+          np.full([np.sum(f.groundtruth_labels == classid)], i)
+          for i, f in enumerate(frames)
+      ])
+      if gt is None:
+        self.assertEmpty(expected_boxes)
+      else:
+        self.assertAllEqual(expected_boxes, gt.boxes)
+        self.assertAllEqual(expected_imgids, gt.imgids)
+
+      pd = metrics._LoadBoundingBoxes('prediction', classid)  # pylint: disable=protected-access
+      expected_scores = np.concatenate([
+          f.detection_scores[classid][f.detection_scores[classid] > 0]
+          for f in frames
+      ])
+      self.assertAllEqual(expected_scores, pd.scores)
+
+  def _AssertSameBreakdowns(self, expected, actual):
+    # pylint: disable=protected-access
+    for name, metric in expected._breakdown_metrics.items():
+      actual_metric = actual._breakdown_metrics[name]
+      self.assertCountEqual(metric._precision_recall.keys(),
+                            actual_metric._precision_recall.keys())
+      for key, pr in metric._precision_recall.items():
+        self.assertAllEqual(pr, actual_metric._precision_recall[key])
+    # pylint: enable=protected-access
+
+  def testParallelEvaluationMatchesSequential(self):
+    metadata = kitti_metadata.KITTIMetadata()
+    params = _FakeKITTIAPMetrics.Params(metadata).Set(
+        breakdown_metrics=['distance', 'num_points', 'rotation'])
+    sequential = params.Copy().Instantiate()
+    parallel = params.Copy().Set(num_eval_workers=4).Instantiate()
+    frame = _RandomFrame(metadata.NumClasses(), 20, 30)
+    sequential.Update('frame', frame)
+    parallel.Update('frame', frame)
+
+    self.assertAllClose(sequential.value, parallel.value)
+    # Every breakdown bin is computed exactly once.
+    self.assertCountEqual(sequential.calls, parallel.calls)
+    self._AssertSameBreakdowns(sequential, parallel)
+
+  def testParallelEvaluationMatchesSequentialWithAPOps(self):
+    np.random.seed(12345)
+    metadata = kitti_metadata.KITTIMetadata()
+    params = kitti_ap_metric.KITTIAPMetrics.Params(metadata).Set(
+        breakdown_metrics=['distance', 'num_points', 'rotation'])
+    sequential = params.Copy().Instantiate()
+    parallel = params.Copy().Set(num_eval_workers=4).Instantiate()
+    for i in range(3):
+      frame = _MatchingFrame(metadata.NumClasses(), 20, 30)
+      sequential.Update('frame%d' % i, frame)
+      parallel.Update('frame%d' % i, frame)
+
+    self.assertGreater(sequential.value, 0.)
+    self.assertAllClose(sequential.value, parallel.value)
+    self._AssertSameBreakdowns(sequential, parallel)
+
+
+class APMetricsBenchmark(tf.test.Benchmark):
+  """Measures the per-frame cost of APMetrics.Update().
+
+  Run with:
+    bazel run -c opt lingvo/tasks/car:ap_metric_test -- --benchmarks=all
+  """
+
+  def _RunBenchmark(self, num_gt, num_detections, num_frames=100):
+    metadata = kitti_metadata.KITTIMetadata()
+    metrics = kitti_ap_metric.KITTIAPMetrics.Params(metadata).Set(
+        breakdown_metrics=['distance', 'num_points', 'rotation']).Instantiate()
+    frames = [
+        _RandomFrame(metadata.NumClasses(), num_gt, num_detections)
+        for _ in range(num_frames)
+    ]
+    start = time.time()
+    for i, frame in enumerate(frames):
+      metrics.Update('frame%d' % i, frame)
+    per_frame_secs = (time.time() - start) / num_frames
+    self.report_benchmark(
+        name='ap_metric_update_gt%d_det%d' % (num_gt, num_detections),
+        iters=num_frames,
+        wall_time=per_frame_secs)
+
+  def benchmarkUpdateSmallFrames(self):
+    self._RunBenchmark(num_gt=20, num_detections=100)
+
+  def benchmarkUpdateLargeFrames(self):
+    self._RunBenchmark(num_gt=200, num_detections=1000)
+
+
+if __name__ == '__main__':
+  test_utils.main()
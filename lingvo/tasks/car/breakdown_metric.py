@@ -146,6 +146,18 @@ class BreakdownMetric:
     del compute_metrics_fn
     return NotImplementedError()
 
+  def ComputeMetricsArgs(self):
+    """Returns the arguments ComputeMetrics() will call compute_metrics_fn with.
+
+    This lets callers compute the metrics of all breakdown bins ahead of time,
+    e.g. in parallel, and feed ComputeMetrics() with the precomputed results.
+
+    Returns:
+      A list of dicts of keyword arguments, one per call of compute_metrics_fn,
+      or None if unknown.
+    """
+    return None
+
   def GenerateSummaries(self, name):
     """Generate list of image summaries plotting precision-recall analysis.
 
@@ -284,6 +296,9 @@ class ByDistance(BreakdownMetric):
     distances = self.Discretize(result.bboxes)
     self._AccumulateHistogram(statistics=distances, labels=result.labels)
 
+  def ComputeMetricsArgs(self):
+    return [dict(distance=d) for d in range(self.NumBinsOfHistogram())]
+
   def ComputeMetrics(self, compute_metrics_fn):
     tf.logging.info('Calculating by distance: start')
     p = self.params
@@ -392,6 +407,12 @@ class ByNumPoints(BreakdownMetric):
     self._AccumulateCumulative(
         statistics=result.num_points, labels=result.labels)
 
+  def ComputeMetricsArgs(self):
+    return [
+        dict(num_points=n)
+        for n in range(len(self._LogSpacedBinEdgesofPoints()) - 1)
+    ]
+
   def ComputeMetrics(self, compute_metrics_fn):
     tf.logging.info('Calculating by number of points: start')
     # Note that we skip the last edge as the number of edges is one greater
@@ -575,6 +596,9 @@ class ByRotation(BreakdownMetric):
     rotations = self.Discretize(result.bboxes)
     self._AccumulateHistogram(statistics=rotations, labels=result.labels)
 
+  def ComputeMetricsArgs(self):
+    return [dict(rotation=r) for r in range(self.NumBinsOfHistogram())]
+
   def ComputeMetrics(self, compute_metrics_fn):
     tf.logging.info('Calculating by rotation: start')
     p = self.params
@@ -670,6 +694,12 @@ class ByDifficulty(BreakdownMetric):
     difficulties = self.Discretize(result.difficulties)
     self._AccumulateHistogram(statistics=difficulties, labels=result.labels)
 
+  def ComputeMetricsArgs(self):
+    return [
+        dict(difficulty=difficulty)
+        for difficulty in self.params.metadata.DifficultyLevels()
+    ]
+
   def ComputeMetrics(self, compute_metrics_fn):
     p = self.params
     tf.logging.info('Calculating by difficulty: start')
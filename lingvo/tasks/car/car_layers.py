@@ -40,6 +40,12 @@ class SamplingAndGroupingLayer(base_layer.BaseLayer):
         'sample_neighbors_uniformly', True,
         'Whether to sample neighbors uniformly within the ball radius. '
         'If False, this will pick the nearest neighbors by distance.')
+    p.Define(
+        'neighbor_search', 'dense',
+        'How to search for neighbors: "dense" or "voxel_hash". See '
+        'car_lib.NeighborhoodIndices.')
+    p.Define('max_points_per_voxel', 64,
+             'Maximum number of points per voxel for "voxel_hash" search.')
     return p
 
   def FProp(self, theta, input_data):
@@ -81,7 +87,9 @@ class SamplingAndGroupingLayer(base_layer.BaseLayer):
         p.group_size,
         points_padding=padding,
         max_distance=p.ball_radius,
-        sample_neighbors_uniformly=p.sample_neighbors_uniformly)
+        sample_neighbors_uniformly=p.sample_neighbors_uniformly,
+        neighbor_search=p.neighbor_search,
+        max_points_per_voxel=p.max_points_per_voxel)
     grouped_points = tf.gather(points, grouped_idx, batch_dims=1)
     # Normalize the grouped points based on the location of the query point.
     grouped_points -= tf.expand_dims(query_points, -2)
@@ -86,7 +86,13 @@ def NeighborSquaredDistanceMatrix(points, neighbor_points):
   return py_utils.HasShape(sq_dist, [n, p1, k])
 
 
-def KnnIndices(points, query_points, k, valid_num=None, max_distance=None):
+def KnnIndices(points,
+               query_points,
+               k,
+               valid_num=None,
+               max_distance=None,
+               neighbor_search='dense',
+               max_points_per_voxel=64):
   """k-nearest neighbors of query_points in points.
 
   The caller should ensure that points[i, :valid_num[i], :] are the non-padding
@@ -119,6 +125,8 @@ def KnnIndices(points, query_points, k, valid_num=None, max_distance=None):
       be. If there are no points within the distance, then the closest point is
       returned (regardless of distance). If this is set to None, then
       max_distance is not used.
+    neighbor_search: 'dense' or 'voxel_hash'. See `NeighborhoodIndices`.
+    max_points_per_voxel: See `NeighborhoodIndices`.
 
   Returns:
     A pair of tensors:
@@ -133,7 +141,14 @@ def KnnIndices(points, query_points, k, valid_num=None, max_distance=None):
   if valid_num is not None:
     padding = tf.greater_equal(tf.range(p1), tf.expand_dims(
         valid_num, -1))  # [N, P1], False/True padding
-  return NeighborhoodIndices(points, query_points, k, padding, max_distance)
+  return NeighborhoodIndices(
+      points,
+      query_points,
+      k,
+      padding,
+      max_distance,
+      neighbor_search=neighbor_search,
+      max_points_per_voxel=max_points_per_voxel)
 
 
 def NeighborhoodIndices(points,
@@ -141,7 +156,9 @@ def NeighborhoodIndices(points,
                         k,
                         points_padding=None,
                         max_distance=None,
-                        sample_neighbors_uniformly=False):
+                        sample_neighbors_uniformly=False,
+                        neighbor_search='dense',
+                        max_points_per_voxel=64):
   """Get indices to k-neighbors of query_points in points.
 
   Padding is returned along-side indices. Non-padded points are guaranteed to
@@ -171,6 +188,16 @@ def NeighborhoodIndices(points,
       filtering by distance is performed.
     sample_neighbors_uniformly: boolean specifying whether to sample neighbors
       uniformly if they are within max distance.
+    neighbor_search: How to search for neighbors. 'dense' computes the distance
+      between every query point and every point, which takes O(P1 * P2) memory.
+      'voxel_hash' only considers the points in the voxels (of size
+      max_distance) adjacent to each query point, which takes
+      O(P2 * 3^dims * max_points_per_voxel) memory, plus O(P1) for each query
+      point without neighbors. Requires max_distance. Both return the same
+      indices and padding, unless a voxel holds more than max_points_per_voxel
+      points.
+    max_points_per_voxel: The maximum number of points per voxel considered by
+      'voxel_hash' search. Points beyond this limit are ignored.
 
   Returns:
     A pair of tensors:
@@ -180,6 +207,16 @@ def NeighborhoodIndices(points,
       0 represents an unpadded (real) point.
 
   """
+  if neighbor_search == 'voxel_hash':
+    if max_distance is None:
+      raise ValueError('Voxel hash neighbor search requires max_distance.')
+    return _VoxelHashNeighborhoodIndices(points, query_points, k,
+                                         points_padding, max_distance,
+                                         sample_neighbors_uniformly,
+                                         max_points_per_voxel)
+  elif neighbor_search != 'dense':
+    raise ValueError(f'Unknown neighbor_search: {neighbor_search}')
+
   n, p1 = py_utils.GetShape(points, 2)
   query_points = py_utils.HasShape(query_points, [n, -1, -1])
   _, p2 = py_utils.GetShape(query_points, 2)
@@ -241,6 +278,142 @@ def NeighborhoodIndices(points,
   return indices, paddings
 
 
+def _VoxelHashNeighborhoodIndices(points, query_points, k, points_padding,
+                                  max_distance, sample_neighbors_uniformly,
+                                  max_points_per_voxel):
+  """NeighborhoodIndices() using a voxel hash instead of a distance matrix.
+
+  Points are bucketed into voxels of size max_distance, so that all neighbors
+  within max_distance of a query point lie in the 3^dims voxels around it. The
+  points are sorted by voxel key, which lets each query point look up the range
+  of points in each of its adjacent voxels with a binary search. Only the first
+  max_points_per_voxel points of each voxel are considered.
+
+  Args:
+    points: tensor of shape [N, P1, dims].
+    query_points: tensor of shape [N, P2, dims]
+    k: Integer.
+    points_padding: optional tensor of shape [N, P1].
+    max_distance: float; the size of the voxels.
+    sample_neighbors_uniformly: See NeighborhoodIndices().
+    max_points_per_voxel: Integer.
+
+  Returns:
+    A pair of tensors (indices, padding) of shape [N, P2, k], as returned by
+    NeighborhoodIndices().
+  """
+  n, p1, dims = py_utils.GetShape(points, 3)
+  query_points = py_utils.HasShape(query_points, [n, -1, dims])
+  _, p2 = py_utils.GetShape(query_points, 2)
+  if not isinstance(dims, int):
+    raise ValueError('Voxel hash neighbor search requires a static number of '
+                     'dimensions.')
+
+  # Integer voxel coordinates, offset so that the coordinates of all points and
+  # of the voxels adjacent to all query points are non-negative.
+  origin = tf.minimum(
+      tf.reduce_min(points, axis=[0, 1]), tf.reduce_min(query_points,
+                                                        axis=[0, 1]))
+  points_voxel = tf.cast(
+      tf.floor((points - origin) / max_distance), tf.int64) + 1
+  query_voxel = tf.cast(
+      tf.floor((query_points - origin) / max_distance), tf.int64) + 1
+  grid_shape = tf.maximum(
+      tf.reduce_max(points_voxel, axis=[0, 1]),
+      tf.reduce_max(query_voxel, axis=[0, 1])) + 2
+  # Voxel keys are unique across the batch; padded points get a key larger than
+  # all others, so they are never looked up.
+  batch_shape = tf.concat([[tf.cast(n, tf.int64)], grid_shape], axis=0)
+  batch_idx = tf.tile(
+      tf.range(n, dtype=tf.int64)[:, tf.newaxis, tf.newaxis], [1, p1, 1])
+  points_key = tf.reshape(
+      RavelIndex(
+          tf.reshape(tf.concat([batch_idx, points_voxel], axis=-1),
+                     [-1, dims + 1]), batch_shape), [n * p1])
+  if points_padding is not None:
+    points_key = tf.where(
+        tf.reshape(tf.cast(points_padding, tf.bool), [n * p1]),
+        tf.fill([n * p1], tf.reduce_prod(batch_shape)), points_key)
+  sorted_order = tf.argsort(points_key, stable=True)
+  sorted_key = tf.gather(points_key, sorted_order)
+
+  # Keys of the 3^dims voxels adjacent to each query point: [N, P2, V].
+  offsets = tf.constant(
+      np.stack(np.meshgrid(*([[-1, 0, 1]] * dims), indexing='ij'),
+               axis=-1).reshape([-1, dims]),
+      dtype=tf.int64)
+  num_offsets = 3**dims
+  query_batch_idx = tf.tile(
+      tf.range(n, dtype=tf.int64)[:, tf.newaxis, tf.newaxis, tf.newaxis],
+      [1, p2, num_offsets, 1])
+  neighbor_voxel = query_voxel[:, :, tf.newaxis, :] + offsets
+  neighbor_key = RavelIndex(
+      tf.reshape(
+          tf.concat([query_batch_idx, neighbor_voxel], axis=-1),
+          [-1, dims + 1]), batch_shape)
+  starts = tf.searchsorted(
+      sorted_key[tf.newaxis], neighbor_key[tf.newaxis], side='left')[0]
+  limits = tf.searchsorted(
+      sorted_key[tf.newaxis], neighbor_key[tf.newaxis], side='right')[0]
+
+  # Candidate neighbors: [N, P2, C] with C = V * max_points_per_voxel, padded
+  # to at least k.
+  num_candidates = max(num_offsets * max_points_per_voxel, k)
+  candidate = (
+      starts[:, tf.newaxis] +
+      tf.range(max_points_per_voxel, dtype=starts.dtype)[tf.newaxis, :])
+  is_valid = tf.less(candidate, limits[:, tf.newaxis])
+  candidate = tf.reshape(candidate, [n, p2, -1])
+  is_valid = tf.reshape(is_valid, [n, p2, -1])
+  if num_candidates > num_offsets * max_points_per_voxel:
+    pad = num_candidates - num_offsets * max_points_per_voxel
+    candidate = tf.pad(candidate, [[0, 0], [0, 0], [0, pad]])
+    is_valid = tf.pad(is_valid, [[0, 0], [0, 0], [0, pad]])
+  candidate = tf.gather(sorted_order,
+                        tf.minimum(candidate, tf.cast(n * p1 - 1,
+                                                      candidate.dtype)))
+  candidate_points = tf.gather(tf.reshape(points, [n * p1, dims]), candidate)
+  # Indices into P1.
+  candidate = tf.cast(candidate % tf.cast(p1, candidate.dtype), tf.int32)
+
+  sq_max_distance = tf.cast(tf.square(max_distance), points.dtype)
+  dist = tf.reduce_sum(
+      tf.square(candidate_points - query_points[:, :, tf.newaxis, :]), axis=-1)
+  is_neighbor = tf.logical_and(is_valid, tf.less_equal(dist, sq_max_distance))
+  if sample_neighbors_uniformly:
+    dist = tf.where(
+        is_neighbor,
+        sq_max_distance * tf.random.uniform(tf.shape(dist), dtype=dist.dtype),
+        dist)
+  # Invalid candidates sort after all valid ones.
+  dist = tf.where(is_valid, dist, tf.fill(tf.shape(dist), dist.dtype.max))
+
+  _, top_k = tf.nn.top_k(-dist, k=k, sorted=True)  # N x P2 x K
+  indices = tf.gather(candidate, top_k, batch_dims=2)
+  paddings = tf.logical_not(tf.gather(is_neighbor, top_k, batch_dims=2))
+  # Like NeighborhoodIndices(), padded neighbors are set to the closest point:
+  # the closest neighbor if there is one, otherwise the closest of all points,
+  # found by a dense search over the query points without neighbors only.
+  closest = indices[:, :, 0]
+  isolated = tf.where(tf.logical_not(tf.reduce_any(is_neighbor, axis=-1)))
+  isolated_points = tf.gather(points, isolated[:, 0])
+  isolated_dist = tf.reduce_sum(
+      tf.square(isolated_points -
+                tf.gather_nd(query_points, isolated)[:, tf.newaxis, :]),
+      axis=-1)
+  if points_padding is not None:
+    isolated_dist += tf.cast(
+        tf.gather(points_padding, isolated[:, 0]),
+        isolated_dist.dtype) * (tf.reduce_max(isolated_dist) + 1)
+  closest = tf.tensor_scatter_nd_update(
+      closest, isolated,
+      tf.argmin(isolated_dist, axis=-1, output_type=closest.dtype))
+  indices = tf.where(paddings, tf.tile(closest[:, :, tf.newaxis], [1, 1, k]),
+                     indices)
+  return (tf.reshape(indices, [n, p2, k]),
+          tf.reshape(tf.cast(paddings, tf.float32), [n, p2, k]))
+
+
 def FarthestPointSampler(points,
                          padding,
                          num_sampled_points,
@@ -255,6 +255,81 @@ class CarLibTest(test_utils.TestCase):
       car_lib.NeighborhoodIndices(
           points, query_points, 1, padding, sample_neighbors_uniformly=True)
 
+  def _testVoxelHashNeighborhoodIndices(self, dims, **kwargs):
+    np.random.seed(12345)
+    points = np.random.uniform(size=[2, 300, dims]).astype(np.float32)
+    query_points = np.random.uniform(size=[2, 40, dims]).astype(np.float32)
+    padding = np.random.uniform(size=[2, 300]) < 0.2
+    args = dict(
+        points=tf.constant(points),
+        query_points=tf.constant(query_points),
+        k=12,
+        points_padding=tf.constant(padding),
+        **kwargs)
+    with self.session():
+      expected_indices, expected_padding = self.evaluate(
+          car_lib.NeighborhoodIndices(**args))
+      indices, padding = self.evaluate(
+          car_lib.NeighborhoodIndices(neighbor_search='voxel_hash', **args))
+    self.assertAllEqual(expected_padding, padding)
+    self.assertAllEqual(expected_indices, indices)
+    return padding
+
+  def testVoxelHashNeighborhoodIndices(self):
+    padding = self._testVoxelHashNeighborhoodIndices(dims=3, max_distance=0.2)
+    # Some, but not all, neighborhoods are full.
+    self.assertBetween(np.mean(padding), 0.1, 0.9)
+
+  def testVoxelHashNeighborhoodIndices2D(self):
+    self._testVoxelHashNeighborhoodIndices(dims=2, max_distance=0.05)
+
+  def testVoxelHashNeighborhoodIndicesWithoutNeighbors(self):
+    # Padded points 1 and 3 are closer to the last two query points than any
+    # real point, and no point is within max_distance of them.
+    points = tf.constant([[[0, 0], [10, 10], [5, 5], [20, 20]]],
+                         dtype=tf.float32)
+    query_points = tf.constant([[[0.1, 0.1], [9, 9], [30, 30]]],
+                               dtype=tf.float32)
+    padding = tf.constant([[0, 1, 0, 1]])
+    args = dict(
+        points=points,
+        query_points=query_points,
+        k=2,
+        points_padding=padding,
+        max_distance=1.)
+    with self.session():
+      expected_indices, expected_padding = self.evaluate(
+          car_lib.NeighborhoodIndices(**args))
+      indices, padding = self.evaluate(
+          car_lib.NeighborhoodIndices(neighbor_search='voxel_hash', **args))
+    self.assertAllEqual([[[0, 0], [2, 2], [2, 2]]], expected_indices)
+    self.assertAllEqual([[[0, 1], [1, 1], [1, 1]]], expected_padding)
+    self.assertAllEqual(expected_indices, indices)
+    self.assertAllEqual(expected_padding, padding)
+
+  def testVoxelHashNeighborhoodIndicesWithUniformSampling(self):
+    points = tf.constant([[[1, 1], [2, 2], [4, 4], [5, 5]]], dtype=tf.float32)
+    query_points = tf.constant([[[2, 2], [5, 5]]], dtype=tf.float32)
+    padding = tf.constant([[1, 0, 1, 0]])
+    with self.session():
+      output_3nn, paddings = self.evaluate(
+          car_lib.NeighborhoodIndices(
+              points,
+              query_points,
+              3,
+              padding,
+              max_distance=1.1,
+              sample_neighbors_uniformly=True,
+              neighbor_search='voxel_hash'))
+    self.assertAllEqual([[[1, 1, 1], [3, 3, 3]]], output_3nn)
+    self.assertAllEqual([[[0, 1, 1], [0, 1, 1]]], paddings)
+
+  def testVoxelHashNeighborhoodIndicesRequiresMaxDistance(self):
+    points = tf.zeros([1, 4, 3])
+    with self.assertRaisesRegex(ValueError, 'requires max_distance'):
+      car_lib.NeighborhoodIndices(
+          points, points, 1, neighbor_search='voxel_hash')
+
   def testFarthestPointSamplerOnePoint(self):
     points = tf.constant([
         [[1, 1, 1, 1]],
@@ -475,5 +550,53 @@ class CarLibTest(test_utils.TestCase):
     return self._testPooling3D(car_lib.SegmentPool3D)
 
 
+class NeighborSearchBenchmark(tf.test.Benchmark):
+  """Compares dense and voxel hash neighbor search across point counts.
+
+  Run with:
+    bazel run -c opt lingvo/tasks/car:car_lib_test -- --benchmarks=all
+  """
+
+  def _RunBenchmark(self, neighbor_search, num_points, num_queries=1024, k=32):
+    with tf.Graph().as_default(), tf.Session() as sess:
+      # Roughly the density of a lidar sweep: 150k points over 100m x 100m.
+      extent = 100. * np.sqrt(num_points / 150000.)
+      points = tf.random.uniform([1, num_points, 3], maxval=extent)
+      query_points = points[:, :num_queries, :]
+      outputs = car_lib.NeighborhoodIndices(
+          points,
+          query_points,
+          k,
+          max_distance=1.0,
+          neighbor_search=neighbor_search)
+      run_metadata = tf.RunMetadata()
+      sess.run(
+          outputs,
+          options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
+          run_metadata=run_metadata)
+      peak_bytes = max(
+          (mem.peak_bytes for dev_stats in run_metadata.step_stats.dev_stats
+           for node_stats in dev_stats.node_stats
+           for mem in node_stats.memory),
+          default=0)
+      result = self.run_op_benchmark(
+          sess,
+          outputs,
+          min_iters=5,
+          name=f'neighborhood_indices_{neighbor_search}_{num_points}',
+          extras={'peak_bytes': peak_bytes})
+      tf.logging.info('%s with %d points: %.4fs, %d peak bytes.',
+                      neighbor_search, num_points, result['wall_time'],
+                      peak_bytes)
+
+  def benchmarkDense(self):
+    for num_points in [4096, 16384, 65536]:
+      self._RunBenchmark('dense', num_points)
+
+  def benchmarkVoxelHash(self):
+    for num_points in [4096, 16384, 65536, 150000]:
+      self._RunBenchmark('voxel_hash', num_points)
+
+
 if __name__ == '__main__':
   test_utils.main()
@@ -0,0 +1,258 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Indexed, memory-mapped database of groundtruth object crops.
+
+The database is a NpMap file (see `saver.WriteNpMap`) with the columns:
+
+  points_xyz: [total_num_points, 3] float32. Points of all objects, object
+    after object.
+  points_feature: [total_num_points, F] float32.
+  point_offsets: [N + 1] int64. The points of object i are
+    `points_xyz[point_offsets[i]:point_offsets[i + 1]]`.
+  bboxes_3d: [N, 7] float32.
+  labels: [N] int32.
+  difficulties: [N] int32.
+  num_points: [N] int32.
+
+Objects are sorted by (label, difficulty, num_points), and the index
+
+  groups: [G, 2] int32. The distinct (label, difficulty) pairs.
+  group_offsets: [G + 1] int64. Objects of group g are
+    `[group_offsets[g], group_offsets[g + 1])`, sorted by num_points.
+
+lets `GroundTruthDB` select all objects of given classes, difficulties and
+point counts as a handful of contiguous ranges, and sample from them in O(1)
+per object without reading anything but the sampled objects.
+"""
+
+import threading
+
+from lingvo.core import py_utils
+from lingvo.core import saver
+import numpy as np
+
+
+def _Float32(x):
+  return np.asarray(x, dtype=np.float32)
+
+
+class GroundTruthDBWriter:
+  """Accumulates groundtruth objects and writes them as a `GroundTruthDB`."""
+
+  def __init__(self):
+    self._objects = []
+
+  def Add(self, points_xyz, points_feature, bbox_3d, label, difficulty):
+    """Adds one object.
+
+    Args:
+      points_xyz: [P, 3] float array of the object's points.
+      points_feature: [P, F] float array of the points' features. May also be
+        flattened. F must be the same for all objects.
+      bbox_3d: [7] float array of the object's box.
+      label: The object's integer class label.
+      difficulty: The object's integer difficulty.
+    """
+    points_xyz = _Float32(points_xyz).reshape([-1, 3])
+    # Reshaped in Write(), as F is unknown for objects without points.
+    points_feature = _Float32(points_feature).reshape([-1])
+    self._objects.append((points_xyz, points_feature,
+                          _Float32(bbox_3d).reshape([7]), int(label),
+                          int(difficulty)))
+
+  def Write(self, filename):
+    """Writes all added objects, sorted and indexed, to `filename`."""
+    if not self._objects:
+      raise ValueError('No objects to write.')
+    objects = sorted(
+        self._objects, key=lambda o: (o[3], o[4], o[0].shape[0]))
+    num_points = np.array([o[0].shape[0] for o in objects], dtype=np.int32)
+    labels = np.array([o[3] for o in objects], dtype=np.int32)
+    difficulties = np.array([o[4] for o in objects], dtype=np.int32)
+
+    keys = np.stack([labels, difficulties], axis=1)
+    is_group_start = np.concatenate(
+        [[True], np.any(keys[1:] != keys[:-1], axis=1)])
+    group_starts = np.flatnonzero(is_group_start)
+
+    points_xyz = np.concatenate([o[0] for o in objects])
+    points_feature = np.concatenate([o[1] for o in objects])
+    num_point_features = (
+        points_feature.size // points_xyz.shape[0] if points_xyz.shape[0] else 1)
+    db = py_utils.NestedMap(
+        points_xyz=points_xyz,
+        points_feature=points_feature.reshape([-1, num_point_features]),
+        point_offsets=np.concatenate([[0], np.cumsum(num_points)
+                                     ]).astype(np.int64),
+        bboxes_3d=np.stack([o[2] for o in objects]),
+        labels=labels,
+        difficulties=difficulties,
+        num_points=num_points,
+        groups=keys[group_starts],
+        group_offsets=np.append(group_starts, len(objects)).astype(np.int64))
+    saver.WriteNpMap(filename, db)
+
+
+class GroundTruthDB:
+  """Samples objects from a database written by `GroundTruthDBWriter`.
+
+  The database file is memory-mapped, so memory use does not depend on the
+  size of the database, and the number of objects is known without a scan.
+  """
+
+  def __init__(self, filename, mmap=True):
+    self._db = saver.ReadNpMap(filename, mmap=mmap)
+
+  @property
+  def num_objects(self):
+    return self._db.labels.shape[0]
+
+  @property
+  def num_point_features(self):
+    return self._db.points_feature.shape[1]
+
+  def SelectRanges(self,
+                   label_weights=None,
+                   difficulty_weights=None,
+                   min_difficulty=0,
+                   min_points=0,
+                   max_points=None):
+    """Selects objects by class, difficulty and number of points.
+
+    Args:
+      label_weights: Optional list of relative sampling weights, indexed by
+        label. Labels beyond its end get weight 0. If None, all labels have
+        weight 1.
+      difficulty_weights: Optional list of relative sampling weights, indexed
+        by difficulty. If None, difficulties >= `min_difficulty` have weight 1
+        and the others 0.
+      min_difficulty: Minimum difficulty; only used if `difficulty_weights` is
+        None.
+      min_points: Minimum number of points per object.
+      max_points: Optional maximum number of points per object.
+
+    Returns:
+      A tuple (starts, limits, weights) of arrays of shape [R], describing R
+      ranges of selected objects `[starts[r], limits[r])` and the sampling
+      weight of each object in range r.
+    """
+    starts, limits, weights = [], [], []
+    group_offsets = np.asarray(self._db.group_offsets)
+    for g, (label, difficulty) in enumerate(np.asarray(self._db.groups)):
+      weight = 1.
+      if label_weights is not None:
+        weight *= label_weights[label] if label < len(label_weights) else 0.
+      if difficulty_weights is not None:
+        weight *= (
+            difficulty_weights[difficulty]
+            if difficulty < len(difficulty_weights) else 0.)
+      elif difficulty < min_difficulty:
+        weight = 0.
+      if weight <= 0:
+        continue
+      # Objects are sorted by number of points within each group.
+      group_start, group_limit = group_offsets[g], group_offsets[g + 1]
+      num_points = self._db.num_points[group_start:group_limit]
+      start = group_start + np.searchsorted(num_points, min_points, 'left')
+      limit = group_limit
+      if max_points is not None:
+        limit = group_start + np.searchsorted(num_points, max_points, 'right')
+      if limit > start:
+        starts.append(start)
+        limits.append(limit)
+        weights.append(weight)
+    return (np.array(starts, dtype=np.int64), np.array(limits, dtype=np.int64),
+            np.array(weights, dtype=np.float64))
+
+  def Sample(self, rng, num_samples, ranges):
+    """Samples `num_samples` object indices (with replacement).
+
+    Args:
+      rng: A `np.random.Generator`.
+      num_samples: Number of objects to sample.
+      ranges: The output of `SelectRanges`.
+
+    Returns:
+      An int64 array of shape [num_samples] of object indices. Empty if no
+      objects were selected.
+    """
+    starts, limits, weights = ranges
+    if not starts.size:
+      return np.zeros([0], dtype=np.int64)
+    range_probs = weights * (limits - starts)
+    range_probs /= np.sum(range_probs)
+    r = rng.choice(starts.size, size=num_samples, p=range_probs)
+    return rng.integers(starts[r], limits[r])
+
+  def Gather(self, indices, max_num_points):
+    """Gathers objects, padding or trimming each to `max_num_points` points.
+
+    Args:
+      indices: [K] int array of object indices.
+      max_num_points: Number of points P to return per object.
+
+    Returns:
+      A NestedMap with points_xyz [K, P, 3], points_feature [K, P, F],
+      points_mask [K, P], bboxes_3d [K, 7], labels [K] and difficulties [K].
+    """
+    num_objects = len(indices)
+    db = self._db
+    points_xyz = np.zeros([num_objects, max_num_points, 3], np.float32)
+    points_feature = np.zeros(
+        [num_objects, max_num_points, self.num_point_features], np.float32)
+    points_mask = np.zeros([num_objects, max_num_points], bool)
+    for i, idx in enumerate(indices):
+      start = db.point_offsets[idx]
+      n = min(int(db.point_offsets[idx + 1] - start), max_num_points)
+      points_xyz[i, :n] = db.points_xyz[start:start + n]
+      points_feature[i, :n] = db.points_feature[start:start + n]
+      points_mask[i, :n] = True
+    indices = np.asarray(indices, dtype=np.int64)
+    return py_utils.NestedMap(
+        points_xyz=points_xyz,
+        points_feature=points_feature,
+        points_mask=points_mask,
+        bboxes_3d=np.array(db.bboxes_3d[indices], dtype=np.float32),
+        labels=np.array(db.labels[indices], dtype=np.int32),
+        difficulties=np.array(db.difficulties[indices], dtype=np.int32))
+
+
+class GroundTruthSampler:
+  """Thread-safe sampler of a fixed selection of `GroundTruthDB` objects."""
+
+  def __init__(self, filename, max_num_points, seed=None, **select_kwargs):
+    """Constructor.
+
+    Args:
+      filename: The `GroundTruthDB` filename.
+      max_num_points: Number of points to return per object.
+      seed: Optional random seed.
+      **select_kwargs: Arguments to `GroundTruthDB.SelectRanges`.
+    """
+    self._db = GroundTruthDB(filename)
+    self._max_num_points = max_num_points
+    self._ranges = self._db.SelectRanges(**select_kwargs)
+    self._rng = np.random.default_rng(seed)
+    self._lock = threading.Lock()
+
+  @property
+  def db(self):
+    return self._db
+
+  def __call__(self, num_samples):
+    """Returns `GroundTruthDB.Gather` of `num_samples` sampled objects."""
+    with self._lock:
+      indices = self._db.Sample(self._rng, int(num_samples), self._ranges)
+    return self._db.Gather(indices, self._max_num_points)
@@ -0,0 +1,100 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for groundtruth_db."""
+
+import os
+
+from lingvo.core import test_utils
+from lingvo.tasks.car import groundtruth_db
+import numpy as np
+
+
+class GroundTruthDBTest(test_utils.TestCase):
+
+  def _WriteDB(self):
+    # (label, difficulty, num_points) of each object.
+    self._objects = [(1, 0, 3), (2, 1, 5), (1, 0, 1), (1, 2, 4), (2, 1, 0),
+                     (1, 0, 6)]
+    writer = groundtruth_db.GroundTruthDBWriter()
+    for i, (label, difficulty, num_points) in enumerate(self._objects):
+      writer.Add(
+          points_xyz=np.full([num_points, 3], i),
+          points_feature=np.full([num_points], -i),
+          bbox_3d=np.full([7], i),
+          label=label,
+          difficulty=difficulty)
+    filename = os.path.join(self.get_temp_dir(), 'gt.npmap')
+    writer.Write(filename)
+    return filename
+
+  def _ObjectIds(self, db, indices):
+    # bboxes_3d are filled with the index of the object when it was added.
+    return sorted(db.Gather(indices, 1).bboxes_3d[:, 0].astype(int).tolist())
+
+  def _Selected(self, db, **kwargs):
+    starts, limits, _ = db.SelectRanges(**kwargs)
+    indices = np.concatenate(
+        [np.arange(s, l) for s, l in zip(starts, limits)] + [[]]).astype(int)
+    return self._ObjectIds(db, indices)
+
+  def testSelectRanges(self):
+    db = groundtruth_db.GroundTruthDB(self._WriteDB())
+    self.assertEqual(6, db.num_objects)
+    self.assertEqual(1, db.num_point_features)
+    self.assertEqual([0, 1, 2, 3, 4, 5], self._Selected(db))
+    self.assertEqual([0, 2, 3, 5], self._Selected(db, label_weights=[0., 1.]))
+    self.assertEqual([3], self._Selected(db, min_difficulty=2))
+    self.assertEqual([1, 3, 4],
+                     self._Selected(db, difficulty_weights=[0., 1., 0.5]))
+    self.assertEqual([0, 1, 3], self._Selected(db, min_points=3, max_points=5))
+    self.assertEqual([], self._Selected(db, label_weights=[1.]))
+
+  def testSampleAndGather(self):
+    db = groundtruth_db.GroundTruthDB(self._WriteDB())
+    rng = np.random.default_rng(0)
+    ranges = db.SelectRanges(label_weights=[0., 1., 3.], min_points=1)
+    indices = db.Sample(rng, 2000, ranges)
+    ids = db.Gather(indices, 1).bboxes_3d[:, 0].astype(int)
+    # Object 1 is the only label-2 object with points; it has weight 3 while
+    # the four label-1 objects have weight 1.
+    self.assertCountEqual([0, 1, 2, 3, 5], set(ids.tolist()))
+    self.assertNear(3. / 7, np.mean(ids == 1), 0.05)
+    self.assertEmpty(db.Sample(rng, 3, db.SelectRanges(min_points=100)))
+
+    sampled = db.Gather(indices[:10], 4)
+    for i, object_id in enumerate(sampled.bboxes_3d[:, 0].astype(int)):
+      label, difficulty, num_points = self._objects[object_id]
+      n = min(num_points, 4)
+      self.assertEqual(label, sampled.labels[i])
+      self.assertEqual(difficulty, sampled.difficulties[i])
+      self.assertAllEqual([True] * n + [False] * (4 - n),
+                          sampled.points_mask[i])
+      self.assertAllEqual(
+          np.full([n, 3], object_id), sampled.points_xyz[i, :n])
+      self.assertAllEqual(
+          np.full([n, 1], -object_id), sampled.points_feature[i, :n])
+      self.assertAllEqual(np.zeros([4 - n, 3]), sampled.points_xyz[i, n:])
+
+  def testSampler(self):
+    sampler = groundtruth_db.GroundTruthSampler(
+        self._WriteDB(), max_num_points=2, seed=1, min_difficulty=1)
+    sampled = sampler(5)
+    self.assertEqual([5, 2, 3], list(sampled.points_xyz.shape))
+    self.assertEqual([5, 2, 1], list(sampled.points_feature.shape))
+    self.assertAllGreaterEqual(sampled.difficulties, 1)
+
+
+if __name__ == '__main__':
+  test_utils.main()
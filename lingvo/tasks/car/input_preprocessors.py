@@ -21,6 +21,7 @@ from lingvo.core import schedule
 from lingvo.tasks.car import car_lib
 from lingvo.tasks.car import detection_3d_lib
 from lingvo.tasks.car import geometry
+from lingvo.tasks.car import groundtruth_db
 from lingvo.tasks.car import ops
 import numpy as np
 # pylint:disable=g-direct-tensorflow-import
@@ -1176,6 +1177,12 @@ class SparseCellGatherFeatures(Preprocessor):
         'Whether to sample the neighbor points for every cell center '
         'uniformly at random. If False, this will default to selecting by '
         'distance.')
+    p.Define(
+        'neighbor_search', 'dense',
+        'How to search for neighbors: "dense" or "voxel_hash". See '
+        'car_lib.NeighborhoodIndices.')
+    p.Define('max_points_per_voxel', 64,
+             'Maximum number of points per voxel for "voxel_hash" search.')
     return p
 
   def TransformFeatures(self, features):
@@ -1202,7 +1209,9 @@ class SparseCellGatherFeatures(Preprocessor):
         p.num_points_per_cell,
         points_padding=None,
         max_distance=p.max_distance,
-        sample_neighbors_uniformly=p.sample_neighbors_uniformly)
+        sample_neighbors_uniformly=p.sample_neighbors_uniformly,
+        neighbor_search=p.neighbor_search,
+        max_points_per_voxel=p.max_points_per_voxel)
 
     # Take first example since NeighboorhoodIndices expects batch dimension.
     sample_indices = sample_indices[0, :, :]
@@ -2723,6 +2732,11 @@ class GroundTruthAugmentor(Preprocessor):
 
   Modifies the above features so that additional objects from
   a groundtruth database are added.
+
+  Objects are read either from a TFRecord of crops (`groundtruth_database`),
+  or sampled from an indexed, memory-mapped `groundtruth_db.GroundTruthDB`
+  (`groundtruth_db_file`), which uses constant memory regardless of the size
+  of the database.
   """
 
   @classmethod
@@ -2733,6 +2747,12 @@ class GroundTruthAugmentor(Preprocessor):
         'If not None, loads groundtruths from this database and adds '
         'them to the current scene. Groundtruth database is expected '
         'to be a TFRecord of KITTI or Waymo crops.')
+    p.Define(
+        'groundtruth_db_file', None,
+        'If not None, samples groundtruths from this groundtruth_db.'
+        'GroundTruthDB file instead of reading groundtruth_database. See '
+        'tools/create_groundtruth_db.py. num_db_objects and batch_mode are '
+        'not needed in this case.')
     p.Define(
         'num_db_objects', None,
         'Number of objects in the database. Because we use TFRecord '
@@ -2858,6 +2878,67 @@ class GroundTruthAugmentor(Preprocessor):
         labels=db_labels,
         difficulties=db_difficulties)
 
+  def _GetGroundTruthSampler(self):
+    """Returns the `GroundTruthSampler` of `groundtruth_db_file`."""
+    p = self.params
+    if getattr(self, '_groundtruth_sampler', None) is None:
+      label_weights = p.class_sampling_probability
+      if label_weights is None and p.label_filter:
+        label_weights = np.zeros(max(p.label_filter) + 1)
+        label_weights[p.label_filter] = 1.
+      # Objects are trimmed to max_num_points_per_bbox points before the
+      # filter_max_points filter applies, like in _CreateExampleFilter().
+      max_points = p.filter_max_points
+      if max_points and max_points >= p.max_num_points_per_bbox:
+        max_points = None
+      self._groundtruth_sampler = groundtruth_db.GroundTruthSampler(
+          p.groundtruth_db_file,
+          max_num_points=p.max_num_points_per_bbox,
+          seed=p.random_seed,
+          label_weights=label_weights,
+          difficulty_weights=p.difficulty_sampling_probability,
+          min_difficulty=p.filter_min_difficulty,
+          min_points=p.filter_min_points,
+          max_points=max_points)
+    return self._groundtruth_sampler
+
+  def _SampleDB(self, num_samples):
+    """Samples objects from `groundtruth_db_file`.
+
+    Objects are sampled with replacement, and with probabilities proportional
+    to the class and difficulty sampling probabilities, among the objects that
+    pass the same filters as in `_CreateExampleFilter()`.
+
+    Args:
+      num_samples: Scalar int32 Tensor, the number of objects to sample.
+
+    Returns:
+      A NestedMap of Tensors like `_ReadDB()`, holding `num_samples` objects,
+      or no objects if none pass the filters.
+    """
+    p = self.params
+    sampler = self._GetGroundTruthSampler()
+
+    def _Sample(n):
+      db = sampler(n)
+      return (db.points_xyz, db.points_feature, db.points_mask, db.bboxes_3d,
+              db.labels, db.difficulties)
+
+    outputs = tf.numpy_function(
+        _Sample, [num_samples],
+        [tf.float32, tf.float32, tf.bool, tf.float32, tf.int32, tf.int32])
+    num_points_per_bbox = p.max_num_points_per_bbox
+    db = py_utils.NestedMap()
+    for key, value, shape in zip([
+        'points_xyz', 'points_feature', 'points_mask', 'bboxes_3d', 'labels',
+        'difficulties'
+    ], outputs, [[None, num_points_per_bbox, 3],
+                 [None, num_points_per_bbox, sampler.db.num_point_features],
+                 [None, num_points_per_bbox], [None, 7], [None], [None]]):
+      value.set_shape(shape)
+      db[key] = value
+    return db
+
   def _CreateExampleFilter(self, db):
     """Construct db example filter.
 
@@ -2971,10 +3052,6 @@ class GroundTruthAugmentor(Preprocessor):
   def TransformFeatures(self, features):
     p = self.params
 
-    tf.logging.info('Loading groundtruth database at %s' %
-                    (p.groundtruth_database))
-    db = self._ReadDB(p.groundtruth_database)
-
     original_features_shape = tf.shape(features.lasers.points_feature)
 
     # Compute the number of bboxes to augment.
@@ -2984,21 +3061,31 @@ class GroundTruthAugmentor(Preprocessor):
     num_augmented_bboxes = tf.minimum(max_bboxes - num_bboxes_in_scene,
                                       p.max_augmented_bboxes)
 
-    # Compute an object index over all objects in the database.
-    num_objects_in_database = tf.shape(db.points_xyz)[0]
-    db_idx = tf.range(num_objects_in_database)
-
-    # Find those indices whose examples pass the filters, and select only those
-    # indices.
-    example_filter = self._CreateExampleFilter(db)
-    db_idx = tf.boolean_mask(db_idx, example_filter)
-
-    # At this point, we might still have a large number of object candidates,
-    # from which we only need a sample.
-    # To reduce the amount of computation, we randomly subsample to slightly
-    # more than we want to augment.
-    db_idx = tf.random.shuffle(
-        db_idx, seed=p.random_seed)[0:num_augmented_bboxes * 5]
+    if p.groundtruth_db_file:
+      # The sampled objects already pass the filters; sample slightly more than
+      # we want to augment, as some are filtered out for overlapping below.
+      db = self._SampleDB(num_augmented_bboxes * 5)
+      db_idx = tf.range(tf.shape(db.points_xyz)[0])
+    else:
+      tf.logging.info('Loading groundtruth database at %s' %
+                      (p.groundtruth_database))
+      db = self._ReadDB(p.groundtruth_database)
+
+      # Compute an object index over all objects in the database.
+      num_objects_in_database = tf.shape(db.points_xyz)[0]
+      db_idx = tf.range(num_objects_in_database)
+
+      # Find those indices whose examples pass the filters, and select only
+      # those indices.
+      example_filter = self._CreateExampleFilter(db)
+      db_idx = tf.boolean_mask(db_idx, example_filter)
+
+      # At this point, we might still have a large number of object candidates,
+      # from which we only need a sample.
+      # To reduce the amount of computation, we randomly subsample to slightly
+      # more than we want to augment.
+      db_idx = tf.random.shuffle(
+          db_idx, seed=p.random_seed)[0:num_augmented_bboxes * 5]
 
     # After filtering, further filter out the db boxes that would occlude with
     # other boxes (including other database boxes).
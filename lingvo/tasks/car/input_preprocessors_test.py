@@ -14,10 +14,13 @@
 # ==============================================================================
 """Input preprocessors tests."""
 
+import os
+
 from lingvo import compat as tf
 from lingvo.core import py_utils
 from lingvo.core import schedule
 from lingvo.core import test_utils
+from lingvo.tasks.car import groundtruth_db
 from lingvo.tasks.car import input_preprocessors
 import numpy as np
 
@@ -160,6 +163,34 @@ class InputPreprocessorsTest(test_utils.TestCase):
       self.assertEqual(np_new_features.foo, 1)
       self.assertEqual(np_new_features.bar, 2)
 
+  def testGroundTruthAugmentorSampleDB(self):
+    writer = groundtruth_db.GroundTruthDBWriter()
+    for i in range(10):
+      writer.Add(
+          points_xyz=np.ones([i, 3]),
+          points_feature=np.ones([i, 1]),
+          bbox_3d=np.full([7], i),
+          label=i % 2,
+          difficulty=0)
+    db_file = os.path.join(self.get_temp_dir(), 'gt.npmap')
+    writer.Write(db_file)
+
+    p = input_preprocessors.GroundTruthAugmentor.Params().Set(
+        groundtruth_db_file=db_file,
+        max_num_points_per_bbox=4,
+        filter_min_points=2,
+        label_filter=[1])
+    db = p.Instantiate()._SampleDB(tf.constant(20))
+    self.assertEqual([None, 4, 3], db.points_xyz.shape.as_list())
+    self.assertEqual([None, 4, 1], db.points_feature.shape.as_list())
+    db = self.evaluate(db)
+    self.assertEqual([20, 4, 3], list(db.points_xyz.shape))
+    self.assertAllEqual(np.ones([20]), db.labels)
+    # Objects 3, 5, 7 and 9 have label 1 and at least 2 points.
+    self.assertContainsSubset(set(db.bboxes_3d[:, 0].tolist()), {3, 5, 7, 9})
+    self.assertAllEqual(np.minimum(db.bboxes_3d[:, 0], 4),
+                        np.sum(db.points_mask, axis=1))
+
 
 if __name__ == '__main__':
   test_utils.main()
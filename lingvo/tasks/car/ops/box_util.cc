@@ -17,6 +17,7 @@ limitations under the License.
 
 #include <algorithm>
 #include <cmath>
+#include <functional>
 
 namespace tensorflow {
 namespace lingvo {
@@ -181,6 +182,18 @@ const std::vector<Vertex>& RotatedBox2D::box_vertices() const {
 
 bool RotatedBox2D::NonZeroAndValid() const { return !extreme_box_dim_; }
 
+bool RotatedBox2D::LooseBounds(BEVBounds* bounds) const {
+  // Boxes of extreme dimensions never intersect; see MaybeIntersects().
+  if (extreme_box_dim_) {
+    return false;
+  }
+  bounds->min_x = loose_min_x_;
+  bounds->min_y = loose_min_y_;
+  bounds->max_x = loose_max_x_;
+  bounds->max_y = loose_max_y_;
+  return true;
+}
+
 bool RotatedBox2D::MaybeIntersects(const RotatedBox2D& other) const {
   // If the box dimensions of either box are too small / large,
   // assume they are not well-formed boxes (otherwise we are
@@ -298,6 +311,13 @@ double Upright3DBox::IoU(const Upright3DBox& other) const {
   return volume_inter > 0 ? volume_inter / volume_union : 0;
 }
 
+bool Upright3DBox::LooseBounds(BEVBounds* bounds) const {
+  if (!NonZeroAndValid()) {
+    return false;
+  }
+  return rbox.LooseBounds(bounds);
+}
+
 double Upright3DBox::Overlap(const Upright3DBox& other) const {
   // Check that both boxes are non-zero and valid.  Otherwise,
   // return 0.
@@ -322,6 +342,113 @@ double Upright3DBox::Overlap(const Upright3DBox& other) const {
   return volume_inter > 0 ? volume_inter / volume_1 : 0;
 }
 
+// Boxes covering more grid cells than this are not added to the cells, but
+// returned by every query instead.
+constexpr int64 kMaxCellsPerBox = 64;
+
+// Bound on the absolute value of cell coordinates, so that they and the
+// number of cells in a range can be represented.
+constexpr double kMaxCellCoordinate = 1e15;
+
+size_t BEVGridIndex::CellHashFn::operator()(
+    const std::pair<int64, int64>& cell) const {
+  return std::hash<uint64>{}(static_cast<uint64>(cell.first) *
+                                 0x9E3779B97F4A7C15ULL ^
+                             static_cast<uint64>(cell.second));
+}
+
+BEVGridIndex::BEVGridIndex(const double cell_size) : cell_size_(cell_size) {
+  CHECK_GT(cell_size_, 0);
+}
+
+double BEVGridIndex::CellSizeFor(const std::vector<BEVBounds>& bounds) {
+  std::vector<double> sizes;
+  sizes.reserve(bounds.size());
+  for (const auto& b : bounds) {
+    const double size = std::max(b.max_x - b.min_x, b.max_y - b.min_y);
+    if (std::isfinite(size) && size > 0) {
+      sizes.push_back(size);
+    }
+  }
+  if (sizes.empty()) {
+    return 1.0;
+  }
+  auto median = sizes.begin() + sizes.size() / 2;
+  std::nth_element(sizes.begin(), median, sizes.end());
+  return *median;
+}
+
+bool BEVGridIndex::CellRange(const BEVBounds& bounds, int64* min_cx,
+                             int64* min_cy, int64* max_cx,
+                             int64* max_cy) const {
+  const double cells[] = {std::floor(bounds.min_x / cell_size_),
+                          std::floor(bounds.min_y / cell_size_),
+                          std::floor(bounds.max_x / cell_size_),
+                          std::floor(bounds.max_y / cell_size_)};
+  for (const double c : cells) {
+    // Also false for NaN.
+    if (!(std::fabs(c) <= kMaxCellCoordinate)) {
+      return false;
+    }
+  }
+  *min_cx = static_cast<int64>(cells[0]);
+  *min_cy = static_cast<int64>(cells[1]);
+  *max_cx = static_cast<int64>(cells[2]);
+  *max_cy = static_cast<int64>(cells[3]);
+  return true;
+}
+
+void BEVGridIndex::Insert(const int id, const BEVBounds& bounds) {
+  ids_.push_back(id);
+  int64 min_cx, min_cy, max_cx, max_cy;
+  if (!CellRange(bounds, &min_cx, &min_cy, &max_cx, &max_cy) ||
+      static_cast<double>(max_cx - min_cx + 1) * (max_cy - min_cy + 1) >
+          kMaxCellsPerBox) {
+    unbounded_ids_.push_back(id);
+    return;
+  }
+  for (int64 cx = min_cx; cx <= max_cx; ++cx) {
+    for (int64 cy = min_cy; cy <= max_cy; ++cy) {
+      cells_[{cx, cy}].push_back(id);
+    }
+  }
+}
+
+void BEVGridIndex::Query(const BEVBounds& bounds,
+                         std::vector<int>* ids) const {
+  int64 min_cx, min_cy, max_cx, max_cy;
+  if (!CellRange(bounds, &min_cx, &min_cy, &max_cx, &max_cy)) {
+    *ids = ids_;
+  } else {
+    *ids = unbounded_ids_;
+    auto append_cell = [ids](const std::vector<int>& cell_ids) {
+      ids->insert(ids->end(), cell_ids.begin(), cell_ids.end());
+    };
+    const double num_cells =
+        static_cast<double>(max_cx - min_cx + 1) * (max_cy - min_cy + 1);
+    if (num_cells > cells_.size()) {
+      // Cheaper to scan the non-empty cells than the covered ones.
+      for (const auto& cell : cells_) {
+        if (cell.first.first >= min_cx && cell.first.first <= max_cx &&
+            cell.first.second >= min_cy && cell.first.second <= max_cy) {
+          append_cell(cell.second);
+        }
+      }
+    } else {
+      for (int64 cx = min_cx; cx <= max_cx; ++cx) {
+        for (int64 cy = min_cy; cy <= max_cy; ++cy) {
+          const auto it = cells_.find({cx, cy});
+          if (it != cells_.end()) {
+            append_cell(it->second);
+          }
+        }
+      }
+    }
+  }
+  std::sort(ids->begin(), ids->end());
+  ids->erase(std::unique(ids->begin(), ids->end()), ids->end());
+}
+
 }  // namespace box
 }  // namespace lingvo
 }  // namespace tensorflow
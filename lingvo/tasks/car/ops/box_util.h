@@ -17,6 +17,8 @@ limitations under the License.
 #define THIRD_PARTY_PY_LINGVO_TASKS_CAR_OPS_BOX_UTIL_H_
 
 #include <string>
+#include <unordered_map>
+#include <utility>
 #include <vector>
 
 #include "tensorflow/core/framework/tensor.h"
@@ -38,6 +40,14 @@ struct Vertex {
   double y = 0;
 };
 
+// An axis-aligned rectangle in the bird's-eye view (x-y) plane.
+struct BEVBounds {
+  double min_x = 0;
+  double min_y = 0;
+  double max_x = 0;
+  double max_y = 0;
+};
+
 // A rotated 2D bounding box represented as (cx, cy, w, h, r). cx, cy are the
 // box center coordinates; w, h are the box width and height; heading is the
 // rotation angle in radian relative to the 'positive x' direction.
@@ -62,6 +72,11 @@ class RotatedBox2D {
   // large or small).
   bool NonZeroAndValid() const;
 
+  // Returns false if this box never intersects any box. Otherwise sets
+  // '*bounds' to loose bounds of the box: two boxes whose loose bounds do not
+  // overlap have an intersection of 0.
+  bool LooseBounds(BEVBounds* bounds) const;
+
  private:
   // Computes / caches box_vertices_ calculation.
   const std::vector<Vertex>& box_vertices() const;
@@ -129,6 +144,54 @@ struct Upright3DBox {
   // Returns true if the box is valid (width and height are not extremely
   // large or small, and zmin < zmax).
   bool NonZeroAndValid() const;
+
+  // Returns false if the IoU of this box with any box is 0. Otherwise sets
+  // '*bounds' to loose bird's-eye view bounds of the box: two boxes whose
+  // loose bounds do not overlap have an IoU of 0.
+  bool LooseBounds(BEVBounds* bounds) const;
+};
+
+// A uniform bird's-eye view grid of box bounds.
+//
+// Finds the boxes whose bounds may overlap a given box by looking only at the
+// grid cells the box covers, instead of comparing it against every box. Used
+// to restrict pairwise IoU computations to boxes that can have a non-zero IoU.
+class BEVGridIndex {
+ public:
+  // Creates an empty index with square cells of side 'cell_size'.
+  explicit BEVGridIndex(double cell_size);
+
+  // Returns a cell size suitable to index boxes of the given bounds: the
+  // median of their larger side length, so that most boxes cover few cells.
+  static double CellSizeFor(const std::vector<BEVBounds>& bounds);
+
+  // Adds box 'id' with the given bounds to the index.
+  void Insert(int id, const BEVBounds& bounds);
+
+  // Sets '*ids' to the sorted, unique ids of all added boxes whose bounds may
+  // overlap 'bounds'. Every added box whose bounds overlap 'bounds' (touching
+  // included) is returned.
+  void Query(const BEVBounds& bounds, std::vector<int>* ids) const;
+
+ private:
+  struct CellHashFn {
+    size_t operator()(const std::pair<int64, int64>& cell) const;
+  };
+
+  // Sets the inclusive cell range covered by 'bounds'. Returns false if the
+  // range can not be represented, e.g. for non-finite bounds.
+  bool CellRange(const BEVBounds& bounds, int64* min_cx, int64* min_cy,
+                 int64* max_cx, int64* max_cy) const;
+
+  double cell_size_;
+  // Ids of the boxes covering each cell.
+  std::unordered_map<std::pair<int64, int64>, std::vector<int>, CellHashFn>
+      cells_;
+  // Ids of boxes that are not in 'cells_', because their bounds are not finite
+  // or cover too many cells. They are returned by every query.
+  std::vector<int> unbounded_ids_;
+  // Ids of all boxes.
+  std::vector<int> ids_;
 };
 
 // Converts a [N, 7] tensor to a vector of N Upright3DBox objects.
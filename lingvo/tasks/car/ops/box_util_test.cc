@@ -0,0 +1,132 @@
+/* Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+==============================================================================*/
+#include "lingvo/tasks/car/ops/box_util.h"
+
+#include <algorithm>
+#include <cmath>
+#include <random>
+#include <vector>
+
+#include <gtest/gtest.h>
+
+namespace tensorflow {
+namespace lingvo {
+namespace box {
+namespace {
+
+// Generates boxes of various sizes, a few of them invalid, very large or with
+// NaN coordinates.
+std::vector<Upright3DBox> GenerateBoxes(int n, std::mt19937* rng) {
+  std::uniform_real_distribution<double> center(-20, 20);
+  std::uniform_real_distribution<double> dim(0, 4);
+  std::uniform_real_distribution<double> heading(-M_PI, M_PI);
+  std::vector<Upright3DBox> boxes;
+  for (int i = 0; i < n; ++i) {
+    std::vector<double> raw = {center(*rng), center(*rng), center(*rng) / 10,
+                               dim(*rng),    dim(*rng),    dim(*rng),
+                               heading(*rng)};
+    if (i % 17 == 0) {
+      raw[3] = 0;
+    } else if (i % 19 == 0) {
+      raw[3] *= 20;
+    } else if (i % 23 == 0) {
+      raw[0] = NAN;
+    }
+    boxes.emplace_back(raw);
+  }
+  return boxes;
+}
+
+TEST(BEVGridIndexTest, QueryFindsAllOverlappingBoxes) {
+  std::mt19937 rng(39183);
+  const std::vector<Upright3DBox> boxes = GenerateBoxes(500, &rng);
+  std::vector<BEVBounds> bounds(boxes.size());
+  std::vector<bool> has_bounds(boxes.size());
+  std::vector<BEVBounds> all_bounds;
+  for (int i = 0; i < boxes.size(); ++i) {
+    has_bounds[i] = boxes[i].LooseBounds(&bounds[i]);
+    if (has_bounds[i]) {
+      all_bounds.push_back(bounds[i]);
+    }
+  }
+  EXPECT_LT(all_bounds.size(), boxes.size());
+
+  BEVGridIndex index(BEVGridIndex::CellSizeFor(all_bounds));
+  for (int i = 0; i < boxes.size(); ++i) {
+    if (has_bounds[i]) {
+      index.Insert(i, bounds[i]);
+    }
+  }
+
+  std::vector<int> ids;
+  int num_pairs = 0;
+  for (int i = 0; i < boxes.size(); ++i) {
+    if (!has_bounds[i]) {
+      // The IoU of boxes without bounds is always 0.
+      for (int j = 0; j < boxes.size(); ++j) {
+        EXPECT_EQ(0, boxes[i].IoU(boxes[j]));
+      }
+      continue;
+    }
+    index.Query(bounds[i], &ids);
+    EXPECT_TRUE(std::is_sorted(ids.begin(), ids.end()));
+    EXPECT_EQ(ids.end(), std::adjacent_find(ids.begin(), ids.end()));
+    num_pairs += ids.size();
+    for (int j = 0; j < boxes.size(); ++j) {
+      if (!std::binary_search(ids.begin(), ids.end(), j)) {
+        EXPECT_EQ(0, boxes[i].IoU(boxes[j])) << i << " " << j;
+      }
+    }
+  }
+  // Far fewer pairs are returned than compared by brute force.
+  EXPECT_LT(num_pairs, boxes.size() * boxes.size() / 4);
+}
+
+TEST(BEVGridIndexTest, TouchingAndUnboundedBoxes) {
+  BEVGridIndex index(1.0);
+  index.Insert(0, {0, 0, 1, 1});
+  index.Insert(1, {2.5, 0, 3.5, 0.5});
+  // Covers too many cells to be added to them.
+  index.Insert(2, {-100, -100, 100, 100});
+  index.Insert(3, {NAN, 0, 1, 1});
+
+  std::vector<int> ids;
+  index.Query({1, 1, 2, 2}, &ids);
+  EXPECT_EQ(std::vector<int>({0, 2, 3}), ids);
+  index.Query({2.2, 0.5, 2.6, 0.5}, &ids);
+  EXPECT_EQ(std::vector<int>({1, 2, 3}), ids);
+  index.Query({10, 10, 11, 11}, &ids);
+  EXPECT_EQ(std::vector<int>({2, 3}), ids);
+  // Queries covering more cells than there are non-empty ones.
+  index.Query({-1e6, -1e6, 1e6, 1e6}, &ids);
+  EXPECT_EQ(std::vector<int>({0, 1, 2, 3}), ids);
+  index.Query({0, 0, INFINITY, 0}, &ids);
+  EXPECT_EQ(std::vector<int>({0, 1, 2, 3}), ids);
+}
+
+TEST(BEVGridIndexTest, CellSizeFor) {
+  EXPECT_EQ(1.0, BEVGridIndex::CellSizeFor({}));
+  EXPECT_EQ(2.0, BEVGridIndex::CellSizeFor({{0, 0, 1, 0.5},
+                                            {0, 0, 0.5, 0.5},
+                                            {0, 0, 2, 1},
+                                            {0, 0, 1, 3},
+                                            {NAN, 0, 1, 1},
+                                            {0, 0, 100, 1}}));
+}
+
+}  // namespace
+}  // namespace box
+}  // namespace lingvo
+}  // namespace tensorflow
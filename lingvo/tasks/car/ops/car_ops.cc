@@ -119,7 +119,8 @@ Greedily selects the top subset of 3D (7 DOF format) bounding boxes per class.
 
 This implementation is rotation and class aware, and for each class takes the
 best boxes that are above our score_threshold and also don't overlap more than
-our nms_iou_threshold with any better scoring boxes.
+our nms_iou_threshold with any better scoring boxes. Boxes are indexed in a
+bird's-eye view grid, so that each box is only compared with the nearby boxes.
 
 bboxes: A tf.float32 Tensor of shape [num_bboxes, 7] where the box is of
   format [center_x, center_y, center_z, dim_x, dim_y, dim_z, heading].
@@ -57,6 +57,14 @@ float Box2D::Overlap(const Box2D& other) const {
   return intersection > 0 ? intersection / Area() : 0.0;
 }
 
+bool Box2D::LooseBounds(box::BEVBounds* bounds) const {
+  bounds->min_x = x.min;
+  bounds->min_y = y.min;
+  bounds->max_x = x.max;
+  bounds->max_y = y.max;
+  return true;
+}
+
 namespace KITTI {
 bool IsBetterMatch(const MatchResult& match1, const MatchResult& match2,
                    MatchingCriterion criterion) {
@@ -16,10 +16,11 @@ limitations under the License.
 #ifndef THIRD_PARTY_PY_LINGVO_TASKS_CAR_OPS_IMAGE_METRICS_H_
 #define THIRD_PARTY_PY_LINGVO_TASKS_CAR_OPS_IMAGE_METRICS_H_
 
-#include <list>
+#include <numeric>
 #include <unordered_map>
 #include <vector>
 
+#include "lingvo/tasks/car/ops/box_util.h"
 #include "tensorflow/core/framework/tensor.h"
 
 namespace tensorflow {
@@ -44,6 +45,9 @@ struct Box2D {
   // Intersection of this box and the given box normalized over the area of
   // this box.
   float Overlap(const Box2D& other) const;
+  // Sets '*bounds' to the box and returns true. See
+  // box::Upright3DBox::LooseBounds().
+  bool LooseBounds(box::BEVBounds* bounds) const;
 };
 
 // If the value is:
@@ -68,6 +72,27 @@ struct Detection {
   IgnoreType ignore = IgnoreType::kDontIgnore;
 };
 
+// Returns a box::BEVGridIndex of the bounds of 'boxes', with their indices as
+// ids. Boxes without bounds, whose IoU with any box is 0, are left out.
+template <class BoxType>
+box::BEVGridIndex MakeBEVGridIndex(
+    const std::vector<Detection<BoxType>>& boxes) {
+  std::vector<box::BEVBounds> bounds;
+  std::vector<int> ids;
+  for (int i = 0; i < boxes.size(); ++i) {
+    box::BEVBounds b;
+    if (boxes[i].box.LooseBounds(&b)) {
+      bounds.push_back(b);
+      ids.push_back(i);
+    }
+  }
+  box::BEVGridIndex index(box::BEVGridIndex::CellSizeFor(bounds));
+  for (int k = 0; k < ids.size(); ++k) {
+    index.Insert(ids[k], bounds[k]);
+  }
+  return index;
+}
+
 // Precision and recall.
 struct PR {
   float p = 0;
@@ -89,9 +114,13 @@ class AveragePrecision {
   //  in the image pixel space and the interval is close on both ends. I.e., the
   //  length of an interval is interval.max - interval.min + 1.
   //  NOTE: voc_eval.py used by Fast-RCNN sets normalized_coordinate=false.
+  // use_bev_grid_index: If true, the IoU of a prediction is only computed with
+  //  the groundtruth boxes near it, found via a box::BEVGridIndex. This gives
+  //  the same results as computing all IoUs, in less time. Default: true.
   struct Options {
     float iou_threshold = 0.5;
     int num_recall_points = 100;
+    bool use_bev_grid_index = true;
   };
   AveragePrecision() : AveragePrecision(Options()) {}
   explicit AveragePrecision(const Options& opts) : opts_(opts) {}
@@ -191,7 +220,7 @@ float AveragePrecision<BoxType>::FromBoxes(
     const std::vector<Detection<BoxType>>& prediction,
     std::vector<PR>* pr_out) {
   // Index ground truth boxes based on imageid.
-  std::unordered_map<int64_t, std::list<Detection<BoxType>>> gt;
+  std::unordered_map<int64_t, std::vector<Detection<BoxType>>> gt;
   int num_gt = 0;
   for (auto& box : groundtruth) {
     gt[box.imgid].push_back(box);
@@ -204,6 +233,21 @@ float AveragePrecision<BoxType>::FromBoxes(
     return NAN;
   }
 
+  // Whether each ground truth box has been matched and can't be matched
+  // anymore.
+  std::unordered_map<int64_t, std::vector<bool>> gt_erased;
+  // Ground truth boxes of each image, indexed by their bounds. A prediction
+  // only matches a box with IoU >= iou_threshold, which for a positive
+  // threshold is only possible for boxes near it.
+  const bool use_index = opts_.use_bev_grid_index && opts_.iou_threshold > 0;
+  std::unordered_map<int64_t, box::BEVGridIndex> gt_index;
+  for (const auto& it : gt) {
+    gt_erased[it.first].assign(it.second.size(), false);
+    if (use_index) {
+      gt_index.emplace(it.first, MakeBEVGridIndex(it.second));
+    }
+  }
+
   // Sort all predicted boxes by their scores in a non-ascending order.
   std::vector<Detection<BoxType>> pd = prediction;
   std::sort(pd.begin(), pd.end(),
@@ -215,33 +259,49 @@ float AveragePrecision<BoxType>::FromBoxes(
   std::vector<PR> pr;
   int correct = 0;
   int num_pd = 0;
+  std::vector<int> candidates;
   for (int i = 0; i < pd.size(); ++i) {
     const Detection<BoxType>& b = pd[i];
-    auto* g = &gt[b.imgid];
-    auto best = g->end();
+    const auto& g = gt[b.imgid];
+    auto& erased = gt_erased[b.imgid];
+    if (use_index) {
+      candidates.clear();
+      box::BEVBounds bounds;
+      const auto index = gt_index.find(b.imgid);
+      if (index != gt_index.end() && b.box.LooseBounds(&bounds)) {
+        index->second.Query(bounds, &candidates);
+      }
+    } else {
+      candidates.resize(g.size());
+      std::iota(candidates.begin(), candidates.end(), 0);
+    }
+    int best = -1;
     float best_iou = -INFINITY;
-    for (auto it = g->begin(); it != g->end(); ++it) {
-      const auto iou = b.box.IoU(it->box);
+    for (const int j : candidates) {
+      if (erased[j]) {
+        continue;
+      }
+      const auto iou = b.box.IoU(g[j].box);
       if (iou > best_iou) {
-        best = it;
+        best = j;
         best_iou = iou;
       }
     }
-    if ((best != g->end()) && (best_iou >= opts_.iou_threshold)) {
-      if (best->difficult) {
+    if ((best != -1) && (best_iou >= opts_.iou_threshold)) {
+      if (g[best].difficult) {
         continue;
       }
-      switch (best->ignore) {
+      switch (g[best].ignore) {
         case kDontIgnore: {
           ++correct;
           ++num_pd;
-          g->erase(best);
+          erased[best] = true;
           pr.push_back({static_cast<float>(correct) / num_pd,
                         static_cast<float>(correct) / num_gt});
           break;
         }
         case kIgnoreOneMatch: {
-          g->erase(best);
+          erased[best] = true;
           break;
         }
         case kIgnoreAllMatches: {
@@ -292,14 +352,37 @@ float ComputePrecision(
     const std::unordered_map<int64_t, std::vector<MatchResult>>& pd_assignments,
     const float score_threshold);
 
+// Sets (*nearby)[i] to the sorted indices of the 'others' whose IoU with
+// boxes[i] may be positive, found via a box::BEVGridIndex of 'others'.
+template <class BoxType>
+void FindNearbyBoxes(const std::vector<Detection<BoxType>>& boxes,
+                     const std::vector<Detection<BoxType>>& others,
+                     std::vector<std::vector<int>>* nearby) {
+  const box::BEVGridIndex index = MakeBEVGridIndex(others);
+  nearby->clear();
+  nearby->resize(boxes.size());
+  for (int i = 0; i < boxes.size(); ++i) {
+    box::BEVBounds b;
+    // Boxes without bounds have an IoU of 0 with every box.
+    if (boxes[i].box.LooseBounds(&b)) {
+      index.Query(b, &(*nearby)[i]);
+    }
+  }
+}
+
 // Match groundtruth with predictions from one scene.
+//
+// If nearby_predictions is not null, it is the output of
+// FindNearbyBoxes(groundtruth, prediction), and a groundtruth is only compared
+// with the predictions near it. The results are the same.
 template <class BoxType>
-void MatchOneScene(const std::vector<Detection<BoxType>>& groundtruth,
-                   const std::vector<Detection<BoxType>>& prediction,
-                   const MatchingCriterion criterion, const float iou_threshold,
-                   const float score_threshold,
-                   std::vector<MatchResult>* gt_assignment,
-                   std::vector<MatchResult>* pd_assignment) {
+void MatchOneScene(
+    const std::vector<Detection<BoxType>>& groundtruth,
+    const std::vector<Detection<BoxType>>& prediction,
+    const MatchingCriterion criterion, const float iou_threshold,
+    const float score_threshold, std::vector<MatchResult>* gt_assignment,
+    std::vector<MatchResult>* pd_assignment,
+    const std::vector<std::vector<int>>* nearby_predictions = nullptr) {
   gt_assignment->clear();
   pd_assignment->clear();
   gt_assignment->resize(groundtruth.size());
@@ -309,13 +392,26 @@ void MatchOneScene(const std::vector<Detection<BoxType>>& groundtruth,
     pd_assignment->at(j_pd).detection_score = prediction[j_pd].score;
     pd_assignment->at(j_pd).pd_ignore_type = prediction[j_pd].ignore;
   }
+
+  // Matches need IoU > iou_threshold, which for a non-negative threshold is
+  // only possible for predictions near the groundtruth.
+  const bool use_nearby = nearby_predictions != nullptr && iou_threshold >= 0;
+  // Otherwise all predictions are compared, in the same increasing order, so
+  // that ties are broken the same way.
+  std::vector<int> all_predictions;
+  if (!use_nearby) {
+    all_predictions.resize(prediction.size());
+    std::iota(all_predictions.begin(), all_predictions.end(), 0);
+  }
+
   for (int i_gt = 0; i_gt < groundtruth.size(); ++i_gt) {
     if (groundtruth[i_gt].ignore == IgnoreType::kIgnoreAllMatches) {
       continue;
     }
     MatchResult best_matched_pd;
     best_matched_pd.gt_ignore_type = groundtruth[i_gt].ignore;
-    for (int j_pd = 0; j_pd < prediction.size(); ++j_pd) {
+    for (const int j_pd : use_nearby ? nearby_predictions->at(i_gt)
+                                     : all_predictions) {
       // For this groundtruth, find the best unassigned prediction that matches.
       if (pd_assignment->at(j_pd).matched_idx != kUnMatched ||
           prediction[j_pd].score < score_threshold) {
@@ -355,6 +451,8 @@ void MatchOneScene(const std::vector<Detection<BoxType>>& groundtruth,
 //   score_thresold: predictions with score lower than this are ignored.
 //   gt_assignments: the matching results for every groundtruth.
 //   pd_assignments: the matching results for every prediction.
+//   nearby_predictions: optional image_id -> nearby predictions mapping. See
+//     MatchOneScene().
 template <class BoxType>
 void MatchAll(
     const std::unordered_map<int64_t, std::vector<Detection<BoxType>>>&
@@ -364,7 +462,9 @@ void MatchAll(
     const MatchingCriterion criterion, const float iou_threshold,
     const float score_threshold,
     std::unordered_map<int64_t, std::vector<MatchResult>>* gt_assignments,
-    std::unordered_map<int64_t, std::vector<MatchResult>>* pd_assignments) {
+    std::unordered_map<int64_t, std::vector<MatchResult>>* pd_assignments,
+    const std::unordered_map<int64_t, std::vector<std::vector<int>>>*
+        nearby_predictions = nullptr) {
   CHECK_EQ(groundtruth.size(), prediction.size());
   std::vector<int64_t> all_img_keys;
   for (const auto& gt_iter : groundtruth) {
@@ -375,7 +475,10 @@ void MatchAll(
     const auto& gt = gt_iter.second;
     const auto& pd = pd_iter->second;
     MatchOneScene(gt, pd, criterion, iou_threshold, score_threshold,
-                  &((*gt_assignments)[img_id]), &((*pd_assignments)[img_id]));
+                  &((*gt_assignments)[img_id]), &((*pd_assignments)[img_id]),
+                  nearby_predictions == nullptr
+                      ? nullptr
+                      : &nearby_predictions->at(img_id));
   }
 }
 
@@ -415,11 +518,21 @@ float AveragePrecision<BoxType>::FromBoxesKITTI(
       gt_bins[box.imgid] = std::vector<Detection<BoxType>>();
     }
   }
+  // The predictions near each groundtruth, found once for all passes.
+  std::unordered_map<int64_t, std::vector<std::vector<int>>> nearby_predictions;
+  if (opts_.use_bev_grid_index) {
+    for (const auto& gt_iter : gt_bins) {
+      KITTI::FindNearbyBoxes(gt_iter.second, pd_bins[gt_iter.first],
+                             &nearby_predictions[gt_iter.first]);
+    }
+  }
+  const auto* nearby =
+      opts_.use_bev_grid_index ? &nearby_predictions : nullptr;
   // Pass 1 matching: find overlapping detection of best score.
   std::unordered_map<int64_t, std::vector<KITTI::MatchResult>> gt_assignments;
   std::unordered_map<int64_t, std::vector<KITTI::MatchResult>> pd_assignments;
   KITTI::MatchAll(gt_bins, pd_bins, KITTI::kBestScore, opts_.iou_threshold, 0,
-                  &gt_assignments, &pd_assignments);
+                  &gt_assignments, &pd_assignments, nearby);
   for (int i = 0; i < prediction.size(); ++i) {
     const int image_id = index_to_image_id[i];
     const int prediction_index = index_to_prediction_index[i];
@@ -446,7 +559,7 @@ float AveragePrecision<BoxType>::FromBoxesKITTI(
     // Pass 2 matching: find detection above the score threshold with largest
     // overlap.
     KITTI::MatchAll(gt_bins, pd_bins, KITTI::kBestIoU, opts_.iou_threshold,
-                    thresholds[i], &gt_assignments, &pd_assignments);
+                    thresholds[i], &gt_assignments, &pd_assignments, nearby);
     const float precision =
         KITTI::ComputePrecision(pd_assignments, thresholds[i]);
     const float recall = static_cast<float>(i) / (opts_.num_recall_points - 1);
@@ -0,0 +1,171 @@
+/* Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+==============================================================================*/
+#include "lingvo/tasks/car/ops/image_metrics.h"
+
+#include <cmath>
+#include <random>
+#include <vector>
+
+#include <gtest/gtest.h>
+#include "lingvo/tasks/car/ops/box_util.h"
+#include "tensorflow/core/platform/test_benchmark.h"
+
+namespace tensorflow {
+namespace lingvo {
+namespace image {
+namespace {
+
+using Detections = std::vector<Detection<box::Upright3DBox>>;
+
+box::Upright3DBox RandomBox(std::mt19937* rng) {
+  std::uniform_real_distribution<double> center(-40, 40);
+  std::uniform_real_distribution<double> dim(0.5, 4);
+  std::uniform_real_distribution<double> heading(-M_PI, M_PI);
+  return box::Upright3DBox({center(*rng), center(*rng), 0, dim(*rng),
+                            dim(*rng), dim(*rng), heading(*rng)});
+}
+
+// Generates n random groundtruth boxes in each of num_images images, a few of
+// them ignored or invalid.
+Detections GenerateGroundtruth(int num_images, int n, std::mt19937* rng) {
+  std::uniform_int_distribution<int> choice(0, 99);
+  Detections gt;
+  for (int image = 0; image < num_images; ++image) {
+    for (int i = 0; i < n; ++i) {
+      Detection<box::Upright3DBox> g;
+      g.imgid = image;
+      g.box = RandomBox(rng);
+      const int c = choice(*rng);
+      if (c < 5) {
+        g.ignore = kIgnoreOneMatch;
+      } else if (c < 8) {
+        g.ignore = kIgnoreAllMatches;
+      } else if (c < 10) {
+        g.box.z_max = g.box.z_min;
+      }
+      gt.push_back(g);
+    }
+  }
+  return gt;
+}
+
+// Generates n predictions per image. 40% of them are copies of groundtruth
+// boxes, most with a jittered height to vary their IoU, which also makes for
+// ties in IoU and score.
+Detections GeneratePredictions(const Detections& gt, int num_images, int n,
+                               std::mt19937* rng) {
+  std::uniform_real_distribution<double> jitter(-0.5, 0.5);
+  std::uniform_int_distribution<int> choice(0, 99);
+  std::uniform_int_distribution<int> gt_index(0, gt.size() - 1);
+  Detections pd;
+  for (int image = 0; image < num_images; ++image) {
+    for (int i = 0; i < n; ++i) {
+      Detection<box::Upright3DBox> p;
+      p.imgid = image;
+      p.score = choice(*rng) / 100.0;
+      p.box = RandomBox(rng);
+      const int c = choice(*rng);
+      if (c < 40) {
+        const auto& g = gt[gt_index(*rng)];
+        p.imgid = g.imgid;
+        p.box = g.box;
+        if (c >= 10) {
+          p.box.z_min += jitter(*rng);
+          p.box.z_max += jitter(*rng);
+        }
+      }
+      if (c % 10 == 0) {
+        p.ignore = kIgnoreOneMatch;
+      }
+      pd.push_back(p);
+    }
+  }
+  return pd;
+}
+
+void ExpectSameAP(const Detections& gt, const Detections& pd,
+                  float iou_threshold) {
+  AveragePrecision<box::Upright3DBox>::Options opts;
+  opts.iou_threshold = iou_threshold;
+  opts.num_recall_points = 41;
+  AveragePrecision<box::Upright3DBox>::Options brute_force_opts = opts;
+  brute_force_opts.use_bev_grid_index = false;
+
+  std::vector<PR> pr, expected_pr;
+  std::vector<float> is_hit, expected_is_hit, score, expected_score;
+  const float ap = AveragePrecision<box::Upright3DBox>(opts).FromBoxesKITTI(
+      gt, pd, &pr, &is_hit, &score);
+  const float expected_ap =
+      AveragePrecision<box::Upright3DBox>(brute_force_opts)
+          .FromBoxesKITTI(gt, pd, &expected_pr, &expected_is_hit,
+                          &expected_score);
+  EXPECT_EQ(expected_ap, ap);
+  EXPECT_EQ(expected_is_hit, is_hit);
+  EXPECT_EQ(expected_score, score);
+  ASSERT_EQ(expected_pr.size(), pr.size());
+  for (int i = 0; i < pr.size(); ++i) {
+    EXPECT_EQ(expected_pr[i].p, pr[i].p);
+    EXPECT_EQ(expected_pr[i].r, pr[i].r);
+  }
+
+  pr.clear();
+  expected_pr.clear();
+  const float voc_ap =
+      AveragePrecision<box::Upright3DBox>(opts).FromBoxes(gt, pd, &pr);
+  const float expected_voc_ap =
+      AveragePrecision<box::Upright3DBox>(brute_force_opts)
+          .FromBoxes(gt, pd, &expected_pr);
+  EXPECT_EQ(expected_voc_ap, voc_ap);
+  ASSERT_EQ(expected_pr.size(), pr.size());
+  for (int i = 0; i < pr.size(); ++i) {
+    EXPECT_EQ(expected_pr[i].p, pr[i].p);
+    EXPECT_EQ(expected_pr[i].r, pr[i].r);
+  }
+}
+
+TEST(AveragePrecisionTest, BEVGridIndexGivesSameResults) {
+  std::mt19937 rng(39183);
+  const Detections gt = GenerateGroundtruth(5, 100, &rng);
+  // Image 5 has predictions only.
+  const Detections pd = GeneratePredictions(gt, 6, 300, &rng);
+  for (const float iou_threshold : {-1.f, 0.f, 0.1f, 0.5f, 0.7f}) {
+    ExpectSameAP(gt, pd, iou_threshold);
+  }
+}
+
+#if defined(PLATFORM_GOOGLE)
+
+void BM_FromBoxesKITTI(benchmark::State& state) {
+  std::mt19937 rng(39183);
+  const Detections gt = GenerateGroundtruth(1, state.range(0), &rng);
+  const Detections pd = GeneratePredictions(gt, 1, 5 * state.range(0), &rng);
+  AveragePrecision<box::Upright3DBox>::Options opts;
+  opts.num_recall_points = 41;
+  opts.use_bev_grid_index = state.range(1);
+  std::vector<PR> pr;
+  for (auto _ : state) {
+    AveragePrecision<box::Upright3DBox>(opts).FromBoxesKITTI(gt, pd, &pr,
+                                                             nullptr, nullptr);
+  }
+}
+
+BENCHMARK(BM_FromBoxesKITTI)->RangePair(16, 1024, 0, 1);
+
+#endif
+
+}  // namespace
+}  // namespace image
+}  // namespace lingvo
+}  // namespace tensorflow
@@ -134,6 +134,21 @@ class NonMaxSuppression3DOp : public OpKernel {
       return iou;
     };
 
+    // A box can only have a positive IoU with boxes whose loose bird's-eye
+    // view bounds overlap its own, so each candidate only needs to be
+    // compared with the selected boxes near it, found via a grid index.
+    std::vector<box::BEVBounds> bounds(num_bboxes);
+    std::vector<bool> has_bounds(num_bboxes);
+    std::vector<box::BEVBounds> all_bounds;
+    for (int box_idx = 0; box_idx < num_bboxes; ++box_idx) {
+      has_bounds[box_idx] = boxes[box_idx].LooseBounds(&bounds[box_idx]);
+      if (has_bounds[box_idx]) {
+        all_bounds.push_back(bounds[box_idx]);
+      }
+    }
+    const double cell_size = box::BEVGridIndex::CellSizeFor(all_bounds);
+    std::vector<int> nearby_selected;
+
     for (int cls_idx = 0; cls_idx < num_classes; ++cls_idx) {
       // Use priority queue to sort candidates above the score threshold
       std::priority_queue<Candidate, std::deque<Candidate>, decltype(score_cmp)>
@@ -145,6 +160,11 @@ class NonMaxSuppression3DOp : public OpKernel {
         }
       }
 
+      // Boxes far apart have an IoU of 0, which only suppresses candidates
+      // if the threshold is negative.
+      const bool use_index = t_nms_iou_threshold(cls_idx) >= 0;
+      box::BEVGridIndex selected_index(cell_size);
+
       std::vector<Candidate> selected;
       Candidate next_candidate;
       while ((selected.size() < max_boxes_per_class_) &&
@@ -152,22 +172,40 @@ class NonMaxSuppression3DOp : public OpKernel {
         next_candidate = candidate_priority_queue.top();
         candidate_priority_queue.pop();
 
-        // Idea taken from tensorflow/core/kernels/non_max_suppression_op.cc
-        // Overlapping boxes are likely to have similar scores,
-        // therefore we iterate through the previously selected boxes backwards
-        // in order to see if `next_candidate` should be suppressed.
         bool should_select = true;
-        for (int selected_idx = static_cast<int>(selected.size()) - 1;
-             selected_idx >= 0; --selected_idx) {
-          if (get_iou(next_candidate.box_idx, selected[selected_idx].box_idx) >
-              t_nms_iou_threshold(cls_idx)) {
-            should_select = false;
-            break;
+        const int box_idx = next_candidate.box_idx;
+        if (use_index) {
+          // Boxes without bounds have an IoU of 0 with every box.
+          if (has_bounds[box_idx]) {
+            selected_index.Query(bounds[box_idx], &nearby_selected);
+            for (const int selected_box_idx : nearby_selected) {
+              if (get_iou(box_idx, selected_box_idx) >
+                  t_nms_iou_threshold(cls_idx)) {
+                should_select = false;
+                break;
+              }
+            }
+          }
+        } else {
+          // Idea taken from tensorflow/core/kernels/non_max_suppression_op.cc
+          // Overlapping boxes are likely to have similar scores, therefore we
+          // iterate through the previously selected boxes backwards in order
+          // to see if `next_candidate` should be suppressed.
+          for (int selected_idx = static_cast<int>(selected.size()) - 1;
+               selected_idx >= 0; --selected_idx) {
+            if (get_iou(box_idx, selected[selected_idx].box_idx) >
+                t_nms_iou_threshold(cls_idx)) {
+              should_select = false;
+              break;
+            }
           }
         }
 
         if (should_select) {
           selected.push_back(next_candidate);
+          if (use_index && has_bounds[box_idx]) {
+            selected_index.Insert(box_idx, bounds[box_idx]);
+          }
         }
       }
 
@@ -18,6 +18,7 @@ import unittest
 from lingvo import compat as tf
 from lingvo.core import test_utils
 from lingvo.tasks.car import ops
+import numpy as np
 
 
 class Nms3dOpTest(test_utils.TestCase):
@@ -157,6 +158,54 @@ class Nms3dOpTest(test_utils.TestCase):
         self.assertAllEqual(per_class_scores[0, per_class_mask],
                             multiclass_scores[cls_idx, multiclass_mask])
 
+  def _BruteForceNMS(self, iou, scores, nms_iou_threshold, score_threshold,
+                     max_boxes_per_class):
+    """Greedy NMS comparing each candidate with every selected box."""
+    expected_indices = []
+    for cls_idx in range(scores.shape[1]):
+      selected = []
+      for box_idx in np.argsort(-scores[:, cls_idx], kind='stable'):
+        if len(selected) == max_boxes_per_class:
+          break
+        if scores[box_idx, cls_idx] < score_threshold[cls_idx]:
+          break
+        if all(iou[box_idx, j] <= nms_iou_threshold[cls_idx] for j in selected):
+          selected.append(box_idx)
+      expected_indices.append(selected)
+    return expected_indices
+
+  def testMatchesBruteForce(self):
+    # Clusters of boxes spread over a large area, some of them invalid, so that
+    # each box only overlaps a few others.
+    np.random.seed(12345)
+    num_bboxes = 1000
+    centers = np.repeat(
+        np.random.uniform(-40, 40, size=(num_bboxes // 10, 3)), 10, axis=0)
+    bboxes_3d = np.concatenate([
+        centers + np.random.normal(scale=0.5, size=(num_bboxes, 3)),
+        np.random.uniform(0.5, 4, size=(num_bboxes, 3)),
+        np.random.uniform(-np.pi, np.pi, size=(num_bboxes, 1))
+    ],
+                               axis=1).astype(np.float32)
+    bboxes_3d[::37, 3] = 0.
+    class_scores = np.random.uniform(size=(num_bboxes, 4)).astype(np.float32)
+    # Non-positive thresholds suppress boxes with an IoU of 0.
+    nms_iou_threshold = np.array([0.1, 0.5, 0., -0.1], dtype=np.float32)
+    score_threshold = [0.1] * 4
+    with self.session():
+      iou = self.evaluate(ops.pairwise_iou3d(bboxes_3d, bboxes_3d))
+    for max_boxes_per_class in [10, num_bboxes]:
+      self._TestNMSOp(
+          bboxes_3d,
+          class_scores,
+          nms_iou_threshold=nms_iou_threshold,
+          score_threshold=score_threshold,
+          max_boxes_per_class=max_boxes_per_class,
+          expected_indices=self._BruteForceNMS(iou, class_scores,
+                                               nms_iou_threshold,
+                                               score_threshold,
+                                               max_boxes_per_class))
+
   @unittest.skip('Speed benchmark')
   def testSpeed(self):
     num_bboxes_list = [500, 1000, 10000]
@@ -0,0 +1,66 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+r"""Converts a TFRecord crop database into an indexed GroundTruthDB file.
+
+The input is the output of create_kitti_crop_dataset.py (or any TFRecord of
+crops in the same format). The output can be used by GroundTruthAugmentor via
+its `groundtruth_db_file` param.
+
+To run:
+
+bazel run -c opt //lingvo/tasks/car/tools:create_groundtruth_db -- \
+  --input_file_pattern=/path/to/gt_objects-*-of-00100 \
+  --output_file=/path/to/gt_objects.npmap
+"""
+
+from absl import app
+from absl import flags
+from lingvo import compat as tf
+from lingvo.tasks.car import groundtruth_db
+
+flags.DEFINE_string('input_file_pattern', None,
+                    'TFRecord file pattern of the crop database.')
+flags.DEFINE_string('output_file', None, 'The GroundTruthDB file to write.')
+
+FLAGS = flags.FLAGS
+
+
+def _AddExample(writer, serialized):
+  """Adds the object of a serialized crop tf.Example to `writer`."""
+  feature = tf.train.Example.FromString(serialized).features.feature
+  writer.Add(
+      points_xyz=list(feature['points'].float_list.value),
+      points_feature=list(feature['points_feature'].float_list.value),
+      bbox_3d=list(feature['bbox_3d'].float_list.value),
+      label=feature['label'].int64_list.value[0],
+      difficulty=feature['difficulty'].int64_list.value[0])
+
+
+def main(argv):
+  del argv
+  writer = groundtruth_db.GroundTruthDBWriter()
+  num_objects = 0
+  for path in sorted(tf.io.gfile.glob(FLAGS.input_file_pattern)):
+    for serialized in tf.io.tf_record_iterator(path):
+      _AddExample(writer, serialized)
+      num_objects += 1
+  writer.Write(FLAGS.output_file)
+  print(f'Wrote {num_objects} objects to {FLAGS.output_file}.')
+
+
+if __name__ == '__main__':
+  flags.mark_flag_as_required('input_file_pattern')
+  flags.mark_flag_as_required('output_file')
+  app.run(main)
@@ -18,17 +18,22 @@ from lingvo import compat as tf
 import numpy as np
 
 
-def LoadVeloBinFile(filepath):
+def LoadVeloBinFile(filepath, mmap=False):
   """Reads and parse raw KITTI velodyne binary file.
 
   Args:
     filepath: Path to a raw KITTI velodyne binary file.
+    mmap: If True, memory-maps the file instead of reading it into a new
+      buffer. Only supported for local files.
 
   Returns:
     A dictionary with keys xyz and reflectance containing numpy arrays.
   """
-  with tf.io.gfile.GFile(filepath, 'rb') as f:
-    scan = np.frombuffer(f.read(), dtype=np.float32).reshape((-1, 4))
+  if mmap:
+    scan = np.memmap(filepath, dtype=np.float32, mode='r').reshape((-1, 4))
+  else:
+    with tf.io.gfile.GFile(filepath, 'rb') as f:
+      scan = np.frombuffer(f.read(), dtype=np.float32).reshape((-1, 4))
   xyz = scan[:, :3]
   reflectance = scan[:, 3:]
   return {
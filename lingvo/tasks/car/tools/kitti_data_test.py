@@ -14,6 +14,8 @@
 # ==============================================================================
 """Tests for kitti_data."""
 
+import os
+
 from lingvo import compat as tf
 from lingvo.core import test_helper
 from lingvo.core import test_utils
@@ -44,6 +46,15 @@ class KittiDataTest(test_utils.TestCase):
     self.assertEqual(objects[1]['rotation_y'], 1.57)
     self.assertEqual(objects[1]['score'], -1.)
 
+  def testLoadVeloBinFile(self):
+    scan = np.arange(20, dtype=np.float32).reshape([5, 4])
+    filepath = os.path.join(self.get_temp_dir(), 'velodyne.bin')
+    scan.tofile(filepath)
+    for mmap in (False, True):
+      velo = kitti_data.LoadVeloBinFile(filepath, mmap=mmap)
+      self.assertAllEqual(scan[:, :3], velo['xyz'])
+      self.assertAllEqual(scan[:, 3:], velo['reflectance'])
+
   def testLoadCalibrationFile(self):
     calib = kitti_data.LoadCalibrationFile(self._calib_file)
 
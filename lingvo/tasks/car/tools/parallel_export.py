@@ -0,0 +1,159 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Local multi-process driver to export datasets to sharded TFRecords.
+
+Inputs (e.g. frame names or serialized frame protos) are converted to
+serialized records by a pool of worker processes on a single machine, and
+written round-robin to `{output_path}-{shard:05d}-of-{num_shards:05d}`. Records
+are written in input order, so the output does not depend on the number of
+workers.
+"""
+
+import collections
+import multiprocessing
+import time
+
+from absl import logging
+from lingvo import compat as tf
+
+ExportStats = collections.namedtuple(
+    'ExportStats', ['num_inputs', 'num_records', 'num_bytes', 'elapsed_secs'])
+
+
+def ShardedFilenames(output_path, num_shards):
+  """Returns the names of the `num_shards` output files of `output_path`."""
+  return [
+      '{}-{:05d}-of-{:05d}'.format(output_path, index, num_shards)
+      for index in range(num_shards)
+  ]
+
+
+class _ProgressReporter:
+  """Periodically logs the progress and throughput of an export."""
+
+  def __init__(self, num_inputs, interval_secs):
+    self._num_inputs = num_inputs
+    self._interval_secs = interval_secs
+    self._start = time.time()
+    self._last_report = self._start
+    self._stats = ExportStats(0, 0, 0, 0.)
+
+  def Update(self, records):
+    s = self._stats
+    self._stats = ExportStats(s.num_inputs + 1, s.num_records + len(records),
+                              s.num_bytes + sum(len(r) for r in records), 0.)
+    now = time.time()
+    if now - self._last_report >= self._interval_secs:
+      self._last_report = now
+      self._Log(now)
+
+  def _Log(self, now):
+    s = self._stats
+    elapsed = max(now - self._start, 1e-6)
+    progress = '%d' % s.num_inputs
+    eta = ''
+    if self._num_inputs:
+      progress += ' of %d' % self._num_inputs
+      eta = ', ETA %.0fs' % (
+          (self._num_inputs - s.num_inputs) * elapsed / max(s.num_inputs, 1))
+    logging.info(
+        'Converted %s inputs (%.1f inputs/s) into %d records, %.1f MB '
+        '(%.1f MB/s)%s.', progress, s.num_inputs / elapsed, s.num_records,
+        s.num_bytes / 1e6, s.num_bytes / 1e6 / elapsed, eta)
+
+  def Done(self):
+    now = time.time()
+    self._Log(now)
+    return self._stats._replace(elapsed_secs=now - self._start)
+
+
+def _ConvertInPool(inputs, convert_fn, num_workers, worker_initializer,
+                   max_in_flight):
+  """Yields `convert_fn(x)` for all `inputs`, computed by worker processes."""
+  # Workers are started fresh rather than forked, as forking a process that
+  # already runs TensorFlow threads is unsafe.
+  context = multiprocessing.get_context('spawn')
+  with context.Pool(num_workers, initializer=worker_initializer) as pool:
+    # Unlike Pool.imap(), only keeps a bounded number of inputs and results in
+    # memory, so that `inputs` can be a stream larger than memory.
+    pending = collections.deque()
+    for x in inputs:
+      pending.append(pool.apply_async(convert_fn, (x,)))
+      if len(pending) >= max_in_flight:
+        yield pending.popleft().get()
+    while pending:
+      yield pending.popleft().get()
+
+
+def ExportToTFRecords(inputs,
+                      convert_fn,
+                      output_path,
+                      num_shards=1,
+                      num_workers=1,
+                      worker_initializer=None,
+                      max_in_flight=None,
+                      report_interval_secs=60.):
+  """Converts `inputs` with `convert_fn` and writes sharded TFRecords.
+
+  Args:
+    inputs: An iterable of inputs. It is consumed lazily. With num_workers > 1,
+      the inputs must be picklable.
+    convert_fn: A function from an input to a list of serialized records. With
+      num_workers > 1, it must be picklable, e.g. a module-level function or a
+      functools.partial of one.
+    output_path: Prefix of the output files. See `ShardedFilenames`.
+    num_shards: Number of output files. Record i is written to shard
+      `i % num_shards`.
+    num_workers: Number of worker processes. If 1, inputs are converted in this
+      process.
+    worker_initializer: Optional function called once in each worker process
+      before converting inputs.
+    max_in_flight: Maximum number of inputs being converted or waiting to be
+      written at any time. Defaults to 4 * num_workers.
+    report_interval_secs: Interval between progress reports.
+
+  Returns:
+    An `ExportStats`.
+  """
+  if num_shards <= 0:
+    raise ValueError('TFRecord dataset must have at least one shard.')
+  try:
+    num_inputs = len(inputs)
+  except TypeError:
+    num_inputs = None
+
+  if num_workers > 1:
+    results = _ConvertInPool(inputs, convert_fn, num_workers,
+                             worker_initializer, max_in_flight or
+                             4 * num_workers)
+  else:
+    results = map(convert_fn, inputs)
+
+  reporter = _ProgressReporter(num_inputs, report_interval_secs)
+  num_records = 0
+  writers = [
+      tf.io.TFRecordWriter(filename)
+      for filename in ShardedFilenames(output_path, num_shards)
+  ]
+  try:
+    for records in results:
+      for record in records:
+        writers[num_records % num_shards].write(record)
+        num_records += 1
+      reporter.Update(records)
+  finally:
+    for writer in writers:
+      writer.close()
+  return reporter.Done()
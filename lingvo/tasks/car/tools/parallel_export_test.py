@@ -0,0 +1,67 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for parallel_export."""
+
+import os
+
+from lingvo import compat as tf
+from lingvo.core import test_utils
+from lingvo.tasks.car.tools import parallel_export
+
+
+def _Convert(x):
+  # Inputs convert to 0 to 2 records.
+  return [b'%d-%d' % (x, i) for i in range(x % 3)]
+
+
+class ParallelExportTest(test_utils.TestCase):
+
+  def _ReadShards(self, output_path, num_shards):
+    return [
+        list(tf.io.tf_record_iterator(filename)) for filename in
+        parallel_export.ShardedFilenames(output_path, num_shards)
+    ]
+
+  def testSerialExport(self):
+    output_path = os.path.join(self.get_temp_dir(), 'serial')
+    stats = parallel_export.ExportToTFRecords(
+        range(5), _Convert, output_path, num_shards=2)
+    self.assertEqual(5, stats.num_inputs)
+    self.assertEqual(4, stats.num_records)
+    self.assertEqual(12, stats.num_bytes)
+    self.assertEqual([[b'1-0', b'2-1'], [b'2-0', b'4-0']],
+                     self._ReadShards(output_path, 2))
+
+  def testParallelExportMatchesSerialExport(self):
+    serial_path = os.path.join(self.get_temp_dir(), 'serial')
+    parallel_path = os.path.join(self.get_temp_dir(), 'parallel')
+    expected_stats = parallel_export.ExportToTFRecords(
+        range(100), _Convert, serial_path, num_shards=3)
+    # A generator, whose length is unknown.
+    stats = parallel_export.ExportToTFRecords(
+        (x for x in range(100)),
+        _Convert,
+        parallel_path,
+        num_shards=3,
+        num_workers=2,
+        max_in_flight=3)
+    self.assertEqual(expected_stats.num_records, stats.num_records)
+    self.assertEqual(expected_stats.num_bytes, stats.num_bytes)
+    self.assertEqual(
+        self._ReadShards(serial_path, 3), self._ReadShards(parallel_path, 3))
+
+
+if __name__ == '__main__':
+  test_utils.main()
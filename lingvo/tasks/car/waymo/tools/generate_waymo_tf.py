@@ -42,6 +42,18 @@ flags.DEFINE_string('output_filebase', None, 'Path to write output')
 FLAGS = flags.FLAGS
 
 
+class WaymoOpenDatasetConverter(beam.DoFn):
+  """Converts WaymoOpenDataset into tf.Examples.  See file docstring."""
+
+  def __init__(self, emitter_fn):
+    self._emitter_fn = emitter_fn
+    self._converter = waymo_proto_to_tfe.FrameToTFE()
+
+  def process(self, item):
+    key, output = self._converter.process(item)
+    return self._emitter_fn(key, output)
+
+
 def main(argv):
   beam_utils.BeamInit()
 
@@ -67,7 +79,7 @@ def main(argv):
         root
         | 'Read' >> reader
         | 'ConvertToTFExample' >> beam.ParDo(
-            waymo_proto_to_tfe.WaymoOpenDatasetConverter(emitter_fn))
+            WaymoOpenDatasetConverter(emitter_fn))
         | 'Write' >> writer)
 
 
@@ -0,0 +1,87 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+r"""Tool to convert Waymo Open Dataset to tf.Examples on a single machine.
+
+Same conversion as generate_waymo_tf.py, but runs without Beam, converting
+frames in a pool of local worker processes:
+
+path/to/generate_waymo_tf_local.py \
+  --input_file_pattern=/path/to/waymo/training/segment-*.tfrecord \
+  --output_filebase=/path/to/waymo/training/output \
+  --num_shards=1000 \
+  --num_workers=16
+"""
+
+import functools
+
+from absl import app
+from absl import flags
+
+from lingvo import compat as tf
+from lingvo.core import py_utils
+from lingvo.tasks.car.tools import parallel_export
+from lingvo.tasks.car.waymo.tools import waymo_proto_to_tfe
+from waymo_open_dataset import dataset_pb2
+
+flags.DEFINE_string('input_file_pattern', None, 'Path to read input')
+flags.DEFINE_string(
+    'output_filebase', None, 'Path to write output. Files are named '
+    '{output_filebase}-{shard_num}-of-{total_shards}.')
+flags.DEFINE_integer('num_shards', 1, 'Number of output shards.')
+flags.DEFINE_integer('num_workers', 1,
+                     'Number of processes converting frames in parallel.')
+
+FLAGS = flags.FLAGS
+
+
+def _ReadSerializedFrames(file_pattern):
+  for filename in sorted(tf.io.gfile.glob(file_pattern)):
+    for serialized in tf.io.tf_record_iterator(filename):
+      yield serialized
+
+
+@functools.lru_cache(maxsize=None)
+def _GetConverter():
+  """Returns the FrameToTFE of this process, created on first use."""
+  return waymo_proto_to_tfe.FrameToTFE()
+
+
+def _ConvertFrame(serialized_frame):
+  """Returns the serialized tf.Example of a frame; run in worker processes."""
+  frame = dataset_pb2.Frame.FromString(serialized_frame)
+  _, example = _GetConverter().process(frame)
+  return [example.SerializeToString()]
+
+
+def main(argv):
+  del argv
+  assert FLAGS.input_file_pattern
+  assert FLAGS.output_filebase
+
+  stats = parallel_export.ExportToTFRecords(
+      _ReadSerializedFrames(FLAGS.input_file_pattern),
+      _ConvertFrame,
+      FLAGS.output_filebase,
+      num_shards=FLAGS.num_shards,
+      num_workers=FLAGS.num_workers,
+      # FrameToTFE relies on eager execution.
+      worker_initializer=py_utils.SetEagerMode)
+  tf.logging.info('Wrote %d frames (%.1f MB) in %.1fs.', stats.num_records,
+                  stats.num_bytes / 1e6, stats.elapsed_secs)
+
+
+if __name__ == '__main__':
+  py_utils.SetEagerMode()
+  app.run(main)
@@ -175,7 +175,6 @@ bounding box corresponding to the enumeration defined in the proto.
 
 import zlib
 
-import apache_beam as beam
 from lingvo import compat as tf
 from lingvo.core import py_utils
 import numpy as np
@@ -686,15 +685,3 @@ class FrameToTFE(object):
               real_name].bytes_list.value[:] = label_ids
       feature['camera_bboxes_%s_bboxes_2d' %
               real_name].float_list.value[:] = list(bboxes)
-
-
-class WaymoOpenDatasetConverter(beam.DoFn):
-  """Converts WaymoOpenDataset into tf.Examples.  See file docstring."""
-
-  def __init__(self, emitter_fn):
-    self._emitter_fn = emitter_fn
-    self._converter = FrameToTFE()
-
-  def process(self, item):
-    key, output = self._converter.process(item)
-    return self._emitter_fn(key, output)
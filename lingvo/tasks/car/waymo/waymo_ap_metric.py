@@ -374,6 +374,9 @@ class WaymoBreakdownMetric(breakdown_metric.BreakdownMetric):
     self._average_precision_headings = {}
     self._precision_recall_headings = {}
 
+  def ComputeMetricsArgs(self):
+    return [{}]
+
   def ComputeMetrics(self, compute_metrics_fn):
     p = self.params
     tf.logging.info('Calculating waymo AP breakdowns: start')
@@ -304,6 +304,10 @@ class MilanTask(base_model.BaseTask):
     p = super().Params()
     p.Define('dual_encoder', DualEncoder.Params(),
              'Configuration of the DualEncoder to train.')
+    p.Define(
+        'corpus_retrieval_eval', None,
+        'Optional retrieval_eval.CorpusRetrievalEvaluator params. If set, '
+        'decoding reports Recall@K and MRR over the whole decoded corpus.')
     p.name = 'milan'
     return p
 
@@ -314,6 +318,7 @@ class MilanTask(base_model.BaseTask):
     p = self.params
     # Construct the model.
     self.CreateChild('dual_encoder', p.dual_encoder)
+    self._corpus_retrieval_evaluator = None
 
   def ComputePredictions(self, theta, input_batch):
     return self.dual_encoder.ComputePredictions(theta.dual_encoder, input_batch)
@@ -323,16 +328,40 @@ class MilanTask(base_model.BaseTask):
                                          input_batch)
 
   # Methods below implement parts of `BaseTask` that get called by lingvo
-  # 'decoder' jobs. The current minimal implementation just causes summaries to
-  # be generated.
+  # 'decoder' jobs. Besides generating summaries, decoding optionally evaluates
+  # retrieval over the whole decoded corpus (see `corpus_retrieval_eval`).
 
   def Decode(self, input_batch):
+    p = self.params
     preds = self.ComputePredictions(self.theta, input_batch)
     # Add summary ops to the graph.
     _ = self.ComputeLoss(self.theta, preds, input_batch)
+    if p.corpus_retrieval_eval:
+      return py_utils.NestedMap(
+          encodings=preds,
+          relevance_keys=utils.GetFromNestedMapOrDie(
+              py_utils.NestedMap(input_batch),
+              p.corpus_retrieval_eval.relevance_feature))
     return preds
 
   def CreateDecoderMetrics(self):
-    return {
+    p = self.params
+    decoder_metrics = {
         'num_samples_in_batch': metrics_lib.AverageMetric(),
     }
+    if p.corpus_retrieval_eval:
+      # A fresh evaluator (and corpus) for every decode run.
+      self._corpus_retrieval_evaluator = p.corpus_retrieval_eval.Instantiate()
+      decoder_metrics.update(self._corpus_retrieval_evaluator.CreateMetrics())
+    return decoder_metrics
+
+  def PostProcessDecodeOut(self, decode_out_dict, decode_metrics_dict):
+    if not self._corpus_retrieval_evaluator:
+      return
+    if not isinstance(decode_out_dict, list):
+      decode_out_dict = [decode_out_dict]
+    for decode_out in decode_out_dict:
+      self._corpus_retrieval_evaluator.Update(decode_out['encodings'],
+                                              decode_out['relevance_keys'])
+      decode_metrics_dict['num_samples_in_batch'].Update(
+          len(decode_out['relevance_keys']))
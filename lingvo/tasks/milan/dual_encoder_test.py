@@ -20,6 +20,7 @@ from lingvo.core import py_utils
 from lingvo.core import test_utils
 from lingvo.tasks.milan import dual_encoder
 from lingvo.tasks.milan import labels as label_lib
+from lingvo.tasks.milan import retrieval_eval
 import numpy as np
 
 
@@ -113,6 +114,34 @@ class DualEncoderTest(test_utils.TestCase):
       loss = self.evaluate(loss)
     self.assertAllClose(expected_average_loss, loss)
 
+  def testMilanTaskCorpusRetrievalEval(self):
+    p = dual_encoder.MilanTask.Params()
+    p.dual_encoder = self._DualEncoderParamsForTest()
+    p.dual_encoder.loss_weights = {('x', 'y'): 1.0}
+    p.dual_encoder.label_fn = lambda _: tf.eye(2)
+    p.corpus_retrieval_eval = (
+        retrieval_eval.CorpusRetrievalEvaluator.Params().Set(
+            directions=[('x', 'y')], relevance_feature='x_ids', ks=[1]))
+    task = p.Instantiate()
+
+    input_batch = py_utils.NestedMap(
+        x_input=tf.constant([[1., 0., 0.], [0., 1., 0.]]),
+        x_ids=tf.constant([1, 2], dtype=tf.int64),
+        y_input=tf.constant([[1., 0., 0., 0.], [0., 1., 0., 0.]]),
+        y_ids=tf.constant([3, 4], dtype=tf.int64))
+    decode_out = task.Decode(input_batch)
+    with self.session():
+      self.evaluate(tf.global_variables_initializer())
+      decode_out = self.evaluate(decode_out)
+
+    decoder_metrics = task.CreateDecoderMetrics()
+    task.PostProcessDecodeOut(decode_out, decoder_metrics)
+    self.assertEqual(2, decoder_metrics['num_samples_in_batch'].total_value)
+    self.assertIn('retrieval_x_to_y/recall@1', decoder_metrics)
+    self.assertIn('retrieval_x_to_y/mrr', decoder_metrics)
+    for name in ('retrieval_x_to_y/recall@1', 'retrieval_x_to_y/mrr'):
+      self.assertBetween(decoder_metrics[name].value, 0., 1.)
+
 
 if __name__ == '__main__':
   test_utils.main()
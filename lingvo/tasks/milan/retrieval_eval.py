@@ -0,0 +1,418 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Full-corpus retrieval evaluation for dual encoders.
+
+`DualEncoder` only reports in-batch retrieval metrics during training. This
+module evaluates retrieval over an entire eval corpus instead:
+
+  - `EmbeddingShardWriter` streams embeddings to fixed-size `.npy` shards on
+    local disk, optionally quantized to int8, so the corpus never has to fit
+    in memory.
+  - `ChunkedTopK` searches the shards with blocked matrix multiplies, keeping
+    a running top-K per query.
+  - `CorpusRetrievalEvaluator` ties the two together and reports Recall@K and
+    MRR for each (query modality, result modality) pair as decoder metrics.
+
+Relevance is defined by a "relevance key" per item: a query is relevant to a
+result iff their keys are equal. Typically the key is an example-level id
+feature such as the image id of an image-caption dataset.
+"""
+
+import glob
+import os
+import shutil
+import tempfile
+import threading
+
+from typing import Dict, Iterator, Sequence, Tuple
+
+from absl import logging
+from lingvo.core import hyperparams
+from lingvo.core import metrics as metrics_lib
+import numpy as np
+
+
+def QuantizeInt8(embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+  """Symmetrically quantizes each row of `embeddings` to int8.
+
+  Args:
+    embeddings: float array of shape [num_items, dim].
+
+  Returns:
+    A tuple (quantized, scales) where `quantized` is an int8 array with the
+    shape of `embeddings` and `scales` is a float32 array of shape [num_items]
+    such that `quantized * scales[:, None]` approximates `embeddings`.
+  """
+  embeddings = np.asarray(embeddings, dtype=np.float32)
+  scales = np.max(np.abs(embeddings), axis=-1) / 127.
+  scales = np.where(scales > 0, scales, 1.).astype(np.float32)
+  quantized = np.clip(np.rint(embeddings / scales[:, None]), -127, 127)
+  return quantized.astype(np.int8), scales
+
+
+def DequantizeInt8(quantized: np.ndarray, scales: np.ndarray) -> np.ndarray:
+  """Inverse of `QuantizeInt8`."""
+  return quantized.astype(np.float32) * scales[:, None]
+
+
+def _ShardPath(output_dir, shard, name):
+  return os.path.join(output_dir, f'shard-{shard:05d}.{name}.npy')
+
+
+class EmbeddingShardWriter:
+  """Streams (key, embedding) pairs to `.npy` shards in `output_dir`.
+
+  Each shard holds up to `shard_size` items as three (or, when quantizing,
+  four) arrays: the relevance `keys`, the `item_ids` used for deduplication and
+  the `embeddings` themselves (plus their `scales` when quantized).
+  """
+
+  def __init__(self,
+               output_dir: str,
+               shard_size: int = 1 << 16,
+               quantize: bool = False,
+               deduplicate: bool = True):
+    """Constructor.
+
+    Args:
+      output_dir: Local directory to write shards to. Created if necessary.
+        Shards left in it by an earlier writer are deleted.
+      shard_size: Maximum number of items per shard.
+      quantize: If True, store embeddings as int8 with per-item scales.
+      deduplicate: If True, only the first occurrence of each item id is kept.
+        All occurrences of an item are assumed to share the same key.
+    """
+    if shard_size <= 0:
+      raise ValueError(f'shard_size must be positive; got {shard_size}')
+    self._output_dir = output_dir
+    self._shard_size = shard_size
+    self._quantize = quantize
+    self._deduplicate = deduplicate
+    self._seen_ids = set()
+    self._buffers = {'keys': [], 'item_ids': [], 'embeddings': []}
+    self._num_buffered = 0
+    self._num_shards = 0
+    self._num_items = 0
+    os.makedirs(output_dir, exist_ok=True)
+    # EmbeddingShards reads all shards in the directory, so stale shards of an
+    # earlier run (e.g. an earlier decode) would be mixed into the results.
+    for path in glob.glob(os.path.join(output_dir, 'shard-*.npy')):
+      os.remove(path)
+
+  @property
+  def num_items(self):
+    return self._num_items
+
+  def Add(self, keys, item_ids, embeddings):
+    """Adds a batch of items.
+
+    Args:
+      keys: int array of relevance keys, shape [num_items].
+      item_ids: int array of item ids, shape [num_items].
+      embeddings: float array of shape [num_items, dim].
+    """
+    keys = np.asarray(keys).reshape([-1])
+    item_ids = np.asarray(item_ids).reshape([-1])
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    embeddings = embeddings.reshape([keys.shape[0], -1])
+    if item_ids.shape != keys.shape:
+      raise ValueError(f'item_ids shape {item_ids.shape} does not match keys '
+                       f'shape {keys.shape}')
+
+    if self._deduplicate:
+      keep = []
+      for i, item_id in enumerate(item_ids.tolist()):
+        if item_id not in self._seen_ids:
+          self._seen_ids.add(item_id)
+          keep.append(i)
+      keys, item_ids, embeddings = (keys[keep], item_ids[keep],
+                                    embeddings[keep])
+
+    start = 0
+    while start < keys.shape[0]:
+      end = min(keys.shape[0], start + self._shard_size - self._num_buffered)
+      self._buffers['keys'].append(keys[start:end])
+      self._buffers['item_ids'].append(item_ids[start:end])
+      self._buffers['embeddings'].append(embeddings[start:end])
+      self._num_buffered += end - start
+      self._num_items += end - start
+      if self._num_buffered == self._shard_size:
+        self._Flush()
+      start = end
+
+  def _Flush(self):
+    """Writes the buffered items to a new shard."""
+    if not self._num_buffered:
+      return
+    arrays = {k: np.concatenate(v) for k, v in self._buffers.items()}
+    if self._quantize:
+      arrays['embeddings'], arrays['scales'] = QuantizeInt8(
+          arrays['embeddings'])
+    for name, value in arrays.items():
+      np.save(_ShardPath(self._output_dir, self._num_shards, name), value)
+    self._num_shards += 1
+    self._buffers = {k: [] for k in self._buffers}
+    self._num_buffered = 0
+
+  def Close(self) -> 'EmbeddingShards':
+    """Flushes any buffered items and returns a reader of the shards."""
+    self._Flush()
+    return EmbeddingShards(self._output_dir)
+
+
+class EmbeddingShards:
+  """Reads the shards written by `EmbeddingShardWriter`.
+
+  Shards are memory-mapped, so iterating over them only keeps one block of
+  (dequantized) embeddings in memory at a time.
+  """
+
+  def __init__(self, output_dir: str):
+    self._shard_prefixes = sorted(
+        p[:-len('.keys.npy')]
+        for p in glob.glob(os.path.join(output_dir, 'shard-*.keys.npy')))
+    self._num_items = sum(
+        np.load(p + '.keys.npy', mmap_mode='r').shape[0]
+        for p in self._shard_prefixes)
+
+  @property
+  def num_items(self):
+    return self._num_items
+
+  def Iterate(self, block_size: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Yields (keys, embeddings) blocks of at most `block_size` items."""
+    for prefix in self._shard_prefixes:
+      keys = np.load(prefix + '.keys.npy', mmap_mode='r')
+      embeddings = np.load(prefix + '.embeddings.npy', mmap_mode='r')
+      scales = None
+      if os.path.exists(prefix + '.scales.npy'):
+        scales = np.load(prefix + '.scales.npy', mmap_mode='r')
+      for start in range(0, keys.shape[0], block_size):
+        end = start + block_size
+        block = embeddings[start:end]
+        if scales is None:
+          block = np.asarray(block, dtype=np.float32)
+        else:
+          block = DequantizeInt8(block, scales[start:end])
+        yield np.asarray(keys[start:end]), block
+
+
+def ChunkedTopK(queries: np.ndarray,
+                results: EmbeddingShards,
+                k: int,
+                block_size: int = 4096) -> Tuple[np.ndarray, np.ndarray]:
+  """Finds the `k` highest-scoring results for each query.
+
+  Scores are dot products, matching `score_functions.DotProductScoreFunction`.
+  Results are scored one block at a time and merged into a running top-k, so
+  memory is bounded by `len(queries) * (k + block_size)` scores.
+
+  Args:
+    queries: float32 array of shape [num_queries, dim].
+    results: The `EmbeddingShards` to search.
+    k: Number of results to return per query.
+    block_size: Number of results to score at a time.
+
+  Returns:
+    A tuple (scores, keys), each of shape [num_queries, min(k, num_results)],
+    holding the scores and keys of the top results sorted by decreasing score.
+  """
+  num_queries = queries.shape[0]
+  top_scores = np.zeros([num_queries, 0], dtype=np.float32)
+  top_keys = np.zeros([num_queries, 0], dtype=np.int64)
+  for block_keys, block in results.Iterate(block_size):
+    scores = np.concatenate([top_scores, np.matmul(queries, block.T)], axis=1)
+    keys = np.concatenate(
+        [top_keys,
+         np.broadcast_to(block_keys.astype(np.int64),
+                         [num_queries, block_keys.shape[0]])],
+        axis=1)
+    if scores.shape[1] > k:
+      top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+      scores = np.take_along_axis(scores, top, axis=1)
+      keys = np.take_along_axis(keys, top, axis=1)
+    top_scores, top_keys = scores, keys
+
+  order = np.argsort(-top_scores, axis=1, kind='stable')
+  return (np.take_along_axis(top_scores, order, axis=1),
+          np.take_along_axis(top_keys, order, axis=1))
+
+
+def RankOfFirstRelevant(query_keys: np.ndarray,
+                        retrieved_keys: np.ndarray) -> np.ndarray:
+  """Returns the 0-based rank of the first relevant result for each query.
+
+  Args:
+    query_keys: int array of shape [num_queries].
+    retrieved_keys: int array of shape [num_queries, k], sorted by rank.
+
+  Returns:
+    A float array of shape [num_queries]. Queries without a relevant result
+    among `retrieved_keys` get rank `inf`.
+  """
+  hits = np.equal(retrieved_keys, np.reshape(query_keys, [-1, 1]))
+  return np.where(
+      np.any(hits, axis=1), np.argmax(hits, axis=1).astype(np.float64), np.inf)
+
+
+class _CorpusRetrievalMetric(metrics_lib.BaseMetric):
+  """One statistic computed by a `CorpusRetrievalEvaluator`."""
+
+  def __init__(self, evaluator, name):
+    self._evaluator = evaluator
+    self._name = name
+
+  @property
+  def value(self):
+    return self._evaluator.Evaluate()[self._name]
+
+
+class CorpusRetrievalEvaluator:
+  """Computes retrieval metrics of dual encoder embeddings over a corpus.
+
+  Usage::
+
+    evaluator = p.Instantiate()
+    decoder_metrics.update(evaluator.CreateMetrics())
+    for each decoded batch:
+      evaluator.Update(encodings, relevance_keys)
+    # Reading any of the metrics' values runs the search.
+  """
+
+  @classmethod
+  def Params(cls):
+    p = hyperparams.InstantiableParams(cls)
+    p.Define(
+        'directions', [],
+        'List of (query_modality, result_modality) tuples to evaluate.')
+    p.Define(
+        'relevance_feature', '',
+        'Name of a scalar, per-example int feature identifying relevant '
+        'query-result pairs: a query is relevant to a result iff they come '
+        'from examples with the same value of this feature.')
+    p.Define('ks', [1, 5, 10], 'Cutoffs at which to report Recall@K.')
+    p.Define('output_dir', '',
+             'Local directory for the embedding shards. Shards of earlier '
+             'evaluations in it are overwritten. If empty, a temporary '
+             'directory is used and deleted after evaluation.')
+    p.Define('shard_size', 1 << 16, 'Number of embeddings per shard.')
+    p.Define('block_size', 4096,
+             'Number of queries and results scored at a time.')
+    p.Define(
+        'quantize', False,
+        'If True, store embeddings as int8 with per-item scales. Shrinks the '
+        'store 4x at the cost of approximate scores.')
+    return p
+
+  def __init__(self, params):
+    self.params = params.Copy()
+    p = self.params
+    if not p.directions:
+      raise ValueError('Required param directions not set.')
+    if not p.relevance_feature:
+      raise ValueError('Required param relevance_feature not set.')
+    if not p.ks or min(p.ks) <= 0:
+      raise ValueError(f'ks must be positive integers; got {p.ks}')
+
+    self._temp_dir = None
+    output_dir = p.output_dir
+    if not output_dir:
+      self._temp_dir = tempfile.mkdtemp(prefix='milan_retrieval_eval')
+      output_dir = self._temp_dir
+    modalities = sorted(set(m for direction in p.directions for m in direction))
+    self._writers = {
+        modality: EmbeddingShardWriter(
+            os.path.join(output_dir, modality),
+            shard_size=p.shard_size,
+            quantize=p.quantize) for modality in modalities
+    }
+    self._lock = threading.Lock()
+    self._results = None
+
+  def CreateMetrics(self) -> Dict[str, metrics_lib.BaseMetric]:
+    """Returns decoder metrics reporting this evaluator's results."""
+    p = self.params
+    names = []
+    for query_modality, result_modality in p.directions:
+      prefix = f'retrieval_{query_modality}_to_{result_modality}'
+      names += [f'{prefix}/recall@{k}' for k in p.ks] + [f'{prefix}/mrr']
+    return {name: _CorpusRetrievalMetric(self, name) for name in names}
+
+  def Update(self, encodings, relevance_keys):
+    """Adds a batch of decoded examples to the corpus.
+
+    Args:
+      encodings: Output of `DualEncoder.ComputePredictions`, fetched as numpy:
+        a dict mapping modality name to a dict with 'ids' of shape
+        `[batch_size, ...]` and 'encodings' of shape `ids.shape + [dim]`.
+      relevance_keys: int array of shape [batch_size]; the value of the
+        `relevance_feature` of each example.
+    """
+    relevance_keys = np.asarray(relevance_keys)
+    with self._lock:
+      if self._results is not None:
+        raise ValueError('Update() called after Evaluate().')
+      for modality, writer in self._writers.items():
+        ids = np.asarray(encodings[modality]['ids'])
+        # Broadcast the per-example keys to all items of each example.
+        keys = np.broadcast_to(
+            relevance_keys.reshape(relevance_keys.shape + (1,) *
+                                   (ids.ndim - relevance_keys.ndim)), ids.shape)
+        writer.Add(keys, ids, encodings[modality]['encodings'])
+
+  def Evaluate(self) -> Dict[str, float]:
+    """Runs the corpus search (once) and returns all metric values."""
+    with self._lock:
+      if self._results is None:
+        try:
+          self._results = self._Evaluate()
+        finally:
+          if self._temp_dir:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+      return self._results
+
+  def _Evaluate(self):
+    p = self.params
+    shards = {m: writer.Close() for m, writer in self._writers.items()}
+    max_k = max(p.ks)
+    results = {}
+    for query_modality, result_modality in p.directions:
+      prefix = f'retrieval_{query_modality}_to_{result_modality}'
+      ranks = self._Ranks(shards[query_modality], shards[result_modality],
+                          max_k)
+      logging.info('%s: %d queries against %d results', prefix, len(ranks),
+                   shards[result_modality].num_items)
+      for k in p.ks:
+        results[f'{prefix}/recall@{k}'] = _Mean(ranks < k)
+      # MRR is truncated at max(ks): queries without a relevant result in the
+      # top max(ks) contribute 0.
+      results[f'{prefix}/mrr'] = _Mean(1. / (ranks + 1.))
+    return results
+
+  def _Ranks(self, queries: EmbeddingShards, results: EmbeddingShards,
+             k: int) -> np.ndarray:
+    """Returns the rank of the first relevant result of every query."""
+    p = self.params
+    ranks = []
+    for query_keys, query_block in queries.Iterate(p.block_size):
+      _, retrieved_keys = ChunkedTopK(
+          query_block, results, k, block_size=p.block_size)
+      ranks.append(RankOfFirstRelevant(query_keys, retrieved_keys))
+    return np.concatenate(ranks) if ranks else np.zeros([0])
+
+
+def _Mean(values: Sequence[float]) -> float:
+  values = np.asarray(values, dtype=np.float64)
+  return float(np.mean(values)) if values.size else 0.
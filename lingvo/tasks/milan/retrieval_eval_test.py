@@ -0,0 +1,134 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for retrieval_eval."""
+
+import os
+
+from lingvo.core import test_utils
+from lingvo.tasks.milan import retrieval_eval
+import numpy as np
+
+
+class RetrievalEvalTest(test_utils.TestCase):
+
+  def testQuantizeInt8(self):
+    embeddings = np.random.RandomState(0).normal(size=[5, 8])
+    embeddings[2] = 0.
+    quantized, scales = retrieval_eval.QuantizeInt8(embeddings)
+    self.assertEqual(np.int8, quantized.dtype)
+    self.assertEqual([5], list(scales.shape))
+    self.assertAllClose(
+        embeddings,
+        retrieval_eval.DequantizeInt8(quantized, scales),
+        atol=0.02)
+
+  def testChunkedTopKMatchesBruteForce(self):
+    rng = np.random.RandomState(1)
+    results = rng.normal(size=[50, 4]).astype(np.float32)
+    queries = rng.normal(size=[7, 4]).astype(np.float32)
+    output_dir = os.path.join(self.get_temp_dir(), 'results')
+    writer = retrieval_eval.EmbeddingShardWriter(output_dir, shard_size=16)
+    # Keys are the result indices; add in uneven batches.
+    writer.Add(np.arange(20), np.arange(20), results[:20])
+    writer.Add(np.arange(20, 50), np.arange(20, 50), results[20:])
+    # Duplicate items are dropped.
+    writer.Add([0], [0], results[:1])
+    shards = writer.Close()
+    self.assertEqual(50, shards.num_items)
+    self.assertLen(os.listdir(output_dir), 4 * 3)
+
+    scores, keys = retrieval_eval.ChunkedTopK(
+        queries, shards, k=5, block_size=7)
+    expected_keys = np.argsort(-np.matmul(queries, results.T), axis=1)[:, :5]
+    self.assertAllEqual(expected_keys, keys)
+    self.assertAllClose(
+        np.take_along_axis(np.matmul(queries, results.T), expected_keys, 1),
+        scores)
+
+    # Fewer results than k.
+    _, keys = retrieval_eval.ChunkedTopK(queries, shards, k=100)
+    self.assertEqual([7, 50], list(keys.shape))
+
+    # A new writer replaces the shards of the previous one.
+    writer = retrieval_eval.EmbeddingShardWriter(output_dir, shard_size=16)
+    writer.Add(np.arange(5), np.arange(5), results[:5])
+    self.assertEqual(5, writer.Close().num_items)
+    self.assertLen(os.listdir(output_dir), 3)
+
+  def testRankOfFirstRelevant(self):
+    ranks = retrieval_eval.RankOfFirstRelevant(
+        np.array([1, 2, 3]), np.array([[1, 2, 1], [3, 4, 2], [4, 5, 6]]))
+    self.assertAllEqual([0, 2, np.inf], ranks)
+
+  def _Evaluate(self, num_examples=4, **kwargs):
+    p = retrieval_eval.CorpusRetrievalEvaluator.Params().Set(
+        directions=[('x', 'y'), ('y', 'x')],
+        relevance_feature='image_id',
+        ks=[1, 2],
+        shard_size=3,
+        block_size=2,
+        **kwargs)
+    evaluator = p.Instantiate()
+    metrics = evaluator.CreateMetrics()
+    # Each 'x' item has a relevant 'y' item with the same embedding, except
+    # for example 3, whose nearest 'y' item is that of example 2.
+    x = np.array([[1., 0.], [0., 1.], [-1., 0.], [-1., 0.1]])
+    y = np.array([[1., 0.], [0., 1.], [-1., 0.], [0., -1.]])
+    for i in range(0, num_examples, 2):
+      evaluator.Update(
+          {
+              'x': {
+                  'ids': np.arange(i, i + 2),
+                  'encodings': x[i:i + 2]
+              },
+              'y': {
+                  'ids': np.arange(i, i + 2),
+                  'encodings': y[i:i + 2]
+              },
+          },
+          relevance_keys=np.arange(i, i + 2))
+    return {name: metric.value for name, metric in metrics.items()}
+
+  def testCorpusRetrievalEvaluator(self):
+    values = self._Evaluate()
+    self.assertCountEqual([
+        'retrieval_x_to_y/recall@1', 'retrieval_x_to_y/recall@2',
+        'retrieval_x_to_y/mrr', 'retrieval_y_to_x/recall@1',
+        'retrieval_y_to_x/recall@2', 'retrieval_y_to_x/mrr'
+    ], values.keys())
+    # x3's relevant result (y3) is ranked last.
+    self.assertAllClose(0.75, values['retrieval_x_to_y/recall@1'])
+    self.assertAllClose(0.75, values['retrieval_x_to_y/recall@2'])
+    self.assertAllClose(0.75, values['retrieval_x_to_y/mrr'])
+    # y3's relevant result (x3) is ranked third, behind x0 and x2.
+    self.assertAllClose(0.75, values['retrieval_y_to_x/recall@2'])
+
+  def testQuantizedCorpusRetrievalEvaluator(self):
+    self.assertAllClose(self._Evaluate(), self._Evaluate(quantize=True))
+
+  def testRepeatedEvaluationsInOutputDir(self):
+    output_dir = os.path.join(self.get_temp_dir(), 'repeated')
+    expected = self._Evaluate()
+    # Each decode creates a new evaluator writing to the same output_dir.
+    self.assertAllClose(expected,
+                        self._Evaluate(output_dir=output_dir, quantize=True))
+    self.assertAllClose(expected, self._Evaluate(output_dir=output_dir))
+    # Only the first two examples, which are all retrieved perfectly.
+    self.assertAllClose({k: 1. for k in expected},
+                        self._Evaluate(output_dir=output_dir, num_examples=2))
+
+
+if __name__ == '__main__':
+  test_utils.main()
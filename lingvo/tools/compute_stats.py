@@ -12,7 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ==============================================================================
-"""Compute stats from tfrecords files."""
+"""Compute stats from tfrecords files.
+
+With --num_workers > 1, the input files are processed in a pool of processes.
+Each worker collects the stats of one file, and the per-file stats are merged:
+mean and variance accumulators are combined with Chan's parallel update, and
+example lengths are kept as a histogram of length -> count, so memory grows
+with the number of distinct lengths rather than the number of examples.
+"""
+
+import collections
+import multiprocessing
 
 import lingvo.compat as tf
 import numpy as np
@@ -22,60 +32,103 @@ tf.flags.DEFINE_string('input_filepattern', '',
 tf.flags.DEFINE_integer('frame_size', 1, 'Size of the frame, for reshaping.')
 tf.flags.DEFINE_integer('num_buckets', 8, 'Number of buckets for the length.')
 tf.flags.DEFINE_string('feature_name', None, 'Name of feature to examine.')
+tf.flags.DEFINE_integer(
+    'num_workers', 1,
+    'Number of processes used to read the input files. Files are read '
+    'serially if <= 1.')
 
 FLAGS = tf.flags.FLAGS
 
 
 class StatsCollector:
-  """Collect stats."""
+  """Collect stats.
+
+  Collectors accumulated over disjoint sets of examples can be combined with
+  Merge(), which gives the same stats as accumulating all examples in one
+  collector (up to floating point rounding).
+  """
 
-  def __init__(self,):
+  def __init__(self, feature_name=None, frame_size=None):
+    self._feature_name = feature_name or FLAGS.feature_name
+    self._frame_size = frame_size or FLAGS.frame_size
     self._num_examples = 0
-    self._lengths = []
+    # Maps an example length to the number of examples with that length.
+    self._length_counts = collections.Counter()
     self._num_frames = 0
-    self._mean_acc = np.zeros(FLAGS.frame_size, dtype=np.float64)
-    self._var_acc = np.zeros(FLAGS.frame_size, dtype=np.float64)
+    # Running mean and sum of squared deviations from the mean of the frames.
+    self._mean = np.zeros(self._frame_size, dtype=np.float64)
+    self._m2 = np.zeros(self._frame_size, dtype=np.float64)
+
+  def _MergeMoments(self, num_frames, mean, m2):
+    """Chan et al.'s update of the moments with those of another set."""
+    if num_frames == 0:
+      return
+    total = self._num_frames + num_frames
+    delta = mean - self._mean
+    self._mean += delta * (num_frames / total)
+    self._m2 += m2 + delta * delta * (self._num_frames * num_frames / total)
+    self._num_frames = total
 
   def _AccumulateMoments(self, float_list):
-    frames = np.reshape(float_list, [-1, FLAGS.frame_size])
-    self._num_frames += frames.shape[0]
-    self._mean_acc += np.sum(frames, axis=0)
-    self._var_acc += np.sum(frames * frames, axis=0)
+    frames = np.reshape(
+        np.asarray(float_list, dtype=np.float64), [-1, self._frame_size])
+    if not frames.shape[0]:
+      return
+    mean = np.mean(frames, axis=0)
+    m2 = np.sum(np.square(frames - mean), axis=0)
+    self._MergeMoments(frames.shape[0], mean, m2)
 
   def _ComputeMeanVar(self):
-    mu = self._mean_acc / self._num_frames
+    mu = self._mean
     # The user is in charge of replacing NaNs with a floor value.
-    v = np.sqrt(self._var_acc / self._num_frames - mu * mu)
+    v = np.sqrt(self._m2 / self._num_frames)
     return mu, v
 
   def Accumulate(self, tf_ex):
     self._num_examples += 1
     if 0 == self._num_examples % 10000:
       tf.logging.info('Processing example %u...', self._num_examples)
-    v = tf_ex.features.feature[FLAGS.feature_name]
+    v = tf_ex.features.feature[self._feature_name]
     if v.HasField('float_list'):
-      num_frames = len(v.float_list.value) // FLAGS.frame_size
+      num_frames = len(v.float_list.value) // self._frame_size
       self._AccumulateMoments(v.float_list.value)
     elif v.HasField('int64_list'):
-      num_frames = len(v.int64_list.value) // FLAGS.frame_size
+      num_frames = len(v.int64_list.value) // self._frame_size
     else:
       tf.logging.fatal(
           'Not sure what to do with value. '
           'Only float/int64 lists are supported: %s', v)
-    self._lengths.append(num_frames)
+    self._length_counts[num_frames] += 1
+
+  def Merge(self, other):
+    """Merges the stats accumulated by another StatsCollector into this one."""
+    assert self._frame_size == other._frame_size, (self._frame_size,
+                                                   other._frame_size)
+    self._num_examples += other._num_examples
+    self._length_counts.update(other._length_counts)
+    self._MergeMoments(other._num_frames, other._mean, other._m2)
+
+  def _LengthQuantiles(self, ranks):
+    """Returns the lengths at the given ranks of the sorted example lengths."""
+    lengths = np.array(sorted(self._length_counts), dtype=np.int64)
+    counts = np.array([self._length_counts[l] for l in lengths], dtype=np.int64)
+    # Rank i falls in the first length whose cumulative count exceeds i.
+    idx = np.searchsorted(np.cumsum(counts), ranks, side='right')
+    return [int(l) for l in lengths[idx]]
 
   def _PrintLengthBuckets(self):
-    sorted_lengths = sorted(self._lengths)
     num_buckets = FLAGS.num_buckets
-    n = len(sorted_lengths)
+    n = self._num_examples
     idx = (n * (np.array(list(range(num_buckets - 1))) + 1)) // num_buckets
-    buckets = [sorted_lengths[i] for i in idx] + [sorted_lengths[-1]]
+    buckets = self._LengthQuantiles(list(idx) + [n - 1])
+    loss_candidates = self._LengthQuantiles(
+        [int(n * .999), int(n * .99), int(n * .98)])
     tf.logging.info('== Buckets.')
     tf.logging.info('bucket upper limits: %s', buckets)
     tf.logging.info('Other candidates for last bucket:')
-    tf.logging.info('  0.1%% loss: %u', sorted_lengths[int(n * .999)])
-    tf.logging.info('    1%% loss: %u', sorted_lengths[int(n * .99)])
-    tf.logging.info('    2%% loss: %u', sorted_lengths[int(n * .98)])
+    tf.logging.info('  0.1%% loss: %u', loss_candidates[0])
+    tf.logging.info('    1%% loss: %u', loss_candidates[1])
+    tf.logging.info('    2%% loss: %u', loss_candidates[2])
 
   def _PrintMeanVar(self):
     m, v = self._ComputeMeanVar()
@@ -92,19 +145,55 @@ class StatsCollector:
     self._PrintMeanVar()
 
 
+def _AccumulateFile(stats, filepath):
+  records = tf.compat.v1.io.tf_record_iterator(filepath)
+  for serialized in records:
+    ex = tf.train.Example()
+    ex.ParseFromString(serialized)
+    stats.Accumulate(ex)
+
+
+def _CollectFileStats(args):
+  """Returns a StatsCollector for one file. Runs in a worker process."""
+  filepath, feature_name, frame_size = args
+  stats = StatsCollector(feature_name, frame_size)
+  _AccumulateFile(stats, filepath)
+  return stats
+
+
+def ComputeStats(filepaths, feature_name, frame_size, num_workers=1):
+  """Returns a StatsCollector of the examples of tfrecord files.
+
+  Args:
+    filepaths: List of tfrecord files.
+    feature_name: Name of the feature to examine.
+    frame_size: Size of the frame, for reshaping.
+    num_workers: Number of processes reading the files. Files are read serially
+      if <= 1.
+  """
+  stats = StatsCollector(feature_name, frame_size)
+  if num_workers <= 1:
+    for filepath in filepaths:
+      _AccumulateFile(stats, filepath)
+    return stats
+  args = [(f, feature_name, frame_size) for f in filepaths]
+  with multiprocessing.Pool(num_workers) as pool:
+    for i, file_stats in enumerate(pool.imap_unordered(_CollectFileStats,
+                                                       args)):
+      stats.Merge(file_stats)
+      tf.logging.info('Processed %d/%d files.', i + 1, len(filepaths))
+  return stats
+
+
 def main(_):
   tf.logging.set_verbosity(tf.logging.INFO)
   if not FLAGS.feature_name:
     tf.logging.fatal(
         'Use a --feature_name to specify what to bucketize on. '
         'For instance, source_id for MT or frames for ASR.')
-  stats = StatsCollector()
-  for filepath in tf.io.gfile.glob(FLAGS.input_filepattern):
-    records = tf.compat.v1.io.tf_record_iterator(filepath)
-    for serialized in records:
-      ex = tf.train.Example()
-      ex.ParseFromString(serialized)
-      stats.Accumulate(ex)
+  stats = ComputeStats(
+      tf.io.gfile.glob(FLAGS.input_filepattern), FLAGS.feature_name,
+      FLAGS.frame_size, FLAGS.num_workers)
   stats.Print()
 
 
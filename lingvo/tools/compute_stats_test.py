@@ -0,0 +1,117 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for compute_stats."""
+
+import os
+from unittest import mock
+
+from absl.testing import flagsaver
+import lingvo.compat as tf
+from lingvo.core import test_utils
+from lingvo.tools import compute_stats
+import numpy as np
+
+
+def _MakeExample(values):
+  ex = tf.train.Example()
+  ex.features.feature['frames'].float_list.value.extend(values)
+  return ex
+
+
+class StatsCollectorTest(test_utils.TestCase):
+
+  def _RandomFrames(self, num_examples, frame_size):
+    np.random.seed(12345)
+    return [
+        np.random.normal(3., 2., size=[np.random.randint(1, 50), frame_size])
+        for _ in range(num_examples)
+    ]
+
+  def testMeanVar(self):
+    examples = self._RandomFrames(20, 3)
+    stats = compute_stats.StatsCollector('frames', 3)
+    for frames in examples:
+      stats.Accumulate(_MakeExample(frames.flatten()))
+    mean, std = stats._ComputeMeanVar()  # pylint: disable=protected-access
+    all_frames = np.concatenate(examples)
+    self.assertAllClose(np.mean(all_frames, axis=0), mean)
+    self.assertAllClose(np.std(all_frames, axis=0), std)
+
+  def testMergeMatchesSingleCollector(self):
+    examples = self._RandomFrames(30, 2)
+    expected = compute_stats.StatsCollector('frames', 2)
+    shards = [compute_stats.StatsCollector('frames', 2) for _ in range(4)]
+    for i, frames in enumerate(examples):
+      expected.Accumulate(_MakeExample(frames.flatten()))
+      shards[i % 3].Accumulate(_MakeExample(frames.flatten()))
+    # The last shard is left empty.
+    merged = shards[0]
+    for shard in shards[1:]:
+      merged.Merge(shard)
+
+    self.assertEqual(expected._num_examples, merged._num_examples)  # pylint: disable=protected-access
+    self.assertEqual(expected._length_counts, merged._length_counts)  # pylint: disable=protected-access
+    for e, m in zip(expected._ComputeMeanVar(), merged._ComputeMeanVar()):  # pylint: disable=protected-access
+      self.assertAllClose(e, m)
+
+  def testLengthQuantiles(self):
+    lengths = np.random.randint(1, 20, size=[101])
+    stats = compute_stats.StatsCollector('frames', 1)
+    for length in lengths:
+      stats.Accumulate(_MakeExample(np.ones([length])))
+    ranks = [0, 1, 50, 99, 100]
+    self.assertEqual([sorted(lengths)[i] for i in ranks],
+                     stats._LengthQuantiles(ranks))  # pylint: disable=protected-access
+
+
+class ComputeStatsTest(test_utils.TestCase):
+
+  def _WriteFiles(self, num_files, frame_size):
+    np.random.seed(12345)
+    filepaths = []
+    for i in range(num_files):
+      filepath = os.path.join(self.get_temp_dir(), 'data-%d.tfrecord' % i)
+      with tf.io.TFRecordWriter(filepath) as writer:
+        for _ in range(np.random.randint(1, 10)):
+          frames = np.random.normal(
+              3., 2., size=[np.random.randint(1, 50), frame_size])
+          writer.write(_MakeExample(frames.flatten()).SerializeToString())
+      filepaths.append(filepath)
+    return filepaths
+
+  def _AssertSameStats(self, expected, actual):
+    # pylint: disable=protected-access
+    self.assertEqual(expected._num_examples, actual._num_examples)
+    self.assertEqual(expected._length_counts, actual._length_counts)
+    for e, a in zip(expected._ComputeMeanVar(), actual._ComputeMeanVar()):
+      self.assertAllClose(e, a)
+    # pylint: enable=protected-access
+
+  def testMainWithWorkerPool(self):
+    filepaths = self._WriteFiles(5, 2)
+    expected = compute_stats.ComputeStats(filepaths, 'frames', 2)
+    with flagsaver.flagsaver(
+        input_filepattern=os.path.join(self.get_temp_dir(), 'data-*'),
+        feature_name='frames',
+        frame_size=2,
+        num_workers=3), mock.patch.object(
+            compute_stats.StatsCollector, 'Print', autospec=True) as mock_print:
+      compute_stats.main([])
+    mock_print.assert_called_once()
+    self._AssertSameStats(expected, mock_print.call_args[0][0])
+
+
+if __name__ == '__main__':
+  test_utils.main()
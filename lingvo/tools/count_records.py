@@ -24,23 +24,67 @@ It is recommended that for other file formats, simply reading the metadata
 available in their formats should work; this file should not really be
 extended to any other format that already has efficient ways of counting
 records.
+
+For uncompressed TFRecord files that are reachable from a single machine,
+--local counts records in a process pool by seeking over the record payloads
+instead of reading them, and --write_index additionally writes the record
+offsets of each file next to it (see tfrecord_index.py), which
+print_tf_records.py uses to jump directly to a record.
 """
 
+import functools
+import multiprocessing
+
 from absl import app
 from absl import flags
 
-import apache_beam as beam
-from lingvo.tools import beam_utils
+import lingvo.compat as tf
+from lingvo.tools import tfrecord_index
 
 flags.DEFINE_string('input_file_pattern', None, 'Path to read input')
 flags.DEFINE_string('output_count_file', None, 'File to write output to.')
 flags.DEFINE_string('record_format', None,
                     'Record format of the input, e.g., tfrecord.')
+flags.DEFINE_bool(
+    'local', False, 'If true, count the records on this machine instead of '
+    'running a beam pipeline. Only supports uncompressed tfrecord files.')
+flags.DEFINE_integer('num_workers', 16,
+                     'Number of processes used to scan files with --local.')
+flags.DEFINE_bool(
+    'write_index', False,
+    'With --local, also write a record offset index next to each file.')
 
 FLAGS = flags.FLAGS
 
 
+def _CountFileRecords(write_index, filepath):
+  return tfrecord_index.CountRecords(filepath, write_index=write_index)
+
+
+def _CountRecordsLocally():
+  """Counts the records of all input files in a process pool."""
+  if FLAGS.record_format != 'tfrecord':
+    raise ValueError('--local only supports the tfrecord format, got: %s' %
+                     FLAGS.record_format)
+  filepaths = tf.io.gfile.glob(FLAGS.input_file_pattern)
+  with multiprocessing.Pool(FLAGS.num_workers) as pool:
+    count = sum(
+        pool.imap_unordered(
+            functools.partial(_CountFileRecords, FLAGS.write_index),
+            filepaths))
+  with tf.io.gfile.GFile(FLAGS.output_count_file, 'w') as f:
+    f.write('%d\n' % count)
+
+
 def main(argv):
+  if FLAGS.local:
+    _CountRecordsLocally()
+    return
+
+  # Only imported here, so that --local does not require beam.
+  import apache_beam as beam  # pylint: disable=g-import-not-at-top
+  from lingvo.tools import beam_utils  # pylint: disable=g-import-not-at-top
+
   beam_utils.BeamInit()
 
   # Construct pipeline options from argv.
@@ -15,12 +15,12 @@
 """Encode the audio tarball contents into tfrecords."""
 
 import os
-import random
 import re
 import tarfile
 import lingvo.compat as tf
 from lingvo.core import py_utils
 from lingvo.tools import audio_lib
+from lingvo.tools import sharded_preprocessing
 
 tf.flags.DEFINE_string('input_tarball', '', 'Input .tar.gz file.')
 tf.flags.DEFINE_string('input_text', '', 'Reference text.')
@@ -41,6 +41,10 @@ tf.flags.DEFINE_integer('output_range_begin', -1, 'Begin of output shard IDs.')
 tf.flags.DEFINE_integer('output_range_end', -1, 'End of output shard IDs.')
 tf.flags.DEFINE_integer('num_output_shards', -1,
                         'Total number of output shards.')
+tf.flags.DEFINE_integer(
+    'num_workers', 1,
+    'Number of processes extracting features. Utterances are written '
+    'round-robin to the output shards of this processor shard.')
 
 FLAGS = tf.flags.FLAGS
 
@@ -133,25 +137,58 @@ def _MakeLogMelFromTensorflowBuiltin(tf_wav_bytes):
   return log_mel
 
 
-def _OpenSubShards():
+def _OutputShardFilepaths():
   tf.logging.info('Shards: %d to %d', FLAGS.output_range_begin,
                        FLAGS.output_range_end)
-  recordio_writers = []
-  for s in range(FLAGS.output_range_begin, FLAGS.output_range_end):
-    filepath = FLAGS.output_template % (s, FLAGS.num_output_shards)
-    tf.logging.info('Opening output shard: %s', filepath)
-    recordio_writers += [tf.python_io.TFRecordWriter(filepath)]
-  return recordio_writers
+  return [
+      FLAGS.output_template % (s, FLAGS.num_output_shards)
+      for s in range(FLAGS.output_range_begin, FLAGS.output_range_end)
+  ]
+
+
+# Session and feature extraction graph of the current process.
+_SESS = None
+_TF_BYTES = None
+_LOG_MEL = None
 
 
-def _CloseSubShards(files):
-  for f in files:
+def _InitFeatureExtraction():
+  global _SESS, _TF_BYTES, _LOG_MEL
+  _TF_BYTES = tf.placeholder(dtype=tf.string)
+  _LOG_MEL = audio_lib.ExtractLogMelFeatures(_TF_BYTES)
+  tfconf = tf.config_pb2.ConfigProto()
+  tfconf.gpu_options.allow_growth = True
+  _SESS = tf.Session(config=tfconf)
+
+
+def _ReadUtterances(trans):
+  """Yields (n, uttid, flac bytes, transcript) of this shard's utterances."""
+  tar = tarfile.open(FLAGS.input_tarball, mode='r:gz')
+  n = 0
+  for tarinfo in tar:
+    if not tarinfo.name.endswith('.flac'):
+      continue
+    n += 1
+    if n % FLAGS.num_shards != FLAGS.shard_id:
+      continue
+    uttid = re.sub('.*/(.+)\\.flac', '\\1', tarinfo.name)
+    uttid = uttid.encode('utf-8')
+    f = tar.extractfile(tarinfo)
+    flac_bytes = f.read()
     f.close()
+    assert uttid in trans, uttid
+    yield n, uttid, flac_bytes, trans[uttid]
+  tar.close()
 
 
-def _SelectRandomShard(files):
-  subshard = random.randint(0, len(files) - 1)
-  return files[subshard]
+def _MakeSerializedExample(utterance):
+  n, uttid, flac_bytes, text = utterance
+  wav_bytes = audio_lib.DecodeFlacToWav(flac_bytes)
+  frames = _SESS.run(_LOG_MEL, feed_dict={_TF_BYTES: wav_bytes})
+  num_words = len(text)
+  tf.logging.info('utt[%d]: %s [%d frames, %d words]', n, uttid,
+                       frames.shape[1], num_words)
+  return _MakeTfExample(uttid, frames, text).SerializeToString()
 
 
 def _CreateAsrFeatures():
@@ -162,36 +199,14 @@ def _CreateAsrFeatures():
     tf.logging.info('Running first pass on the fly')
     trans = _ReadTranscriptions()
   tf.logging.info('Total transcripts: %d', len(trans))
-  tf_bytes = tf.placeholder(dtype=tf.string)
-  log_mel = audio_lib.ExtractLogMelFeatures(tf_bytes)
   # Second pass: transcode the flac.
-  tar = tarfile.open(FLAGS.input_tarball, mode='r:gz')
-  n = 0
-  recordio_writers = _OpenSubShards()
-  tfconf = tf.config_pb2.ConfigProto()
-  tfconf.gpu_options.allow_growth = True
-  with tf.Session(config=tfconf) as sess:
-    for tarinfo in tar:
-      if not tarinfo.name.endswith('.flac'):
-        continue
-      n += 1
-      if n % FLAGS.num_shards != FLAGS.shard_id:
-        continue
-      uttid = re.sub('.*/(.+)\\.flac', '\\1', tarinfo.name)
-      uttid = uttid.encode('utf-8')
-      f = tar.extractfile(tarinfo)
-      wav_bytes = audio_lib.DecodeFlacToWav(f.read())
-      f.close()
-      frames = sess.run(log_mel, feed_dict={tf_bytes: wav_bytes})
-      assert uttid in trans, uttid
-      num_words = len(trans[uttid])
-      tf.logging.info('utt[%d]: %s [%d frames, %d words]', n, uttid,
-                           frames.shape[1], num_words)
-      ex = _MakeTfExample(uttid, frames, trans[uttid])
-      outf = _SelectRandomShard(recordio_writers)
-      outf.write(ex.SerializeToString())
-    tar.close()
-  _CloseSubShards(recordio_writers)
+  sharded_preprocessing.ProcessToShards(
+      _ReadUtterances(trans),
+      _MakeSerializedExample,
+      _OutputShardFilepaths(),
+      num_workers=FLAGS.num_workers,
+      chunk_size=1,
+      initializer=_InitFeatureExtraction)
 
 
 def main(_):
@@ -0,0 +1,49 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+r"""Generates the model index consulted by model_imports.ImportParams().
+
+The index maps each registered model name to the module registering it, so
+that binaries only import the params module of the model they run instead of
+probing candidate modules.
+
+Usage:
+  generate_model_index --output=lingvo/model_index.txt
+"""
+
+from absl import app
+from absl import flags
+from lingvo import model_imports
+from lingvo import model_registry
+
+flags.DEFINE_string('output', None, 'Path of the model index file.')
+
+FLAGS = flags.FLAGS
+
+
+def main(argv):
+  del argv
+  model_imports.ImportAllParams(require_success=True)
+  model_modules = {
+      name: module
+      for name, module in model_registry.GetAllRegisteredModules().items()
+      if not name.startswith('test.')
+  }
+  model_imports.WriteModelIndex(FLAGS.output, model_modules)
+  print(f'Wrote {len(model_modules)} models to {FLAGS.output}.')
+
+
+if __name__ == '__main__':
+  flags.mark_flag_as_required('output')
+  app.run(main)
@@ -15,6 +15,7 @@
 """Debug print tf records in text format."""
 
 import lingvo.compat as tf
+from lingvo.tools import tfrecord_index
 import six
 
 tf.flags.DEFINE_string('input_filepattern', '',
@@ -29,6 +30,11 @@ tf.flags.DEFINE_bool('bytes_as_utf8', True,
                      'Print byte strings as UTF-8 strings')
 tf.flags.DEFINE_bool('count_only', False,
                      'Don\'t print, just count number of entries')
+tf.flags.DEFINE_bool(
+    'use_index', True,
+    'Use the record index files written by count_records.py --write_index, '
+    'when present and up to date, to skip records and count entries without '
+    'reading them.')
 
 FLAGS = tf.flags.FLAGS
 
@@ -79,7 +85,19 @@ def _PrintHeader(tf_example):
 def _PrintFiles():
   entry = 0
   for filepath in tf.io.gfile.glob(FLAGS.input_filepattern):
-    records = tf.compat.v1.io.tf_record_iterator(filepath)
+    records = None
+    offsets = tfrecord_index.ReadIndex(filepath) if FLAGS.use_index else None
+    if offsets is not None:
+      skip = min(max(FLAGS.skip_first_n - entry, 0), len(offsets))
+      entry += skip
+      if FLAGS.count_only and FLAGS.print_only_n < 0:
+        entry += len(offsets) - skip
+        continue
+      if skip == len(offsets):
+        continue
+      records = tfrecord_index.ReadRecords(filepath, offsets[skip])
+    if records is None:
+      records = tf.compat.v1.io.tf_record_iterator(filepath)
     for serialized in records:
       if entry < FLAGS.skip_first_n:
         entry += 1
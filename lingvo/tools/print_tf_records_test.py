@@ -0,0 +1,113 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for print_tf_records."""
+
+import os
+from unittest import mock
+
+from absl.testing import flagsaver
+import lingvo.compat as tf
+from lingvo.core import test_utils
+from lingvo.tools import print_tf_records
+from lingvo.tools import tfrecord_index
+
+# Flag values whose printed records and counts are checked.
+_FLAG_VALUES = [
+    dict(),
+    dict(skip_first_n=3),
+    dict(skip_first_n=7, print_only_n=2),
+    dict(skip_first_n=20),
+    dict(count_only=True),
+    dict(count_only=True, skip_first_n=4),
+    dict(count_only=True, print_only_n=5),
+]
+
+
+class PrintTfRecordsTest(test_utils.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self._filepaths = [self._WriteFile(0, 5), self._WriteFile(1, 8)]
+
+  def _WriteFile(self, shard, num_records):
+    filepath = os.path.join(self.get_temp_dir(), 'data-%d.tfrecord' % shard)
+    with tf.io.TFRecordWriter(filepath) as writer:
+      for i in range(num_records):
+        ex = tf.train.Example()
+        ex.features.feature['id'].bytes_list.value.append(b'%d-%d' % (shard, i))
+        writer.write(ex.SerializeToString())
+    return filepath
+
+  def _PrintFiles(self, **flag_values):
+    """Returns the logged records and total, and the number of full reads."""
+    iterator = tf.compat.v1.io.tf_record_iterator
+    with flagsaver.flagsaver(
+        input_filepattern=os.path.join(self.get_temp_dir(), '*.tfrecord'),
+        **flag_values):
+      with mock.patch.object(tf.logging, 'info') as info, mock.patch.object(
+          tf.compat.v1.io, 'tf_record_iterator',
+          side_effect=iterator) as tf_record_iterator:
+        print_tf_records._PrintFiles()
+    logged = [
+        args[1:] for args, _ in info.call_args_list
+        if args[0].startswith('== ')
+    ]
+    return logged, tf_record_iterator.call_count
+
+  def _ExpectedOutputs(self):
+    outputs = []
+    for flag_values in _FLAG_VALUES:
+      logged, num_reads = self._PrintFiles(use_index=False, **flag_values)
+      self.assertEqual(len(self._filepaths), num_reads)
+      outputs.append(logged)
+    return outputs
+
+  def testIndexIsUsed(self):
+    expected_outputs = self._ExpectedOutputs()
+    for filepath in self._filepaths:
+      tfrecord_index.CountRecords(filepath, write_index=True)
+    for flag_values, expected in zip(_FLAG_VALUES, expected_outputs):
+      logged, num_reads = self._PrintFiles(**flag_values)
+      self.assertEqual(expected, logged, flag_values)
+      self.assertEqual(0, num_reads, flag_values)
+
+  def testStaleIndexIsIgnored(self):
+    for filepath in self._filepaths:
+      tfrecord_index.CountRecords(filepath, write_index=True)
+    self._WriteFile(0, 6)
+    expected_outputs = self._ExpectedOutputs()
+    for flag_values, expected in zip(_FLAG_VALUES, expected_outputs):
+      logged, num_reads = self._PrintFiles(**flag_values)
+      self.assertEqual(expected, logged, flag_values)
+      self.assertEqual(1, num_reads, flag_values)
+
+  def testTruncatedIndexIsIgnored(self):
+    expected_outputs = self._ExpectedOutputs()
+    for filepath in self._filepaths:
+      tfrecord_index.CountRecords(filepath, write_index=True)
+    index_path = tfrecord_index.IndexPath(self._filepaths[1])
+    with tf.io.gfile.GFile(index_path, 'rb') as f:
+      data = f.read()
+    for size in (len(data) - 3, len(data) - 8):
+      with tf.io.gfile.GFile(index_path, 'wb') as f:
+        f.write(data[:size])
+      for flag_values, expected in zip(_FLAG_VALUES, expected_outputs):
+        logged, num_reads = self._PrintFiles(**flag_values)
+        self.assertEqual(expected, logged, flag_values)
+        self.assertEqual(1, num_reads, flag_values)
+
+
+if __name__ == '__main__':
+  test_utils.main()
@@ -0,0 +1,167 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Driver to preprocess a corpus into TFRecord shards with a process pool.
+
+Inputs are read in the calling process and sent in chunks to worker processes,
+which turn each input into a serialized record. Records are written back in
+the calling process in input order, the i-th record going to output shard
+i % num_output_shards, so the output is deterministic and the shards are
+balanced regardless of the number of workers.
+
+Typical usage:
+
+  def _InitWorker(vocab_path):
+    global _ENCODER
+    _ENCODER = Encoder(vocab_path)
+
+  def _Process(line):
+    return _ENCODER.Encode(line).SerializeToString()
+
+  stats = sharded_preprocessing.ProcessToShards(
+      lines, _Process, output_filepaths, num_workers=8,
+      initializer=_InitWorker, initargs=(vocab_path,))
+
+process_fn and initializer must be picklable, e.g. module level functions.
+Worker state such as a tf.Session should be created in initializer, after the
+worker has started, rather than in the calling process.
+"""
+
+import collections
+import itertools
+import multiprocessing
+import time
+
+import lingvo.compat as tf
+
+ProcessingStats = collections.namedtuple(
+    'ProcessingStats', ['num_inputs', 'num_records', 'num_bytes', 'seconds'])
+
+
+def ShardedFilepaths(output_filepath, num_output_shards):
+  """Returns the paths of num_output_shards shards of output_filepath."""
+  if num_output_shards == 1:
+    return [output_filepath]
+  return [
+      '%s-%05d-of-%05d' % (output_filepath, i, num_output_shards)
+      for i in range(num_output_shards)
+  ]
+
+
+def _ProcessChunk(process_fn, chunk):
+  return [process_fn(item) for item in chunk]
+
+
+def _Chunks(inputs, chunk_size):
+  inputs = iter(inputs)
+  while True:
+    chunk = list(itertools.islice(inputs, chunk_size))
+    if not chunk:
+      return
+    yield chunk
+
+
+def _ProcessedChunks(inputs, process_fn, num_workers, chunk_size, initializer,
+                     initargs):
+  """Yields (chunk size, processed chunk) in input order."""
+  if num_workers <= 1:
+    if initializer:
+      initializer(*initargs)
+    for chunk in _Chunks(inputs, chunk_size):
+      yield len(chunk), _ProcessChunk(process_fn, chunk)
+    return
+
+  # Bounds the number of chunks in flight, so that inputs are not all read
+  # into memory ahead of the workers.
+  max_pending = 2 * num_workers
+  with multiprocessing.Pool(num_workers, initializer, initargs) as pool:
+    pending = collections.deque()
+    for chunk in _Chunks(inputs, chunk_size):
+      if len(pending) >= max_pending:
+        size, result = pending.popleft()
+        yield size, result.get()
+      pending.append(
+          (len(chunk), pool.apply_async(_ProcessChunk, (process_fn, chunk))))
+    while pending:
+      size, result = pending.popleft()
+      yield size, result.get()
+
+
+def ProcessToShards(inputs,
+                    process_fn,
+                    output_filepaths,
+                    num_workers=1,
+                    chunk_size=64,
+                    initializer=None,
+                    initargs=(),
+                    log_every_n=10000):
+  """Processes inputs into serialized records written to TFRecord shards.
+
+  Args:
+    inputs: An iterable of picklable inputs.
+    process_fn: A function mapping one input to a serialized record (bytes), or
+      to None to drop the input. With num_workers > 1, process_fn and
+      initializer must be picklable, and must not read flags or other state
+      of the calling process: workers may be started with spawn, which does
+      not copy that state. Pass such values explicitly, e.g. with
+      functools.partial or initargs.
+    output_filepaths: List of paths of the output TFRecord shards.
+    num_workers: Number of worker processes. If <= 1, inputs are processed in
+      the calling process.
+    chunk_size: Number of inputs sent to a worker at once.
+    initializer: Optional function called once in each worker (or once in the
+      calling process if num_workers <= 1) before processing inputs.
+    initargs: Arguments of initializer.
+    log_every_n: Logs progress every time this many inputs are processed.
+
+  Returns:
+    A ProcessingStats with the number of inputs, records and record bytes, and
+    the number of seconds spent.
+  """
+  start = time.time()
+  num_inputs = 0
+  num_records = 0
+  num_bytes = 0
+  writers = [tf.io.TFRecordWriter(path) for path in output_filepaths]
+  try:
+    for size, records in _ProcessedChunks(inputs, process_fn, num_workers,
+                                          chunk_size, initializer, initargs):
+      for record in records:
+        if record is None:
+          continue
+        writers[num_records % len(writers)].write(record)
+        num_records += 1
+        num_bytes += len(record)
+      if (num_inputs + size) // log_every_n > num_inputs // log_every_n:
+        tf.logging.info('Processed %d inputs into %d records...',
+                        num_inputs + size, num_records)
+      num_inputs += size
+  finally:
+    for writer in writers:
+      writer.close()
+
+  stats = ProcessingStats(num_inputs, num_records, num_bytes,
+                          time.time() - start)
+  LogThroughput(stats)
+  return stats
+
+
+def LogThroughput(stats):
+  """Logs the throughput of a ProcessToShards() run."""
+  seconds = max(stats.seconds, 1e-9)
+  tf.logging.info(
+      'Processed %d inputs into %d records (%d bytes) in %.1fs: '
+      '%.1f records/s, %.1f bytes/s.', stats.num_inputs, stats.num_records,
+      stats.num_bytes, stats.seconds, stats.num_records / seconds,
+      stats.num_bytes / seconds)
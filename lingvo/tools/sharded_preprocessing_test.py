@@ -0,0 +1,78 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for sharded_preprocessing."""
+
+import os
+
+from absl.testing import parameterized
+import lingvo.compat as tf
+from lingvo.core import test_utils
+from lingvo.tools import sharded_preprocessing
+
+_SUFFIX = None
+
+
+def _InitSuffix(suffix):
+  global _SUFFIX
+  _SUFFIX = suffix
+
+
+def _Process(i):
+  """Drops multiples of 3, serializes the other inputs."""
+  if i % 3 == 0:
+    return None
+  return b'%d%s' % (i, _SUFFIX)
+
+
+class ShardedPreprocessingTest(test_utils.TestCase, parameterized.TestCase):
+
+  def _ReadShards(self, filepaths):
+    return [list(tf.io.tf_record_iterator(path)) for path in filepaths]
+
+  def testShardedFilepaths(self):
+    self.assertEqual(['/a/b'], sharded_preprocessing.ShardedFilepaths('/a/b', 1))
+    self.assertEqual(['/a/b-00000-of-00002', '/a/b-00001-of-00002'],
+                     sharded_preprocessing.ShardedFilepaths('/a/b', 2))
+
+  @parameterized.parameters(1, 3)
+  def testProcessToShards(self, num_workers):
+    filepaths = sharded_preprocessing.ShardedFilepaths(
+        os.path.join(self.get_temp_dir(), 'out%d' % num_workers), 3)
+    stats = sharded_preprocessing.ProcessToShards(
+        range(100),
+        _Process,
+        filepaths,
+        num_workers=num_workers,
+        chunk_size=7,
+        initializer=_InitSuffix,
+        initargs=(b'x',))
+
+    expected = [b'%dx' % i for i in range(100) if i % 3]
+    self.assertEqual(100, stats.num_inputs)
+    self.assertEqual(len(expected), stats.num_records)
+    self.assertEqual(sum(len(r) for r in expected), stats.num_bytes)
+    # Records are written round-robin in input order.
+    shards = self._ReadShards(filepaths)
+    self.assertEqual([expected[0::3], expected[1::3], expected[2::3]], shards)
+
+  def testEmptyInputs(self):
+    filepaths = [os.path.join(self.get_temp_dir(), 'empty')]
+    stats = sharded_preprocessing.ProcessToShards([], _Process, filepaths)
+    self.assertEqual(0, stats.num_records)
+    self.assertEqual([[]], self._ReadShards(filepaths))
+
+
+if __name__ == '__main__':
+  test_utils.main()
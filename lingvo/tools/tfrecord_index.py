@@ -0,0 +1,205 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Record offsets and sidecar index files for uncompressed TFRecord files.
+
+A TFRecord file is a sequence of records, each laid out as:
+
+  uint64 length
+  uint32 masked crc32 of length
+  byte   data[length]
+  uint32 masked crc32 of data
+
+Records are located by reading the 12 byte header of each record and seeking
+over its payload, so no record data is read and no checksum is verified.
+
+An index file is written next to the shard, at IndexPath(filepath), and allows
+seeking directly to the N-th record. It holds little-endian int64 values: a
+magic number, the size and modification time (in ns) of the shard when the
+index was written, then the start offset of every record. An index whose size
+or modification time does not match the shard's, or that does not cover the
+whole shard, e.g. because it was truncated, is stale and ignored.
+"""
+
+import struct
+
+import lingvo.compat as tf
+import numpy as np
+
+_HEADER_SIZE = 12
+_FOOTER_SIZE = 4
+_INDEX_SUFFIX = '.index'
+_INDEX_MAGIC = int.from_bytes(b'TFRINDX1', 'little')
+_INDEX_HEADER_SIZE = 3
+
+
+def IndexPath(filepath):
+  """Returns the path of the index file of a TFRecord file."""
+  return filepath + _INDEX_SUFFIX
+
+
+def RecordOffsets(filepath):
+  """Returns the start offsets of all records of a TFRecord file.
+
+  Args:
+    filepath: Path of an uncompressed TFRecord file.
+
+  Returns:
+    An int64 np.array with the byte offset of each record in the file.
+
+  Raises:
+    ValueError: if the file ends in the middle of a record.
+  """
+  file_size = tf.io.gfile.stat(filepath).length
+  offsets = []
+  offset = 0
+  with tf.io.gfile.GFile(filepath, 'rb') as f:
+    while offset < file_size:
+      f.seek(offset)
+      header = f.read(_HEADER_SIZE)
+      if len(header) < _HEADER_SIZE:
+        raise ValueError('Truncated record header at offset %d of %s.' %
+                         (offset, filepath))
+      length, = struct.unpack('<Q', header[:8])
+      offsets.append(offset)
+      offset += _HEADER_SIZE + length + _FOOTER_SIZE
+  if offset != file_size:
+    raise ValueError('Truncated record at offset %d of %s.' %
+                     (offsets[-1], filepath))
+  return np.array(offsets, dtype=np.int64)
+
+
+def _FileVersion(filepath):
+  """Returns the (size, mtime in ns) of filepath."""
+  stat = tf.io.gfile.stat(filepath)
+  return stat.length, stat.mtime_nsec
+
+
+def WriteIndex(filepath, offsets, file_version=None):
+  """Writes the record offsets of filepath to its index file.
+
+  Args:
+    filepath: Path of an uncompressed TFRecord file.
+    offsets: The offsets of its records, from RecordOffsets().
+    file_version: The (size, mtime in ns) of filepath when offsets were
+      computed. Defaults to its current size and modification time.
+  """
+  size, mtime_nsec = file_version or _FileVersion(filepath)
+  header = np.array([_INDEX_MAGIC, size, mtime_nsec], dtype='<i8')
+  with tf.io.gfile.GFile(IndexPath(filepath), 'wb') as f:
+    f.write(header.tobytes() + np.asarray(offsets, dtype='<i8').tobytes())
+
+
+def _RecordEnd(filepath, offset):
+  """Returns the end offset of the record at offset, or None if truncated."""
+  with tf.io.gfile.GFile(filepath, 'rb') as f:
+    f.seek(int(offset))
+    header = f.read(_HEADER_SIZE)
+  if len(header) < _HEADER_SIZE:
+    return None
+  length, = struct.unpack('<Q', header[:8])
+  return offset + _HEADER_SIZE + length + _FOOTER_SIZE
+
+
+def _IsValidIndex(filepath, data):
+  """Returns whether the index file contents data are up to date and complete.
+
+  Args:
+    filepath: Path of an uncompressed TFRecord file.
+    data: The contents of its index file.
+  """
+  if len(data) % 8 or len(data) < _INDEX_HEADER_SIZE * 8:
+    return False
+  values = np.frombuffer(data, dtype='<i8')
+  size, mtime_nsec = _FileVersion(filepath)
+  if values[:_INDEX_HEADER_SIZE].tolist() != [_INDEX_MAGIC, size, mtime_nsec]:
+    return False
+  # An index truncated at a value boundary misses the last offsets.
+  offsets = values[_INDEX_HEADER_SIZE:]
+  if offsets.size == 0:
+    return size == 0
+  return offsets[0] == 0 and _RecordEnd(filepath, offsets[-1]) == size
+
+
+def ReadIndex(filepath):
+  """Returns the record offsets of filepath from its index.
+
+  Args:
+    filepath: Path of an uncompressed TFRecord file.
+
+  Returns:
+    An int64 np.array of record offsets, or None if filepath has no index or
+    its index is stale or invalid, e.g. filepath was modified after the index
+    was written, or the index file is truncated. CountRecords() with
+    write_index rewrites it.
+  """
+  index_path = IndexPath(filepath)
+  if not tf.io.gfile.exists(index_path):
+    return None
+  with tf.io.gfile.GFile(index_path, 'rb') as f:
+    data = f.read()
+  if not _IsValidIndex(filepath, data):
+    tf.logging.warning('Ignoring stale or invalid index %s.', index_path)
+    return None
+  return np.frombuffer(data, dtype='<i8').astype(np.int64)[_INDEX_HEADER_SIZE:]
+
+
+def CountRecords(filepath, write_index=False):
+  """Returns the number of records of a TFRecord file.
+
+  Args:
+    filepath: Path of an uncompressed TFRecord file.
+    write_index: If True, also writes the index file of filepath.
+
+  Returns:
+    The number of records in the file.
+  """
+  file_version = _FileVersion(filepath)
+  offsets = RecordOffsets(filepath)
+  if write_index:
+    WriteIndex(filepath, offsets, file_version)
+  return len(offsets)
+
+
+def ReadRecords(filepath, offset=0):
+  """Yields the serialized records of a TFRecord file starting at offset.
+
+  Args:
+    filepath: Path of an uncompressed TFRecord file.
+    offset: Byte offset of the first record to read, e.g. from ReadIndex().
+
+  Yields:
+    The data of each record, as bytes.
+
+  Raises:
+    ValueError: if the file ends in the middle of a record.
+  """
+  with tf.io.gfile.GFile(filepath, 'rb') as f:
+    offset = int(offset)
+    f.seek(offset)
+    while True:
+      header = f.read(_HEADER_SIZE)
+      if not header:
+        return
+      truncated = len(header) < _HEADER_SIZE
+      if not truncated:
+        length, = struct.unpack('<Q', header[:8])
+        data = f.read(length)
+        truncated = (
+            len(data) < length or len(f.read(_FOOTER_SIZE)) < _FOOTER_SIZE)
+      if truncated:
+        raise ValueError('Truncated record at offset %d of %s.' %
+                         (offset, filepath))
+      offset += _HEADER_SIZE + length + _FOOTER_SIZE
+      yield data
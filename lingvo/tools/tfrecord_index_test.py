@@ -0,0 +1,104 @@
+# Copyright 2024 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for tfrecord_index."""
+
+import os
+
+import lingvo.compat as tf
+from lingvo.core import test_utils
+from lingvo.tools import tfrecord_index
+
+
+class TFRecordIndexTest(test_utils.TestCase):
+
+  def _WriteRecords(self, records):
+    filepath = os.path.join(self.get_temp_dir(), 'data.tfrecord')
+    with tf.io.TFRecordWriter(filepath) as writer:
+      for record in records:
+        writer.write(record)
+    return filepath
+
+  def testCountRecords(self):
+    records = [b'x' * i for i in range(20)]
+    filepath = self._WriteRecords(records)
+    self.assertEqual(20, tfrecord_index.CountRecords(filepath))
+    self.assertFalse(tf.io.gfile.exists(tfrecord_index.IndexPath(filepath)))
+
+  def testEmptyFile(self):
+    filepath = self._WriteRecords([])
+    self.assertEqual(0, tfrecord_index.CountRecords(filepath, write_index=True))
+    self.assertAllEqual([], tfrecord_index.ReadIndex(filepath))
+
+  def testReadRecordsFromIndex(self):
+    records = [b'record %d' % i * (i % 7) for i in range(50)]
+    filepath = self._WriteRecords(records)
+    self.assertIsNone(tfrecord_index.ReadIndex(filepath))
+    self.assertEqual(50, tfrecord_index.CountRecords(filepath, write_index=True))
+
+    offsets = tfrecord_index.ReadIndex(filepath)
+    self.assertAllEqual(tfrecord_index.RecordOffsets(filepath), offsets)
+    self.assertEqual(records, list(tfrecord_index.ReadRecords(filepath)))
+    for n in (0, 1, 17, 49):
+      self.assertEqual(records[n:],
+                       list(tfrecord_index.ReadRecords(filepath, offsets[n])))
+
+  def testStaleIndexIsIgnored(self):
+    filepath = self._WriteRecords([b'abc', b'defgh'])
+    tfrecord_index.CountRecords(filepath, write_index=True)
+    self.assertLen(tfrecord_index.ReadIndex(filepath), 2)
+
+    # Rewritten with the same size.
+    stat = os.stat(filepath)
+    self._WriteRecords([b'cba', b'hgfed'])
+    os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    self.assertIsNone(tfrecord_index.ReadIndex(filepath))
+    tfrecord_index.CountRecords(filepath, write_index=True)
+    self.assertLen(tfrecord_index.ReadIndex(filepath), 2)
+
+    # Rewritten with another size, but the same modification time.
+    stat = os.stat(filepath)
+    self._WriteRecords([b'abc'])
+    os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    self.assertIsNone(tfrecord_index.ReadIndex(filepath))
+
+  def testTruncatedIndexIsIgnored(self):
+    filepath = self._WriteRecords([b'record %d' % i for i in range(10)])
+    tfrecord_index.CountRecords(filepath, write_index=True)
+    index_path = tfrecord_index.IndexPath(filepath)
+    with tf.io.gfile.GFile(index_path, 'rb') as f:
+      data = f.read()
+    # Within an offset, at an offset boundary, and within the header.
+    for size in (len(data) - 3, len(data) - 8, 12):
+      with tf.io.gfile.GFile(index_path, 'wb') as f:
+        f.write(data[:size])
+      self.assertIsNone(tfrecord_index.ReadIndex(filepath))
+    tfrecord_index.CountRecords(filepath, write_index=True)
+    self.assertLen(tfrecord_index.ReadIndex(filepath), 10)
+
+  def testTruncatedFile(self):
+    filepath = self._WriteRecords([b'abc', b'defgh'])
+    with tf.io.gfile.GFile(filepath, 'rb') as f:
+      data = f.read()
+    for size in (len(data) - 3, len(data) - 10, 20):
+      with tf.io.gfile.GFile(filepath, 'wb') as f:
+        f.write(data[:size])
+      with self.assertRaisesRegex(ValueError, 'Truncated record'):
+        tfrecord_index.RecordOffsets(filepath)
+      with self.assertRaisesRegex(ValueError, 'Truncated record at offset 19'):
+        list(tfrecord_index.ReadRecords(filepath))
+
+
+if __name__ == '__main__':
+  test_utils.main()
@@ -14,8 +14,11 @@
 # ==============================================================================
 """Encode file using the wpm_encoder."""
 
+import functools
+
 import lingvo.compat as tf
 from lingvo.core import wpm_encoder
+from lingvo.tools import sharded_preprocessing
 import numpy as np
 import six
 from six import text_type
@@ -33,9 +36,26 @@ tf.flags.DEFINE_integer(
     'max_len', 0,
     'Drop sentence if src/tgt tokens exceed max length, counting <s> and </s>. '
     'Only use during training. A value of 0 does not filter.')
+tf.flags.DEFINE_bool(
+    'use_host_encoder', False,
+    'If true, encode with wpm_encoder.HostWpmEncoder in Python instead of '
+    'running the WpmEncoder graph for each sentence pair. Both produce the '
+    'same ids.')
+
+tf.flags.DEFINE_integer(
+    'num_workers', 1,
+    'Number of processes encoding the text. Each one creates its own encoder.')
+tf.flags.DEFINE_integer(
+    'num_output_shards', 1,
+    'Number of output files. If > 1, records are written round-robin to '
+    '<output_filepath>-<i>-of-<num_output_shards>.')
 
 FLAGS = tf.flags.FLAGS
 
+# Encoder and (source, target) encoding function of the current process.
+_ENCODER = None
+_ENCODE_FN = None
+
 
 def _MakeBytesFeature(unicode_array):
   value = [tf.compat.as_bytes(w) for w in unicode_array]
@@ -57,16 +77,16 @@ def _AssertTextFormat(text):
   assert not text.endswith('</S>')
 
 
-def _MakeTfExample(enc, src_i, src_s, tgt_i, tgt_s):
+def _MakeTfExample(enc, src_i, src_s, tgt_i, tgt_s, max_len):
   """Creates TfExample from the encoded results."""
   src_i = list(src_i) + [enc.sentence_end_id]
   src_s = list(src_s) + [enc.sentence_end_string]
-  if FLAGS.max_len > 0 and len(src_i) > FLAGS.max_len:
+  if max_len > 0 and len(src_i) > max_len:
     return None
   tgt_l = list(tgt_i) + [enc.sentence_end_id]
   tgt_i = [enc.sentence_start_id] + list(tgt_i)
   tgt_s = [enc.sentence_start_string] + list(tgt_s)
-  if FLAGS.max_len > 0 and len(tgt_i) > FLAGS.max_len:
+  if max_len > 0 and len(tgt_i) > max_len:
     return None
   feature = {
       'source_id': _MakeInt64Feature(src_i),
@@ -88,45 +108,79 @@ def _Preprocess(text):
   return text.strip().replace(' </s>', '')
 
 
-def _RunEncoding():
+def _MakeEncodeFn(wpm_filepath, use_host_encoder):
+  """Returns the encoder and a function encoding a (source, target) pair."""
+  if use_host_encoder:
+    enc = wpm_encoder.HostWpmEncoder(wpm_filepath)
+    return enc, lambda src, tgt: (enc.Encode(src), enc.Encode(tgt))
+
   sess = tf.Session()
-  enc = wpm_encoder.WpmEncoder(FLAGS.wpm_filepath)
+  enc = wpm_encoder.WpmEncoder(wpm_filepath)
   src_txt_placeholder = tf.placeholder(tf.string, [])
   src_encode_op = enc.Encode(src_txt_placeholder)
   tgt_txt_placeholder = tf.placeholder(tf.string, [])
   tgt_encode_op = enc.Encode(tgt_txt_placeholder)
+
+  def _Encode(source_text, target_text):
+    return sess.run(
+        [src_encode_op, tgt_encode_op],
+        feed_dict={
+            src_txt_placeholder: source_text,
+            tgt_txt_placeholder: target_text
+        },
+    )
+
+  return enc, _Encode
+
+
+def _InitEncoder(wpm_filepath, use_host_encoder):
+  global _ENCODER, _ENCODE_FN
+  _ENCODER, _ENCODE_FN = _MakeEncodeFn(wpm_filepath, use_host_encoder)
+
+
+def _ReadTextPairs():
+  """Yields the (source, target) lines of this shard."""
   pairs = list(
       zip(FLAGS.source_filepaths.split(','), FLAGS.target_filepaths.split(',')))
-  with tf.python_io.TFRecordWriter(FLAGS.output_filepath) as outf:
-    n = 0
-    for p in pairs:
-      with tf.io.gfile.GFile(p[0], 'r') as sourcef:
-        with tf.io.gfile.GFile(p[1], 'r') as targetf:
-          for textp in zip(sourcef.readlines(), targetf.readlines()):
-            n += 1
-            if n % 10000 == 0:
-              tf.logging.info('Watermark[%d]: %d', FLAGS.shard_id, n)
-            if n % FLAGS.num_shards != FLAGS.shard_id:
-              continue
-            source_text = _Preprocess(textp[0])
-            target_text = _Preprocess(textp[1])
-            # By convention:
-            # * source always ends in </s>, never starts with <s>.
-            # * target never ends in </s>, always starts with <s>.
-            _AssertTextFormat(source_text)
-            _AssertTextFormat(target_text)
-            ((src_i, src_s), (tgt_i, tgt_s)) = sess.run(
-                [src_encode_op, tgt_encode_op],
-                feed_dict={
-                    src_txt_placeholder: source_text,
-                    tgt_txt_placeholder: target_text
-                },
-            )
-            ex = _MakeTfExample(enc, src_i, src_s, tgt_i, tgt_s)
-            if not ex:  # Too long.
-              continue
-            encoded = ex.SerializeToString()
-            outf.write(encoded)
+  n = 0
+  for p in pairs:
+    with tf.io.gfile.GFile(p[0], 'r') as sourcef:
+      with tf.io.gfile.GFile(p[1], 'r') as targetf:
+        for textp in zip(sourcef.readlines(), targetf.readlines()):
+          n += 1
+          if n % 10000 == 0:
+            tf.logging.info('Watermark[%d]: %d', FLAGS.shard_id, n)
+          if n % FLAGS.num_shards != FLAGS.shard_id:
+            continue
+          yield textp
+
+
+def _EncodeTextPair(max_len, textp):
+  """Returns the serialized tf.Example of a text pair, or None if too long."""
+  source_text = _Preprocess(textp[0])
+  target_text = _Preprocess(textp[1])
+  # By convention:
+  # * source always ends in </s>, never starts with <s>.
+  # * target never ends in </s>, always starts with <s>.
+  _AssertTextFormat(source_text)
+  _AssertTextFormat(target_text)
+  ((src_i, src_s), (tgt_i, tgt_s)) = _ENCODE_FN(source_text, target_text)
+  ex = _MakeTfExample(_ENCODER, src_i, src_s, tgt_i, tgt_s, max_len)
+  if not ex:  # Too long.
+    return None
+  return ex.SerializeToString()
+
+
+def _RunEncoding():
+  # Flag values are passed explicitly, as they are not parsed in workers.
+  sharded_preprocessing.ProcessToShards(
+      _ReadTextPairs(),
+      functools.partial(_EncodeTextPair, FLAGS.max_len),
+      sharded_preprocessing.ShardedFilepaths(FLAGS.output_filepath,
+                                             FLAGS.num_output_shards),
+      num_workers=FLAGS.num_workers,
+      initializer=_InitEncoder,
+      initargs=(FLAGS.wpm_filepath, FLAGS.use_host_encoder))
 
 
 def main(_):
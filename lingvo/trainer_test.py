@@ -279,6 +279,45 @@ class TrainerTest(BaseTrainerTest, parameterized.TestCase):
       self.assertEqual(score_2_mod_time,
                        pathlib.Path(score_2_path).stat().st_mtime)
 
+    # Test that decoding with post-processing on a background thread gives the
+    # same metrics and decode outputs as the sequential loop.
+    def _ReadDecodeResults():
+      results = {}
+      for root, _, filenames in tf.io.gfile.walk(dec_dir):
+        for filename in filenames:
+          if filename.startswith(('score-', 'decoder_out_')):
+            with tf.io.gfile.GFile(os.path.join(root, filename), 'rb') as f:
+              # The decoding speed differs between runs.
+              results[filename] = [
+                  line for line in f.readlines()
+                  if not line.startswith(b'examples/sec')
+              ]
+      return results
+
+    shutil.rmtree(dec_dir)
+    cfg = self._GetSimpleTestConfig()
+    runner_manager.StartRunners([self._CreateDecoderDev(cfg)])
+    expected_results = _ReadDecodeResults()
+    shutil.rmtree(dec_dir)
+    with self.subTest(name='PipelinedDecoder'):
+      cfg = self._GetSimpleTestConfig()
+      cfg.task.eval.decoder_postprocess_pipeline_depth = 2
+      runner_manager.StartRunners([self._CreateDecoderDev(cfg)])
+      self.assertIn('score-00000002.txt', expected_results)
+      self.assertTrue(self._HasLine(score_2_path, 'examples/sec'))
+      self.assertEqual(expected_results, _ReadDecodeResults())
+
+    # Test streaming decoder outputs to chunked record files.
+    shutil.rmtree(dec_dir)
+    with self.subTest(name='ChunkedDecodeOut'):
+      cfg = self._GetSimpleTestConfig()
+      cfg.task.eval.decode_out_chunk_size = 1
+      runner_manager.StartRunners([self._CreateDecoderDev(cfg)])
+      dec_files = tf.io.gfile.glob(os.path.join(dec_dir, '*'))
+      self.assertTrue(self._HasFile(dec_files, 'score-00000002.txt'))
+      self.assertTrue(self._HasFile(dec_files, '.chunk-complete'))
+      self.assertFalse(self._HasFile(dec_files, '.tmp'))
+
   @flagsaver.flagsaver
   def testWriteInferenceGraph(self):
     random.seed()